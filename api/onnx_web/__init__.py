@@ -1,76 +1,85 @@
+from importlib import import_module
+
 from . import logging
-from .chain import (
-    correct_codeformer,
-    correct_gfpgan,
-    upscale_resrgan,
-    upscale_stable_diffusion,
-)
-from .convert.diffusion.lora import blend_loras
-from .convert.diffusion.textual_inversion import blend_textual_inversions
-from .diffusers.load import load_pipeline, optimize_pipeline
-from .diffusers.utils import get_tile_latents, get_latents_from_seed
-from .diffusers.run import (
-    run_blend_pipeline,
-    run_img2img_pipeline,
-    run_inpaint_pipeline,
-    run_txt2img_pipeline,
-    run_upscale_pipeline,
-)
-from .diffusers.stub_scheduler import StubScheduler
-from .chain.upscale import stage_upscale_correction
-from .image.utils import (
-    expand_image,
-)
-from .image.mask_filter import (
-    mask_filter_gaussian_multiply,
-    mask_filter_gaussian_screen,
-    mask_filter_none,
-)
-from .image.noise_source import (
-    noise_source_fill_edge,
-    noise_source_fill_mask,
-    noise_source_gaussian,
-    noise_source_histogram,
-    noise_source_normal,
-    noise_source_uniform,
-)
-from .image.source_filter import (
-    source_filter_canny,
-    source_filter_depth,
-    source_filter_hed,
-    source_filter_mlsd,
-    source_filter_normal,
-    source_filter_openpose,
-    source_filter_scribble,
-    source_filter_segment,
-)
-from .onnx import OnnxRRDBNet, OnnxTensor
-from .params import (
-    Border,
-    DeviceParams,
-    ImageParams,
-    Param,
-    Point,
-    Size,
-    StageParams,
-    UpscaleParams,
-)
-from .server import (
-    ModelCache,
-    ServerContext,
-    apply_patch_basicsr,
-    apply_patch_codeformer,
-    apply_patch_facexlib,
-    apply_patches,
-)
-from .utils import (
-    base_join,
-    get_and_clamp_float,
-    get_and_clamp_int,
-    get_from_list,
-    get_from_map,
-    get_not_empty,
-)
-from .worker import (
-    DevicePoolExecutor,
-)
+
+# name -> module, which is imported on first use, so the server process does not need to load the pipelines
+LAZY_EXPORTS = {
+    # chain
+    "correct_codeformer": ".chain.correct_codeformer",
+    "correct_gfpgan": ".chain.correct_gfpgan",
+    "upscale_resrgan": ".chain.upscale_resrgan",
+    "upscale_stable_diffusion": ".chain.upscale_stable_diffusion",
+    "stage_upscale_correction": ".chain.upscale",
+    # convert
+    "blend_loras": ".convert.diffusion.lora",
+    "blend_textual_inversions": ".convert.diffusion.textual_inversion",
+    # diffusers
+    "load_pipeline": ".diffusers.load",
+    "optimize_pipeline": ".diffusers.load",
+    "get_tile_latents": ".diffusers.utils",
+    "get_latents_from_seed": ".diffusers.utils",
+    "run_blend_pipeline": ".diffusers.run",
+    "run_img2img_pipeline": ".diffusers.run",
+    "run_inpaint_pipeline": ".diffusers.run",
+    "run_txt2img_pipeline": ".diffusers.run",
+    "run_upscale_pipeline": ".diffusers.run",
+    "StubScheduler": ".diffusers.stub_scheduler",
+    # image
+    "expand_image": ".image.utils",
+    "mask_filter_gaussian_multiply": ".image.mask_filter",
+    "mask_filter_gaussian_screen": ".image.mask_filter",
+    "mask_filter_none": ".image.mask_filter",
+    "noise_source_fill_edge": ".image.noise_source",
+    "noise_source_fill_mask": ".image.noise_source",
+    "noise_source_gaussian": ".image.noise_source",
+    "noise_source_histogram": ".image.noise_source",
+    "noise_source_normal": ".image.noise_source",
+    "noise_source_uniform": ".image.noise_source",
+    "source_filter_canny": ".image.source_filter",
+    "source_filter_depth": ".image.source_filter",
+    "source_filter_hed": ".image.source_filter",
+    "source_filter_mlsd": ".image.source_filter",
+    "source_filter_normal": ".image.source_filter",
+    "source_filter_openpose": ".image.source_filter",
+    "source_filter_scribble": ".image.source_filter",
+    "source_filter_segment": ".image.source_filter",
+    # onnx
+    "OnnxRRDBNet": ".onnx",
+    "OnnxTensor": ".onnx",
+    # params
+    "Border": ".params",
+    "DeviceParams": ".params",
+    "ImageParams": ".params",
+    "Param": ".params",
+    "Point": ".params",
+    "Size": ".params",
+    "StageParams": ".params",
+    "UpscaleParams": ".params",
+    # server
+    "ModelCache": ".server",
+    "ServerContext": ".server",
+    "apply_patch_basicsr": ".server",
+    "apply_patch_codeformer": ".server",
+    "apply_patch_facexlib": ".server",
+    "apply_patches": ".server",
+    # utils
+    "base_join": ".utils",
+    "get_and_clamp_float": ".utils",
+    "get_and_clamp_int": ".utils",
+    "get_from_list": ".utils",
+    "get_from_map": ".utils",
+    "get_not_empty": ".utils",
+    # worker
+    "DevicePoolExecutor": ".worker",
+}
+
+
+def __getattr__(name: str):
+    if name in LAZY_EXPORTS:
+        module = import_module(LAZY_EXPORTS[name], __name__)
+        if name == module.__name__.rsplit(".", 1)[-1]:
+            return module
+
+        return getattr(module, name)
+
+    raise AttributeError(f"module {__name__} has no attribute {name}")
@@ -1,23 +1,31 @@
 from datetime import timedelta
 from logging import getLogger
+from os import path
 from time import monotonic
-from typing import Any, List, Optional, Tuple
+from typing import Any, List, Optional, Tuple, Union
 
 from PIL import Image
 
-from ..errors import RetryException
+from ..errors import PreemptedException, RetryException
+from ..image.encoded import decode_images
 from ..output import save_image
-from ..params import ImageParams, StageParams
+from ..params import ImageParams, Size, StageParams
 from ..server import ServerContext
 from ..utils import is_debug, run_gc
 from ..worker import ProgressCallback, WorkerContext
+from ..worker.checkpoint import JobCheckpoint, load_checkpoint, save_checkpoint
+from .cache import find_stage_result, make_stage_digests, save_stage_result
+from .plan import ChainPlan, get_stage_tile, plan_chain
+from .result import StageResult
+from .scatter import ScatterTileRunner
 from .stage import BaseStage
-from .tile import needs_tile, process_tile_order
+from .tile import TILE_CANVAS_PATH, needs_tile, process_tile_order
 
 logger = getLogger(__name__)
 
 
-PipelineStage = Tuple[BaseStage, StageParams, Optional[dict]]
+# stages can be given by type name, which will be imported when the pipeline runs
+PipelineStage = Tuple[Union[BaseStage, str], StageParams, Optional[dict]]
 
 
 class ChainProgress:
@@ -43,6 +51,71 @@ class ChainProgress:
         return ChainProgress(parent, start=start)
 
 
+def get_stage_result(stage: BaseStage, outputs: Any) -> StageResult:
+    """
+    Wrap the outputs from a stage, which can be a list of images, a list of arrays in the stage's output format, or
+    a result.
+    """
+    if isinstance(outputs, StageResult):
+        return outputs
+
+    if stage.output_format is None:
+        return StageResult.from_images(outputs)
+
+    return StageResult.from_arrays(outputs, stage.output_format)
+
+
+def run_stage_tile(
+    worker: WorkerContext,
+    server: ServerContext,
+    stage: BaseStage,
+    stage_params: StageParams,
+    params: ImageParams,
+    source_tile: Image.Image,
+    tile_mask: Optional[Image.Image],
+    dims: Tuple[int, int, int],
+    callback: Optional[ProgressCallback] = None,
+    **kwargs,
+) -> Image.Image:
+    """
+    Run a stage on a single tile, converting the tile to and from the formats used by the stage.
+    """
+    tile_sources = StageResult.from_images([source_tile])
+    tile_outputs = stage.run(
+        worker,
+        server,
+        stage_params,
+        params,
+        tile_sources.as_format(stage.input_format),
+        tile_mask=tile_mask,
+        callback=callback,
+        dims=dims,
+        **kwargs,
+    )
+    return get_stage_result(stage, tile_outputs).as_images()[0]
+
+
+def get_tile_canvas(
+    server: ServerContext,
+    source: Optional[Image.Image],
+    scale: int,
+    size: Optional[Size] = None,
+) -> Optional[str]:
+    """
+    Get the path for the blending buffers of a tiled stage, if its output is large enough that they should be kept on
+    disk rather than in memory.
+    """
+    if server.large_image_pixels <= 0:
+        return None
+
+    width, height = size or source.size
+    if (width * scale) * (height * scale) < server.large_image_pixels:
+        return None
+
+    logger.debug("blending large image on disk: %sx%s", width * scale, height * scale)
+    return path.join(server.cache_path, TILE_CANVAS_PATH)
+
+
 class ChainPipeline:
     """
     Run many stages in series, passing the image results from each to the next, and processing
@@ -73,9 +146,9 @@ class ChainPipeline:
         worker: WorkerContext,
         server: ServerContext,
         params: ImageParams,
-        sources: List[Image.Image],
+        sources: Union[List[Image.Image], StageResult],
         callback: Optional[ProgressCallback],
-        **kwargs
+        **kwargs,
     ) -> List[Image.Image]:
         return self(
             worker, server, params, sources=sources, callback=callback, **kwargs
@@ -85,21 +158,44 @@ class ChainPipeline:
         self.stages.append((callback, params, kwargs))
         return self
 
+    def plan(self, params: ImageParams, **kwargs) -> ChainPlan:
+        """
+        Plan the stages that will run, without running them. Use `ChainPlan.explain` to describe the plan.
+        """
+        return plan_chain(self.stages, params, kwargs)
+
     def __call__(
         self,
         worker: WorkerContext,
         server: ServerContext,
         params: ImageParams,
-        sources: List[Image.Image],
+        sources: Union[List[Image.Image], StageResult],
         callback: Optional[ProgressCallback] = None,
-        **pipeline_kwargs
+        **pipeline_kwargs,
     ) -> List[Image.Image]:
         """
         DEPRECATED: use `run` instead
+
+        The images are passed between stages as a `StageResult`, which is only converted when the next stage needs
+        a different format, and converted to PIL images at the end.
+
+        The first pipeline in each job can be preempted between stages, saving a checkpoint that is used to resume
+        from the next stage when the job runs again. Pipelines run by other stages are not checkpointed.
+
+        When the stage cache is enabled, the output of each stage is cached by the digest of its inputs, and the
+        first pipeline in each job will start after the last stage that has already been cached.
+
+        The stages are planned before running, see `plan_chain`, and the checkpoints and cache use the planned stages.
         """
         if callback is not None:
             callback = ChainProgress.from_progress(callback)
 
+        checkpoint = None
+        can_checkpoint = worker.checkpoint_owner is None
+        if can_checkpoint:
+            worker.checkpoint_owner = self
+            checkpoint = load_checkpoint(server, worker.job)
+
         start = monotonic()
 
         if len(sources) > 0:
@@ -111,10 +207,45 @@ class ChainPipeline:
             sources = [None]
             logger.info("running pipeline without source images")
 
-        stage_sources = sources
-        for stage_pipe, stage_params, stage_kwargs in self.stages:
+        if isinstance(sources, StageResult):
+            stage_sources = sources
+        else:
+            stage_sources = StageResult.from_images(sources)
+
+        plan = self.plan(params, **pipeline_kwargs)
+        stages = plan.stages
+        if is_debug():
+            source_size = next(
+                (size for size in stage_sources.sizes() if size is not None),
+                pipeline_kwargs.get("size", None),
+            )
+            logger.debug("planned chain pipeline:\n%s", plan.explain(source_size))
+
+        stage_digests = []
+        if can_checkpoint and server.stage_cache_limit > 0:
+            stage_digests = make_stage_digests(
+                server, params, stage_sources, stages, pipeline_kwargs
+            )
+
+        start_stage = 0
+        if checkpoint is not None:
+            start_stage = checkpoint.stage
+            stage_sources = StageResult.from_images(checkpoint.images)
+            if callback is not None:
+                callback.total = checkpoint.progress
+        elif len(stage_digests) > 0:
+            cached_stage, cached_images = find_stage_result(server, stage_digests)
+            if cached_images is not None:
+                start_stage = cached_stage + 1
+                stage_sources = StageResult.from_images(cached_images)
+
+        for stage_index, (stage_pipe, stage_params, stage_kwargs) in enumerate(stages):
+            if stage_index < start_stage:
+                logger.debug("skipping stage %s from checkpoint or cache", stage_index)
+                continue
+
             name = stage_params.name or stage_pipe.__class__.__name__
-            kwargs = stage_kwargs or {}
+            kwargs = decode_images(stage_kwargs or {})
             kwargs = {**pipeline_kwargs, **kwargs}
             logger.debug(
                 "running stage %s with %s source images, parameters: %s",
@@ -130,19 +261,18 @@ class ChainPipeline:
                         stage_pipe.max_tile,
                         stage_params.tile_size,
                         size=kwargs.get("size", None),
-                        source=source,
+                        source=source_size,
                     )
-                    for source in stage_sources
+                    for source_size in stage_sources.sizes()
                 ]
             )
 
-            tile = stage_params.tile_size
-            if stage_pipe.max_tile > 0:
-                tile = min(stage_pipe.max_tile, stage_params.tile_size)
+            tile = get_stage_tile(stage_pipe, stage_params)
 
             if must_tile:
+                # tiles are cropped and blended as PIL images
                 stage_outputs = []
-                for source in stage_sources:
+                for source in stage_sources.as_images():
                     logger.info(
                         "image larger than tile size of %s, tiling stage",
                         tile,
@@ -155,17 +285,18 @@ class ChainPipeline:
                     ) -> Image.Image:
                         for i in range(worker.retries):
                             try:
-                                output_tile = stage_pipe.run(
+                                output_tile = run_stage_tile(
                                     worker,
                                     server,
+                                    stage_pipe,
                                     stage_params,
                                     params,
-                                    [source_tile],
-                                    tile_mask=tile_mask,
+                                    source_tile,
+                                    tile_mask,
+                                    dims,
                                     callback=callback,
-                                    dims=dims,
                                     **kwargs,
-                                )[0]
+                                )
 
                                 if is_debug():
                                     save_image(server, "last-tile.png", output_tile)
@@ -182,17 +313,29 @@ class ChainPipeline:
 
                         raise RetryException("exhausted retries on tile")
 
+                    # the tiles can be run on other devices, if they are idle
+                    tile_runner = ScatterTileRunner(
+                        worker, server, stage_pipe, stage_params, params, kwargs
+                    )
+                    canvas_path = get_tile_canvas(
+                        server,
+                        source,
+                        stage_params.outscale,
+                        size=kwargs.get("size", None),
+                    )
                     output = process_tile_order(
                         stage_params.tile_order,
                         source,
                         tile,
                         stage_params.outscale,
                         [stage_tile],
+                        tile_runner=tile_runner,
+                        canvas_path=canvas_path,
                         **kwargs,
                     )
                     stage_outputs.append(output)
 
-                stage_sources = stage_outputs
+                stage_sources = StageResult.from_images(stage_outputs)
             else:
                 logger.debug("image within tile size of %s, running stage", tile)
                 for i in range(worker.retries):
@@ -202,13 +345,13 @@ class ChainPipeline:
                             server,
                             stage_params,
                             params,
-                            stage_sources,
+                            stage_sources.as_format(stage_pipe.input_format),
                             callback=callback,
                             **kwargs,
                         )
                         # doing this on the same line as stage_pipe.run can leave sources as None, which the pipeline
                         # does not like, so it throws
-                        stage_sources = stage_outputs
+                        stage_sources = get_stage_result(stage_pipe, stage_outputs)
                         break
                     except Exception:
                         logger.exception(
@@ -228,7 +371,27 @@ class ChainPipeline:
             )
 
             if is_debug():
-                save_image(server, "last-stage.png", stage_sources[0])
+                save_image(server, "last-stage.png", stage_sources.as_images()[0])
+
+            if stage_index < len(stage_digests):
+                save_stage_result(
+                    server, stage_digests[stage_index], stage_sources.as_images()
+                )
+
+            if (
+                can_checkpoint
+                and worker.is_preempted()
+                and stage_index < len(stages) - 1
+            ):
+                progress = (
+                    worker.get_progress() if callback is None else callback.get_total()
+                )
+                save_checkpoint(
+                    server,
+                    worker.job,
+                    JobCheckpoint(stage_index + 1, progress, stage_sources.as_images()),
+                )
+                raise PreemptedException("job preempted after stage %s" % (name))
 
         end = monotonic()
         duration = timedelta(seconds=(end - start))
@@ -237,4 +400,4 @@ class ChainPipeline:
             duration,
             len(stage_sources),
         )
-        return stage_sources
+        return stage_sources.as_images()
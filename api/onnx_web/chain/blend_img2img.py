@@ -17,6 +17,7 @@ logger = getLogger(__name__)
 
 class BlendImg2ImgStage(BaseStage):
     max_tile = SizeChart.unlimited
+    tile_locality = "band"
 
     def run(
         self,
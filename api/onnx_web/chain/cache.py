@@ -0,0 +1,225 @@
+from hashlib import sha256
+from json import dumps
+from logging import getLogger
+from os import listdir, makedirs, path, remove, stat, utime
+from pickle import dump, load
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from ..output import get_model_hash, get_network_hashes, write_atomic
+from ..params import ImageParams
+from ..server.context import ServerContext
+from ..utils import base_join
+from .result import StageResult
+from .stage import get_stage_class
+
+logger = getLogger(__name__)
+
+# path within the cache path
+STAGE_CACHE_PATH = "stages"
+STAGE_CACHE_EXTENSION = ".pkl"
+
+# pipeline arguments that change for every job, without changing the images
+UNCACHED_KWARGS = ["callback", "output"]
+
+
+def get_cache_value(value: Any) -> Any:
+    """
+    Convert a stage argument into something that can be hashed as JSON. Images are replaced with the hash of their
+    contents, and functions with their name.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    elif isinstance(value, (list, tuple)):
+        return [get_cache_value(item) for item in value]
+    elif isinstance(value, dict):
+        return {str(key): get_cache_value(item) for key, item in value.items()}
+    elif isinstance(value, Image.Image):
+        sha = sha256(value.tobytes())
+        return [value.mode, value.size, sha.hexdigest()]
+    elif isinstance(value, np.ndarray):
+        sha = sha256(np.ascontiguousarray(value).tobytes())
+        return [str(value.dtype), value.shape, sha.hexdigest()]
+    elif hasattr(value, "get_data"):
+        # encoded images from the server
+        return sha256(value.get_data()).hexdigest()
+    elif hasattr(value, "tojson"):
+        return value.tojson()
+    elif callable(value):
+        return f"{value.__module__}.{value.__qualname__}"
+    elif hasattr(value, "__dict__"):
+        return [value.__class__.__name__, get_cache_value(vars(value))]
+    else:
+        return repr(value)
+
+
+def get_stage_digest(upstream: str, value: Any) -> str:
+    sha = sha256(upstream.encode("utf-8"))
+    sha.update(dumps(value, sort_keys=True, default=repr).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def make_stage_digests(
+    server: ServerContext,
+    params: ImageParams,
+    sources: StageResult,
+    stages: List[Any],
+    pipeline_kwargs: Dict[str, Any],
+) -> List[str]:
+    """
+    Make a digest for the output of each stage, from the digest of the stage before it and the stage's own type,
+    parameters, and arguments, so stages that have the same inputs will have the same digest.
+
+    Only the stages before the first one that cannot be cached will have a digest.
+    """
+    upstream = get_stage_digest(
+        "",
+        {
+            "model_hash": get_model_hash(params.model),
+            "networks": get_network_hashes(server, params),
+            "params": params.tojson(),
+            "sources": get_cache_value(sources.as_images()),
+            "version": server.server_version,
+        },
+    )
+
+    shared_kwargs = {
+        key: get_cache_value(value)
+        for key, value in pipeline_kwargs.items()
+        if key not in UNCACHED_KWARGS
+    }
+
+    digests = []
+    for stage_pipe, stage_params, stage_kwargs in stages:
+        if isinstance(stage_pipe, str):
+            stage_class = get_stage_class(stage_pipe)
+        else:
+            stage_class = stage_pipe.__class__
+
+        if not stage_class.cacheable:
+            logger.debug("stage %s cannot be cached", stage_class.__name__)
+            break
+
+        upstream = get_stage_digest(
+            upstream,
+            {
+                "kwargs": {**shared_kwargs, **get_cache_value(stage_kwargs or {})},
+                "stage": stage_class.__name__,
+                "stage_params": get_cache_value(stage_params),
+            },
+        )
+        digests.append(upstream)
+
+    return digests
+
+
+def get_stage_cache_path(server: ServerContext, digest: str) -> str:
+    return base_join(
+        path.join(server.cache_path, STAGE_CACHE_PATH),
+        f"{digest}{STAGE_CACHE_EXTENSION}",
+    )
+
+
+def load_stage_result(
+    server: ServerContext, digest: str
+) -> Optional[List[Optional[Image.Image]]]:
+    cache_path = get_stage_cache_path(server, digest)
+    try:
+        with open(cache_path, "rb") as f:
+            images = load(f)
+
+        # mark the result as recently used, so it will be evicted last
+        utime(cache_path)
+        return images
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning("error loading cached stage result: %s", digest, exc_info=True)
+        return None
+
+
+def find_stage_result(
+    server: ServerContext, digests: List[str]
+) -> Tuple[int, Optional[List[Optional[Image.Image]]]]:
+    """
+    Find the last stage with a cached result, and return its index and images, or -1 if none of the stages have
+    been cached.
+    """
+    for index in reversed(range(len(digests))):
+        images = load_stage_result(server, digests[index])
+        if images is not None:
+            logger.info("found cached result for stage %s: %s", index, digests[index])
+            return (index, images)
+
+    return (-1, None)
+
+
+def save_stage_result(
+    server: ServerContext, digest: str, images: List[Optional[Image.Image]]
+) -> Optional[str]:
+    """
+    Save the images from a stage and evict the oldest results, if the cache is full. The cache is optional, so
+    errors are logged rather than failing the job.
+    """
+    dest = get_stage_cache_path(server, digest)
+
+    def write(temp_path: str):
+        with open(temp_path, "wb") as f:
+            dump(images, f)
+
+    try:
+        makedirs(path.dirname(dest), exist_ok=True)
+        write_atomic(dest, write)
+        logger.debug("cached stage result: %s", digest)
+    except Exception:
+        logger.warning("error caching stage result: %s", digest, exc_info=True)
+        return None
+
+    try:
+        evict_stage_results(server)
+    except Exception:
+        logger.warning("error evicting stage results", exc_info=True)
+
+    return dest
+
+
+def evict_stage_results(server: ServerContext) -> int:
+    """
+    Remove the least recently used stage results until the cache is within its size limit, and return the number
+    of results that were removed.
+    """
+    cache_path = path.join(server.cache_path, STAGE_CACHE_PATH)
+    limit = server.stage_cache_limit * 1024 * 1024
+
+    results = []
+    for name in listdir(cache_path):
+        if not name.endswith(STAGE_CACHE_EXTENSION):
+            continue
+
+        try:
+            stat_result = stat(path.join(cache_path, name))
+            results.append((stat_result.st_mtime, stat_result.st_size, name))
+        except FileNotFoundError:
+            # removed by another worker
+            continue
+
+    total = sum(size for _mtime, size, _name in results)
+    removed = 0
+    for _mtime, size, name in sorted(results):
+        if total <= limit:
+            break
+
+        try:
+            remove(path.join(cache_path, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+        total -= size
+
+    if removed > 0:
+        logger.debug("evicted %s stage results from cache", removed)
+
+    return removed
@@ -1,17 +1,24 @@
 from logging import getLogger
 from typing import List, Optional
 
+import numpy as np
 from PIL import Image
 
-from ..params import ImageParams, StageParams, UpscaleParams
+from ..image.face import correct_faces
+from ..params import ImageParams, SizeChart, StageParams, UpscaleParams
 from ..server import ServerContext
 from ..worker import WorkerContext
 from .stage import BaseStage
 
 logger = getLogger(__name__)
 
+CODEFORMER_FIDELITY = 0.5
+
 
 class CorrectCodeformerStage(BaseStage):
+    # faces are detected on the whole image, tiling would split them
+    max_tile = SizeChart.hd64k
+
     def run(
         self,
         worker: WorkerContext,
@@ -32,4 +39,21 @@ class CorrectCodeformerStage(BaseStage):
 
         device = worker.get_device()
         pipe = CodeFormer(upscale=upscale.face_outscale).to(device.torch_str())
-        return [pipe(source) for source in sources]
+
+        if upscale.face_outscale != 1:
+            return [pipe(source) for source in sources]
+
+        def restore(faces):
+            return pipe.model(faces, w=CODEFORMER_FIDELITY, adain=True)[0]
+
+        outputs = []
+        for source in sources:
+            output = correct_faces(pipe.face_helper, np.array(source), restore)
+            outputs.append(Image.fromarray(output, "RGB"))
+
+        return outputs
+
+    def is_noop(
+        self, _params: ImageParams, upscale: Optional[UpscaleParams] = None, **kwargs
+    ) -> bool:
+        return upscale is not None and not upscale.with_args(**kwargs).faces
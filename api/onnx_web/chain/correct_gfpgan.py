@@ -5,16 +5,24 @@ from typing import List, Optional
 import numpy as np
 from PIL import Image
 
-from ..params import DeviceParams, ImageParams, StageParams, UpscaleParams
+from ..image.face import correct_faces
+from ..params import DeviceParams, ImageParams, SizeChart, StageParams, UpscaleParams
 from ..server import ModelTypes, ServerContext
 from ..utils import run_gc
 from ..worker import WorkerContext
+from .result import FORMAT_HWC_RGB
 from .stage import BaseStage
 
 logger = getLogger(__name__)
 
 
 class CorrectGFPGANStage(BaseStage):
+    # faces are detected on the whole image, tiling would split them
+    max_tile = SizeChart.hd64k
+
+    input_format = FORMAT_HWC_RGB
+    output_format = FORMAT_HWC_RGB
+
     def load(
         self,
         server: ServerContext,
@@ -57,12 +65,12 @@ class CorrectGFPGANStage(BaseStage):
         server: ServerContext,
         stage: StageParams,
         _params: ImageParams,
-        sources: List[Image.Image],
+        sources: List[np.ndarray],
         *,
         upscale: UpscaleParams,
         stage_source: Optional[Image.Image] = None,
         **kwargs,
-    ) -> List[Image.Image]:
+    ) -> List[np.ndarray]:
         upscale = upscale.with_args(**kwargs)
 
         if upscale.correction_model is None:
@@ -73,16 +81,33 @@ class CorrectGFPGANStage(BaseStage):
         device = worker.get_device()
         gfpgan = self.load(server, stage, upscale, device)
 
+        def restore(faces):
+            return gfpgan.gfpgan(faces, return_rgb=False, weight=upscale.face_strength)[
+                0
+            ]
+
         outputs = []
         for source in sources:
-            output = np.array(source)
-            _, _, output = gfpgan.enhance(
-                output,
-                has_aligned=False,
-                only_center_face=False,
-                paste_back=True,
-                weight=upscale.face_strength,
-            )
-            outputs.append(Image.fromarray(output, "RGB"))
+            if upscale.face_outscale == 1:
+                output = correct_faces(gfpgan.face_helper, source, restore)
+            else:
+                _, _, output = gfpgan.enhance(
+                    source,
+                    has_aligned=False,
+                    only_center_face=False,
+                    paste_back=True,
+                    weight=upscale.face_strength,
+                )
+
+            outputs.append(output)
 
         return outputs
+
+    def is_noop(
+        self, _params: ImageParams, upscale: Optional[UpscaleParams] = None, **kwargs
+    ) -> bool:
+        if upscale is None:
+            return False
+
+        upscale = upscale.with_args(**kwargs)
+        return not upscale.faces or upscale.correction_model is None
@@ -3,8 +3,8 @@ from typing import List
 
 from PIL import Image
 
-from ..output import save_image
-from ..params import ImageParams, StageParams
+from ..output import OutputMetadata, save_image, save_manifest
+from ..params import ImageParams, Size, StageParams
 from ..server import ServerContext
 from ..worker import WorkerContext
 from .stage import BaseStage
@@ -13,6 +13,8 @@ logger = getLogger(__name__)
 
 
 class PersistDiskStage(BaseStage):
+    cacheable = False
+
     def run(
         self,
         _worker: WorkerContext,
@@ -27,7 +29,9 @@ class PersistDiskStage(BaseStage):
     ) -> List[Image.Image]:
         for source in sources:
             # TODO: append index to output name
-            dest = save_image(server, output, source, params=params)
+            metadata = OutputMetadata.from_params(server, params, Size(*source.size))
+            dest = save_image(server, output, source, metadata=metadata)
+            save_manifest(server, [output], metadata)
             logger.info("saved image to %s", dest)
 
         return sources
@@ -0,0 +1,163 @@
+from logging import getLogger
+from math import ceil
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..params import ImageParams, Size, StageParams
+from .stage import BaseStage, get_stage_class
+from .tile import needs_tile
+from .upscale_simple import UpscaleSimpleStage
+
+logger = getLogger(__name__)
+
+PlannedStage = Tuple[BaseStage, StageParams, Optional[dict]]
+
+
+def get_stage_tile(stage: BaseStage, stage_params: StageParams) -> int:
+    """
+    Get the tile size that a stage will use, which is the smaller of the stage's own limit and the tile size from
+    the request.
+    """
+    if stage.max_tile > 0:
+        return min(stage.max_tile, stage_params.tile_size)
+
+    return stage_params.tile_size
+
+
+def count_tiles(size: Size, tile: int) -> int:
+    if tile <= 0:
+        return 1
+
+    return ceil(size.width / tile) * ceil(size.height / tile)
+
+
+class ChainPlan:
+    """
+    The stages that will run for a chain pipeline, after dropping the stages that would not change the images and
+    merging the stages that can run together.
+    """
+
+    stages: List[PlannedStage]
+    notes: List[str]
+
+    def __init__(self, stages: List[PlannedStage], notes: List[str]) -> None:
+        self.stages = stages
+        self.notes = notes
+
+    def explain(self, size: Optional[Size] = None) -> str:
+        """
+        Describe each stage in the plan and the changes made by the planner. When the size of the source images is
+        known, this includes the size of each stage and the number of tiles it will use.
+        """
+        lines = []
+        for index, (stage, stage_params, stage_kwargs) in enumerate(self.stages):
+            name = stage_params.name or stage.__class__.__name__
+            tile = get_stage_tile(stage, stage_params)
+
+            if size is None:
+                lines.append(f"{index}: {name}, tile size {tile}")
+                continue
+
+            output_size = stage.get_output_size(
+                stage_params, size, **(stage_kwargs or {})
+            )
+            if needs_tile(stage.max_tile, stage_params.tile_size, source=size):
+                tiles = count_tiles(size, tile)
+                lines.append(
+                    f"{index}: {name}, {size} -> {output_size}, up to {tiles} tiles of {tile}"
+                )
+            else:
+                lines.append(f"{index}: {name}, {size} -> {output_size}, not tiled")
+
+            size = output_size
+
+        lines.extend(f"- {note}" for note in self.notes)
+        return "\n".join(lines)
+
+
+def merge_resize(previous: PlannedStage, stage: PlannedStage) -> Optional[PlannedStage]:
+    """
+    Combine two simple resizes into a single resize, if they use the same method.
+    """
+    prev_stage, prev_params, prev_kwargs = previous
+    next_stage, _next_params, next_kwargs = stage
+    if not (
+        isinstance(prev_stage, UpscaleSimpleStage)
+        and isinstance(next_stage, UpscaleSimpleStage)
+    ):
+        return None
+
+    prev_kwargs = prev_kwargs or {}
+    next_kwargs = next_kwargs or {}
+    prev_upscale = prev_kwargs.get("upscale", None)
+    next_upscale = next_kwargs.get("upscale", None)
+    if prev_upscale is None or next_upscale is None:
+        return None
+
+    if prev_kwargs.get("method", None) != next_kwargs.get("method", None):
+        return None
+
+    scale = prev_upscale.scale * next_upscale.scale
+    return (
+        prev_stage,
+        prev_params,
+        {
+            **prev_kwargs,
+            "upscale": prev_upscale.with_args(scale=scale, outscale=scale),
+        },
+    )
+
+
+def plan_chain(
+    stages: List[Any],
+    params: ImageParams,
+    pipeline_kwargs: Optional[Dict[str, Any]] = None,
+) -> ChainPlan:
+    """
+    Plan the stages of a chain pipeline before running it:
+
+    - stages given by type name are loaded
+    - stages that would return their sources unchanged are dropped
+    - a stage that appears twice in a row is only run once, like the face correction for `correction-both` when
+      there is no upscaling between the two corrections
+    - consecutive simple resizes with the same method are merged into one
+    """
+    pipeline_kwargs = pipeline_kwargs or {}
+
+    planned: List[PlannedStage] = []
+    notes = []
+    previous_source: Optional[Any] = None
+
+    for index, source_stage in enumerate(stages):
+        stage, stage_params, stage_kwargs = source_stage
+        if isinstance(stage, str):
+            stage = get_stage_class(stage)()
+
+        name = stage_params.name or stage.__class__.__name__
+        if stage.is_noop(params, **{**pipeline_kwargs, **(stage_kwargs or {})}):
+            notes.append(
+                f"dropped stage {index}, {name}, which would not change the images"
+            )
+            continue
+
+        if source_stage is previous_source:
+            notes.append(
+                f"dropped stage {index}, {name}, which repeats the stage before it"
+            )
+            continue
+
+        previous_source = source_stage
+        stage = (stage, stage_params, stage_kwargs)
+
+        if len(planned) > 0:
+            merged = merge_resize(planned[-1], stage)
+            if merged is not None:
+                notes.append(f"merged stage {index}, {name}, into the resize before it")
+                planned[-1] = merged
+                continue
+
+        planned.append(stage)
+
+    if len(notes) > 0:
+        logger.debug("planned chain with %s of %s stages", len(planned), len(stages))
+
+    return ChainPlan(planned, notes)
@@ -28,8 +28,7 @@ class ReduceThumbnailStage(BaseStage):
 
         for source in sources:
             image = source.copy()
-
-            image = image.thumbnail((size.width, size.height))
+            image.thumbnail((size.width, size.height))
 
             logger.info(
                 "created thumbnail with dimensions: %sx%s", image.width, image.height
@@ -0,0 +1,205 @@
+from logging import getLogger
+from typing import Any, Dict, List, Literal, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from ..params import Size
+
+logger = getLogger(__name__)
+
+ChannelOrder = Literal["RGB", "BGR"]
+Layout = Literal["HWC", "NCHW"]
+
+
+class ImageFormat:
+    """
+    The layout, dtype, and channel order of an image array.
+
+    Integer arrays hold values from 0 to 255 and float arrays hold values from 0 to 1. NCHW arrays always have a batch
+    size of 1.
+    """
+
+    layout: Layout
+    dtype: str
+    channels: ChannelOrder
+
+    def __init__(
+        self, layout: Layout, dtype: str = "uint8", channels: ChannelOrder = "RGB"
+    ) -> None:
+        self.layout = layout
+        self.dtype = dtype
+        self.channels = channels
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, ImageFormat)
+            and self.layout == other.layout
+            and self.dtype == other.dtype
+            and self.channels == other.channels
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.layout, self.dtype, self.channels))
+
+    def __repr__(self) -> str:
+        return f"ImageFormat({self.layout}, {self.dtype}, {self.channels})"
+
+    def is_float(self) -> bool:
+        return np.issubdtype(np.dtype(self.dtype), np.floating)
+
+
+# the format of np.array(image) for an RGB image
+FORMAT_HWC_RGB = ImageFormat("HWC", "uint8", "RGB")
+
+# the input format for most of the ONNX upscaling models
+FORMAT_NCHW_BGR = ImageFormat("NCHW", "float32", "BGR")
+
+
+def convert_array(
+    array: np.ndarray, source: ImageFormat, dest: ImageFormat
+) -> np.ndarray:
+    """
+    Convert an image array from one format to another.
+    """
+    if source == dest:
+        return array
+
+    if source.layout == "NCHW":
+        array = np.squeeze(array, axis=0).transpose((1, 2, 0))
+
+    if source.channels != dest.channels:
+        array = array[:, :, ::-1]
+
+    if source.dtype != dest.dtype:
+        if source.is_float() and not dest.is_float():
+            array = (np.clip(array, 0, 1) * 255.0).round().astype(dest.dtype)
+        elif dest.is_float() and not source.is_float():
+            array = (array / 255.0).astype(dest.dtype)
+        else:
+            array = array.astype(dest.dtype)
+
+    if dest.layout == "NCHW":
+        array = np.expand_dims(array.transpose((2, 0, 1)), axis=0)
+
+    return np.ascontiguousarray(array)
+
+
+def get_rgb(image: Image.Image) -> Image.Image:
+    if image.mode == "RGB":
+        return image
+
+    return image.convert("RGB")
+
+
+class StageResult:
+    """
+    The images passed between chain stages.
+
+    The images can be held as PIL images or arrays in any format, and are only converted when a stage asks for a
+    different one. Each conversion is kept, so stages that use the same format share it. Empty sources are kept as
+    None, so stages that create images can still tell how many to create.
+    """
+
+    data: Dict[Optional[ImageFormat], List[Optional[Union[Image.Image, np.ndarray]]]]
+
+    def __init__(
+        self,
+        images: Optional[List[Optional[Image.Image]]] = None,
+        arrays: Optional[List[Optional[np.ndarray]]] = None,
+        format: Optional[ImageFormat] = None,
+    ) -> None:
+        self.data = {}
+
+        if images is not None:
+            self.data[None] = list(images)
+
+        if arrays is not None:
+            if format is None:
+                raise ValueError("arrays must have a format")
+
+            self.data[format] = list(arrays)
+
+        if len(self.data) == 0:
+            raise ValueError("results must have images or arrays")
+
+    def __len__(self) -> int:
+        return len(next(iter(self.data.values())))
+
+    def __repr__(self) -> str:
+        return f"StageResult({len(self)} images, {list(self.data.keys())})"
+
+    @classmethod
+    def from_images(cls, images: List[Optional[Image.Image]]) -> "StageResult":
+        return StageResult(images=images)
+
+    @classmethod
+    def from_arrays(
+        cls, arrays: List[Optional[np.ndarray]], format: ImageFormat
+    ) -> "StageResult":
+        return StageResult(arrays=arrays, format=format)
+
+    def count(self, value: None) -> int:
+        # list.count compares arrays by value, which is ambiguous, so only empty sources can be counted
+        return sum(1 for item in next(iter(self.data.values())) if item is value)
+
+    def as_images(self) -> List[Optional[Image.Image]]:
+        if None not in self.data:
+            arrays = self.as_arrays(FORMAT_HWC_RGB)
+            logger.trace("converting %s arrays to images", len(arrays))
+            self.data[None] = [
+                None if array is None else Image.fromarray(array, "RGB")
+                for array in arrays
+            ]
+
+        return self.data[None]
+
+    def as_arrays(self, format: ImageFormat) -> List[Optional[np.ndarray]]:
+        if format in self.data:
+            return self.data[format]
+
+        # prefer an existing array over the PIL images, which need to be copied
+        source = next((key for key in self.data.keys() if key is not None), None)
+        if source is None:
+            logger.trace("converting %s images to arrays", len(self))
+            source = FORMAT_HWC_RGB
+            self.data[source] = [
+                None if image is None else np.array(get_rgb(image))
+                for image in self.data[None]
+            ]
+
+        if format != source:
+            logger.trace("converting arrays from %s to %s", source, format)
+            self.data[format] = [
+                None if array is None else convert_array(array, source, format)
+                for array in self.data[source]
+            ]
+
+        return self.data[format]
+
+    def as_format(self, format: Optional[ImageFormat]) -> List[Optional[Any]]:
+        """
+        Get the images as PIL images, when the format is None, or arrays in the given format.
+        """
+        if format is None:
+            return self.as_images()
+
+        return self.as_arrays(format)
+
+    def sizes(self) -> List[Optional[Size]]:
+        if None in self.data:
+            return [
+                None if image is None else Size(image.width, image.height)
+                for image in self.data[None]
+            ]
+
+        format, arrays = next(iter(self.data.items()))
+        height_axis = 0 if format.layout == "HWC" else 2
+        return [
+            (
+                None
+                if array is None
+                else Size(array.shape[height_axis + 1], array.shape[height_axis])
+            )
+            for array in arrays
+        ]
@@ -0,0 +1,331 @@
+from logging import getLogger
+from math import ceil, sqrt
+from os import makedirs, path, remove
+from pickle import dump, load
+from shutil import rmtree
+from time import monotonic, sleep
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from uuid import uuid4
+
+from PIL import Image
+
+from ..errors import CancelledException
+from ..output import write_atomic
+from ..params import ImageParams, StageParams
+from ..server.context import ServerContext
+from ..worker.context import WorkerContext
+from .stage import BaseStage
+from .tile import TileCallback, TileInput, run_tiles
+
+logger = getLogger(__name__)
+
+# path within the cache path
+TILE_PATH = "tiles"
+
+TILE_LOCALITY_BAND = "band"
+TILE_LOCALITY_NONE = "none"
+TILE_LOCALITY_TILE = "tile"
+
+# how often to check for tiles from the other devices, in seconds
+TILE_POLL_INTERVAL = 0.25
+
+# how long to wait for a tile from another device before running it here, as a multiple of the slowest local band
+TILE_STEAL_FACTOR = 4.0
+TILE_STEAL_MIN = 30.0
+
+
+class TileTask:
+    """
+    The stage and arguments needed to run the tiles of a scattered stage on another device.
+    """
+
+    stage: BaseStage
+    stage_params: StageParams
+    params: ImageParams
+    kwargs: Dict[str, Any]
+    bands: List[List[int]]
+    tile: int
+
+    def __init__(
+        self,
+        stage: BaseStage,
+        stage_params: StageParams,
+        params: ImageParams,
+        kwargs: Dict[str, Any],
+        bands: List[List[int]],
+        tile: int,
+    ) -> None:
+        self.stage = stage
+        self.stage_params = stage_params
+        self.params = params
+        self.kwargs = kwargs
+        self.bands = bands
+        self.tile = tile
+
+
+def get_tile_bands(count: int, locality: str) -> List[List[int]]:
+    """
+    Group the tiles into the bands that each device will claim. Stages that need their neighbours to run on the same
+    device claim a band of neighbouring tiles at a time, others claim one tile at a time.
+    """
+    if locality == TILE_LOCALITY_BAND:
+        size = ceil(sqrt(count))
+    else:
+        size = 1
+
+    return [
+        list(range(start, min(start + size, count))) for start in range(0, count, size)
+    ]
+
+
+def get_task_path(tile_path: str) -> str:
+    return path.join(tile_path, "task.pkl")
+
+
+def get_input_path(tile_path: str, index: int) -> str:
+    return path.join(tile_path, f"input-{index}.pkl")
+
+
+def get_output_path(tile_path: str, index: int) -> str:
+    return path.join(tile_path, f"output-{index}.pkl")
+
+
+def claim_band(tile_path: str, band: int) -> bool:
+    """
+    Claim a band of tiles, which will only succeed for the first device to ask.
+    """
+    try:
+        with open(path.join(tile_path, f"claim-{band}"), "x"):
+            return True
+    except FileExistsError:
+        return False
+
+
+def release_band(tile_path: str, band: int) -> None:
+    try:
+        remove(path.join(tile_path, f"claim-{band}"))
+    except FileNotFoundError:
+        pass
+
+
+def save_pickle(dest: str, value: Any) -> None:
+    def write(temp_path: str):
+        with open(temp_path, "wb") as f:
+            dump(value, f)
+
+    write_atomic(dest, write)
+
+
+def load_pickle(source: str) -> Any:
+    with open(source, "rb") as f:
+        return load(f)
+
+
+class ScatterTileRunner:
+    """
+    Run the tiles for a stage on this device and any idle devices on the same platform.
+
+    The tiles are written to the cache path and each device claims them a band at a time, so this device keeps
+    working on the tiles when no other devices are available, and runs any tiles that another device claims but
+    does not finish.
+    """
+
+    worker: WorkerContext
+    server: ServerContext
+    stage: BaseStage
+    stage_params: StageParams
+    params: ImageParams
+    kwargs: Dict[str, Any]
+
+    def __init__(
+        self,
+        worker: WorkerContext,
+        server: ServerContext,
+        stage: BaseStage,
+        stage_params: StageParams,
+        params: ImageParams,
+        kwargs: Dict[str, Any],
+    ) -> None:
+        self.worker = worker
+        self.server = server
+        self.stage = stage
+        self.stage_params = stage_params
+        self.params = params
+        self.kwargs = kwargs
+
+    def can_scatter(self, count: int) -> bool:
+        return (
+            self.server.scatter_tiles > 0
+            and count >= self.server.scatter_tiles
+            and self.stage.tile_locality != TILE_LOCALITY_NONE
+            and getattr(self.worker, "tile_requests", None) is not None
+        )
+
+    def __call__(
+        self, tiles: Sequence[TileInput], filters: List[TileCallback], tile: int
+    ) -> Iterable[Image.Image]:
+        if not self.can_scatter(len(tiles)):
+            return run_tiles(tiles, filters, tile)
+
+        # every tile needs to be written before the other devices can start
+        tiles = list(tiles)
+        bands = get_tile_bands(len(tiles), self.stage.tile_locality)
+        tile_path = path.join(
+            self.server.cache_path, TILE_PATH, f"{self.worker.job}-{uuid4().hex}"
+        )
+
+        try:
+            makedirs(tile_path, exist_ok=True)
+            for index, tile_input in enumerate(tiles):
+                save_pickle(get_input_path(tile_path, index), tile_input)
+
+            # the task goes last, since the other devices will not start until they can load it
+            save_pickle(
+                get_task_path(tile_path),
+                TileTask(
+                    self.stage, self.stage_params, self.params, self.kwargs, bands, tile
+                ),
+            )
+        except Exception:
+            logger.warning(
+                "error writing tiles, running them on this device", exc_info=True
+            )
+            rmtree(tile_path, ignore_errors=True)
+            return run_tiles(tiles, filters, tile)
+
+        logger.info(
+            "scattering %s tiles in %s bands from device %s",
+            len(tiles),
+            len(bands),
+            self.worker.device.device,
+        )
+        self.worker.request_tiles(tile_path)
+
+        try:
+            return self.gather(tile_path, tiles, bands, filters, tile)
+        finally:
+            rmtree(tile_path, ignore_errors=True)
+
+    def gather(
+        self,
+        tile_path: str,
+        tiles: List[TileInput],
+        bands: List[List[int]],
+        filters: List[TileCallback],
+        tile: int,
+    ) -> List[Image.Image]:
+        outputs: List[Optional[Image.Image]] = [None] * len(tiles)
+        claimed_at: Dict[int, float] = {}
+        slowest = 0.0
+
+        def run_band(band: int):
+            nonlocal slowest
+            start = monotonic()
+            band_tiles = [tiles[index] for index in bands[band]]
+            for index, output in zip(bands[band], run_tiles(band_tiles, filters, tile)):
+                outputs[index] = output
+
+            slowest = max(slowest, monotonic() - start)
+
+        remaining = list(range(len(bands)))
+        while len(remaining) > 0:
+            # claim and run the next band on this device
+            band = next((band for band in remaining if band not in claimed_at), None)
+            if band is not None:
+                if claim_band(tile_path, band):
+                    run_band(band)
+                    remaining.remove(band)
+                else:
+                    claimed_at[band] = monotonic()
+
+                continue
+
+            # collect the bands that have been finished by other devices
+            for band in list(remaining):
+                output_paths = [
+                    get_output_path(tile_path, index) for index in bands[band]
+                ]
+                if all(path.exists(output_path) for output_path in output_paths):
+                    for index, output_path in zip(bands[band], output_paths):
+                        outputs[index] = load_pickle(output_path)
+
+                    remaining.remove(band)
+                elif not path.exists(path.join(tile_path, f"claim-{band}")):
+                    # released by a device that could not finish it
+                    claimed_at.pop(band, None)
+
+            if len(remaining) == 0:
+                break
+
+            if self.worker.is_cancelled():
+                raise CancelledException(
+                    "job has been cancelled while waiting for tiles"
+                )
+
+            # run any band that another device is taking too long to finish
+            steal_after = max(TILE_STEAL_MIN, slowest * TILE_STEAL_FACTOR)
+            for band in list(remaining):
+                if band in claimed_at and monotonic() - claimed_at[band] > steal_after:
+                    logger.warning(
+                        "band %s was not finished by another device, running it here",
+                        band,
+                    )
+                    run_band(band)
+                    remaining.remove(band)
+
+            sleep(TILE_POLL_INTERVAL)
+
+        logger.debug("gathered %s tiles", len(outputs))
+        return outputs
+
+
+def run_tile_job(worker: WorkerContext, server: ServerContext, tile_path: str) -> None:
+    """
+    Help another device with the tiles for its stage, claiming bands from the end so each device works on a separate
+    part of the image.
+    """
+    from .base import run_stage_tile
+
+    try:
+        task: TileTask = load_pickle(get_task_path(tile_path))
+    except FileNotFoundError:
+        logger.debug("tiles have already been finished: %s", tile_path)
+        return
+
+    finished = 0
+    for band in reversed(range(len(task.bands))):
+        try:
+            if not claim_band(tile_path, band):
+                continue
+        except FileNotFoundError:
+            logger.debug("tiles were finished by another device: %s", tile_path)
+            return
+
+        try:
+            for index in task.bands[band]:
+                left, top, tile_image, tile_mask = load_pickle(
+                    get_input_path(tile_path, index)
+                )
+                output = run_stage_tile(
+                    worker,
+                    server,
+                    task.stage,
+                    task.stage_params,
+                    task.params,
+                    tile_image,
+                    tile_mask,
+                    (left, top, task.tile),
+                    **task.kwargs,
+                )
+                save_pickle(get_output_path(tile_path, index), output)
+                finished += 1
+                worker.set_progress(finished)
+        except FileNotFoundError:
+            logger.debug("tiles were finished by another device: %s", tile_path)
+            return
+        except Exception:
+            # let the device that scattered the tiles run them instead
+            release_band(tile_path, band)
+            raise
+
+    logger.info("finished %s tiles for another device", finished)
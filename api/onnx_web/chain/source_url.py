@@ -14,6 +14,8 @@ logger = getLogger(__name__)
 
 
 class SourceURLStage(BaseStage):
+    cacheable = False
+
     def run(
         self,
         _worker: WorkerContext,
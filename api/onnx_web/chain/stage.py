@@ -1,15 +1,59 @@
-from typing import List, Optional
+from importlib import import_module
+from typing import List, Literal, Optional, Type
 
 from PIL import Image
 
 from ..params import ImageParams, Size, SizeChart, StageParams
 from ..server.context import ServerContext
 from ..worker.context import WorkerContext
+from .result import ImageFormat
+
+TileLocality = Literal["band", "none", "tile"]
+
+# stage type -> (module, class), which are imported on first use, so the server does not need to load them
+CHAIN_STAGES = {
+    "blend-img2img": ("blend_img2img", "BlendImg2ImgStage"),
+    "blend-inpaint": ("upscale_outpaint", "UpscaleOutpaintStage"),
+    "blend-linear": ("blend_linear", "BlendLinearStage"),
+    "blend-mask": ("blend_mask", "BlendMaskStage"),
+    "correct-codeformer": ("correct_codeformer", "CorrectCodeformerStage"),
+    "correct-gfpgan": ("correct_gfpgan", "CorrectGFPGANStage"),
+    "persist-disk": ("persist_disk", "PersistDiskStage"),
+    "persist-s3": ("persist_s3", "PersistS3Stage"),
+    "reduce-crop": ("reduce_crop", "ReduceCropStage"),
+    "reduce-thumbnail": ("reduce_thumbnail", "ReduceThumbnailStage"),
+    "source-noise": ("source_noise", "SourceNoiseStage"),
+    "source-s3": ("source_s3", "SourceS3Stage"),
+    "source-txt2img": ("source_txt2img", "SourceTxt2ImgStage"),
+    "source-url": ("source_url", "SourceURLStage"),
+    "upscale-bsrgan": ("upscale_bsrgan", "UpscaleBSRGANStage"),
+    "upscale-highres": ("upscale_highres", "UpscaleHighresStage"),
+    "upscale-outpaint": ("upscale_outpaint", "UpscaleOutpaintStage"),
+    "upscale-resrgan": ("upscale_resrgan", "UpscaleRealESRGANStage"),
+    "upscale-simple": ("upscale_simple", "UpscaleSimpleStage"),
+    "upscale-stable-diffusion": (
+        "upscale_stable_diffusion",
+        "UpscaleStableDiffusionStage",
+    ),
+    "upscale-swinir": ("upscale_swinir", "UpscaleSwinIRStage"),
+}
 
 
 class BaseStage:
     max_tile = SizeChart.auto
 
+    # stages take and return PIL images by default, but can ask for arrays in another format, which are only
+    # converted when the previous stage returned something else
+    input_format: Optional[ImageFormat] = None
+    output_format: Optional[ImageFormat] = None
+
+    # stages that read or write outside of the pipeline, like URLs and buckets, should not be skipped by the stage cache
+    cacheable = True
+
+    # when the tiles are scattered to other devices, "tile" stages can run each tile on any device, "band" stages keep
+    # neighbouring tiles on the same device so the seams between them match, and "none" stages keep every tile here
+    tile_locality: TileLocality = "none"
+
     def run(
         self,
         worker: WorkerContext,
@@ -29,3 +73,21 @@ class BaseStage:
         size: Size,
     ) -> int:
         raise NotImplementedError()
+
+    def is_noop(self, _params: ImageParams, **kwargs) -> bool:
+        """
+        Check whether this stage would return its sources unchanged, so the chain planner can drop it.
+        """
+        return False
+
+    def get_output_size(self, stage: StageParams, size: Size, **kwargs) -> Size:
+        return Size(size.width * stage.outscale, size.height * stage.outscale)
+
+
+def get_stage_class(stage_type: str) -> Type[BaseStage]:
+    """
+    Import the stage class for a stage type.
+    """
+    module_name, class_name = CHAIN_STAGES[stage_type]
+    module = import_module(f".{module_name}", __package__)
+    return getattr(module, class_name)
@@ -1,8 +1,25 @@
 import itertools
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from enum import Enum
+from functools import partial
 from logging import getLogger
 from math import ceil
-from typing import List, Optional, Protocol, Tuple
+from os import makedirs
+from tempfile import TemporaryFile
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import numpy as np
 from PIL import Image
@@ -15,6 +32,18 @@ from ..params import Size, TileOrder
 
 logger = getLogger(__name__)
 
+# how far a mask reaches past its pixels, in case the mask filter or blending softens the edges
+MASK_DILATION = 16
+
+# masked regions are cropped to multiples of the latent size
+MASK_ALIGNMENT = 8
+
+# path within the cache path for the blending buffers of large images
+TILE_CANVAS_PATH = "canvas"
+
+# how many tiles can be prepared ahead of the running tile, and how many finished tiles can wait to be blended
+TILE_QUEUE_SIZE = 2
+
 
 class TileCallback(Protocol):
     """
@@ -28,6 +57,190 @@ class TileCallback(Protocol):
         pass
 
 
+# the left and top edges of a tile, with the tile image and mask
+TileInput = Tuple[int, int, Optional[Image.Image], Optional[Image.Image]]
+
+# crops a tile and its mask from the source image, so it can be prepared on another thread
+TilePrepare = Callable[[], TileInput]
+
+# the left and top edges of a tile, how to prepare it, and whether it should be run through the filters
+PlannedTile = Tuple[int, int, TilePrepare, bool]
+
+
+class TileRunner(Protocol):
+    """
+    Definition for a function that runs the tile filters on each tile and returns the outputs in the same order.
+    """
+
+    def __call__(
+        self, tiles: Sequence[TileInput], filters: List[TileCallback], tile: int
+    ) -> Iterable[Image.Image]:
+        pass
+
+
+class TileInputs(Sequence[TileInput]):
+    """
+    The tiles that will be run through the filters, which are only prepared when they are needed.
+
+    When an executor is given, iterating over the tiles will prepare the next few in the background while the current
+    tile is running.
+    """
+
+    prepares: List[TilePrepare]
+    executor: Optional[Executor]
+    queue_size: int
+
+    def __init__(
+        self,
+        prepares: List[TilePrepare],
+        executor: Optional[Executor] = None,
+        queue_size: int = TILE_QUEUE_SIZE,
+    ) -> None:
+        self.prepares = prepares
+        self.executor = executor
+        self.queue_size = queue_size
+
+    def __getitem__(self, index: int) -> TileInput:
+        return self.prepares[index]()
+
+    def __len__(self) -> int:
+        return len(self.prepares)
+
+    def __iter__(self) -> Iterator[TileInput]:
+        if self.executor is None:
+            for prepare in self.prepares:
+                yield prepare()
+
+            return
+
+        futures: Deque[Future] = deque()
+        for prepare in self.prepares:
+            futures.append(self.executor.submit(prepare))
+            if len(futures) > self.queue_size:
+                yield futures.popleft().result()
+
+        while len(futures) > 0:
+            yield futures.popleft().result()
+
+
+class MaskPlan:
+    """
+    The parts of an image that are covered by a mask, which is used to find the tiles that need to be processed before
+    doing any work on them.
+
+    Any pixel that is not black is covered. Lookups use a summed-area table, so each tile costs the same to check
+    regardless of its size.
+    """
+
+    def __init__(self, mask: Image.Image, dilation: int = MASK_DILATION) -> None:
+        self.width, self.height = mask.size
+        self.dilation = dilation
+
+        covered = (np.array(mask.convert("L")) > 0).astype(np.int64)
+        self.table = np.pad(covered.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+
+    def covers(self, left: int, top: int, right: int, bottom: int) -> bool:
+        """
+        Check whether the (dilated) mask covers any part of a box, which may extend past the edges of the mask.
+        """
+        left = min(max(left - self.dilation, 0), self.width)
+        top = min(max(top - self.dilation, 0), self.height)
+        right = min(max(right + self.dilation, 0), self.width)
+        bottom = min(max(bottom + self.dilation, 0), self.height)
+
+        if left >= right or top >= bottom:
+            return False
+
+        table = self.table
+        total = (
+            table[bottom, right]
+            - table[top, right]
+            - table[bottom, left]
+            + table[top, left]
+        )
+        return total > 0
+
+    def bbox(self) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Get the bounding box of the dilated mask, or None if nothing is covered.
+        """
+        if self.table[-1, -1] == 0:
+            return None
+
+        rows = np.flatnonzero(np.diff(self.table[:, -1]))
+        cols = np.flatnonzero(np.diff(self.table[-1, :]))
+
+        return (
+            max(int(cols[0]) - self.dilation, 0),
+            max(int(rows[0]) - self.dilation, 0),
+            min(int(cols[-1]) + 1 + self.dilation, self.width),
+            min(int(rows[-1]) + 1 + self.dilation, self.height),
+        )
+
+
+def get_mask_plan(
+    mask: Optional[Image.Image], scale: int, width: int, height: int
+) -> Optional[MaskPlan]:
+    """
+    Plan which tiles can be skipped. Only stages that keep the size of the image can skip tiles, since the tiles
+    in any other stage still need to be resized.
+    """
+    if mask is None or scale != 1:
+        return None
+
+    if mask.size != (width, height):
+        mask = mask.resize((width, height), Image.Resampling.NEAREST)
+
+    return MaskPlan(mask)
+
+
+def get_mask_crop(
+    mask: Image.Image,
+    tile: int,
+    dilation: int = MASK_DILATION,
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Get the region of an image that needs to be processed for a mask, expanded to at least the tile size so the model
+    has some context around the mask. Returns None if the whole image should be used.
+    """
+    bbox = MaskPlan(mask, dilation=dilation).bbox()
+    if bbox is None:
+        return None
+
+    width, height = mask.size
+    left, top, right, bottom = bbox
+
+    def expand(start: int, end: int, limit: int) -> Tuple[int, int]:
+        # align the box, then grow it to the tile size around the center
+        start = (start // MASK_ALIGNMENT) * MASK_ALIGNMENT
+        end = min(ceil(end / MASK_ALIGNMENT) * MASK_ALIGNMENT, limit)
+        size = min(max(end - start, tile), limit)
+        grow = ((size - (end - start)) // (2 * MASK_ALIGNMENT)) * MASK_ALIGNMENT
+        start = min(max(start - grow, 0), limit - size)
+        return (start, start + size)
+
+    left, right = expand(left, right, width)
+    top, bottom = expand(top, bottom, height)
+
+    if (right - left) * (bottom - top) >= width * height:
+        return None
+
+    return (left, top, right, bottom)
+
+
+def run_tiles(
+    tiles: Iterable[TileInput], filters: List[TileCallback], tile: int
+) -> Iterator[Image.Image]:
+    """
+    Run the tile filters on each tile in turn.
+    """
+    for left, top, tile_image, tile_mask in tiles:
+        for tile_filter in filters:
+            tile_image = tile_filter(tile_image, tile_mask, (left, top, tile))
+
+        yield tile_image
+
+
 def complete_tile(
     source: Image.Image,
     tile: int,
@@ -47,7 +260,7 @@ def needs_tile(
     max_tile: int,
     stage_tile: int,
     size: Optional[Size] = None,
-    source: Optional[Image.Image] = None,
+    source: Optional[Union[Image.Image, Size]] = None,
 ) -> bool:
     tile = min(max_tile, stage_tile)
 
@@ -85,36 +298,97 @@ def get_tile_grads(
     return (grad_x, grad_y)
 
 
-def blend_tiles(
-    tiles: List[Tuple[int, int, Image.Image]],
-    scale: int,
-    width: int,
-    height: int,
-    tile: int,
-    overlap: float,
-):
-    adj_tile = int(float(tile) * (1.0 - overlap))
-    logger.debug(
-        "adjusting tile size from %s to %s based on %s overlap", tile, adj_tile, overlap
-    )
+class TileAccumulator:
+    """
+    Blend tiles into the output image one at a time, so each tile can be released as soon as it has been blended.
 
-    scaled_size = (height * scale, width * scale, 3)
-    count = np.zeros(scaled_size)
-    value = np.zeros(scaled_size)
+    The output is blended in bands of rows, each the height of a scaled tile. Once none of the remaining tiles reach
+    into a band, it is converted into the output pixels and its blending buffers are released, so peak memory depends
+    on the number of open bands rather than the size of the image. Tiles in the grid order finish their bands as they
+    go, while the spiral order keeps most bands open until the end. When a canvas path is given, the blending buffers
+    are kept in temporary files within it, so only the bands that are being written need to fit in memory.
+
+    Tiles must be added in the same order to get the same output, since the overlapping edges are summed.
+    """
+
+    scale: int
+    width: int
+    height: int
+    tile: int
+    adj_tile: int
+    band_height: int
+    canvas_path: Optional[str]
+    scaled_size: Tuple[int, int, int]
+    bands: Dict[int, Tuple[np.ndarray, np.ndarray]]
+    output: np.ndarray
+
+    def __init__(
+        self,
+        scale: int,
+        width: int,
+        height: int,
+        tile: int,
+        overlap: float,
+        canvas_path: Optional[str] = None,
+    ) -> None:
+        self.scale = scale
+        self.width = width
+        self.height = height
+        self.tile = tile
+        self.adj_tile = int(float(tile) * (1.0 - overlap))
+        logger.debug(
+            "adjusting tile size from %s to %s based on %s overlap",
+            tile,
+            self.adj_tile,
+            overlap,
+        )
+
+        self.band_height = max(tile * scale, 1)
+        self.canvas_path = canvas_path
+        self.scaled_size = (height * scale, width * scale, 3)
+        self.bands = {}
+        self.output = np.zeros(self.scaled_size, dtype=np.uint8)
+
+    def make_buffer(self, shape: Tuple[int, ...]) -> np.ndarray:
+        if self.canvas_path is None:
+            return np.zeros(shape)
+
+        # the file is removed when it is closed, but the mapping keeps the space until the buffer is released
+        makedirs(self.canvas_path, exist_ok=True)
+        with TemporaryFile(dir=self.canvas_path) as f:
+            return np.memmap(f, dtype=np.float64, mode="w+", shape=shape)
+
+    def get_band(self, band: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the blended values and their weights for a band of rows, starting a new band if needed.
+        """
+        if band not in self.bands:
+            rows = min(self.band_height, self.scaled_size[0] - band * self.band_height)
+            self.bands[band] = (
+                self.make_buffer((rows, self.scaled_size[1], 3)),
+                self.make_buffer((rows, self.scaled_size[1])),
+            )
+
+        return self.bands[band]
+
+    def add(self, left: int, top: int, tile_image: Image.Image) -> None:
+        scale = self.scale
+        tile = self.tile
 
-    for left, top, tile_image in tiles:
         # histogram equalization
         equalized = np.array(tile_image).astype(np.float32)
         mask = np.ones_like(equalized[:, :, 0])
 
-        if adj_tile < tile:
+        if self.adj_tile < tile:
             # sort gradient points
-            p1 = adj_tile * scale
-            p2 = (tile - adj_tile) * scale
+            p1 = self.adj_tile * scale
+            p2 = (tile - self.adj_tile) * scale
             points = [0, min(p1, p2), max(p1, p2), tile * scale]
 
             # gradient blending
-            grad_x, grad_y = get_tile_grads(left, top, adj_tile, width, height)
+            grad_x, grad_y = get_tile_grads(
+                left, top, self.adj_tile, self.width, self.height
+            )
             logger.debug("tile gradients: %s, %s, %s", points, grad_x, grad_y)
 
             mult_x = [np.interp(i, points, grad_x) for i in range(tile * scale)]
@@ -133,8 +407,8 @@ def blend_tiles(
 
         writable_top = max(scaled_top, 0)
         writable_left = max(scaled_left, 0)
-        writable_bottom = min(scaled_bottom, scaled_size[0])
-        writable_right = min(scaled_right, scaled_size[1])
+        writable_bottom = min(scaled_bottom, self.scaled_size[0])
+        writable_right = min(scaled_right, self.scaled_size[1])
 
         margin_top = writable_top - scaled_top
         margin_left = writable_left - scaled_left
@@ -153,29 +427,175 @@ def blend_tiles(
             equalized.shape[0] + margin_right,
         )
 
-        # accumulation
-        value[
-            writable_top:writable_bottom, writable_left:writable_right, :
-        ] += equalized[
-            margin_top : equalized.shape[0] + margin_bottom,
-            margin_left : equalized.shape[1] + margin_right,
-            :,
-        ]
-        count[
-            writable_top:writable_bottom, writable_left:writable_right, :
-        ] += np.repeat(
-            mask[
-                margin_top : equalized.shape[0] + margin_bottom,
+        # accumulation, split between the bands that the tile covers
+        if writable_bottom <= writable_top:
+            return
+
+        first_band = writable_top // self.band_height
+        last_band = (writable_bottom - 1) // self.band_height
+        for band in range(first_band, last_band + 1):
+            value, count = self.get_band(band)
+            band_top = band * self.band_height
+            rows_top = max(writable_top, band_top)
+            rows_bottom = min(writable_bottom, band_top + value.shape[0])
+
+            source_top = margin_top + rows_top - writable_top
+            source_bottom = source_top + rows_bottom - rows_top
+
+            value[
+                rows_top - band_top : rows_bottom - band_top,
+                writable_left:writable_right,
+                :,
+            ] += equalized[
+                source_top:source_bottom,
                 margin_left : equalized.shape[1] + margin_right,
-                np.newaxis,
-            ],
-            3,
-            axis=2,
+                :,
+            ]
+            count[
+                rows_top - band_top : rows_bottom - band_top,
+                writable_left:writable_right,
+            ] += mask[
+                source_top:source_bottom,
+                margin_left : equalized.shape[1] + margin_right,
+            ]
+
+    def complete(self, top: Optional[int] = None) -> None:
+        """
+        Convert the bands above the top edge of the remaining tiles into output pixels and release their buffers, or
+        every band when there are no tiles remaining.
+        """
+        for band in sorted(self.bands.keys()):
+            band_top = band * self.band_height
+            if top is not None and band_top + self.band_height > top * self.scale:
+                continue
+
+            value, count = self.bands.pop(band)
+            weight = count[:, :, np.newaxis]
+            logger.trace("mean tiles contributing to band %s: %s", band, np.mean(count))
+            pixels = np.where(weight > 0, value / weight, value)
+            self.output[band_top : band_top + value.shape[0]] = np.uint8(pixels)
+
+    def finish(self) -> Image.Image:
+        self.complete()
+        return Image.fromarray(self.output)
+
+
+def blend_tiles(
+    tiles: List[Tuple[int, int, Image.Image]],
+    scale: int,
+    width: int,
+    height: int,
+    tile: int,
+    overlap: float,
+):
+    accumulator = TileAccumulator(scale, width, height, tile, overlap)
+    for left, top, tile_image in tiles:
+        accumulator.add(left, top, tile_image)
+
+    return accumulator.finish()
+
+
+def run_tile_plan(
+    tiles: List[PlannedTile],
+    filters: List[TileCallback],
+    tile: int,
+    accumulator: TileAccumulator,
+    tile_runner: Optional[TileRunner] = None,
+    prepare_executor: Optional[Executor] = None,
+    blend_executor: Optional[Executor] = None,
+) -> Image.Image:
+    """
+    Prepare, run, and blend each tile in order. When executors are given, the next tiles are prepared and the
+    previous tiles are blended in the background while the current tile is running.
+    """
+    runner = tile_runner or run_tiles
+    pending = TileInputs(
+        [prepare for _left, _top, prepare, run in tiles if run],
+        executor=prepare_executor,
+    )
+    outputs = iter(runner(pending, filters, tile))
+
+    # the top edge of the highest tile after each one, so the accumulator can complete the bands above it
+    next_tops: List[Optional[int]] = [None] * len(tiles)
+    for index in reversed(range(len(tiles) - 1)):
+        next_top = tiles[index + 1][1]
+        following = next_tops[index + 1]
+        next_tops[index] = next_top if following is None else min(next_top, following)
+
+    def blend(left: int, top: int, tile_image: Image.Image, next_top: Optional[int]):
+        accumulator.add(left, top, tile_image)
+        if next_top is not None:
+            accumulator.complete(next_top)
+
+    blends: Deque[Future] = deque()
+    for (left, top, prepare, run), next_top in zip(tiles, next_tops):
+        if run:
+            tile_image = next(outputs)
+        else:
+            _left, _top, tile_image, _tile_mask = prepare()
+
+        if blend_executor is None:
+            blend(left, top, tile_image, next_top)
+            continue
+
+        blends.append(blend_executor.submit(blend, left, top, tile_image, next_top))
+        while len(blends) > TILE_QUEUE_SIZE:
+            blends.popleft().result()
+
+    while len(blends) > 0:
+        blends.popleft().result()
+
+    return accumulator.finish()
+
+
+def process_tiles(
+    tiles: List[PlannedTile],
+    filters: List[TileCallback],
+    tile: int,
+    accumulator: TileAccumulator,
+    tile_runner: Optional[TileRunner] = None,
+    tile_pipeline: bool = True,
+) -> Image.Image:
+    """
+    Run the filters on the planned tiles and blend them into the output image.
+
+    With the tile pipeline, each tile is cropped on one thread and blended on another, so the device does not need to
+    wait for the CPU between tiles. The tiles are still run and blended in order, so the output is the same either way.
+    """
+    if not tile_pipeline:
+        return run_tile_plan(tiles, filters, tile, accumulator, tile_runner)
+
+    with ThreadPoolExecutor(
+        1, thread_name_prefix="tile-prepare"
+    ) as prepare_executor, ThreadPoolExecutor(
+        1, thread_name_prefix="tile-blend"
+    ) as blend_executor:
+        return run_tile_plan(
+            tiles,
+            filters,
+            tile,
+            accumulator,
+            tile_runner,
+            prepare_executor=prepare_executor,
+            blend_executor=blend_executor,
         )
 
-    logger.trace("mean tiles contributing to each pixel: %s", np.mean(count))
-    pixels = np.where(count > 0, value / count, value)
-    return Image.fromarray(np.uint8(pixels))
+
+def prepare_grid_tile(
+    source: Optional[Image.Image],
+    mask: Optional[Image.Image],
+    left: int,
+    top: int,
+    tile: int,
+) -> TileInput:
+    tile_image = source.crop((left, top, left + tile, top + tile)) if source else None
+    tile_image = complete_tile(tile_image, tile)
+
+    tile_mask = None
+    if mask is not None:
+        tile_mask = complete_tile(mask.crop((left, top, left + tile, top + tile)), tile)
+
+    return (left, top, tile_image, tile_mask)
 
 
 def process_tile_grid(
@@ -184,9 +604,16 @@ def process_tile_grid(
     scale: int,
     filters: List[TileCallback],
     overlap: float = 0.0,
+    tile_runner: Optional[TileRunner] = None,
+    tile_pipeline: bool = True,
+    canvas_path: Optional[str] = None,
     **kwargs,
 ) -> Image.Image:
     width, height = kwargs.get("size", source.size if source else None)
+    mask = kwargs.get("mask", None)
+    plan = get_mask_plan(mask, scale, width, height) if source else None
+    if plan is not None and mask.size != (width, height):
+        mask = mask.resize((width, height), Image.Resampling.NEAREST)
 
     adj_tile = int(float(tile) * (1.0 - overlap))
     tiles_x = ceil(width / adj_tile)
@@ -201,26 +628,130 @@ def process_tile_grid(
         overlap,
     )
 
-    tiles: List[Tuple[int, int, Image.Image]] = []
+    tiles: List[PlannedTile] = []
+    skipped = 0
 
     for y in range(tiles_y):
         for x in range(tiles_x):
             idx = (y * tiles_x) + x
             left = x * adj_tile
             top = y * adj_tile
+
+            if plan is not None and not plan.covers(left, top, left + tile, top + tile):
+                logger.debug("skipping tile %s of %s outside of mask", idx + 1, total)
+                skipped += 1
+                prepare = partial(prepare_grid_tile, source, None, left, top, tile)
+                tiles.append((left, top, prepare, False))
+                continue
+
             logger.info("processing tile %s of %s, %s.%s", idx + 1, total, y, x)
+            prepare = partial(prepare_grid_tile, source, mask, left, top, tile)
+            tiles.append((left, top, prepare, True))
+
+    if skipped > 0:
+        logger.info("skipped %s of %s tiles outside of mask", skipped, total)
+
+    return process_tiles(
+        tiles,
+        filters,
+        tile,
+        TileAccumulator(scale, width, height, tile, overlap, canvas_path=canvas_path),
+        tile_runner=tile_runner,
+        tile_pipeline=tile_pipeline,
+    )
+
 
-            tile_image = (
-                source.crop((left, top, left + tile, top + tile)) if source else None
+def prepare_spiral_tile(
+    source: Optional[Image.Image],
+    mask: Optional[Image.Image],
+    left: int,
+    top: int,
+    tile: int,
+    width: int,
+    height: int,
+    single_tile: bool,
+    noise_source: Callable,
+    fill_color: Optional[str],
+) -> TileInput:
+    right = left + tile
+    bottom = top + tile
+    tile_mask = None
+
+    left_margin = right_margin = top_margin = bottom_margin = 0
+    needs_margin = False
+
+    if left < 0:
+        needs_margin = True
+        left_margin = 0 - left
+    if right > width:
+        needs_margin = True
+        right_margin = width - right
+    if top < 0:
+        needs_margin = True
+        top_margin = 0 - top
+    if bottom > height:
+        needs_margin = True
+        bottom_margin = height - bottom
+
+    # if no source given, we don't have a source image
+    if not source:
+        tile_image = None
+    elif needs_margin:
+        # in the special case where the image is smaller than the specified tile size, just use the image
+        if single_tile:
+            logger.debug("creating and processing single-tile subtile")
+            tile_image = source
+            if mask:
+                tile_mask = mask
+        # otherwise use add histogram noise outside of the image border
+        else:
+            logger.debug(
+                "tiling and adding margins: %s, %s, %s, %s",
+                left_margin,
+                top_margin,
+                right_margin,
+                bottom_margin,
             )
-            tile_image = complete_tile(tile_image, tile)
+            base_image = source.crop(
+                (
+                    left + left_margin,
+                    top + top_margin,
+                    right + right_margin,
+                    bottom + bottom_margin,
+                )
+            )
+            tile_image = noise_source(base_image, (tile, tile), (0, 0), fill=fill_color)
+            tile_image.paste(base_image, (left_margin, top_margin))
+
+            if mask:
+                base_mask = mask.crop(
+                    (
+                        left + left_margin,
+                        top + top_margin,
+                        right + right_margin,
+                        bottom + bottom_margin,
+                    )
+                )
+                tile_mask = Image.new("L", (tile, tile), color=0)
+                tile_mask.paste(base_mask, (left_margin, top_margin))
+
+    else:
+        logger.debug("tiling normally")
+        tile_image = source.crop((left, top, right, bottom))
+        if mask:
+            tile_mask = mask.crop((left, top, right, bottom))
+
+    return (left, top, tile_image, tile_mask)
 
-            for filter in filters:
-                tile_image = filter(tile_image, (left, top, tile))
 
-            tiles.append((left, top, tile_image))
+def prepare_skipped_tile(
+    source: Image.Image, left: int, top: int, tile: int, single_tile: bool
+) -> TileInput:
+    # tiles that the mask does not touch keep the source pixels, which are blended like any other tile
+    if single_tile:
+        return (left, top, source, None)
 
-    return blend_tiles(tiles, scale, width, height, tile, overlap)
+    return (left, top, source.crop((left, top, left + tile, top + tile)), None)
 
 
 def process_tile_spiral(
@@ -229,16 +760,22 @@ def process_tile_spiral(
     scale: int,
     filters: List[TileCallback],
     overlap: float = 0.5,
+    tile_runner: Optional[TileRunner] = None,
+    tile_pipeline: bool = True,
+    canvas_path: Optional[str] = None,
     **kwargs,
 ) -> Image.Image:
     width, height = kwargs.get("size", source.size if source else None)
     mask = kwargs.get("mask", None)
     noise_source = kwargs.get("noise_source", noise_source_histogram)
     fill_color = kwargs.get("fill_color", None)
-    if not mask:
-        tile_mask = None
 
-    tiles: List[Tuple[int, int, Image.Image]] = []
+    plan = get_mask_plan(mask, scale, width, height) if source else None
+    if plan is not None and mask.size != (width, height):
+        mask = mask.resize((width, height), Image.Resampling.NEAREST)
+
+    tiles: List[PlannedTile] = []
+    skipped = 0
 
     # tile tuples is source, multiply by scale for dest
     counter = 0
@@ -251,88 +788,57 @@ def process_tile_spiral(
 
     for left, top in tile_coords:
         counter += 1
-        logger.info(
-            "processing tile %s of %s, %sx%s", counter, len(tile_coords), left, top
-        )
-
         right = left + tile
         bottom = top + tile
 
-        left_margin = right_margin = top_margin = bottom_margin = 0
-        needs_margin = False
-
-        if left < 0:
-            needs_margin = True
-            left_margin = 0 - left
-        if right > width:
-            needs_margin = True
-            right_margin = width - right
-        if top < 0:
-            needs_margin = True
-            top_margin = 0 - top
-        if bottom > height:
-            needs_margin = True
-            bottom_margin = height - bottom
-
-        # if no source given, we don't have a source image
-        if not source:
-            tile_image = None
-        elif needs_margin:
-            # in the special case where the image is smaller than the specified tile size, just use the image
-            if single_tile:
-                logger.debug("creating and processing single-tile subtile")
-                tile_image = source
-                if mask:
-                    tile_mask = mask
-            # otherwise use add histogram noise outside of the image border
-            else:
-                logger.debug(
-                    "tiling and adding margins: %s, %s, %s, %s",
-                    left_margin,
-                    top_margin,
-                    right_margin,
-                    bottom_margin,
-                )
-                base_image = source.crop(
-                    (
-                        left + left_margin,
-                        top + top_margin,
-                        right + right_margin,
-                        bottom + bottom_margin,
-                    )
-                )
-                tile_image = noise_source(
-                    base_image, (tile, tile), (0, 0), fill=fill_color
-                )
-                tile_image.paste(base_image, (left_margin, top_margin))
-
-                if mask:
-                    base_mask = mask.crop(
-                        (
-                            left + left_margin,
-                            top + top_margin,
-                            right + right_margin,
-                            bottom + bottom_margin,
-                        )
-                    )
-                    tile_mask = Image.new("L", (tile, tile), color=0)
-                    tile_mask.paste(base_mask, (left_margin, top_margin))
-
-        else:
-            logger.debug("tiling normally")
-            tile_image = source.crop((left, top, right, bottom))
-            if mask:
-                tile_mask = mask.crop((left, top, right, bottom))
+        if plan is not None and not plan.covers(left, top, right, bottom):
+            logger.debug(
+                "skipping tile %s of %s outside of mask", counter, len(tile_coords)
+            )
+            skipped += 1
+            prepare = partial(
+                prepare_skipped_tile, source, left, top, tile, single_tile
+            )
+            tiles.append((left, top, prepare, False))
+            continue
 
-        for image_filter in filters:
-            tile_image = image_filter(tile_image, tile_mask, (left, top, tile))
+        logger.info(
+            "processing tile %s of %s, %sx%s", counter, len(tile_coords), left, top
+        )
+        prepare = partial(
+            prepare_spiral_tile,
+            source,
+            mask,
+            left,
+            top,
+            tile,
+            width,
+            height,
+            single_tile,
+            noise_source,
+            fill_color,
+        )
+        tiles.append((left, top, prepare, True))
 
-        tiles.append((left, top, tile_image))
+    if skipped > 0:
+        logger.info("skipped %s of %s tiles outside of mask", skipped, len(tile_coords))
 
     if single_tile:
-        return tile_image
-    else:
-        return blend_tiles(tiles, scale, width, height, tile, overlap)
+        _left, _top, prepare, run = tiles[0]
+        if not run:
+            return prepare()[2]
+
+        runner = tile_runner or run_tiles
+        return next(iter(runner(TileInputs([prepare]), filters, tile)))
+
+    return process_tiles(
+        tiles,
+        filters,
+        tile,
+        TileAccumulator(scale, width, height, tile, overlap, canvas_path=canvas_path),
+        tile_runner=tile_runner,
+        tile_pipeline=tile_pipeline,
+    )
 
 
 def process_tile_order(
@@ -96,8 +96,9 @@ def stage_upscale_correction(
 
     correct_stage: Optional[PipelineStage] = None
     if upscale.faces:
+        # faces are detected once on the whole image, rather than per tile
         face_params = StageParams(
-            tile_size=stage.tile_size, outscale=upscale.face_outscale
+            tile_size=SizeChart.hd64k, outscale=upscale.face_outscale
         )
         if upscale.correction_model is None:
             logger.warning("no correction model set, skipping")
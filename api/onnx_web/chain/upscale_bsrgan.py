@@ -10,6 +10,7 @@ from ..params import DeviceParams, ImageParams, Size, StageParams, UpscaleParams
 from ..server import ModelTypes, ServerContext
 from ..utils import run_gc
 from ..worker import WorkerContext
+from .result import FORMAT_NCHW_BGR
 from .stage import BaseStage
 
 logger = getLogger(__name__)
@@ -17,6 +18,10 @@ logger = getLogger(__name__)
 
 class UpscaleBSRGANStage(BaseStage):
     max_tile = 64
+    tile_locality = "tile"
+
+    input_format = FORMAT_NCHW_BGR
+    output_format = FORMAT_NCHW_BGR
 
     def load(
         self,
@@ -54,12 +59,12 @@ class UpscaleBSRGANStage(BaseStage):
         server: ServerContext,
         stage: StageParams,
         _params: ImageParams,
-        sources: List[Image.Image],
+        sources: List[np.ndarray],
         *,
         upscale: UpscaleParams,
         stage_source: Optional[Image.Image] = None,
         **kwargs,
-    ) -> List[Image.Image]:
+    ) -> List[np.ndarray]:
         upscale = upscale.with_args(**kwargs)
 
         if upscale.upscale_model is None:
@@ -72,30 +77,11 @@ class UpscaleBSRGANStage(BaseStage):
 
         outputs = []
         for source in sources:
-            image = np.array(source) / 255.0
-            image = image[:, :, [2, 1, 0]].astype(np.float32).transpose((2, 0, 1))
-            image = np.expand_dims(image, axis=0)
-            logger.trace("BSRGAN input shape: %s", image.shape)
-
-            scale = upscale.outscale
-            dest = np.zeros(
-                (
-                    image.shape[0],
-                    image.shape[1],
-                    image.shape[2] * scale,
-                    image.shape[3] * scale,
-                )
-            )
-            logger.trace("BSRGAN output shape: %s", dest.shape)
-
-            dest = bsrgan(image)
-
-            dest = np.clip(np.squeeze(dest, axis=0), 0, 1)
-            dest = dest[[2, 1, 0], :, :].transpose((1, 2, 0))
-            dest = (dest * 255.0).round().astype(np.uint8)
-
-            output = Image.fromarray(dest, "RGB")
-            logger.debug("output image size: %s x %s", output.width, output.height)
+            logger.trace("BSRGAN input shape: %s", source.shape)
+
+            # the output is converted back to an image by the pipeline, if the next stage needs one
+            output = np.clip(bsrgan(source), 0, 1)
+            logger.debug("output image shape: %s", output.shape)
 
             outputs.append(output)
 
@@ -4,7 +4,7 @@ from typing import List, Optional
 from PIL import Image
 
 from ..chain.highres import stage_highres
-from ..params import HighresParams, ImageParams, StageParams, UpscaleParams
+from ..params import HighresParams, ImageParams, Size, StageParams, UpscaleParams
 from ..server import ServerContext
 from ..worker import WorkerContext
 from ..worker.context import ProgressCallback
@@ -43,3 +43,23 @@ class UpscaleHighresStage(BaseStage):
             )
             for source in sources
         ]
+
+    def is_noop(
+        self, _params: ImageParams, highres: Optional[HighresParams] = None, **kwargs
+    ) -> bool:
+        if highres is None:
+            return False
+
+        return highres.scale <= 1 or not highres.enabled or highres.iterations < 1
+
+    def get_output_size(
+        self,
+        _stage: StageParams,
+        size: Size,
+        highres: Optional[HighresParams] = None,
+        **kwargs,
+    ) -> Size:
+        if highres is None or self.is_noop(None, highres=highres):
+            return size
+
+        return highres.resize(size)
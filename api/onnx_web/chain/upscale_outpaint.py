@@ -25,6 +25,7 @@ logger = getLogger(__name__)
 
 class UpscaleOutpaintStage(BaseStage):
     max_tile = SizeChart.unlimited
+    tile_locality = "band"
 
     def run(
         self,
@@ -10,6 +10,7 @@ from ..params import DeviceParams, ImageParams, StageParams, UpscaleParams
 from ..server import ModelTypes, ServerContext
 from ..utils import run_gc
 from ..worker import WorkerContext
+from .result import FORMAT_HWC_RGB
 from .stage import BaseStage
 
 logger = getLogger(__name__)
@@ -18,6 +19,10 @@ TAG_X4_V3 = "real-esrgan-x4-v3"
 
 
 class UpscaleRealESRGANStage(BaseStage):
+    input_format = FORMAT_HWC_RGB
+    output_format = FORMAT_HWC_RGB
+    tile_locality = "tile"
+
     def load(
         self, server: ServerContext, params: UpscaleParams, device: DeviceParams, tile=0
     ):
@@ -77,25 +82,23 @@ class UpscaleRealESRGANStage(BaseStage):
         server: ServerContext,
         stage: StageParams,
         _params: ImageParams,
-        sources: List[Image.Image],
+        sources: List[np.ndarray],
         *,
         upscale: UpscaleParams,
         stage_source: Optional[Image.Image] = None,
         **kwargs,
-    ) -> List[Image.Image]:
+    ) -> List[np.ndarray]:
         logger.info("upscaling image with Real ESRGAN: x%s", upscale.scale)
 
         outputs = []
         for source in sources:
-            output = np.array(source)
             upsampler = self.load(
                 server, upscale, worker.get_device(), tile=stage.tile_size
             )
 
-            output, _ = upsampler.enhance(output, outscale=upscale.outscale)
+            output, _ = upsampler.enhance(source, outscale=upscale.outscale)
 
-            output = Image.fromarray(output, "RGB")
-            logger.info("final output image size: %sx%s", output.width, output.height)
+            logger.info("final output image shape: %s", output.shape)
             outputs.append(output)
 
         return outputs
@@ -3,7 +3,7 @@ from typing import List, Optional
 
 from PIL import Image
 
-from ..params import ImageParams, StageParams, UpscaleParams
+from ..params import ImageParams, Size, StageParams, UpscaleParams
 from ..server import ServerContext
 from ..worker import WorkerContext
 from .stage import BaseStage
@@ -47,3 +47,18 @@ class UpscaleSimpleStage(BaseStage):
             outputs.append(source)
 
         return outputs
+
+    def is_noop(
+        self, _params: ImageParams, upscale: Optional[UpscaleParams] = None, **kwargs
+    ) -> bool:
+        return upscale is not None and upscale.scale <= 1
+
+    def get_output_size(
+        self,
+        _stage: StageParams,
+        size: Size,
+        upscale: Optional[UpscaleParams] = None,
+        **kwargs,
+    ) -> Size:
+        scale = 1 if upscale is None else max(upscale.scale, 1)
+        return Size(size.width * scale, size.height * scale)
@@ -16,6 +16,8 @@ logger = getLogger(__name__)
 
 
 class UpscaleStableDiffusionStage(BaseStage):
+    tile_locality = "band"
+
     def run(
         self,
         worker: WorkerContext,
@@ -1,2 +1,5 @@
 ONNX_MODEL = "model.onnx"
 ONNX_WEIGHTS = "weights.pb"
+
+# extensions for LoRA and Textual Inversion tensors, in the order they are checked
+RESOLVE_FORMATS = ["safetensors", "ckpt", "pt", "bin"]
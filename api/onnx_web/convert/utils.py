@@ -9,15 +9,18 @@ import requests
 import safetensors
 import torch
 from huggingface_hub.utils.tqdm import tqdm
-from onnx import load_model, save_model
-from onnx.shape_inference import infer_shapes_path
-from onnxruntime.transformers.float16 import convert_float_to_float16
+from onnx import save_model
 from packaging import version
 from torch.onnx import export
 
-from ..constants import ONNX_WEIGHTS
+from ..constants import ONNX_WEIGHTS, RESOLVE_FORMATS
 from ..errors import RequestException
 from ..server import ServerContext
+from ..server.precision import (
+    convert_model_fp16,
+    get_model_precision,
+    save_model_precision,
+)
 from ..utils import get_boolean
 
 logger = getLogger(__name__)
@@ -185,7 +188,6 @@ def tuple_to_upscaling(model: Union[ModelDict, LegacyModel]):
 
 
 MODEL_FORMATS = ["onnx", "pth", "ckpt", "safetensors"]
-RESOLVE_FORMATS = ["safetensors", "ckpt", "pt", "bin"]
 
 
 def source_format(model: Dict) -> Optional[str]:
@@ -316,21 +318,9 @@ def onnx_export(
         opset_version=opset,
     )
 
-    op_block_list = None
-    if v2:
-        op_block_list = ["Attention", "MultiHeadAttention"]
-
     if half:
         logger.info("converting model to fp16 internally: %s", output_file)
-        infer_shapes_path(output_file)
-        base_model = load_model(output_file)
-        opt_model = convert_float_to_float16(
-            base_model,
-            disable_shape_infer=True,
-            force_fp16_initializers=True,
-            keep_io_types=True,
-            op_block_list=op_block_list,
-        )
+        opt_model = convert_model_fp16(output_file, v2=v2)
         save_model(
             opt_model,
             f"{output_file}",
@@ -338,3 +328,6 @@ def onnx_export(
             all_tensors_to_one_file=True,
             location=ONNX_WEIGHTS,
         )
+    else:
+        # record the precision, so the server does not need to check the weights later
+        save_model_precision(output_file, get_model_precision(output_file))
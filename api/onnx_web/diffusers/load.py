@@ -17,8 +17,12 @@ from ..diffusers.pipelines.upscale import OnnxStableDiffusionUpscalePipeline
 from ..diffusers.utils import expand_prompt
 from ..params import DeviceParams, ImageParams
 from ..server import ModelTypes, ServerContext
+from ..server.session_cache import load_session
 from ..torch_before_ort import InferenceSession
 from ..utils import run_gc
+from .names import get_available_pipelines, get_pipeline_schedulers  # NOQA
+from .patches.controlnet import ControlNetBinding
+from .patches.text_encoder import TextEncoderWrapper
 from .patches.unet import UNetWrapper
 from .patches.vae import VAEWrapper
 from .pipelines.controlnet import OnnxStableDiffusionControlNetPipeline
@@ -26,6 +30,13 @@ from .pipelines.lpw import OnnxStableDiffusionLongPromptWeightingPipeline
 from .pipelines.panorama import OnnxStableDiffusionPanoramaPipeline
 from .pipelines.panorama_xl import ORTStableDiffusionXLPanoramaPipeline
 from .pipelines.pix2pix import OnnxStableDiffusionInstructPix2PixPipeline
+from .schedulers.ddim import NumpyDDIMScheduler
+from .schedulers.dpm import NumpyDPMSolverMultistepScheduler
+from .schedulers.euler import (
+    NumpyEulerAncestralDiscreteScheduler,
+    NumpyEulerDiscreteScheduler,
+)
+from .schedulers.unipc import NumpyUniPCMultistepScheduler
 from .version_safe_diffusers import (
     DDIMScheduler,
     DDPMScheduler,
@@ -84,13 +95,14 @@ pipeline_schedulers = {
     "unipc-multi": UniPCMultistepScheduler,
 }
 
-
-def get_available_pipelines() -> List[str]:
-    return list(available_pipelines.keys())
-
-
-def get_pipeline_schedulers() -> List[str]:
-    return list(pipeline_schedulers.keys())
+# schedulers that can step with NumPy, without converting the latents to and from Torch
+numpy_schedulers = {
+    "ddim": NumpyDDIMScheduler,
+    "dpm-multi": NumpyDPMSolverMultistepScheduler,
+    "euler": NumpyEulerDiscreteScheduler,
+    "euler-a": NumpyEulerAncestralDiscreteScheduler,
+    "unipc-multi": NumpyUniPCMultistepScheduler,
+}
 
 
 def get_scheduler_name(scheduler: Any) -> Optional[str]:
@@ -98,9 +110,23 @@ def get_scheduler_name(scheduler: Any) -> Optional[str]:
         if scheduler == v or scheduler == v.__name__:
             return k
 
+    for k, v in numpy_schedulers.items():
+        if scheduler == v or scheduler == v.__name__:
+            return k
+
     return None
 
 
+def get_scheduler_type(server: ServerContext, scheduler: str) -> Any:
+    if (
+        "diffusers-numpy-schedulers" in server.optimizations
+        and scheduler in numpy_schedulers
+    ):
+        return numpy_schedulers[scheduler]
+
+    return pipeline_schedulers[scheduler]
+
+
 def load_pipeline(
     server: ServerContext,
     params: ImageParams,
@@ -128,7 +154,7 @@ def load_pipeline(
         loras,
     )
     scheduler_key = (params.scheduler, model)
-    scheduler_type = pipeline_schedulers[params.scheduler]
+    scheduler_type = get_scheduler_type(server, params.scheduler)
 
     cache_pipe = server.cache.get(ModelTypes.diffusion, pipe_key)
 
@@ -182,11 +208,7 @@ def load_pipeline(
             )
             logger.debug("loading ControlNet weights from %s", cnet_path)
             components["controlnet"] = OnnxRuntimeModel(
-                OnnxRuntimeModel.load_model(
-                    cnet_path,
-                    provider=device.ort_provider(),
-                    sess_options=device.sess_options(),
-                )
+                load_session(server, device, cnet_path, "controlnet")
             )
 
             unet_type = "cnet"
@@ -257,7 +279,9 @@ def load_pipeline(
                 text_encoder
             )
             text_encoder_names, text_encoder_values = zip(*text_encoder_data)
-            text_encoder_opts = device.sess_options(cache=False)
+            text_encoder_opts = device.sess_options(
+                cache=False, model_type="text-encoder"
+            )
             text_encoder_opts.add_external_initializers(
                 list(text_encoder_names), list(text_encoder_values)
             )
@@ -293,7 +317,9 @@ def load_pipeline(
                     text_encoder_2
                 )
                 text_encoder_2_names, text_encoder_2_values = zip(*text_encoder_2_data)
-                text_encoder_2_opts = device.sess_options(cache=False)
+                text_encoder_2_opts = device.sess_options(
+                    cache=False, model_type="text-encoder"
+                )
                 text_encoder_2_opts.add_external_initializers(
                     list(text_encoder_2_names), list(text_encoder_2_values)
                 )
@@ -342,11 +368,19 @@ def load_pipeline(
             unet = path.join(model, unet_type, ONNX_MODEL)
             logger.debug("loading UNet (%s) from %s", unet_type, unet)
             components["unet"] = OnnxRuntimeModel(
-                OnnxRuntimeModel.load_model(
-                    unet,
-                    provider=device.ort_provider("unet"),
-                    sess_options=device.sess_options(),
-                )
+                load_session(server, device, unet, "unet")
+            )
+
+        # load the text encoder here, rather than in the pipeline, so it can use the session cache
+        text_encoder_path = path.join(model, "text_encoder", ONNX_MODEL)
+        if (
+            not params.is_xl()
+            and "text_encoder" not in components
+            and path.exists(text_encoder_path)
+        ):
+            logger.debug("loading text encoder from %s", text_encoder_path)
+            components["text_encoder"] = OnnxRuntimeModel(
+                load_session(server, device, text_encoder_path, "text-encoder")
             )
 
         # one or more VAE models need to be loaded
@@ -357,31 +391,19 @@ def load_pipeline(
         if not params.is_xl() and path.exists(vae):
             logger.debug("loading VAE from %s", vae)
             components["vae"] = OnnxRuntimeModel(
-                OnnxRuntimeModel.load_model(
-                    vae,
-                    provider=device.ort_provider("vae"),
-                    sess_options=device.sess_options(),
-                )
+                load_session(server, device, vae, "vae")
             )
         elif (
             not params.is_xl() and path.exists(vae_decoder) and path.exists(vae_encoder)
         ):
             logger.debug("loading VAE decoder from %s", vae_decoder)
             components["vae_decoder"] = OnnxRuntimeModel(
-                OnnxRuntimeModel.load_model(
-                    vae_decoder,
-                    provider=device.ort_provider("vae"),
-                    sess_options=device.sess_options(),
-                )
+                load_session(server, device, vae_decoder, "vae")
             )
 
             logger.debug("loading VAE encoder from %s", vae_encoder)
             components["vae_encoder"] = OnnxRuntimeModel(
-                OnnxRuntimeModel.load_model(
-                    vae_encoder,
-                    provider=device.ort_provider("vae"),
-                    sess_options=device.sess_options(),
-                )
+                load_session(server, device, vae_encoder, "vae")
             )
 
         # additional options for panorama pipeline
@@ -523,11 +545,27 @@ def patch_pipeline(
     if params.is_lpw():
         pipe._encode_prompt = expand_prompt.__get__(pipe, pipeline)
 
+    latent_dtype = None
     if not params.is_xl():
         original_unet = pipe.unet
         pipe.unet = UNetWrapper(server, original_unet)
+        latent_dtype = pipe.unet.sample_dtype
         logger.debug("patched UNet with wrapper")
 
+        if getattr(pipe, "text_encoder", None) is not None:
+            original_encoder = pipe.text_encoder
+            pipe.text_encoder = TextEncoderWrapper(
+                server, original_encoder, pipe.unet.hidden_states_dtype
+            )
+            logger.debug("patched text encoder with wrapper")
+
+    if hasattr(pipe, "controlnet") and "onnx-iobinding" in server.optimizations:
+        pipe.controlnet_binding = ControlNetBinding.from_sessions(
+            pipe.controlnet.model, pipe.unet.model
+        )
+        if pipe.controlnet_binding is not None:
+            logger.debug("patched ControlNet and UNet with IO binding")
+
     if hasattr(pipe, "vae_decoder"):
         original_decoder = pipe.vae_decoder
         pipe.vae_decoder = VAEWrapper(
@@ -547,6 +585,7 @@ def patch_pipeline(
             decoder=False,
             window=params.tiles,
             overlap=params.overlap,
+            output_dtype=latent_dtype,
         )
         logger.debug("patched VAE encoder with wrapper")
 
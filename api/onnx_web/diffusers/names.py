@@ -0,0 +1,43 @@
+from typing import List
+
+# these must match the keys of `available_pipelines` and `pipeline_schedulers` in `load.py`, and are kept here
+# so the server can validate requests without importing the pipelines
+available_pipeline_names = [
+    "controlnet",
+    "img2img",
+    "img2img-sdxl",
+    "inpaint",
+    "lpw",
+    "panorama",
+    "panorama-sdxl",
+    "pix2pix",
+    "txt2img-sdxl",
+    "txt2img",
+    "upscale",
+]
+
+pipeline_scheduler_names = [
+    "ddim",
+    "ddpm",
+    "deis-multi",
+    "dpm-multi",
+    "dpm-single",
+    "euler",
+    "euler-a",
+    "heun",
+    "ipndm",
+    "k-dpm-2-a",
+    "k-dpm-2",
+    "karras-ve",
+    "lms-discrete",
+    "pndm",
+    "unipc-multi",
+]
+
+
+def get_available_pipelines() -> List[str]:
+    return list(available_pipeline_names)
+
+
+def get_pipeline_schedulers() -> List[str]:
+    return list(pipeline_scheduler_names)
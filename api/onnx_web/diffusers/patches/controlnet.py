@@ -0,0 +1,223 @@
+from logging import getLogger
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from diffusers.pipelines.onnx_utils import ORT_TO_NP_TYPE
+from onnx import TensorProto, helper
+
+from ...torch_before_ort import InferenceSession, OrtValue
+
+logger = getLogger(__name__)
+
+CONTROLNET_RESIDUALS = 13
+
+# providers that can keep OrtValues on the device, and the device type used for them
+BINDING_DEVICES = {
+    "CUDAExecutionProvider": "cuda",
+    "ROCMExecutionProvider": "cuda",
+}
+
+NP_TO_ONNX_TYPE = {
+    np.dtype(np.float16): TensorProto.FLOAT16,
+    np.dtype(np.float32): TensorProto.FLOAT,
+}
+
+UNET_RESIDUALS = [f"down_block_{i}" for i in range(CONTROLNET_RESIDUALS - 1)] + [
+    "mid_block_additional_residual"
+]
+
+
+def make_scale_model(count: int, dtype: np.dtype) -> bytes:
+    """
+    Make an ONNX model that multiplies each of its inputs by a scalar scale.
+
+    This is used to apply the ControlNet conditioning scale to the residuals without copying them back to the host.
+    """
+    elem_type = NP_TO_ONNX_TYPE[np.dtype(dtype)]
+    inputs = [
+        helper.make_tensor_value_info(f"input_{i}", elem_type, None)
+        for i in range(count)
+    ]
+    outputs = [
+        helper.make_tensor_value_info(f"output_{i}", elem_type, None)
+        for i in range(count)
+    ]
+    scale = helper.make_tensor_value_info("scale", elem_type, [])
+    nodes = [
+        helper.make_node("Mul", [f"input_{i}", "scale"], [f"output_{i}"])
+        for i in range(count)
+    ]
+
+    graph = helper.make_graph(nodes, "controlnet_scale", [*inputs, scale], outputs)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 14)])
+    model.ir_version = 8
+    return model.SerializeToString()
+
+
+def get_binding_device(session: InferenceSession) -> Optional[Tuple[str, int]]:
+    provider = session.get_providers()[0]
+    if provider not in BINDING_DEVICES:
+        return None
+
+    options = session.get_provider_options().get(provider, {})
+    return (BINDING_DEVICES[provider], int(options.get("device_id", 0)))
+
+
+class ControlNetBinding:
+    """
+    Run the ControlNet and UNet with IO binding, passing the residuals from one to the other on the device.
+
+    The conditioning image and prompt embeds are only copied to the device when they change, and only the UNet
+    output is copied back to the host.
+    """
+
+    controlnet: InferenceSession
+    unet: InferenceSession
+    device_type: str
+    device_id: int
+
+    constants: Dict[str, Tuple[np.ndarray, OrtValue]]
+    scale_sessions: Dict[np.dtype, InferenceSession]
+
+    def __init__(
+        self,
+        controlnet: InferenceSession,
+        unet: InferenceSession,
+        device_type: str,
+        device_id: int = 0,
+    ) -> None:
+        self.controlnet = controlnet
+        self.unet = unet
+        self.device_type = device_type
+        self.device_id = device_id
+
+        self.constants = {}
+        self.scale_sessions = {}
+        self.controlnet_outputs = [output.name for output in controlnet.get_outputs()]
+        self.unet_output = unet.get_outputs()[0].name
+        self.residual_dtype = np.dtype(ORT_TO_NP_TYPE[controlnet.get_outputs()[0].type])
+
+    @classmethod
+    def from_sessions(
+        cls, controlnet: InferenceSession, unet: InferenceSession
+    ) -> Optional["ControlNetBinding"]:
+        """
+        Create a binding if both sessions are running on the same device, otherwise return None.
+        """
+        controlnet_device = get_binding_device(controlnet)
+        unet_device = get_binding_device(unet)
+
+        if controlnet_device is None or controlnet_device != unet_device:
+            logger.debug(
+                "ControlNet and UNet are not on the same GPU, cannot bind residuals: %s, %s",
+                controlnet.get_providers(),
+                unet.get_providers(),
+            )
+            return None
+
+        if len(controlnet.get_outputs()) != CONTROLNET_RESIDUALS:
+            logger.debug("ControlNet has an unexpected number of outputs")
+            return None
+
+        logger.debug("binding ControlNet residuals on device: %s", controlnet_device)
+        return cls(controlnet, unet, *controlnet_device)
+
+    def to_device(self, value: np.ndarray) -> OrtValue:
+        return OrtValue.ortvalue_from_numpy(
+            np.ascontiguousarray(value), self.device_type, self.device_id
+        )
+
+    def get_constant(self, name: str, value: np.ndarray) -> OrtValue:
+        """
+        Get a device copy of an input that usually does not change between steps, copying it only when it does.
+        """
+        cached = self.constants.get(name, None)
+        if cached is not None and cached[0] is value:
+            return cached[1]
+
+        logger.trace("copying %s to device", name)
+        device_value = self.to_device(value)
+        self.constants[name] = (value, device_value)
+        return device_value
+
+    def get_scale_session(self, dtype: np.dtype) -> InferenceSession:
+        if dtype not in self.scale_sessions:
+            self.scale_sessions[dtype] = InferenceSession(
+                make_scale_model(CONTROLNET_RESIDUALS, dtype),
+                providers=self.controlnet.get_providers(),
+                provider_options=[
+                    self.controlnet.get_provider_options()[provider]
+                    for provider in self.controlnet.get_providers()
+                ],
+            )
+
+        return self.scale_sessions[dtype]
+
+    def scale(self, residuals: List[OrtValue], scale: float) -> List[OrtValue]:
+        if scale == 1.0:
+            return residuals
+
+        session = self.get_scale_session(self.residual_dtype)
+        binding = session.io_binding()
+        for i, residual in enumerate(residuals):
+            binding.bind_ortvalue_input(f"input_{i}", residual)
+            binding.bind_output(f"output_{i}", self.device_type, self.device_id)
+
+        binding.bind_cpu_input("scale", np.array(scale, dtype=self.residual_dtype))
+        session.run_with_iobinding(binding)
+        return binding.get_outputs()
+
+    def __call__(
+        self,
+        sample: np.ndarray,
+        timestep: np.ndarray,
+        encoder_hidden_states: np.ndarray,
+        controlnet_cond: np.ndarray,
+        conditioning_scale: float,
+        unet_sample: Optional[np.ndarray] = None,
+        unet_hidden_states: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Run one step of the ControlNet and UNet and return the noise prediction.
+
+        The UNet inputs default to the ControlNet inputs, but can be provided separately if they have been
+        converted or replaced.
+        """
+        sample_value = self.to_device(sample)
+
+        controlnet = self.controlnet.io_binding()
+        controlnet.bind_ortvalue_input("sample", sample_value)
+        controlnet.bind_cpu_input("timestep", timestep)
+        controlnet.bind_ortvalue_input(
+            "encoder_hidden_states",
+            self.get_constant("controlnet_hidden_states", encoder_hidden_states),
+        )
+        controlnet.bind_ortvalue_input(
+            "controlnet_cond", self.get_constant("controlnet_cond", controlnet_cond)
+        )
+        for name in self.controlnet_outputs:
+            controlnet.bind_output(name, self.device_type, self.device_id)
+
+        self.controlnet.run_with_iobinding(controlnet)
+        residuals = self.scale(controlnet.get_outputs(), conditioning_scale)
+
+        if unet_sample is not None and unet_sample is not sample:
+            sample_value = self.to_device(unet_sample)
+
+        if unet_hidden_states is None:
+            unet_hidden_states = encoder_hidden_states
+
+        unet = self.unet.io_binding()
+        unet.bind_ortvalue_input("sample", sample_value)
+        unet.bind_cpu_input("timestep", timestep)
+        unet.bind_ortvalue_input(
+            "encoder_hidden_states",
+            self.get_constant("unet_hidden_states", unet_hidden_states),
+        )
+        for name, residual in zip(UNET_RESIDUALS, residuals):
+            unet.bind_ortvalue_input(name, residual)
+
+        unet.bind_output(self.unet_output)
+        self.unet.run_with_iobinding(unet)
+
+        return unet.get_outputs()[0].numpy()
@@ -0,0 +1,49 @@
+from logging import getLogger
+
+import numpy as np
+from diffusers import OnnxRuntimeModel
+
+from ...server import ServerContext
+
+logger = getLogger(__name__)
+
+
+class TextEncoderWrapper(object):
+    """
+    Convert the text encoder outputs to the dtype used by the UNet.
+
+    The pipelines create the latents with the same dtype as the prompt embeds, so converting the embeds once here
+    keeps the latents in the UNet dtype and avoids converting them again on every step.
+    """
+
+    dtype: np.dtype
+    server: ServerContext
+    wrapped: OnnxRuntimeModel
+
+    def __init__(
+        self,
+        server: ServerContext,
+        wrapped: OnnxRuntimeModel,
+        dtype: np.dtype,
+    ):
+        self.server = server
+        self.wrapped = wrapped
+        self.dtype = dtype
+
+    def __call__(self, **kwargs):
+        outputs = self.wrapped(**kwargs)
+        logger.trace(
+            "text encoder output types: %s", [output.dtype for output in outputs]
+        )
+
+        return [
+            (
+                output.astype(self.dtype, copy=False)
+                if np.issubdtype(output.dtype, np.floating)
+                else output
+            )
+            for output in outputs
+        ]
+
+    def __getattr__(self, attr):
+        return getattr(self.wrapped, attr)
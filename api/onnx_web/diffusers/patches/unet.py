@@ -1,15 +1,17 @@
 from logging import getLogger
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 from diffusers import OnnxRuntimeModel
 
 from ...server import ServerContext
+from ...server.precision import get_input_types
 
 logger = getLogger(__name__)
 
 
 class UNetWrapper(object):
+    input_types: Dict[str, np.dtype]
     prompt_embeds: Optional[List[np.ndarray]] = None
     prompt_index: int = 0
     server: ServerContext
@@ -22,6 +24,15 @@ class UNetWrapper(object):
     ):
         self.server = server
         self.wrapped = wrapped
+        self.input_types = get_input_types(wrapped.model)
+
+    @property
+    def hidden_states_dtype(self) -> np.dtype:
+        return self.input_types.get("encoder_hidden_states", np.dtype(np.float32))
+
+    @property
+    def sample_dtype(self) -> np.dtype:
+        return self.input_types.get("sample", np.dtype(np.float32))
 
     def __call__(
         self,
@@ -30,6 +41,29 @@ class UNetWrapper(object):
         encoder_hidden_states: np.ndarray = None,
         **kwargs,
     ):
+        sample, timestep, encoder_hidden_states = self.prepare_inputs(
+            sample, timestep, encoder_hidden_states
+        )
+
+        return self.wrapped(
+            sample=sample,
+            timestep=timestep,
+            encoder_hidden_states=encoder_hidden_states,
+            **kwargs,
+        )
+
+    def prepare_inputs(
+        self,
+        sample: np.ndarray,
+        timestep: np.ndarray,
+        encoder_hidden_states: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Select the prompt embeds for this step and convert the inputs to the dtypes the model expects.
+
+        This advances the prompt index and should be called once per step. The text encoder outputs and prompt
+        embeds are converted when they are created, so the inputs should already match and this is only a fallback.
+        """
         logger.trace(
             "UNet parameter types: %s, %s, %s",
             sample.dtype,
@@ -43,20 +77,19 @@ class UNetWrapper(object):
             encoder_hidden_states = self.prompt_embeds[step_index]
             self.prompt_index += 1
 
-        if sample.dtype != timestep.dtype:
-            logger.trace("converting UNet sample to timestep dtype")
-            sample = sample.astype(timestep.dtype)
+        if sample.dtype != self.sample_dtype:
+            logger.trace("converting UNet sample to %s", self.sample_dtype)
+            sample = sample.astype(self.sample_dtype)
 
-        if encoder_hidden_states.dtype != timestep.dtype:
-            logger.trace("converting UNet hidden states to timestep dtype")
-            encoder_hidden_states = encoder_hidden_states.astype(timestep.dtype)
+        if encoder_hidden_states.dtype != self.hidden_states_dtype:
+            logger.trace(
+                "converting UNet hidden states to %s", self.hidden_states_dtype
+            )
+            encoder_hidden_states = encoder_hidden_states.astype(
+                self.hidden_states_dtype
+            )
 
-        return self.wrapped(
-            sample=sample,
-            timestep=timestep,
-            encoder_hidden_states=encoder_hidden_states,
-            **kwargs,
-        )
+        return (sample, timestep, encoder_hidden_states)
 
     def __getattr__(self, attr):
         return getattr(self.wrapped, attr)
@@ -65,5 +98,7 @@ class UNetWrapper(object):
         logger.debug(
             "setting prompt embeds for UNet: %s", [p.shape for p in prompt_embeds]
         )
-        self.prompt_embeds = prompt_embeds
+        self.prompt_embeds = [
+            p.astype(self.hidden_states_dtype, copy=False) for p in prompt_embeds
+        ]
         self.prompt_index = 0
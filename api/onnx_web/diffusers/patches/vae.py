@@ -1,14 +1,14 @@
 from logging import getLogger
-from typing import Union
+from typing import Optional, Union
 
 import numpy as np
 import torch
 from diffusers import OnnxRuntimeModel
 from diffusers.models.autoencoder_kl import AutoencoderKLOutput
 from diffusers.models.vae import DecoderOutput
-from diffusers.pipelines.onnx_utils import ORT_TO_NP_TYPE
 
 from ...server import ServerContext
+from ...server.precision import get_input_types
 
 logger = getLogger(__name__)
 
@@ -23,13 +23,21 @@ class VAEWrapper(object):
         decoder: bool,
         window: int,
         overlap: float,
+        output_dtype: Optional[np.dtype] = None,
     ):
         self.server = server
         self.wrapped = wrapped
         self.decoder = decoder
+        self.output_dtype = output_dtype
         self.tiled = False
         self.set_window_size(window, overlap)
 
+        model = wrapped.model if hasattr(wrapped, "model") else wrapped.session
+        input_types = get_input_types(model)
+        self.sample_dtype = input_types.get(
+            "latent_sample" if decoder else "sample", np.dtype(np.float32)
+        )
+
     def set_tiled(self, tiled: bool = True):
         self.tiled = tiled
 
@@ -39,22 +47,7 @@ class VAEWrapper(object):
         self.tile_overlap_factor = overlap
 
     def __call__(self, latent_sample=None, sample=None, **kwargs):
-        model = (
-            self.wrapped.model
-            if hasattr(self.wrapped, "model")
-            else self.wrapped.session
-        )
-
-        # set timestep dtype to input type
-        sample_dtype = next(
-            (
-                input.type
-                for input in model.get_inputs()
-                if input.name == "sample" or input.name == "latent_sample"
-            ),
-            "tensor(float)",
-        )
-        sample_dtype = ORT_TO_NP_TYPE[sample_dtype]
+        sample_dtype = self.sample_dtype
 
         logger.trace(
             "VAE %s parameter types: %s, %s",
@@ -80,11 +73,18 @@ class VAEWrapper(object):
             if self.decoder:
                 return self.wrapped(latent_sample=latent_sample)
             else:
-                return self.wrapped(sample=sample)
+                return self.cast_outputs(self.wrapped(sample=sample))
 
     def __getattr__(self, attr):
         return getattr(self.wrapped, attr)
 
+    def cast_outputs(self, outputs):
+        # encode to the dtype used by the UNet, so the latents do not need to be converted on every step
+        if self.output_dtype is None:
+            return outputs
+
+        return [output.astype(self.output_dtype, copy=False) for output in outputs]
+
     def blend_v(self, a, b, blend_extent):
         for y in range(min(a.shape[2], b.shape[2], blend_extent)):
             b[:, :, y, :] = a[:, :, -blend_extent + y, :] * (1 - y / blend_extent) + b[
@@ -148,6 +148,9 @@ class VAEWrapper(object):
             result_rows.append(torch.cat(result_row, dim=3))
 
         moments = torch.cat(result_rows, dim=2).numpy()
+        if self.output_dtype is not None:
+            moments = moments.astype(self.output_dtype, copy=False)
+
         if not return_dict:
             return (moments,)
 
@@ -7,7 +7,7 @@
 # Special thanks to https://github.com/uchuusen for the initial conversion effort
 
 import inspect
-from typing import Callable, List, Optional, Union
+from typing import Callable, List, Optional, Tuple, Union
 
 import numpy as np
 import PIL
@@ -20,6 +20,9 @@ from diffusers.schedulers import DDIMScheduler, LMSDiscreteScheduler, PNDMSchedu
 from diffusers.utils import PIL_INTERPOLATION, deprecate, logging
 from transformers import CLIPTokenizer
 
+from ..patches.controlnet import ControlNetBinding
+from ..schedulers.base import get_scheduler_input, to_numpy
+
 logger = logging.get_logger(__name__)
 
 
@@ -31,6 +34,7 @@ class OnnxStableDiffusionControlNetPipeline(DiffusionPipeline):
     unet: OnnxRuntimeModel
     controlnet: OnnxRuntimeModel
     scheduler: Union[DDIMScheduler, PNDMScheduler, LMSDiscreteScheduler]
+    controlnet_binding: Optional[ControlNetBinding] = None
 
     def __init__(
         self,
@@ -289,6 +293,18 @@ class OnnxStableDiffusionControlNetPipeline(DiffusionPipeline):
 
         return prompt_embeds
 
+    def prepare_unet_inputs(
+        self,
+        sample: np.ndarray,
+        timestep: np.ndarray,
+        encoder_hidden_states: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # the UNet wrapper selects the prompt for each step, which needs to happen before binding
+        if hasattr(self.unet, "prepare_inputs"):
+            return self.unet.prepare_inputs(sample, timestep, encoder_hidden_states)
+
+        return (sample, timestep, encoder_hidden_states)
+
     def __call__(
         self,
         prompt: Union[str, List[str]],
@@ -406,49 +422,67 @@ class OnnxStableDiffusionControlNetPipeline(DiffusionPipeline):
                     else latents
                 )
                 latent_model_input = self.scheduler.scale_model_input(
-                    torch.from_numpy(latent_model_input), t
+                    get_scheduler_input(self.scheduler, latent_model_input), t
                 )
-                latent_model_input = latent_model_input.cpu().numpy()
+                latent_model_input = to_numpy(latent_model_input)
 
                 timestep = np.array([t], dtype=timestep_dtype)
 
-                blocksamples = self.controlnet(
-                    sample=latent_model_input,
-                    timestep=timestep,
-                    encoder_hidden_states=prompt_embeds,
-                    controlnet_cond=image,
-                )
-
-                mid_block_res_sample = blocksamples[12]
-                down_block_res_samples = blocksamples[0:12]
+                if self.controlnet_binding is not None:
+                    (
+                        unet_sample,
+                        _unet_timestep,
+                        unet_hidden_states,
+                    ) = self.prepare_unet_inputs(
+                        latent_model_input, timestep, prompt_embeds
+                    )
+                    noise_pred = self.controlnet_binding(
+                        latent_model_input,
+                        timestep,
+                        prompt_embeds,
+                        image,
+                        controlnet_conditioning_scale,
+                        unet_sample=unet_sample,
+                        unet_hidden_states=unet_hidden_states,
+                    )
+                else:
+                    blocksamples = self.controlnet(
+                        sample=latent_model_input,
+                        timestep=timestep,
+                        encoder_hidden_states=prompt_embeds,
+                        controlnet_cond=image,
+                    )
 
-                down_block_res_samples = [
-                    down_block_res_sample * controlnet_conditioning_scale
-                    for down_block_res_sample in down_block_res_samples
-                ]
-                mid_block_res_sample *= controlnet_conditioning_scale
-
-                # predict the noise residual
-
-                noise_pred = self.unet(
-                    sample=latent_model_input,
-                    timestep=timestep,
-                    encoder_hidden_states=prompt_embeds,
-                    down_block_0=down_block_res_samples[0],
-                    down_block_1=down_block_res_samples[1],
-                    down_block_2=down_block_res_samples[2],
-                    down_block_3=down_block_res_samples[3],
-                    down_block_4=down_block_res_samples[4],
-                    down_block_5=down_block_res_samples[5],
-                    down_block_6=down_block_res_samples[6],
-                    down_block_7=down_block_res_samples[7],
-                    down_block_8=down_block_res_samples[8],
-                    down_block_9=down_block_res_samples[9],
-                    down_block_10=down_block_res_samples[10],
-                    down_block_11=down_block_res_samples[11],
-                    mid_block_additional_residual=mid_block_res_sample,
-                )
-                noise_pred = noise_pred[0]
+                    mid_block_res_sample = blocksamples[12]
+                    down_block_res_samples = blocksamples[0:12]
+
+                    down_block_res_samples = [
+                        down_block_res_sample * controlnet_conditioning_scale
+                        for down_block_res_sample in down_block_res_samples
+                    ]
+                    mid_block_res_sample *= controlnet_conditioning_scale
+
+                    # predict the noise residual
+
+                    noise_pred = self.unet(
+                        sample=latent_model_input,
+                        timestep=timestep,
+                        encoder_hidden_states=prompt_embeds,
+                        down_block_0=down_block_res_samples[0],
+                        down_block_1=down_block_res_samples[1],
+                        down_block_2=down_block_res_samples[2],
+                        down_block_3=down_block_res_samples[3],
+                        down_block_4=down_block_res_samples[4],
+                        down_block_5=down_block_res_samples[5],
+                        down_block_6=down_block_res_samples[6],
+                        down_block_7=down_block_res_samples[7],
+                        down_block_8=down_block_res_samples[8],
+                        down_block_9=down_block_res_samples[9],
+                        down_block_10=down_block_res_samples[10],
+                        down_block_11=down_block_res_samples[11],
+                        mid_block_additional_residual=mid_block_res_sample,
+                    )
+                    noise_pred = noise_pred[0]
 
                 # perform guidance
                 if do_classifier_free_guidance:
@@ -459,12 +493,12 @@ class OnnxStableDiffusionControlNetPipeline(DiffusionPipeline):
 
                 # compute the previous noisy sample x_t -> x_t-1
                 scheduler_output = self.scheduler.step(
-                    torch.from_numpy(noise_pred),
+                    get_scheduler_input(self.scheduler, noise_pred),
                     t,
-                    torch.from_numpy(latents),
+                    get_scheduler_input(self.scheduler, latents),
                     **extra_step_kwargs,
                 )
-                latents = scheduler_output.prev_sample.numpy()
+                latents = to_numpy(scheduler_output.prev_sample)
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or (
@@ -17,6 +17,8 @@ from diffusers.utils import logging
 from packaging import version
 from transformers import CLIPImageProcessor, CLIPTokenizer
 
+from ..schedulers.base import get_scheduler_input, to_numpy
+
 try:
     from diffusers.pipelines.onnx_utils import ORT_TO_NP_TYPE
 except ImportError:
@@ -886,9 +888,9 @@ class OnnxStableDiffusionLongPromptWeightingPipeline(OnnxStableDiffusionPipeline
                 else latents
             )
             latent_model_input = self.scheduler.scale_model_input(
-                torch.from_numpy(latent_model_input), t
+                get_scheduler_input(self.scheduler, latent_model_input), t
             )
-            latent_model_input = latent_model_input.numpy()
+            latent_model_input = to_numpy(latent_model_input)
 
             # predict the noise residual
             noise_pred = self.unet(
@@ -907,12 +909,12 @@ class OnnxStableDiffusionLongPromptWeightingPipeline(OnnxStableDiffusionPipeline
 
             # compute the previous noisy sample x_t -> x_t-1
             scheduler_output = self.scheduler.step(
-                torch.from_numpy(noise_pred),
+                get_scheduler_input(self.scheduler, noise_pred),
                 t,
-                torch.from_numpy(latents),
+                get_scheduler_input(self.scheduler, latents),
                 **extra_step_kwargs,
             )
-            latents = scheduler_output.prev_sample.numpy()
+            latents = to_numpy(scheduler_output.prev_sample)
 
             if mask is not None:
                 # masking
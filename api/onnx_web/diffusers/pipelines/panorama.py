@@ -26,6 +26,8 @@ from diffusers.schedulers import DDIMScheduler, LMSDiscreteScheduler, PNDMSchedu
 from diffusers.utils import PIL_INTERPOLATION, deprecate, logging
 from transformers import CLIPImageProcessor, CLIPTokenizer
 
+from ..schedulers.base import get_scheduler_input, to_numpy
+
 logger = logging.get_logger(__name__)
 
 
@@ -544,9 +546,9 @@ class OnnxStableDiffusionPanoramaPipeline(DiffusionPipeline):
                     else latents_for_view
                 )
                 latent_model_input = self.scheduler.scale_model_input(
-                    torch.from_numpy(latent_model_input), t
+                    get_scheduler_input(self.scheduler, latent_model_input), t
                 )
-                latent_model_input = latent_model_input.cpu().numpy()
+                latent_model_input = to_numpy(latent_model_input)
 
                 # predict the noise residual
                 timestep = np.array([t], dtype=timestep_dtype)
@@ -566,12 +568,12 @@ class OnnxStableDiffusionPanoramaPipeline(DiffusionPipeline):
 
                 # compute the previous noisy sample x_t -> x_t-1
                 scheduler_output = self.scheduler.step(
-                    torch.from_numpy(noise_pred),
+                    get_scheduler_input(self.scheduler, noise_pred),
                     t,
-                    torch.from_numpy(latents_for_view),
+                    get_scheduler_input(self.scheduler, latents_for_view),
                     **extra_step_kwargs,
                 )
-                latents_view_denoised = scheduler_output.prev_sample.numpy()
+                latents_view_denoised = to_numpy(scheduler_output.prev_sample)
 
                 value[:, :, h_start:h_end, w_start:w_end] += latents_view_denoised
                 count[:, :, h_start:h_end, w_start:w_end] += 1
@@ -847,9 +849,9 @@ class OnnxStableDiffusionPanoramaPipeline(DiffusionPipeline):
                     else latents_for_view
                 )
                 latent_model_input = self.scheduler.scale_model_input(
-                    torch.from_numpy(latent_model_input), t
+                    get_scheduler_input(self.scheduler, latent_model_input), t
                 )
-                latent_model_input = latent_model_input.cpu().numpy()
+                latent_model_input = to_numpy(latent_model_input)
 
                 # predict the noise residual
                 timestep = np.array([t], dtype=timestep_dtype)
@@ -869,12 +871,12 @@ class OnnxStableDiffusionPanoramaPipeline(DiffusionPipeline):
 
                 # compute the previous noisy sample x_t -> x_t-1
                 scheduler_output = self.scheduler.step(
-                    torch.from_numpy(noise_pred),
+                    get_scheduler_input(self.scheduler, noise_pred),
                     t,
-                    torch.from_numpy(latents_for_view),
+                    get_scheduler_input(self.scheduler, latents_for_view),
                     **extra_step_kwargs,
                 )
-                latents_view_denoised = scheduler_output.prev_sample.numpy()
+                latents_view_denoised = to_numpy(scheduler_output.prev_sample)
 
                 value[:, :, h_start:h_end, w_start:w_end] += latents_view_denoised
                 count[:, :, h_start:h_end, w_start:w_end] += 1
@@ -1160,9 +1162,9 @@ class OnnxStableDiffusionPanoramaPipeline(DiffusionPipeline):
                 )
                 # concat latents, mask, masked_image_latnets in the channel dimension
                 latent_model_input = self.scheduler.scale_model_input(
-                    torch.from_numpy(latent_model_input), t
+                    get_scheduler_input(self.scheduler, latent_model_input), t
                 )
-                latent_model_input = latent_model_input.cpu().numpy()
+                latent_model_input = to_numpy(latent_model_input)
                 latent_model_input = np.concatenate(
                     [latent_model_input, mask_for_view, masked_latents_for_view], axis=1
                 )
@@ -1184,12 +1186,12 @@ class OnnxStableDiffusionPanoramaPipeline(DiffusionPipeline):
 
                 # compute the previous noisy sample x_t -> x_t-1
                 scheduler_output = self.scheduler.step(
-                    torch.from_numpy(noise_pred),
+                    get_scheduler_input(self.scheduler, noise_pred),
                     t,
-                    torch.from_numpy(latents_for_view),
+                    get_scheduler_input(self.scheduler, latents_for_view),
                     **extra_step_kwargs,
                 )
-                latents_view_denoised = scheduler_output.prev_sample.numpy()
+                latents_view_denoised = to_numpy(scheduler_output.prev_sample)
 
                 value[:, :, h_start:h_end, w_start:w_end] += latents_view_denoised
                 count[:, :, h_start:h_end, w_start:w_end] += 1
@@ -12,6 +12,8 @@ from optimum.pipelines.diffusers.pipeline_stable_diffusion_xl_img2img import (
 )
 from optimum.pipelines.diffusers.pipeline_utils import preprocess, rescale_noise_cfg
 
+from ..schedulers.base import get_scheduler_input, to_numpy
+
 logger = logging.getLogger(__name__)
 
 
@@ -359,9 +361,9 @@ class StableDiffusionXLPanoramaPipelineMixin(StableDiffusionXLImg2ImgPipelineMix
                     else latents_for_view
                 )
                 latent_model_input = self.scheduler.scale_model_input(
-                    torch.from_numpy(latent_model_input), t
+                    get_scheduler_input(self.scheduler, latent_model_input), t
                 )
-                latent_model_input = latent_model_input.cpu().numpy()
+                latent_model_input = to_numpy(latent_model_input)
 
                 # predict the noise residual
                 timestep = np.array([t], dtype=timestep_dtype)
@@ -390,12 +392,12 @@ class StableDiffusionXLPanoramaPipelineMixin(StableDiffusionXLImg2ImgPipelineMix
 
                 # compute the previous noisy sample x_t -> x_t-1
                 scheduler_output = self.scheduler.step(
-                    torch.from_numpy(noise_pred),
+                    get_scheduler_input(self.scheduler, noise_pred),
                     t,
-                    torch.from_numpy(latents_for_view),
+                    get_scheduler_input(self.scheduler, latents_for_view),
                     **extra_step_kwargs,
                 )
-                latents_view_denoised = scheduler_output.prev_sample.numpy()
+                latents_view_denoised = to_numpy(scheduler_output.prev_sample)
 
                 value[:, :, h_start:h_end, w_start:w_end] += latents_view_denoised
                 count[:, :, h_start:h_end, w_start:w_end] += 1
@@ -663,9 +665,9 @@ class StableDiffusionXLPanoramaPipelineMixin(StableDiffusionXLImg2ImgPipelineMix
                     else latents_for_view
                 )
                 latent_model_input = self.scheduler.scale_model_input(
-                    torch.from_numpy(latent_model_input), t
+                    get_scheduler_input(self.scheduler, latent_model_input), t
                 )
-                latent_model_input = latent_model_input.cpu().numpy()
+                latent_model_input = to_numpy(latent_model_input)
 
                 # predict the noise residual
                 timestep = np.array([t], dtype=timestep_dtype)
@@ -694,12 +696,12 @@ class StableDiffusionXLPanoramaPipelineMixin(StableDiffusionXLImg2ImgPipelineMix
 
                 # compute the previous noisy sample x_t -> x_t-1
                 scheduler_output = self.scheduler.step(
-                    torch.from_numpy(noise_pred),
+                    get_scheduler_input(self.scheduler, noise_pred),
                     t,
-                    torch.from_numpy(latents_for_view),
+                    get_scheduler_input(self.scheduler, latents_for_view),
                     **extra_step_kwargs,
                 )
-                latents_view_denoised = scheduler_output.prev_sample.numpy()
+                latents_view_denoised = to_numpy(scheduler_output.prev_sample)
 
                 value[:, :, h_start:h_end, w_start:w_end] += latents_view_denoised
                 count[:, :, h_start:h_end, w_start:w_end] += 1
@@ -42,6 +42,8 @@ from diffusers.schedulers import (
 )
 from diffusers.utils import PIL_INTERPOLATION, logging
 
+from ..schedulers.base import get_scheduler_input, to_numpy
+
 logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
 
 
@@ -372,9 +374,9 @@ class OnnxStableDiffusionInstructPix2PixPipeline(DiffusionPipeline):
                 )
 
                 scaled_latent_model_input = self.scheduler.scale_model_input(
-                    torch.from_numpy(latent_model_input), t
+                    get_scheduler_input(self.scheduler, latent_model_input), t
                 )
-                scaled_latent_model_input = scaled_latent_model_input.cpu().numpy()
+                scaled_latent_model_input = to_numpy(scaled_latent_model_input)
 
                 scaled_latent_model_input = np.concatenate(
                     [scaled_latent_model_input, image_latents], axis=1
@@ -419,9 +421,12 @@ class OnnxStableDiffusionInstructPix2PixPipeline(DiffusionPipeline):
 
                 # compute the previous noisy sample x_t -> x_t-1
                 scheduler_output = self.scheduler.step(
-                    noise_pred, t, torch.from_numpy(latents), **extra_step_kwargs
+                    get_scheduler_input(self.scheduler, noise_pred),
+                    t,
+                    get_scheduler_input(self.scheduler, latents),
+                    **extra_step_kwargs,
                 )
-                latents = scheduler_output.prev_sample.numpy()
+                latents = to_numpy(scheduler_output.prev_sample)
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or (
@@ -16,6 +16,8 @@ from diffusers.pipelines.onnx_utils import ORT_TO_NP_TYPE, OnnxRuntimeModel
 from diffusers.pipelines.stable_diffusion import StableDiffusionUpscalePipeline
 from diffusers.schedulers import DDPMScheduler
 
+from ..schedulers.base import get_scheduler_input
+
 logger = getLogger(__name__)
 
 
@@ -213,7 +215,10 @@ class OnnxStableDiffusionUpscalePipeline(StableDiffusionUpscalePipeline):
 
                 # compute the previous noisy sample x_t -> x_t-1
                 latents = self.scheduler.step(
-                    torch.from_numpy(noise_pred), t, latents, **extra_step_kwargs
+                    get_scheduler_input(self.scheduler, noise_pred),
+                    t,
+                    latents,
+                    **extra_step_kwargs,
                 ).prev_sample
 
                 # call the callback, if provided
@@ -13,9 +13,10 @@ from ..chain import (
     SourceTxt2ImgStage,
     UpscaleOutpaintStage,
 )
+from ..chain.tile import get_mask_crop
 from ..chain.upscale import split_upscale, stage_upscale_correction
 from ..image import expand_image
-from ..output import save_image
+from ..output import OutputMetadata, save_image, save_manifest
 from ..params import (
     Border,
     HighresParams,
@@ -28,7 +29,7 @@ from ..server import ServerContext
 from ..server.load import get_source_filters
 from ..utils import is_debug, run_gc, show_system_toast
 from ..worker import WorkerContext
-from .utils import get_latents_from_seed, parse_prompt
+from .utils import LATENT_FACTOR, get_latents_from_seed, parse_prompt
 
 logger = getLogger(__name__)
 
@@ -91,23 +92,24 @@ def run_txt2img_pipeline(
 
     # run and save
     latents = get_latents_from_seed(params.seed, size, batch=params.batch)
-    progress = worker.get_progress_callback()
+    progress = worker.get_progress_callback(server)
     images = chain.run(worker, server, params, [], callback=progress, latents=latents)
 
     _pairs, loras, inversions, _rest = parse_prompt(params)
 
+    metadata = OutputMetadata.from_params(
+        server,
+        params,
+        size,
+        upscale=upscale,
+        highres=highres,
+        inversions=inversions,
+        loras=loras,
+    )
     for image, output in zip(images, outputs):
-        dest = save_image(
-            server,
-            output,
-            image,
-            params,
-            size,
-            upscale=upscale,
-            highres=highres,
-            inversions=inversions,
-            loras=loras,
-        )
+        dest = save_image(server, output, image, metadata=metadata)
+
+    save_manifest(server, outputs, metadata)
 
     # clean up
     run_gc([worker.get_device()])
@@ -185,7 +187,7 @@ def run_img2img_pipeline(
     )
 
     # run and append the filtered source
-    progress = worker.get_progress_callback()
+    progress = worker.get_progress_callback(server)
     images = chain(worker, server, params, [source], callback=progress)
 
     if source_filter is not None and source_filter != "none":
@@ -195,18 +197,19 @@ def run_img2img_pipeline(
     _pairs, loras, inversions, _rest = parse_prompt(params)
     size = Size(*source.size)
 
+    metadata = OutputMetadata.from_params(
+        server,
+        params,
+        size,
+        upscale=upscale,
+        highres=highres,
+        inversions=inversions,
+        loras=loras,
+    )
     for image, output in zip(images, outputs):
-        dest = save_image(
-            server,
-            output,
-            image,
-            params,
-            size,
-            upscale=upscale,
-            highres=highres,
-            inversions=inversions,
-            loras=loras,
-        )
+        dest = save_image(server, output, image, metadata=metadata)
+
+    save_manifest(server, outputs, metadata)
 
     # clean up
     run_gc([worker.get_device()])
@@ -320,6 +323,22 @@ def run_inpaint_pipeline(
             logger.debug("cannot perform full-res inpaint due to size issue")
             full_res_inpaint = False
 
+    # when the pipeline does not change the image size, only the region around the mask needs to be processed, and
+    # the rest of the image can be pasted back afterwards
+    crop_box = None
+    source_size = Size(*source.size)
+    keep_size = tuple(upscale.resize(source_size)) == tuple(source_size) and (
+        not highres.enabled or highres.iterations < 1 or highres.scale == 1
+    )
+    if keep_size and not full_res_inpaint:
+        crop_box = get_mask_crop(mask, tile_size)
+
+    if crop_box is not None:
+        logger.debug("cropping source to masked region: %s", crop_box)
+        uncropped_source = source
+        source = source.crop(crop_box)
+        mask = mask.crop(crop_box)
+
     # set up the chain pipeline and base stage
     chain = ChainPipeline()
     stage = StageParams(tile_order=tile_order, tile_size=tile_size)
@@ -365,28 +384,46 @@ def run_inpaint_pipeline(
 
     # run and save
     latents = get_latents_from_seed(params.seed, size, batch=params.batch)
-    progress = worker.get_progress_callback()
-    images = chain(worker, server, params, [source], callback=progress, latents=latents)
+    if crop_box is not None:
+        left, top, right, bottom = [coord // LATENT_FACTOR for coord in crop_box]
+        latents = latents[:, :, top:bottom, left:right]
+
+    # the mask is passed to every stage, so tiles outside of it can be skipped
+    progress = worker.get_progress_callback(server)
+    images = chain(
+        worker,
+        server,
+        params,
+        [source],
+        callback=progress,
+        latents=latents,
+        mask=mask,
+    )
 
     _pairs, loras, inversions, _rest = parse_prompt(params)
+    metadata = OutputMetadata.from_params(
+        server,
+        params,
+        size,
+        upscale=upscale,
+        border=border,
+        inversions=inversions,
+        loras=loras,
+    )
     for image, output in zip(images, outputs):
         if full_res_inpaint:
             if is_debug():
                 save_image(server, "adjusted-output.png", image)
             mini_image = ImageOps.contain(image, (adj_mask_size, adj_mask_size))
-            image = original_source
+            image = original_source.copy()
             image.paste(mini_image, box=adj_mask_border)
-        dest = save_image(
-            server,
-            output,
-            image,
-            params,
-            size,
-            upscale=upscale,
-            border=border,
-            inversions=inversions,
-            loras=loras,
-        )
+        elif crop_box is not None:
+            cropped_image = image
+            image = uncropped_source.copy()
+            image.paste(cropped_image, box=crop_box[:2])
+        dest = save_image(server, output, image, metadata=metadata)
+
+    save_manifest(server, outputs, metadata)
 
     # clean up
     del image
@@ -440,21 +477,22 @@ def run_upscale_pipeline(
     )
 
     # run and save
-    progress = worker.get_progress_callback()
+    progress = worker.get_progress_callback(server)
     images = chain(worker, server, params, [source], callback=progress)
 
     _pairs, loras, inversions, _rest = parse_prompt(params)
+    metadata = OutputMetadata.from_params(
+        server,
+        params,
+        size,
+        upscale=upscale,
+        inversions=inversions,
+        loras=loras,
+    )
     for image, output in zip(images, outputs):
-        dest = save_image(
-            server,
-            output,
-            image,
-            params,
-            size,
-            upscale=upscale,
-            inversions=inversions,
-            loras=loras,
-        )
+        dest = save_image(server, output, image, metadata=metadata)
+
+    save_manifest(server, outputs, metadata)
 
     # clean up
     del image
@@ -490,11 +528,14 @@ def run_blend_pipeline(
     )
 
     # run and save
-    progress = worker.get_progress_callback()
+    progress = worker.get_progress_callback(server)
     images = chain(worker, server, params, sources, callback=progress)
 
+    metadata = OutputMetadata.from_params(server, params, size, upscale=upscale)
     for image, output in zip(images, outputs):
-        dest = save_image(server, output, image, params, size, upscale=upscale)
+        dest = save_image(server, output, image, metadata=metadata)
+
+    save_manifest(server, outputs, metadata)
 
     # clean up
     del image
@@ -0,0 +1,200 @@
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+logger = getLogger(__name__)
+
+Sample = Union[np.ndarray, torch.Tensor]
+
+NP_TO_TORCH_TYPE = {
+    np.dtype(np.float16): torch.float16,
+    np.dtype(np.float32): torch.float32,
+    np.dtype(np.float64): torch.float64,
+}
+
+
+def get_scalar(value: Any) -> Union[int, float]:
+    if isinstance(value, torch.Tensor):
+        return value.item()
+
+    return np.asarray(value).item()
+
+
+def to_numpy(value: Sample) -> np.ndarray:
+    """
+    Get a NumPy view of a CPU tensor, without copying it.
+    """
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu().numpy()
+
+    return value
+
+
+def like_input(value: np.ndarray, like: Sample) -> Sample:
+    """
+    Return a result using the same type as the input, so callers that pass tensors get tensors back.
+    """
+    if isinstance(like, torch.Tensor):
+        return torch.from_numpy(value)
+
+    return value
+
+
+def randn(
+    shape: Tuple[int, ...],
+    dtype: np.dtype,
+    generator: Optional[torch.Generator] = None,
+) -> np.ndarray:
+    """
+    Draw noise with the Torch generator, so seeds produce the same images as the diffusers schedulers.
+    """
+    return torch.randn(
+        shape,
+        generator=generator,
+        dtype=NP_TO_TORCH_TYPE.get(np.dtype(dtype), torch.float32),
+    ).numpy()
+
+
+def combine(
+    terms: List[Tuple[float, np.ndarray]],
+    out: np.ndarray,
+    scratch: np.ndarray,
+) -> np.ndarray:
+    """
+    Write the linear combination of some samples into `out`, using `scratch` for the intermediate products.
+
+    Every scheduler step is a weighted sum of the sample and model outputs, with scalar weights that only depend
+    on the timesteps, so they can be computed once in float64 and applied in a single pass per term.
+    """
+    first_coef, first_value = terms[0]
+    np.multiply(first_value, first_coef, out=out)
+
+    for coef, value in terms[1:]:
+        np.multiply(value, coef, out=scratch)
+        np.add(out, scratch, out=out)
+
+    return out
+
+
+class SampleHistory:
+    """
+    Preallocated ring of previous model outputs for the multistep schedulers.
+
+    There is one more slot than the scheduler order, so the next output can be converted while the previous
+    ones are still in use, then pushed without copying.
+    """
+
+    order: int
+    outputs: List[Optional[np.ndarray]]
+    timesteps: List[Optional[int]]
+
+    def __init__(self, order: int) -> None:
+        self.order = order
+        self.slots: List[np.ndarray] = []
+        self.reset()
+
+    def reset(self) -> None:
+        self.outputs = [None] * self.order
+        self.timesteps = [None] * self.order
+
+    def next_slot(self, like: np.ndarray) -> np.ndarray:
+        """
+        Get the spare slot, allocating the ring if the sample shape or type has changed.
+        """
+        if (
+            len(self.slots) == 0
+            or self.slots[0].shape != like.shape
+            or self.slots[0].dtype != like.dtype
+        ):
+            logger.trace(
+                "allocating scheduler history for %s samples: %s",
+                like.dtype,
+                like.shape,
+            )
+            self.slots = [np.empty_like(like) for _ in range(self.order + 1)]
+            self.reset()
+
+        in_use = [id(output) for output in self.outputs if output is not None]
+        for slot in self.slots:
+            if id(slot) not in in_use:
+                return slot
+
+        raise ValueError("no free slot in scheduler history")
+
+    def push(self, output: np.ndarray, timestep: int) -> None:
+        self.outputs = self.outputs[1:] + [output]
+        self.timesteps = self.timesteps[1:] + [timestep]
+
+
+class NumpySchedulerMixin:
+    """
+    Step a diffusers scheduler with NumPy, rather than Torch.
+
+    The timestep schedule and config still come from the diffusers base class, so these can be loaded with
+    `from_pretrained` and used anywhere the original scheduler was, but each step is a few NumPy operations into
+    preallocated buffers. Tensors and arrays are both accepted, and results are returned using the same type as
+    the sample. The buffers are reused, so each sample is only valid until the step after next, and callers that
+    keep them for longer must copy them.
+
+    Configs that use features without a NumPy implementation fall back to the diffusers step.
+    """
+
+    buffers: Dict[str, np.ndarray]
+    step_indices: Dict[Union[int, float], int]
+
+    def set_timesteps(self, num_inference_steps: int, *args, **kwargs) -> None:
+        super().set_timesteps(num_inference_steps, *args, **kwargs)
+
+        timesteps = self.timesteps.cpu().numpy()
+        self.step_indices = {t: i for i, t in enumerate(timesteps.tolist())}
+        self.buffers = getattr(self, "buffers", {})
+        self.reset_numpy()
+
+    def reset_numpy(self) -> None:
+        pass
+
+    def has_numpy_step(self) -> bool:
+        return True
+
+    def get_step_index(self, timestep: Any, default: Optional[int] = None) -> int:
+        step_index = self.step_indices.get(get_scalar(timestep), default)
+        if step_index is None:
+            raise ValueError(f"timestep is not part of the schedule: {timestep}")
+
+        return step_index
+
+    def get_buffer(self, name: str, like: np.ndarray) -> np.ndarray:
+        """
+        Get a scratch buffer with the same shape and type as the sample, which is reused between steps.
+        """
+        buffer = self.buffers.get(name, None)
+        if buffer is None or buffer.shape != like.shape or buffer.dtype != like.dtype:
+            buffer = np.empty_like(like)
+            self.buffers[name] = buffer
+
+        return buffer
+
+    def get_sample_buffer(self, like: np.ndarray) -> np.ndarray:
+        """
+        Get a buffer for the next sample, alternating between two of them, since the sample from the previous step
+        is usually passed back in and still being read.
+        """
+        for name in ["sample_0", "sample_1"]:
+            buffer = self.get_buffer(name, like)
+            if not np.may_share_memory(buffer, like):
+                return buffer
+
+        raise ValueError("no free sample buffer in scheduler")
+
+
+def get_scheduler_input(scheduler: Any, value: np.ndarray) -> Sample:
+    """
+    Pass arrays straight through to the NumPy schedulers, and convert them to tensors for the diffusers schedulers
+    and any configs that fall back to the diffusers step.
+    """
+    if isinstance(scheduler, NumpySchedulerMixin) and scheduler.has_numpy_step():
+        return value
+
+    return torch.from_numpy(value)
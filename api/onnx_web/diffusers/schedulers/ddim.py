@@ -0,0 +1,148 @@
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import torch
+from diffusers.schedulers.scheduling_ddim import DDIMSchedulerOutput
+
+from ..version_safe_diffusers import DDIMScheduler
+from .base import NumpySchedulerMixin, Sample, combine, like_input, randn, to_numpy
+
+
+class NumpyDDIMScheduler(NumpySchedulerMixin, DDIMScheduler):
+    def reset_numpy(self) -> None:
+        self.np_alphas_cumprod = self.alphas_cumprod.numpy().astype(np.float64)
+        self.np_final_alpha_cumprod = float(self.final_alpha_cumprod)
+
+    def has_numpy_step(self) -> bool:
+        return not self.config.thresholding
+
+    def step(
+        self,
+        model_output: Sample,
+        timestep: int,
+        sample: Sample,
+        eta: float = 0.0,
+        use_clipped_model_output: bool = False,
+        generator: Optional[torch.Generator] = None,
+        variance_noise: Optional[Sample] = None,
+        return_dict: bool = True,
+    ) -> Union[DDIMSchedulerOutput, Tuple]:
+        if not self.has_numpy_step():
+            return super().step(
+                model_output,
+                timestep,
+                sample,
+                eta=eta,
+                use_clipped_model_output=use_clipped_model_output,
+                generator=generator,
+                variance_noise=variance_noise,
+                return_dict=return_dict,
+            )
+
+        if self.num_inference_steps is None:
+            raise ValueError(
+                "number of inference steps is not set, run set_timesteps before step"
+            )
+
+        output = to_numpy(model_output)
+        latents = to_numpy(sample)
+        scratch = self.get_buffer("scratch", latents)
+
+        timestep = int(timestep)
+        prev_timestep = (
+            timestep - self.config.num_train_timesteps // self.num_inference_steps
+        )
+
+        alpha_prod_t = self.np_alphas_cumprod[timestep]
+        alpha_prod_t_prev = (
+            self.np_alphas_cumprod[prev_timestep]
+            if prev_timestep >= 0
+            else self.np_final_alpha_cumprod
+        )
+        beta_prod_t = 1 - alpha_prod_t
+        beta_prod_t_prev = 1 - alpha_prod_t_prev
+
+        alpha_t = float(alpha_prod_t**0.5)
+        beta_t = float(beta_prod_t**0.5)
+
+        pred_original_sample = self.get_buffer("pred_original", latents)
+        if self.config.prediction_type == "epsilon":
+            combine(
+                [(1 / alpha_t, latents), (-beta_t / alpha_t, output)],
+                pred_original_sample,
+                scratch,
+            )
+            pred_epsilon = output
+        elif self.config.prediction_type == "sample":
+            np.copyto(pred_original_sample, output)
+            pred_epsilon = combine(
+                [(1 / beta_t, latents), (-alpha_t / beta_t, output)],
+                self.get_buffer("epsilon", latents),
+                scratch,
+            )
+        elif self.config.prediction_type == "v_prediction":
+            combine(
+                [(alpha_t, latents), (-beta_t, output)], pred_original_sample, scratch
+            )
+            pred_epsilon = combine(
+                [(alpha_t, output), (beta_t, latents)],
+                self.get_buffer("epsilon", latents),
+                scratch,
+            )
+        else:
+            raise ValueError(
+                f"prediction_type given as {self.config.prediction_type} must be one of `epsilon`, `sample`, or"
+                " `v_prediction`"
+            )
+
+        if self.config.clip_sample:
+            clip_range = self.config.clip_sample_range
+            np.clip(
+                pred_original_sample, -clip_range, clip_range, out=pred_original_sample
+            )
+
+        variance = (beta_prod_t_prev / beta_prod_t) * (
+            1 - alpha_prod_t / alpha_prod_t_prev
+        )
+        std_dev_t = float(eta * variance**0.5)
+
+        if use_clipped_model_output:
+            pred_epsilon = combine(
+                [(1 / beta_t, latents), (-alpha_t / beta_t, pred_original_sample)],
+                self.get_buffer("epsilon", latents),
+                scratch,
+            )
+
+        direction = float((1 - alpha_prod_t_prev - std_dev_t**2) ** 0.5)
+        prev_sample = combine(
+            [
+                (float(alpha_prod_t_prev**0.5), pred_original_sample),
+                (direction, pred_epsilon),
+            ],
+            self.get_sample_buffer(latents),
+            scratch,
+        )
+
+        if eta > 0:
+            if variance_noise is not None and generator is not None:
+                raise ValueError(
+                    "cannot pass both generator and variance_noise, only one can be used"
+                )
+
+            if variance_noise is None:
+                noise = randn(latents.shape, latents.dtype, generator)
+            else:
+                noise = to_numpy(variance_noise)
+
+            np.multiply(noise, std_dev_t, out=scratch)
+            np.add(prev_sample, scratch, out=prev_sample)
+
+        prev_sample = like_input(prev_sample, sample)
+        pred_original_sample = like_input(pred_original_sample, sample)
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return DDIMSchedulerOutput(
+            prev_sample=prev_sample, pred_original_sample=pred_original_sample
+        )
@@ -0,0 +1,233 @@
+from math import exp
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+from diffusers.schedulers.scheduling_utils import SchedulerOutput
+
+from ..version_safe_diffusers import DPMSolverMultistepScheduler
+from .base import (
+    NumpySchedulerMixin,
+    Sample,
+    SampleHistory,
+    combine,
+    get_scalar,
+    like_input,
+    to_numpy,
+)
+
+
+class NumpyDPMSolverMultistepScheduler(
+    NumpySchedulerMixin, DPMSolverMultistepScheduler
+):
+    """
+    DPM-Solver and DPM-Solver++ multistep, with the previous model outputs kept in a preallocated history.
+
+    The SDE variants, thresholding, and learned variance use the diffusers step.
+    """
+
+    def reset_numpy(self) -> None:
+        self.np_alpha_t = self.alpha_t.numpy().astype(np.float64)
+        self.np_sigma_t = self.sigma_t.numpy().astype(np.float64)
+        self.np_lambda_t = self.lambda_t.numpy().astype(np.float64)
+        self.np_timesteps = self.timesteps.cpu().numpy().tolist()
+
+        if (
+            not hasattr(self, "history")
+            or self.history.order != self.config.solver_order
+        ):
+            self.history = SampleHistory(self.config.solver_order)
+
+        self.history.reset()
+
+    def has_numpy_step(self) -> bool:
+        return (
+            self.config.algorithm_type in ["dpmsolver", "dpmsolver++"]
+            and self.config.solver_type in ["midpoint", "heun"]
+            and self.config.variance_type not in ["learned", "learned_range"]
+            and not self.config.thresholding
+        )
+
+    def convert_output(
+        self,
+        output: np.ndarray,
+        timestep: int,
+        latents: np.ndarray,
+        scratch: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Convert the model output to the data (DPM-Solver++) or noise (DPM-Solver) prediction, writing it into the
+        next slot of the history.
+        """
+        alpha_t = self.np_alpha_t[timestep]
+        sigma_t = self.np_sigma_t[timestep]
+        prediction_type = self.config.prediction_type
+        slot = self.history.next_slot(latents)
+
+        if self.config.algorithm_type == "dpmsolver++":
+            if prediction_type == "epsilon":
+                terms = [(1 / alpha_t, latents), (-sigma_t / alpha_t, output)]
+            elif prediction_type == "sample":
+                terms = [(1.0, output)]
+            elif prediction_type == "v_prediction":
+                terms = [(alpha_t, latents), (-sigma_t, output)]
+            else:
+                raise ValueError(f"unsupported prediction type: {prediction_type}")
+        else:
+            if prediction_type == "epsilon":
+                terms = [(1.0, output)]
+            elif prediction_type == "sample":
+                terms = [(1 / sigma_t, latents), (-alpha_t / sigma_t, output)]
+            elif prediction_type == "v_prediction":
+                terms = [(alpha_t, output), (sigma_t, latents)]
+            else:
+                raise ValueError(f"unsupported prediction type: {prediction_type}")
+
+        return combine([(float(c), v) for c, v in terms], slot, scratch)
+
+    def get_update_terms(
+        self,
+        outputs: List[np.ndarray],
+        timesteps: List[int],
+        prev_timestep: int,
+        latents: np.ndarray,
+        order: int,
+    ) -> List[Tuple[float, np.ndarray]]:
+        """
+        Get the weights of the sample and previous outputs for a first, second, or third order update.
+        """
+        t = prev_timestep
+        s0 = timesteps[-1]
+        lambda_t, lambda_s0 = self.np_lambda_t[t], self.np_lambda_t[s0]
+        alpha_t, alpha_s0 = self.np_alpha_t[t], self.np_alpha_t[s0]
+        sigma_t, sigma_s0 = self.np_sigma_t[t], self.np_sigma_t[s0]
+        h = lambda_t - lambda_s0
+
+        data = self.config.algorithm_type == "dpmsolver++"
+        if data:
+            sample_coef = sigma_t / sigma_s0
+            phi_1 = -alpha_t * (exp(-h) - 1.0)
+        else:
+            sample_coef = alpha_t / alpha_s0
+            phi_1 = -sigma_t * (exp(h) - 1.0)
+
+        m0 = outputs[-1]
+        if order == 1:
+            return [(sample_coef, latents), (phi_1, m0)]
+
+        m1 = outputs[-2]
+        s1 = timesteps[-2]
+        h_0 = lambda_s0 - self.np_lambda_t[s1]
+        r0 = h_0 / h
+
+        if order == 2:
+            # D1 = (m0 - m1) / r0
+            if self.config.solver_type == "midpoint":
+                d1_coef = 0.5 * phi_1
+            elif data:
+                d1_coef = alpha_t * ((exp(-h) - 1.0) / h + 1.0)
+            else:
+                d1_coef = -sigma_t * ((exp(h) - 1.0) / h - 1.0)
+
+            d1_coef = d1_coef / r0
+            return [(sample_coef, latents), (phi_1 + d1_coef, m0), (-d1_coef, m1)]
+
+        m2 = outputs[-3]
+        s2 = timesteps[-3]
+        h_1 = self.np_lambda_t[s1] - self.np_lambda_t[s2]
+        r1 = h_1 / h
+
+        # D1_0 = (m0 - m1) / r0, D1_1 = (m1 - m2) / r1
+        # D1 = D1_0 + (r0 / (r0 + r1)) * (D1_0 - D1_1), D2 = (D1_0 - D1_1) / (r0 + r1)
+        if data:
+            d1_coef = alpha_t * ((exp(-h) - 1.0) / h + 1.0)
+            d2_coef = -alpha_t * ((exp(-h) - 1.0 + h) / h**2 - 0.5)
+        else:
+            d1_coef = -sigma_t * ((exp(h) - 1.0) / h - 1.0)
+            d2_coef = -sigma_t * ((exp(h) - 1.0 - h) / h**2 - 0.5)
+
+        d1_0_coef = d1_coef * (1 + r0 / (r0 + r1)) + d2_coef / (r0 + r1)
+        d1_1_coef = -d1_coef * (r0 / (r0 + r1)) - d2_coef / (r0 + r1)
+
+        return [
+            (sample_coef, latents),
+            (phi_1 + d1_0_coef / r0, m0),
+            (-d1_0_coef / r0 + d1_1_coef / r1, m1),
+            (-d1_1_coef / r1, m2),
+        ]
+
+    def step(
+        self,
+        model_output: Sample,
+        timestep: int,
+        sample: Sample,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[SchedulerOutput, Tuple]:
+        if not self.has_numpy_step():
+            return super().step(
+                model_output,
+                timestep,
+                sample,
+                generator=generator,
+                return_dict=return_dict,
+            )
+
+        if self.num_inference_steps is None:
+            raise ValueError(
+                "number of inference steps is not set, run set_timesteps before step"
+            )
+
+        output = to_numpy(model_output)
+        latents = to_numpy(sample)
+        scratch = self.get_buffer("scratch", latents)
+
+        num_timesteps = len(self.np_timesteps)
+        step_index = self.get_step_index(timestep, default=num_timesteps - 1)
+        timestep = int(get_scalar(timestep))
+        prev_timestep = (
+            0 if step_index == num_timesteps - 1 else self.np_timesteps[step_index + 1]
+        )
+
+        lower_order = self.config.lower_order_final and num_timesteps < 15
+        lower_order_final = lower_order and step_index == num_timesteps - 1
+        lower_order_second = lower_order and step_index == num_timesteps - 2
+
+        converted = self.convert_output(output, timestep, latents, scratch)
+        self.history.push(converted, timestep)
+
+        if (
+            self.config.solver_order == 1
+            or self.lower_order_nums < 1
+            or lower_order_final
+        ):
+            order = 1
+        elif (
+            self.config.solver_order == 2
+            or self.lower_order_nums < 2
+            or lower_order_second
+        ):
+            order = 2
+        else:
+            order = 3
+
+        terms = self.get_update_terms(
+            self.history.outputs,
+            self.history.timesteps,
+            prev_timestep,
+            latents,
+            order,
+        )
+        prev_sample = combine(
+            [(float(c), v) for c, v in terms], self.get_sample_buffer(latents), scratch
+        )
+
+        if self.lower_order_nums < self.config.solver_order:
+            self.lower_order_nums += 1
+
+        prev_sample = like_input(prev_sample, sample)
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return SchedulerOutput(prev_sample=prev_sample)
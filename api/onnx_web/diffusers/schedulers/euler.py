@@ -0,0 +1,177 @@
+from typing import Any, Optional, Tuple, Union
+
+import numpy as np
+import torch
+from diffusers.schedulers.scheduling_euler_ancestral_discrete import (
+    EulerAncestralDiscreteSchedulerOutput,
+)
+from diffusers.schedulers.scheduling_euler_discrete import (
+    EulerDiscreteSchedulerOutput,
+)
+
+from ..version_safe_diffusers import (
+    EulerAncestralDiscreteScheduler,
+    EulerDiscreteScheduler,
+)
+from .base import NumpySchedulerMixin, Sample, combine, like_input, randn, to_numpy
+
+
+class NumpySigmaMixin(NumpySchedulerMixin):
+    """
+    Shared input scaling and prediction for the Euler schedulers, which step in sigma space.
+    """
+
+    def reset_numpy(self) -> None:
+        self.np_sigmas = self.sigmas.cpu().numpy().astype(np.float64)
+
+    def scale_model_input(self, sample: Sample, timestep: Any) -> Sample:
+        sigma = self.np_sigmas[self.get_step_index(timestep)]
+        scaled = np.divide(to_numpy(sample), float((sigma**2 + 1) ** 0.5))
+        self.is_scale_input_called = True
+        return like_input(scaled, sample)
+
+    def predict_original(
+        self,
+        output: np.ndarray,
+        latents: np.ndarray,
+        sigma: float,
+        scratch: np.ndarray,
+    ) -> np.ndarray:
+        pred_original_sample = self.get_buffer("pred_original", latents)
+        if self.config.prediction_type == "epsilon":
+            return combine(
+                [(1.0, latents), (-sigma, output)], pred_original_sample, scratch
+            )
+        elif self.config.prediction_type == "v_prediction":
+            return combine(
+                [
+                    (-sigma / (sigma**2 + 1) ** 0.5, output),
+                    (1 / (sigma**2 + 1), latents),
+                ],
+                pred_original_sample,
+                scratch,
+            )
+        elif self.config.prediction_type in ["original_sample", "sample"]:
+            np.copyto(pred_original_sample, output)
+            return pred_original_sample
+        else:
+            raise ValueError(
+                f"prediction_type given as {self.config.prediction_type} must be one of `epsilon`, or `v_prediction`"
+            )
+
+
+class NumpyEulerDiscreteScheduler(NumpySigmaMixin, EulerDiscreteScheduler):
+    def step(
+        self,
+        model_output: Sample,
+        timestep: Union[float, torch.Tensor],
+        sample: Sample,
+        s_churn: float = 0.0,
+        s_tmin: float = 0.0,
+        s_tmax: float = float("inf"),
+        s_noise: float = 1.0,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[EulerDiscreteSchedulerOutput, Tuple]:
+        output = to_numpy(model_output)
+        latents = to_numpy(sample)
+        scratch = self.get_buffer("scratch", latents)
+        # pick the output buffer before churning, so the sample that was passed in is not overwritten
+        prev_buffer = self.get_sample_buffer(latents)
+
+        step_index = self.get_step_index(timestep)
+        sigma = float(self.np_sigmas[step_index])
+
+        gamma = (
+            min(s_churn / (len(self.np_sigmas) - 1), 2**0.5 - 1)
+            if s_tmin <= sigma <= s_tmax
+            else 0.0
+        )
+        sigma_hat = sigma * (gamma + 1)
+
+        if gamma > 0:
+            # the noise is only needed (and drawn) when churn is enabled
+            noise = randn(latents.shape, latents.dtype, generator)
+            latents = combine(
+                [(1.0, latents), (s_noise * (sigma_hat**2 - sigma**2) ** 0.5, noise)],
+                self.get_buffer("churn", latents),
+                scratch,
+            )
+
+        # the diffusers scheduler only uses the churned sigma for epsilon predictions
+        pred_original_sample = self.predict_original(
+            output,
+            latents,
+            sigma_hat if self.config.prediction_type == "epsilon" else sigma,
+            scratch,
+        )
+
+        # sample + ((sample - pred) / sigma_hat) * dt
+        dt = float(self.np_sigmas[step_index + 1]) - sigma_hat
+        prev_sample = combine(
+            [(1.0 + dt / sigma_hat, latents), (-dt / sigma_hat, pred_original_sample)],
+            prev_buffer,
+            scratch,
+        )
+
+        prev_sample = like_input(prev_sample, sample)
+        pred_original_sample = like_input(pred_original_sample, sample)
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return EulerDiscreteSchedulerOutput(
+            prev_sample=prev_sample, pred_original_sample=pred_original_sample
+        )
+
+
+class NumpyEulerAncestralDiscreteScheduler(
+    NumpySigmaMixin, EulerAncestralDiscreteScheduler
+):
+    def step(
+        self,
+        model_output: Sample,
+        timestep: Union[float, torch.Tensor],
+        sample: Sample,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[EulerAncestralDiscreteSchedulerOutput, Tuple]:
+        output = to_numpy(model_output)
+        latents = to_numpy(sample)
+        scratch = self.get_buffer("scratch", latents)
+
+        step_index = self.get_step_index(timestep)
+        sigma_from = float(self.np_sigmas[step_index])
+        sigma_to = float(self.np_sigmas[step_index + 1])
+
+        if self.config.prediction_type == "sample":
+            raise NotImplementedError("prediction_type not implemented yet: sample")
+
+        pred_original_sample = self.predict_original(
+            output, latents, sigma_from, scratch
+        )
+
+        sigma_up = (sigma_to**2 * (sigma_from**2 - sigma_to**2) / sigma_from**2) ** 0.5
+        sigma_down = (sigma_to**2 - sigma_up**2) ** 0.5
+        dt = sigma_down - sigma_from
+
+        noise = randn(latents.shape, latents.dtype, generator)
+        prev_sample = combine(
+            [
+                (1.0 + dt / sigma_from, latents),
+                (-dt / sigma_from, pred_original_sample),
+                (sigma_up, noise),
+            ],
+            self.get_sample_buffer(latents),
+            scratch,
+        )
+
+        prev_sample = like_input(prev_sample, sample)
+        pred_original_sample = like_input(pred_original_sample, sample)
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return EulerAncestralDiscreteSchedulerOutput(
+            prev_sample=prev_sample, pred_original_sample=pred_original_sample
+        )
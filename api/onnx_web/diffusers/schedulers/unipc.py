@@ -0,0 +1,272 @@
+from math import expm1
+from typing import List, Tuple, Union
+
+import numpy as np
+from diffusers.schedulers.scheduling_utils import SchedulerOutput
+
+from ..version_safe_diffusers import UniPCMultistepScheduler
+from .base import (
+    NumpySchedulerMixin,
+    Sample,
+    SampleHistory,
+    combine,
+    get_scalar,
+    like_input,
+    to_numpy,
+)
+
+
+class NumpyUniPCMultistepScheduler(NumpySchedulerMixin, UniPCMultistepScheduler):
+    """
+    UniPC multistep predictor and corrector, with the previous model outputs and sample kept in preallocated
+    buffers.
+
+    Thresholding and an external predictor (`solver_p`) use the diffusers step.
+    """
+
+    def reset_numpy(self) -> None:
+        self.np_alpha_t = self.alpha_t.numpy().astype(np.float64)
+        self.np_sigma_t = self.sigma_t.numpy().astype(np.float64)
+        self.np_lambda_t = self.lambda_t.numpy().astype(np.float64)
+        self.np_timesteps = self.timesteps.cpu().numpy().tolist()
+        self.np_last_sample = False
+
+        if (
+            not hasattr(self, "history")
+            or self.history.order != self.config.solver_order
+        ):
+            self.history = SampleHistory(self.config.solver_order)
+
+        self.history.reset()
+
+    def has_numpy_step(self) -> bool:
+        return (
+            self.config.solver_type in ["bh1", "bh2"]
+            and self.solver_p is None
+            and not self.config.thresholding
+        )
+
+    def convert_output(
+        self,
+        output: np.ndarray,
+        timestep: int,
+        latents: np.ndarray,
+        scratch: np.ndarray,
+    ) -> np.ndarray:
+        alpha_t = self.np_alpha_t[timestep]
+        sigma_t = self.np_sigma_t[timestep]
+        prediction_type = self.config.prediction_type
+        slot = self.history.next_slot(latents)
+
+        if self.predict_x0:
+            if prediction_type == "epsilon":
+                terms = [(1 / alpha_t, latents), (-sigma_t / alpha_t, output)]
+            elif prediction_type == "sample":
+                terms = [(1.0, output)]
+            elif prediction_type == "v_prediction":
+                terms = [(alpha_t, latents), (-sigma_t, output)]
+            else:
+                raise ValueError(f"unsupported prediction type: {prediction_type}")
+        else:
+            if prediction_type == "epsilon":
+                terms = [(1.0, output)]
+            elif prediction_type == "sample":
+                terms = [(1 / sigma_t, latents), (-alpha_t / sigma_t, output)]
+            elif prediction_type == "v_prediction":
+                terms = [(alpha_t, output), (sigma_t, latents)]
+            else:
+                raise ValueError(f"unsupported prediction type: {prediction_type}")
+
+        return combine([(float(c), v) for c, v in terms], slot, scratch)
+
+    def get_bh_terms(
+        self, t: int, order: int
+    ) -> Tuple[float, float, float, float, List[float], np.ndarray, np.ndarray]:
+        """
+        Get the shared coefficients for the predictor and corrector updates from timestep `t`, using the history.
+        """
+        timesteps = self.history.timesteps
+        s0 = timesteps[-1]
+        lambda_t, lambda_s0 = self.np_lambda_t[t], self.np_lambda_t[s0]
+        alpha_t, alpha_s0 = self.np_alpha_t[t], self.np_alpha_t[s0]
+        sigma_t, sigma_s0 = self.np_sigma_t[t], self.np_sigma_t[s0]
+        h = lambda_t - lambda_s0
+
+        rks = [
+            (self.np_lambda_t[timesteps[-(i + 1)]] - lambda_s0) / h
+            for i in range(1, order)
+        ]
+
+        hh = -h if self.predict_x0 else h
+        h_phi_1 = expm1(hh)
+        h_phi_k = h_phi_1 / hh - 1
+        factorial_i = 1
+
+        if self.config.solver_type == "bh1":
+            B_h = hh
+        else:
+            B_h = expm1(hh)
+
+        R = []
+        b = []
+        all_rks = np.array(rks + [1.0], dtype=np.float64)
+        for i in range(1, order + 1):
+            R.append(np.power(all_rks, i - 1))
+            b.append(h_phi_k * factorial_i / B_h)
+            factorial_i *= i + 1
+            h_phi_k = h_phi_k / hh - 1 / factorial_i
+
+        if self.predict_x0:
+            sample_coef = sigma_t / sigma_s0
+            scale = alpha_t
+        else:
+            sample_coef = alpha_t / alpha_s0
+            scale = sigma_t
+
+        return (
+            sample_coef,
+            scale,
+            h_phi_1,
+            B_h,
+            rks,
+            np.stack(R),
+            np.array(b, dtype=np.float64),
+        )
+
+    def get_predictor_terms(
+        self, prev_timestep: int, latents: np.ndarray, order: int
+    ) -> List[Tuple[float, np.ndarray]]:
+        sample_coef, scale, h_phi_1, B_h, rks, R, b = self.get_bh_terms(
+            prev_timestep, order
+        )
+        outputs = self.history.outputs
+
+        if order == 1:
+            rhos_p = []
+        elif order == 2:
+            rhos_p = [0.5]
+        else:
+            rhos_p = np.linalg.solve(R[:-1, :-1], b[:-1]).tolist()
+
+        # D1s[k] = (m_k - m0) / rk
+        m0_coef = -scale * h_phi_1
+        terms = [(sample_coef, latents)]
+        for k, (rho, rk) in enumerate(zip(rhos_p, rks)):
+            m0_coef += scale * B_h * rho / rk
+            terms.append((-scale * B_h * rho / rk, outputs[-(k + 2)]))
+
+        terms.insert(1, (m0_coef, outputs[-1]))
+        return terms
+
+    def get_corrector_terms(
+        self,
+        timestep: int,
+        last_sample: np.ndarray,
+        this_output: np.ndarray,
+        order: int,
+    ) -> List[Tuple[float, np.ndarray]]:
+        sample_coef, scale, h_phi_1, B_h, rks, R, b = self.get_bh_terms(timestep, order)
+        outputs = self.history.outputs
+
+        if order == 1:
+            rhos_c = [0.5]
+        else:
+            rhos_c = np.linalg.solve(R, b).tolist()
+
+        # D1s[k] = (m_k - m0) / rk, D1_t = model_t - m0
+        m0_coef = -scale * h_phi_1 + scale * B_h * rhos_c[-1]
+        terms = [(sample_coef, last_sample)]
+        for k, (rho, rk) in enumerate(zip(rhos_c[:-1], rks)):
+            m0_coef += scale * B_h * rho / rk
+            terms.append((-scale * B_h * rho / rk, outputs[-(k + 2)]))
+
+        terms.insert(1, (m0_coef, outputs[-1]))
+        terms.append((-scale * B_h * rhos_c[-1], this_output))
+        return terms
+
+    def step(
+        self,
+        model_output: Sample,
+        timestep: int,
+        sample: Sample,
+        return_dict: bool = True,
+    ) -> Union[SchedulerOutput, Tuple]:
+        if not self.has_numpy_step():
+            return super().step(
+                model_output,
+                timestep,
+                sample,
+                return_dict=return_dict,
+            )
+
+        if self.num_inference_steps is None:
+            raise ValueError(
+                "number of inference steps is not set, run set_timesteps before step"
+            )
+
+        output = to_numpy(model_output)
+        latents = to_numpy(sample)
+        scratch = self.get_buffer("scratch", latents)
+        last_sample = self.get_buffer("last_sample", latents)
+
+        num_timesteps = len(self.np_timesteps)
+        step_index = self.get_step_index(timestep, default=num_timesteps - 1)
+        timestep = int(get_scalar(timestep))
+
+        use_corrector = (
+            step_index > 0
+            and step_index - 1 not in self.disable_corrector
+            and self.np_last_sample
+        )
+
+        converted = self.convert_output(output, timestep, latents, scratch)
+
+        if use_corrector:
+            # the previous sample is only used as the first term, so the corrected sample can replace it in place
+            combine(
+                [
+                    (float(c), v)
+                    for c, v in self.get_corrector_terms(
+                        timestep, last_sample, converted, self.this_order
+                    )
+                ],
+                last_sample,
+                scratch,
+            )
+        else:
+            np.copyto(last_sample, latents)
+
+        self.np_last_sample = True
+
+        prev_timestep = (
+            0 if step_index == num_timesteps - 1 else self.np_timesteps[step_index + 1]
+        )
+        self.history.push(converted, timestep)
+
+        if self.config.lower_order_final:
+            this_order = min(self.config.solver_order, num_timesteps - step_index)
+        else:
+            this_order = self.config.solver_order
+
+        self.this_order = min(this_order, self.lower_order_nums + 1)
+
+        prev_sample = combine(
+            [
+                (float(c), v)
+                for c, v in self.get_predictor_terms(
+                    prev_timestep, last_sample, self.this_order
+                )
+            ],
+            self.get_sample_buffer(latents),
+            scratch,
+        )
+
+        if self.lower_order_nums < self.config.solver_order:
+            self.lower_order_nums += 1
+
+        prev_sample = like_input(prev_sample, sample)
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return SchedulerOutput(prev_sample=prev_sample)
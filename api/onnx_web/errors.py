@@ -14,6 +14,14 @@ class CancelledException(Exception):
     pass
 
 
+class PreemptedException(Exception):
+    """
+    Used when a job has saved a checkpoint and needs to stop, so a higher priority job can run.
+    """
+
+    pass
+
+
 class RequestException(Exception):
     """
     Used when an HTTP request has failed.
@@ -1,5 +1,6 @@
 from .utils import (
     expand_image,
+    latents_to_image,
 )
 from .mask_filter import (
     mask_filter_gaussian_multiply,
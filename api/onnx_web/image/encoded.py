@@ -0,0 +1,126 @@
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+if TYPE_CHECKING:
+    from ..worker.shared import SharedBuffer
+
+
+class EncodedImage:
+    """
+    An uploaded image that has not been decoded yet.
+
+    The server only reads the image header, to get the size, and passes the encoded bytes to the worker, which
+    decodes them before running the job. Large images are moved into shared memory when the job is submitted, so
+    only the name of the buffer is sent to the worker. Jobs sent through a broker keep the data in the broker and
+    only send a reference, which the broker restores before the job runs.
+    """
+
+    data: Optional[bytes]
+    buffer: Optional["SharedBuffer"]
+    ref: Optional[int]
+    mode: str
+    background: Optional[Tuple[int, ...]]
+
+    def __init__(
+        self,
+        data: bytes,
+        mode: str = "RGB",
+        background: Optional[Tuple[int, ...]] = None,
+    ) -> None:
+        self.data = data
+        self.buffer = None
+        self.ref = None
+        self.mode = mode
+        self.background = background
+
+    def __repr__(self) -> str:
+        if self.buffer is not None:
+            return f"EncodedImage({self.buffer}, {self.mode})"
+
+        if self.data is None:
+            return f"EncodedImage(ref {self.ref}, {self.mode})"
+
+        return f"EncodedImage({len(self.data)} bytes, {self.mode})"
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        # opening an image only reads the header, the pixels are not decoded until they are used
+        with Image.open(BytesIO(self.get_data())) as image:
+            return image.size
+
+    def get_data(self) -> bytes:
+        if self.buffer is not None:
+            try:
+                return self.buffer.map().tobytes()
+            finally:
+                self.buffer.close()
+
+        return self.data
+
+    def share(self, min_size: int = 0) -> Optional["SharedBuffer"]:
+        """
+        Move the encoded data into shared memory, if it is at least `min_size` bytes. The caller owns the buffer
+        and must release it once the image has been decoded.
+        """
+        from ..worker.shared import SharedBuffer
+
+        if self.data is None or len(self.data) < min_size:
+            return None
+
+        self.buffer = SharedBuffer.from_array(np.frombuffer(self.data, dtype=np.uint8))
+        self.data = None
+        return self.buffer
+
+    def decode(self) -> Image.Image:
+        image = Image.open(BytesIO(self.get_data())).convert(self.mode)
+
+        if self.background is not None:
+            base = Image.new(self.mode, image.size, color=self.background)
+            base.alpha_composite(image)
+            image = base
+
+        return image
+
+    @classmethod
+    def from_file(
+        cls,
+        file: Any,
+        mode: str = "RGB",
+        background: Optional[Tuple[int, ...]] = None,
+    ) -> "EncodedImage":
+        return EncodedImage(file.read(), mode=mode, background=background)
+
+
+def find_images(value: Any) -> List[EncodedImage]:
+    """
+    Find the encoded images in a job argument, including lists, tuples, and dicts of them, in a stable order.
+    """
+    if isinstance(value, EncodedImage):
+        return [value]
+
+    if isinstance(value, (list, tuple)):
+        return [image for item in value for image in find_images(item)]
+
+    if isinstance(value, dict):
+        return [image for item in value.values() for image in find_images(item)]
+
+    return []
+
+
+def decode_images(value: Any) -> Any:
+    """
+    Decode any encoded images in a job argument, including lists and dicts of them.
+    """
+    if isinstance(value, EncodedImage):
+        return value.decode()
+
+    if isinstance(value, list):
+        return [decode_images(item) for item in value]
+
+    if isinstance(value, dict):
+        return {key: decode_images(item) for key, item in value.items()}
+
+    return value
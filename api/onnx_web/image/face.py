@@ -0,0 +1,269 @@
+from logging import getLogger
+from typing import Any, Callable, List, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+logger = getLogger(__name__)
+
+FACE_BATCH_SIZE = 8
+FACE_DETECT_SIZE = 1024
+FACE_PARSE_SIZE = 512
+
+# parsing labels that should be kept from the restored face, from facexlib
+FACE_PARSE_COLORMAP = [0, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 0, 255, 0, 0, 0]  # fmt: skip
+
+FaceRestorer = Callable[[torch.Tensor], torch.Tensor]
+
+
+def detect_faces(
+    face_helper: Any,
+    image: np.ndarray,
+    detect_size: int = FACE_DETECT_SIZE,
+    only_center_face: bool = False,
+) -> int:
+    """
+    Detect and align faces using a downscaled copy of the image, if it is larger than the detection size.
+
+    The landmarks are scaled back to the full image before alignment, so the aligned crops still come from the
+    full-resolution source.
+    """
+    face_helper.clean_all()
+    face_helper.read_image(image)
+    full_image = face_helper.input_img
+
+    height, width = full_image.shape[0:2]
+    scale = 1.0
+    if min(height, width) > detect_size and not face_helper.pad_blur:
+        # the padded crops for blurry faces are taken from the detection image, so they need the full image
+        scale = detect_size / min(height, width)
+        face_helper.input_img = cv2.resize(
+            full_image,
+            (round(width * scale), round(height * scale)),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    try:
+        count = face_helper.get_face_landmarks_5(
+            only_center_face=only_center_face,
+            eye_dist_threshold=5 * scale,
+        )
+    finally:
+        face_helper.input_img = full_image
+
+    logger.debug("detected %s faces at scale %s", count, scale)
+
+    if scale != 1.0:
+        face_helper.all_landmarks_5 = [
+            landmarks / scale for landmarks in face_helper.all_landmarks_5
+        ]
+        face_helper.det_faces = [
+            np.concatenate([bbox[0:4] / scale, bbox[4:]])
+            for bbox in face_helper.det_faces
+        ]
+
+    face_helper.align_warp_face()
+    return len(face_helper.cropped_faces)
+
+
+def faces_to_tensor(faces: List[np.ndarray], device: torch.device) -> torch.Tensor:
+    # BGR uint8 HWC -> RGB float NCHW in [-1, 1], matching basicsr.img2tensor and normalize
+    batch = np.stack(faces).astype(np.float32)[:, :, :, ::-1]
+    batch = (batch / 127.5) - 1.0
+    return torch.from_numpy(batch.transpose((0, 3, 1, 2)).copy()).to(device)
+
+
+def tensor_to_faces(batch: torch.Tensor) -> List[np.ndarray]:
+    # RGB float NCHW in [-1, 1] -> BGR uint8 HWC, matching basicsr.tensor2img
+    batch = batch.float().detach().cpu().clamp_(-1, 1).numpy()
+    batch = (batch + 1.0) / 2.0
+    batch = (batch.transpose((0, 2, 3, 1))[:, :, :, ::-1] * 255.0).round()
+    return [face.astype(np.uint8) for face in batch]
+
+
+@torch.no_grad()
+def restore_faces(
+    face_helper: Any,
+    restore: FaceRestorer,
+    batch_size: int = FACE_BATCH_SIZE,
+) -> List[np.ndarray]:
+    """
+    Run the aligned faces through the restoration model in batches, rather than one face per call.
+    """
+    faces = face_helper.cropped_faces
+    restored = []
+
+    for start in range(0, len(faces), batch_size):
+        batch = faces[start : start + batch_size]
+        logger.debug("restoring batch of %s faces", len(batch))
+        try:
+            output = restore(faces_to_tensor(batch, face_helper.device))
+            restored.extend(tensor_to_faces(output))
+        except RuntimeError:
+            logger.exception("error restoring faces, keeping original crops")
+            restored.extend(batch)
+
+    for face in restored:
+        face_helper.add_restored_face(face)
+
+    return restored
+
+
+@torch.no_grad()
+def get_parse_masks(face_helper: Any, faces: List[np.ndarray]) -> List[np.ndarray]:
+    """
+    Run the face parsing model on all of the restored faces in a single batch and build soft masks.
+    """
+    resized = [
+        cv2.resize(
+            face, (FACE_PARSE_SIZE, FACE_PARSE_SIZE), interpolation=cv2.INTER_LINEAR
+        )
+        for face in faces
+    ]
+    labels = face_helper.face_parse(faces_to_tensor(resized, face_helper.device))[0]
+    labels = labels.argmax(dim=1).cpu().numpy()
+
+    colormap = np.array(FACE_PARSE_COLORMAP, dtype=np.float32)
+    masks = []
+    for face, label in zip(faces, labels):
+        mask = colormap[label]
+        mask = cv2.GaussianBlur(mask, (101, 101), 11)
+        mask = cv2.GaussianBlur(mask, (101, 101), 11)
+
+        # remove the black borders
+        thres = 10
+        mask[:thres, :] = 0
+        mask[-thres:, :] = 0
+        mask[:, :thres] = 0
+        mask[:, -thres:] = 0
+
+        masks.append(cv2.resize(mask / 255.0, face.shape[:2]))
+
+    return masks
+
+
+def get_square_mask(
+    face_size: Tuple[int, int], inverse_affine: np.ndarray, region: Tuple[int, int]
+) -> np.ndarray:
+    mask = np.ones(face_size, dtype=np.float32)
+    inv_mask = cv2.warpAffine(mask, inverse_affine, region)
+
+    # remove the black borders and compute the fusion edge based on the area of face
+    inv_mask_erosion = cv2.erode(inv_mask, np.ones((2, 2), np.uint8))
+    total_face_area = np.sum(inv_mask_erosion)
+    w_edge = int(total_face_area**0.5) // 20
+    erosion_radius = max(w_edge * 2, 1)
+    inv_mask_center = cv2.erode(
+        inv_mask_erosion, np.ones((erosion_radius, erosion_radius), np.uint8)
+    )
+
+    blur_size = w_edge * 2
+    return cv2.GaussianBlur(inv_mask_center, (blur_size + 1, blur_size + 1), 0)
+
+
+def get_face_region(
+    inverse_affine: np.ndarray,
+    face_size: Tuple[int, int],
+    width: int,
+    height: int,
+    pad: int = 4,
+) -> Tuple[int, int, int, int]:
+    """
+    Find the bounding box of a restored face after it has been warped back into the source image.
+    """
+    face_width, face_height = face_size
+    corners = np.array(
+        [
+            [0, 0, 1],
+            [face_width, 0, 1],
+            [0, face_height, 1],
+            [face_width, face_height, 1],
+        ],
+        dtype=np.float32,
+    )
+    points = corners @ inverse_affine.T
+
+    left = max(int(np.floor(points[:, 0].min())) - pad, 0)
+    top = max(int(np.floor(points[:, 1].min())) - pad, 0)
+    right = min(int(np.ceil(points[:, 0].max())) + pad, width)
+    bottom = min(int(np.ceil(points[:, 1].max())) + pad, height)
+
+    return (left, top, right, bottom)
+
+
+def paste_faces(
+    face_helper: Any,
+    image: np.ndarray,
+    restored_faces: List[np.ndarray],
+) -> np.ndarray:
+    """
+    Paste the restored faces back into the source image, in place, only touching the region around each face.
+
+    This is equivalent to `FaceRestoreHelper.paste_faces_to_input_image` with an upscale factor of 1, but works on
+    each face's bounding box rather than warping and blending full-size copies of the image for every face.
+    """
+    height, width = image.shape[0:2]
+
+    if face_helper.use_parse and len(restored_faces) > 0:
+        masks = get_parse_masks(face_helper, restored_faces)
+    else:
+        masks = [None] * len(restored_faces)
+
+    for restored_face, affine, mask in zip(
+        restored_faces, face_helper.affine_matrices, masks
+    ):
+        inverse_affine = cv2.invertAffineTransform(affine)
+        left, top, right, bottom = get_face_region(
+            inverse_affine, face_helper.face_size, width, height
+        )
+        if right <= left or bottom <= top:
+            logger.debug("restored face is outside of the image, skipping")
+            continue
+
+        # shift the transform into the face region
+        region_affine = inverse_affine.copy()
+        region_affine[0, 2] -= left
+        region_affine[1, 2] -= top
+        region_size = (right - left, bottom - top)
+
+        pasted_face = cv2.warpAffine(restored_face, region_affine, region_size).astype(
+            np.float32
+        )
+        if mask is None:
+            soft_mask = get_square_mask(
+                face_helper.face_size, region_affine, region_size
+            )
+        else:
+            soft_mask = cv2.warpAffine(mask, region_affine, region_size, flags=3)
+
+        soft_mask = soft_mask[:, :, np.newaxis]
+        region = image[top:bottom, left:right, 0:3].astype(np.float32)
+        blended = soft_mask * pasted_face + (1 - soft_mask) * region
+        image[top:bottom, left:right, 0:3] = np.clip(blended, 0, 255).astype(
+            image.dtype
+        )
+
+    return image
+
+
+def correct_faces(
+    face_helper: Any,
+    image: np.ndarray,
+    restore: FaceRestorer,
+    detect_size: int = FACE_DETECT_SIZE,
+    batch_size: int = FACE_BATCH_SIZE,
+) -> np.ndarray:
+    """
+    Detect, restore, and paste back all of the faces in an image, without changing its size.
+
+    The cost depends on the number of faces rather than the size of the image.
+    """
+    count = detect_faces(face_helper, image, detect_size=detect_size)
+    if count == 0:
+        logger.debug("no faces detected, skipping correction")
+        return image
+
+    logger.info("correcting %s faces", count)
+    restored = restore_faces(face_helper, restore, batch_size=batch_size)
+    return paste_faces(face_helper, image, restored)
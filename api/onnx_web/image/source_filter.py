@@ -3,23 +3,22 @@
 from logging import getLogger
 from os import path
 
-import cv2
 import numpy as np
-import torch
-import transformers
-from controlnet_aux import HEDdetector, MLSDdetector, OpenposeDetector
-from huggingface_hub import snapshot_download
 from PIL import Image, ImageChops, ImageFilter
 
 from ..server.context import ServerContext
 from .ade_palette import ade_palette
-from .laion_face import generate_annotation
 from .noise_source import noise_source_histogram
 
 logger = getLogger(__name__)
 
+# the detectors and their dependencies are imported by each filter, since they take longer to load than
+# the rest of the server and most of them will not be used
+
 
 def pil_to_cv2(source: Image.Image) -> np.ndarray:
+    import cv2
+
     return cv2.cvtColor(np.array(source), cv2.COLOR_RGB2BGR)
 
 
@@ -57,6 +56,8 @@ def source_filter_face(
     max_faces: int = 1,
     min_confidence: float = 0.5,
 ) -> Image.Image:
+    from .laion_face import generate_annotation
+
     logger.debug("running face detection on source image")
 
     image = generate_annotation(pil_to_cv2(source), max_faces, min_confidence)
@@ -66,6 +67,10 @@ def source_filter_face(
 
 
 def source_filter_segment(server: ServerContext, source: Image.Image) -> Image.Image:
+    import torch
+    import transformers
+    from huggingface_hub import snapshot_download
+
     logger.debug("running segmentation on source image")
 
     openmm_model = snapshot_download(
@@ -107,6 +112,8 @@ def source_filter_segment(server: ServerContext, source: Image.Image) -> Image.I
 
 
 def source_filter_mlsd(server: ServerContext, source: Image.Image) -> Image.Image:
+    from controlnet_aux import MLSDdetector
+
     logger.debug("running MLSD on source image")
 
     mlsd = MLSDdetector.from_pretrained(
@@ -119,6 +126,10 @@ def source_filter_mlsd(server: ServerContext, source: Image.Image) -> Image.Imag
 
 
 def source_filter_normal(server: ServerContext, source: Image.Image) -> Image.Image:
+    import cv2
+    import transformers
+    from huggingface_hub import snapshot_download
+
     logger.debug("running normal detection on source image")
 
     depth_estimator = transformers.pipeline(
@@ -157,6 +168,8 @@ def source_filter_normal(server: ServerContext, source: Image.Image) -> Image.Im
 
 
 def source_filter_hed(server: ServerContext, source: Image.Image) -> Image.Image:
+    from controlnet_aux import HEDdetector
+
     logger.debug("running HED detection on source image")
 
     hed = HEDdetector.from_pretrained(
@@ -169,6 +182,8 @@ def source_filter_hed(server: ServerContext, source: Image.Image) -> Image.Image
 
 
 def source_filter_scribble(server: ServerContext, source: Image.Image) -> Image.Image:
+    from controlnet_aux import HEDdetector
+
     logger.debug("running scribble detection on source image")
 
     hed = HEDdetector.from_pretrained(
@@ -181,6 +196,8 @@ def source_filter_scribble(server: ServerContext, source: Image.Image) -> Image.
 
 
 def source_filter_depth(server: ServerContext, source: Image.Image) -> Image.Image:
+    import transformers
+
     logger.debug("running depth detection on source image")
     depth_estimator = transformers.pipeline("depth-estimation")
 
@@ -196,6 +213,8 @@ def source_filter_depth(server: ServerContext, source: Image.Image) -> Image.Ima
 def source_filter_canny(
     server: ServerContext, source: Image.Image, low_threshold=100, high_threshold=200
 ) -> Image.Image:
+    import cv2
+
     logger.debug("running Canny detection on source image")
 
     image = cv2.Canny(pil_to_cv2(source), low_threshold, high_threshold)
@@ -206,6 +225,8 @@ def source_filter_canny(
 
 
 def source_filter_openpose(server: ServerContext, source: Image.Image) -> Image.Image:
+    from controlnet_aux import OpenposeDetector
+
     logger.debug("running OpenPose detection on source image")
 
     model = OpenposeDetector.from_pretrained(
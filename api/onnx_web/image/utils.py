@@ -1,9 +1,23 @@
+from typing import Any
+
+import numpy as np
 from PIL import Image, ImageChops
 
 from ..params import Border, Size
 from .mask_filter import mask_filter_none
 from .noise_source import noise_source_histogram
 
+# approximate linear projection from SD v1 latent channels to RGB, commonly used for previews
+LATENT_RGB_FACTORS = np.array(
+    [
+        [0.298, 0.207, 0.208],
+        [0.187, 0.286, 0.173],
+        [-0.158, 0.189, 0.264],
+        [-0.184, -0.271, -0.473],
+    ],
+    dtype=np.float32,
+)
+
 
 # very loosely based on https://github.com/AUTOMATIC1111/stable-diffusion-webui/blob/master/scripts/outpainting_mk_2.py#L175-L232
 def expand_image(
@@ -29,3 +43,18 @@ def expand_image(
     full_source = Image.composite(full_noise, full_source, full_mask.convert("L"))
 
     return (full_source, full_mask, full_noise, size)
+
+
+def latents_to_image(latents: Any) -> Image.Image:
+    """
+    Make a low-resolution preview of the first image in a batch of latents, without running the VAE.
+
+    The preview is the same size as the latents, 1/8th of the output size.
+    """
+    if hasattr(latents, "cpu"):
+        latents = latents.cpu().numpy()
+
+    latents = np.asarray(latents, dtype=np.float32)[0]  # first image, CHW
+    rgb = np.tensordot(latents, LATENT_RGB_FACTORS, axes=([0], [0]))  # HWC
+    rgb = np.clip((rgb + 1.0) * 127.5, 0, 255).astype(np.uint8)
+    return Image.fromarray(rgb, "RGB")
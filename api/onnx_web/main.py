@@ -3,30 +3,29 @@ import gc
 import mimetypes
 from functools import partial
 from logging import getLogger
+from multiprocessing import set_start_method
 
-from diffusers.utils.logging import disable_progress_bar
 from flask import Flask
 from flask_cors import CORS
-from huggingface_hub.utils.tqdm import disable_progress_bars
 from setproctitle import setproctitle
-from torch.multiprocessing import set_start_method
 
 from .server.admin import register_admin_routes
 from .server.api import register_api_routes
 from .server.context import ServerContext
-from .server.hacks import apply_patches
 from .server.load import (
     get_available_platforms,
     load_extras,
     load_models,
     load_params,
     load_platforms,
+    load_schemas,
     load_wildcards,
 )
+from .server.output_index import load_output_index
 from .server.static import register_static_routes
 from .server.utils import check_paths
 from .utils import is_debug
-from .worker import DevicePoolExecutor
+from .worker import DevicePoolExecutor, RemotePoolExecutor, get_job_broker
 
 logger = getLogger(__name__)
 
@@ -41,26 +40,26 @@ def main():
 
     # launch server, read env and list paths
     server = ServerContext.from_environ()
-    apply_patches(server)
     check_paths(server)
     load_extras(server)
     load_models(server)
     load_params(server)
     load_platforms(server)
+    load_schemas(server)
     load_wildcards(server)
+    load_output_index(server)
 
     if is_debug():
         gc.set_debug(gc.DEBUG_STATS)
 
-    if not server.show_progress:
-        disable_progress_bar()
-        disable_progress_bars()
-
     # create workers
     # any is a fake device and should not be in the pool
-    pool = DevicePoolExecutor(
-        server, [p for p in get_available_platforms() if p.device != "any"]
-    )
+    devices = [p for p in get_available_platforms() if p.device != "any"]
+    broker = get_job_broker(server)
+    if broker is None:
+        pool = DevicePoolExecutor(server, devices)
+    else:
+        pool = RemotePoolExecutor(server, devices, broker)
 
     # create server
     app = Flask(__name__)
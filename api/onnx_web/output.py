@@ -1,38 +1,74 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from hashlib import sha256
 from json import dumps
 from logging import getLogger
-from os import path
+from os import makedirs, path, remove, replace
+from os.path import exists
+from re import compile
 from struct import pack
+from threading import BoundedSemaphore, Lock
 from time import time
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from piexif import ExifIFD, ImageIFD, dump
 from piexif.helper import UserComment
 from PIL import Image, PngImagePlugin
 
-from onnx_web.convert.utils import resolve_tensor
 from onnx_web.server.load import get_extra_hashes
 
+from .constants import RESOLVE_FORMATS
+from .image.utils import latents_to_image
 from .params import Border, HighresParams, ImageParams, Param, Size, UpscaleParams
 from .server import ServerContext
+from .server.file_hash import hash_file_cached
+from .server.output_index import get_output_index
 from .utils import base_join
 
 logger = getLogger(__name__)
 
-HASH_BUFFER_SIZE = 2**22  # 4MB
+# paths within the output path
+PREVIEW_PATH = "previews"
+THUMBNAIL_PATH = "thumbnails"
+THUMBNAIL_QUALITY = 80
 
+# LoRA and Textual Inversion tokens, only the type and name are needed to find the file
+NETWORK_TOKEN = compile(r"\<(inversion|lora):([^:\>]+):")
 
-def hash_file(name: str):
-    sha = sha256()
-    with open(name, "rb") as f:
-        while True:
-            data = f.read(HASH_BUFFER_SIZE)
-            if not data:
-                break
+# names that Pillow does not recognize as formats
+IMAGE_FORMATS = {
+    "jpg": "jpeg",
+}
 
-            sha.update(data)
 
-    return sha.hexdigest()
+# model hashes, keyed by model path, with the modification time of the hash file
+model_hashes: Dict[str, Tuple[Optional[float], Optional[str]]] = {}
+
+
+def get_model_hash(model: str) -> str:
+    """
+    Get the hash for a model from the extra models or its hash file, reading the hash file only once.
+    """
+    model_name = path.basename(path.normpath(model))
+    model_hash = get_extra_hashes().get(model_name, None)
+    if model_hash is not None:
+        return model_hash
+
+    model_hash_path = path.join(model, "hash.txt")
+    mtime = None
+    if path.exists(model_hash_path):
+        mtime = path.getmtime(model_hash_path)
+
+    cached_mtime, model_hash = model_hashes.get(model, (None, None))
+    if model not in model_hashes or cached_mtime != mtime:
+        logger.debug("reading model hash for %s", model_name)
+        model_hash = None
+        if mtime is not None:
+            with open(model_hash_path, "r") as f:
+                model_hash = f.readline().rstrip(",. \n\t\r")
+
+        model_hashes[model] = (mtime, model_hash)
+
+    return model_hash or "unknown"
 
 
 def hash_value(sha, param: Optional[Param]):
@@ -50,6 +86,28 @@ def hash_value(sha, param: Optional[Param]):
         logger.warning("cannot hash param: %s, %s", param, type(param))
 
 
+def get_output_size(
+    size: Size,
+    upscale: Optional[UpscaleParams] = None,
+    border: Optional[Border] = None,
+    highres: Optional[HighresParams] = None,
+) -> Size:
+    """
+    Calculate the final output size, after the border, highres, and upscaling have been applied.
+    """
+    output_size = size
+    if border is not None:
+        output_size = output_size.add_border(border)
+
+    if highres is not None:
+        output_size = highres.resize(output_size)
+
+    if upscale is not None:
+        output_size = upscale.resize(output_size)
+
+    return output_size
+
+
 def json_params(
     outputs: List[str],
     params: ImageParams,
@@ -68,21 +126,16 @@ def json_params(
     json["params"]["model"] = path.basename(params.model)
     json["params"]["scheduler"] = params.scheduler
 
-    # calculate final output size
-    output_size = size
     if border is not None:
         json["border"] = border.tojson()
-        output_size = output_size.add_border(border)
 
     if highres is not None:
         json["highres"] = highres.tojson()
-        output_size = highres.resize(output_size)
 
     if upscale is not None:
         json["upscale"] = upscale.tojson()
-        output_size = upscale.resize(output_size)
 
-    json["size"] = output_size.tojson()
+    json["size"] = get_output_size(size, upscale, border, highres).tojson()
 
     return json
 
@@ -94,17 +147,13 @@ def str_params(
     inversions: List[Tuple[str, float]] = None,
     loras: List[Tuple[str, float]] = None,
 ) -> str:
+    # the convert utils need Torch and ONNX, which are only loaded by the workers
+    from .convert.utils import resolve_tensor
+
     model_name = path.basename(path.normpath(params.model))
     logger.debug("getting model hash for %s", model_name)
 
-    model_hash = get_extra_hashes().get(model_name, None)
-    if model_hash is None:
-        model_hash_path = path.join(params.model, "hash.txt")
-        if path.exists(model_hash_path):
-            with open(model_hash_path, "r") as f:
-                model_hash = f.readline().rstrip(",. \n\t\r")
-
-    model_hash = model_hash or "unknown"
+    model_hash = get_model_hash(params.model)
     hash_map = {
         model_name: model_hash,
     }
@@ -114,7 +163,7 @@ def str_params(
         inversion_pairs = [
             (
                 name,
-                hash_file(
+                hash_file_cached(
                     resolve_tensor(path.join(server.model_path, "inversion", name))
                 ).upper(),
             )
@@ -130,7 +179,7 @@ def str_params(
         lora_pairs = [
             (
                 name,
-                hash_file(
+                hash_file_cached(
                     resolve_tensor(path.join(server.model_path, "lora", name))
                 ).upper(),
             )
@@ -187,6 +236,331 @@ def make_output_name(
     ]
 
 
+def get_network_hashes(server: ServerContext, params: ImageParams) -> Dict[str, str]:
+    """
+    Hash the LoRA and Textual Inversion files used in the prompts, without loading the convert utils.
+    """
+    hashes = {}
+    for prompt in [params.prompt, params.negative_prompt]:
+        for network_type, name in NETWORK_TOKEN.findall(prompt or ""):
+            key = f"{network_type}:{name}"
+            if key in hashes:
+                continue
+
+            base = path.join(server.model_path, network_type, name)
+            tensor = next(
+                (
+                    f"{base}.{extension}"
+                    for extension in RESOLVE_FORMATS
+                    if path.exists(f"{base}.{extension}")
+                ),
+                None,
+            )
+            hashes[key] = "missing" if tensor is None else hash_file_cached(tensor)
+
+    return hashes
+
+
+def make_request_digest(
+    server: ServerContext,
+    mode: str,
+    params: ImageParams,
+    size: Size,
+    upscale: Optional[UpscaleParams] = None,
+    border: Optional[Border] = None,
+    highres: Optional[HighresParams] = None,
+    extras: Optional[List[Any]] = None,
+    sources: Optional[List[Any]] = None,
+) -> str:
+    """
+    Hash everything that can change the outputs of a request, so identical requests can reuse the earlier outputs.
+
+    Unlike the output name, this includes the model and network file hashes, so replacing a file will not return
+    stale outputs, and the contents of any source images, which must have a `get_data` method.
+    """
+    request = {
+        "border": None if border is None else border.tojson(),
+        "extras": extras,
+        "format": server.image_format,
+        "highres": None if highres is None else highres.tojson(),
+        "mode": mode,
+        "model_hash": get_model_hash(params.model),
+        "networks": get_network_hashes(server, params),
+        "params": params.tojson(),
+        "size": size.tojson(),
+        "upscale": None if upscale is None else upscale.tojson(),
+        "version": server.server_version,
+    }
+
+    sha = sha256()
+    sha.update(dumps(request, sort_keys=True, default=str).encode("utf-8"))
+
+    for source in sources or []:
+        if source is None:
+            hash_value(sha, "none")
+        else:
+            sha.update(sha256(source.get_data()).digest())
+
+    return sha.hexdigest()
+
+
+def get_cached_result(server: ServerContext, digest: str) -> Optional[List[str]]:
+    """
+    Get the outputs from an earlier request with the same digest, if they have all been written.
+
+    The outputs are recorded when the job is queued, so they will not be returned until the job has finished.
+    """
+    index = get_output_index(server)
+    if not server.result_cache or index is None:
+        return None
+
+    outputs = index.get_result(digest)
+    if outputs is None:
+        return None
+
+    if not all(exists(base_join(server.output_path, output)) for output in outputs):
+        logger.debug("cached result has not been written yet: %s", digest)
+        return None
+
+    return outputs
+
+
+def find_cached_result(
+    server: ServerContext,
+    mode: str,
+    params: ImageParams,
+    size: Size,
+    **kwargs,
+) -> Tuple[Optional[str], Optional[List[str]]]:
+    """
+    Check the result cache for a request, returning the request digest and any earlier outputs.
+
+    The digest is also used to find duplicate jobs, so it is returned even when the result cache is disabled.
+    """
+    digest = make_request_digest(server, mode, params, size, **kwargs)
+    return (digest, get_cached_result(server, digest))
+
+
+def add_cached_result(
+    server: ServerContext, digest: Optional[str], outputs: List[str]
+) -> None:
+    index = get_output_index(server)
+    if not server.result_cache or digest is None or index is None:
+        return
+
+    try:
+        index.add_result(digest, outputs)
+        evict_results(server)
+    except Exception:
+        # the job has already been queued, so this should not fail the request
+        logger.exception("error adding result to cache: %s", digest)
+
+
+def evict_results(server: ServerContext) -> int:
+    """
+    Remove the cached results that have expired or are beyond the limit, along with their output files.
+    """
+    index = get_output_index(server)
+    if index is None:
+        return 0
+
+    outputs = index.expire_results(server.result_cache_limit, server.result_cache_ttl)
+    for output in outputs:
+        remove_output(server, output)
+
+    if len(outputs) > 0:
+        logger.debug("evicted %s cached outputs", len(outputs))
+
+    return len(outputs)
+
+
+def remove_output(server: ServerContext, output: str) -> None:
+    """
+    Remove an output image, with its JSON file and thumbnail, and remove it from the output index.
+    """
+    names = [output, f"{output}.json"]
+
+    index = get_output_index(server)
+    if index is not None:
+        row = index.get_output(output)
+        if row is not None and row["thumbnail"] is not None:
+            names.append(row["thumbnail"])
+
+        index.remove_output(output)
+
+    for name in names:
+        file = base_join(server.output_path, name)
+        if exists(file):
+            logger.trace("removing output file: %s", file)
+            remove(file)
+
+
+def get_pil_format(image_format: str, fallback: str = "PNG") -> str:
+    Image.init()
+    pil_format = IMAGE_FORMATS.get(image_format, image_format).upper()
+    if pil_format not in Image.SAVE:
+        logger.warning(
+            "image format %s is not supported by this version of Pillow, using %s",
+            pil_format,
+            fallback,
+        )
+        return fallback
+
+    return pil_format
+
+
+def get_image_format(server: ServerContext) -> str:
+    return get_pil_format(server.image_format)
+
+
+def write_atomic(path: str, write: Callable[[str], None]) -> str:
+    """
+    Write to a temporary file and rename it into place, so a partially written file is never visible.
+    """
+    temp_path = f"{path}.tmp"
+    try:
+        write(temp_path)
+        replace(temp_path, path)
+    except Exception:
+        if exists(temp_path):
+            remove(temp_path)
+        raise
+
+    return path
+
+
+class OutputWriter:
+    """
+    Encode and write output files on a bounded pool of background threads.
+
+    Submitting more files than the queue limit will block until an earlier file has been written, so a slow disk
+    cannot cause unbounded memory growth.
+    """
+
+    def __init__(self, workers: int, queue_limit: Optional[int] = None) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="onnx-web output"
+        )
+        self.futures: List[Future] = []
+        self.lock = Lock()
+        self.slots = BoundedSemaphore(queue_limit or (workers * 4))
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self.slots.release()
+            raise
+
+        future.add_done_callback(lambda _f: self.slots.release())
+        with self.lock:
+            self.futures.append(future)
+
+        return future
+
+    def drain(self) -> List[Future]:
+        """
+        Collect the files that have been submitted since the last call.
+        """
+        with self.lock:
+            futures = self.futures
+            self.futures = []
+
+        return futures
+
+
+output_writer: Optional[OutputWriter] = None
+
+
+def when_written(futures: List[Future], callback: Callable[[bool], None]) -> None:
+    """
+    Call the callback once all of the futures have finished, with a flag indicating whether any of them failed.
+    """
+    if len(futures) == 0:
+        callback(False)
+        return
+
+    lock = Lock()
+    remaining = [len(futures)]
+    failed = [False]
+
+    def on_done(future: Future):
+        with lock:
+            if future.exception() is not None:
+                logger.error("error writing output file", exc_info=future.exception())
+                failed[0] = True
+
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+
+        callback(failed[0])
+
+    for future in futures:
+        future.add_done_callback(on_done)
+
+
+def get_output_writer(server: ServerContext) -> Optional[OutputWriter]:
+    global output_writer
+
+    if server.output_workers < 1:
+        return None
+
+    if output_writer is None:
+        logger.debug("starting output writer with %s threads", server.output_workers)
+        output_writer = OutputWriter(server.output_workers)
+
+    return output_writer
+
+
+def drain_output_writes() -> List[Future]:
+    if output_writer is None:
+        return []
+
+    return output_writer.drain()
+
+
+class OutputMetadata:
+    """
+    Metadata shared by all of the outputs from a job, which only differ by filename.
+
+    This is built once per job, before the images are saved, and reused for the image text, the JSON sidecar,
+    and the manifest.
+    """
+
+    json: Dict[str, Any]
+    text: str
+
+    def __init__(self, json: Dict[str, Any], text: str) -> None:
+        self.json = json
+        self.text = text
+
+    def tojson(self, outputs: Union[str, List[str]]) -> Dict[str, Any]:
+        json = self.json.copy()
+        json["outputs"] = outputs
+        return json
+
+    @classmethod
+    def from_params(
+        cls,
+        server: ServerContext,
+        params: ImageParams,
+        size: Size,
+        upscale: Optional[UpscaleParams] = None,
+        border: Optional[Border] = None,
+        highres: Optional[HighresParams] = None,
+        inversions: List[Tuple[str, float]] = None,
+        loras: List[Tuple[str, float]] = None,
+    ) -> "OutputMetadata":
+        return cls(
+            json_params(
+                [], params, size, upscale=upscale, border=border, highres=highres
+            ),
+            str_params(server, params, size, inversions=inversions, loras=loras),
+        )
+
+
 def save_image(
     server: ServerContext,
     output: str,
@@ -198,79 +572,189 @@ def save_image(
     highres: Optional[HighresParams] = None,
     inversions: List[Tuple[str, float]] = None,
     loras: List[Tuple[str, float]] = None,
+    metadata: Optional[OutputMetadata] = None,
+) -> str:
+    """
+    Save an image and its parameters to the output path.
+
+    When saving more than one image from the same job, build the metadata once and pass it to each call.
+
+    If the server has output workers, the image will be encoded and written in the background and the path
+    returned immediately. The image must not be modified after it has been passed to this function.
+    """
+    if metadata is None and params is not None:
+        metadata = OutputMetadata.from_params(
+            server,
+            params,
+            size,
+            upscale=upscale,
+            border=border,
+            highres=highres,
+            inversions=inversions,
+            loras=loras,
+        )
+
+    writer = get_output_writer(server)
+    if writer is None:
+        return write_image(server, output, image, metadata)
+
+    writer.submit(write_image, server, output, image, metadata)
+    return base_join(server.output_path, output)
+
+
+def write_image(
+    server: ServerContext,
+    output: str,
+    image: Image.Image,
+    metadata: Optional[OutputMetadata] = None,
 ) -> str:
     path = base_join(server.output_path, output)
+    image_format = get_image_format(server)
 
-    if server.image_format == "png":
+    if image_format == "PNG":
         exif = PngImagePlugin.PngInfo()
 
-        if params is not None:
+        if metadata is not None:
             exif.add_text("make", "onnx-web")
-            exif.add_text(
-                "maker note",
-                dumps(
-                    json_params(
-                        [output],
-                        params,
-                        size,
-                        upscale=upscale,
-                        border=border,
-                        highres=highres,
-                    )
-                ),
-            )
+            exif.add_text("maker note", dumps(metadata.tojson([output])))
             exif.add_text("model", server.server_version)
-            exif.add_text(
-                "parameters",
-                str_params(server, params, size, inversions=inversions, loras=loras),
-            )
-
-        image.save(path, format=server.image_format, pnginfo=exif)
+            exif.add_text("parameters", metadata.text)
+
+        write_atomic(
+            path,
+            lambda temp_path: image.save(
+                temp_path,
+                format=image_format,
+                pnginfo=exif,
+                compress_level=server.png_compression,
+            ),
+        )
     else:
-        exif = dump(
-            {
-                "0th": {
-                    ExifIFD.MakerNote: UserComment.dump(
-                        dumps(
-                            json_params(
-                                [output],
-                                params,
-                                size,
-                                upscale=upscale,
-                                border=border,
-                                highres=highres,
-                            )
+        exif = b""
+        if metadata is not None:
+            exif = dump(
+                {
+                    "0th": {
+                        ExifIFD.MakerNote: UserComment.dump(
+                            dumps(metadata.tojson([output])),
+                            encoding="unicode",
                         ),
-                        encoding="unicode",
-                    ),
-                    ExifIFD.UserComment: UserComment.dump(
-                        str_params(
-                            server, params, size, inversions=inversions, loras=loras
+                        ExifIFD.UserComment: UserComment.dump(
+                            metadata.text,
+                            encoding="unicode",
                         ),
-                        encoding="unicode",
-                    ),
-                    ImageIFD.Make: "onnx-web",
-                    ImageIFD.Model: server.server_version,
+                        ImageIFD.Make: "onnx-web",
+                        ImageIFD.Model: server.server_version,
+                    }
                 }
-            }
-        )
-        image.save(path, format=server.image_format, exif=exif)
+            )
 
-    if params is not None:
-        save_params(
-            server,
-            output,
-            params,
-            size,
-            upscale=upscale,
-            border=border,
-            highres=highres,
+        write_atomic(
+            path,
+            lambda temp_path: image.save(temp_path, format=image_format, exif=exif),
         )
 
+    if metadata is not None:
+        if not server.output_manifest:
+            write_params(server, output, metadata)
+
+        thumbnail = write_thumbnail(server, output, image)
+        index_output(server, output, metadata, thumbnail=thumbnail)
+
     logger.debug("saved output image to: %s", path)
     return path
 
 
+def index_output(
+    server: ServerContext,
+    output: str,
+    metadata: OutputMetadata,
+    thumbnail: Optional[str] = None,
+) -> None:
+    index = get_output_index(server)
+    if index is None:
+        return
+
+    try:
+        index.add_json(output, metadata.tojson([output]), thumbnail=thumbnail)
+    except Exception:
+        # the image has already been written, so this should not fail the job
+        logger.exception("error adding output to index: %s", output)
+
+
+def write_thumbnail(
+    server: ServerContext, output: str, image: Image.Image
+) -> Optional[str]:
+    """
+    Write a downscaled copy of an output image to the thumbnail path and return its name, relative to the
+    output path.
+    """
+    if server.thumbnail_size < 1:
+        return None
+
+    thumbnail_format = get_pil_format(server.thumbnail_format, fallback="JPEG")
+    name = f"{THUMBNAIL_PATH}/{output}.{thumbnail_format.lower()}"
+    dest = base_join(server.output_path, name)
+    makedirs(path.dirname(dest), exist_ok=True)
+
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail(
+        (server.thumbnail_size, server.thumbnail_size), Image.Resampling.LANCZOS
+    )
+    write_atomic(
+        dest,
+        lambda temp_path: thumbnail.save(
+            temp_path, format=thumbnail_format, quality=THUMBNAIL_QUALITY
+        ),
+    )
+
+    logger.debug("saved output thumbnail to: %s", dest)
+    return name
+
+
+def get_preview_name(server: ServerContext, job: str) -> Tuple[str, str]:
+    preview_format = get_pil_format(server.thumbnail_format, fallback="JPEG")
+    return (f"{PREVIEW_PATH}/{job}.{preview_format.lower()}", preview_format)
+
+
+def save_preview(server: ServerContext, job: str, latents: Any) -> str:
+    """
+    Write a low-resolution preview of the latents for a running job, replacing the previous preview.
+    """
+    name, preview_format = get_preview_name(server, job)
+    dest = base_join(server.output_path, name)
+    makedirs(path.dirname(dest), exist_ok=True)
+
+    preview = latents_to_image(latents)
+    write_atomic(
+        dest,
+        lambda temp_path: preview.save(
+            temp_path, format=preview_format, quality=THUMBNAIL_QUALITY
+        ),
+    )
+
+    logger.trace("saved latent preview to: %s", dest)
+    return name
+
+
+def remove_preview(server: ServerContext, job: str) -> bool:
+    """
+    Remove the latent preview for a job once it has finished or been cancelled, if it has one.
+    """
+    name, _preview_format = get_preview_name(server, job)
+    dest = base_join(server.output_path, name)
+    if not path.exists(dest):
+        return False
+
+    try:
+        remove(dest)
+    except FileNotFoundError:
+        return False
+
+    logger.debug("removed latent preview: %s", dest)
+    return True
+
+
 def save_params(
     server: ServerContext,
     output: str,
@@ -280,11 +764,52 @@ def save_params(
     border: Optional[Border] = None,
     highres: Optional[HighresParams] = None,
 ) -> str:
-    path = base_join(server.output_path, f"{output}.json")
-    json = json_params(
-        output, params, size, upscale=upscale, border=border, highres=highres
+    metadata = OutputMetadata(
+        json_params([], params, size, upscale=upscale, border=border, highres=highres),
+        "",
     )
-    with open(path, "w") as f:
-        f.write(dumps(json))
-        logger.debug("saved image params to: %s", path)
-        return path
+    return write_params(server, output, metadata)
+
+
+def write_params(server: ServerContext, output: str, metadata: OutputMetadata) -> str:
+    path = base_join(server.output_path, f"{output}.json")
+    json = metadata.tojson(output)
+
+    def write(temp_path: str):
+        with open(temp_path, "w") as f:
+            f.write(dumps(json))
+
+    write_atomic(path, write)
+    logger.debug("saved image params to: %s", path)
+    return path
+
+
+def save_manifest(
+    server: ServerContext,
+    outputs: List[str],
+    metadata: OutputMetadata,
+) -> Optional[str]:
+    """
+    Save the parameters for all of the outputs from a job to a single JSONL manifest, with one line per output.
+
+    This replaces the JSON file for each output when the manifest is enabled, and does nothing otherwise.
+    """
+    if not server.output_manifest or len(outputs) == 0:
+        return None
+
+    name = f"{path.splitext(outputs[0])[0]}.jsonl"
+    lines = [dumps(metadata.tojson(output)) for output in outputs]
+
+    def write(temp_path: str):
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    dest = base_join(server.output_path, name)
+    writer = get_output_writer(server)
+    if writer is None:
+        write_atomic(dest, write)
+    else:
+        writer.submit(write_atomic, dest, write)
+
+    logger.debug("saved job manifest to: %s", dest)
+    return dest
@@ -1,10 +1,12 @@
 from enum import IntEnum
 from logging import getLogger
 from math import ceil
-from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Tuple, Union
 
 from .models.meta import NetworkModel
-from .torch_before_ort import GraphOptimizationLevel, SessionOptions
+
+if TYPE_CHECKING:
+    from onnxruntime import SessionOptions
 
 logger = getLogger(__name__)
 
@@ -111,6 +113,26 @@ class Size:
         )
 
 
+# models that run once per image and can use a smaller thread pool than the UNet
+AUX_MODEL_TYPES = ["text-encoder", "vae"]
+
+
+def format_cores(cores: List[int]) -> str:
+    """
+    Format a list of CPU cores as ranges, like `0-3,8`.
+    """
+    ranges = []
+    for core in sorted(cores):
+        if len(ranges) > 0 and ranges[-1][1] == core - 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+
+    return ",".join(
+        str(start) if start == end else f"{start}-{end}" for start, end in ranges
+    )
+
+
 class DeviceParams:
     def __init__(
         self,
@@ -118,14 +140,39 @@ class DeviceParams:
         provider: str,
         options: Optional[dict] = None,
         optimizations: Optional[List[str]] = None,
+        platform: Optional[str] = None,
+        threads: int = 0,
+        inter_threads: int = 0,
+        aux_threads: int = 0,
+        affinity: Optional[List[int]] = None,
     ) -> None:
+        """
+        Parameters for a device and the worker that runs on it.
+
+        More than one device can share a platform, like logical CPU devices that each have their own set of cores.
+        The thread counts only apply to the CPU and a count of 0 leaves it to the ONNX runtime.
+        """
         self.device = device
         self.provider = provider
         self.options = options
         self.optimizations = optimizations or []
+        self.platform = platform or device
+        self.threads = threads
+        self.inter_threads = inter_threads
+        self.aux_threads = aux_threads
+        self.affinity = affinity
         self.sess_options_cache = None
 
     def __str__(self) -> str:
+        if self.affinity is not None:
+            return "%s - %s (%s) on %s threads, cores %s" % (
+                self.device,
+                self.provider,
+                self.options,
+                self.threads,
+                format_cores(self.affinity),
+            )
+
         return "%s - %s (%s)" % (self.device, self.provider, self.options)
 
     def ort_provider(
@@ -142,12 +189,28 @@ class DeviceParams:
         else:
             return self.provider  # (self.provider, self.options)
 
-    def sess_options(self, cache=True) -> SessionOptions:
+    def sess_options(
+        self, cache=True, model_type: Optional[str] = None
+    ) -> "SessionOptions":
+        from .torch_before_ort import GraphOptimizationLevel, SessionOptions
+
+        # the smaller thread pool is only used for some models, so those options cannot be shared
+        aux = self.aux_threads > 0 and model_type in AUX_MODEL_TYPES
+        cache = cache and not aux
+
         if cache and self.sess_options_cache is not None:
             return self.sess_options_cache
 
         sess = SessionOptions()
 
+        threads = self.aux_threads if aux else self.threads
+        if threads > 0:
+            logger.debug("using %s ONNX threads for %s model", threads, model_type)
+            sess.intra_op_num_threads = threads
+
+        if self.inter_threads > 0:
+            sess.inter_op_num_threads = self.inter_threads
+
         if "onnx-low-memory" in self.optimizations:
             logger.debug("enabling ONNX low-memory optimizations")
             sess.enable_cpu_mem_arena = False
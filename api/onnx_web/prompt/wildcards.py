@@ -0,0 +1,56 @@
+import random
+from copy import deepcopy
+from logging import getLogger
+from re import compile
+from typing import Dict, List
+
+from ..params import ImageParams
+
+logger = getLogger(__name__)
+
+WILDCARD_TOKEN = compile(r"__([-/\\\w]+)__")
+
+
+def parse_wildcards(prompt: str, seed: int, wildcards: Dict[str, List[str]]) -> str:
+    next_match = WILDCARD_TOKEN.search(prompt)
+    remaining_prompt = prompt
+
+    # prep a local copy to avoid mutating the main one
+    wildcards = deepcopy(wildcards)
+    random.seed(seed)
+
+    while next_match is not None:
+        logger.debug("found wildcard in prompt: %s", next_match)
+        name, *rest = next_match.groups()
+
+        wildcard = ""
+        if name in wildcards:
+            wildcard = pop_random(wildcards.get(name))
+        else:
+            logger.warning("unknown wildcard: %s", name)
+
+        remaining_prompt = (
+            remaining_prompt[: next_match.start()]
+            + wildcard
+            + remaining_prompt[next_match.end() :]
+        )
+        next_match = WILDCARD_TOKEN.search(remaining_prompt)
+
+    return remaining_prompt
+
+
+def replace_wildcards(params: ImageParams, wildcards: Dict[str, List[str]]):
+    params.prompt = parse_wildcards(params.prompt, params.seed, wildcards)
+    if params.negative_prompt is not None:
+        params.negative_prompt = parse_wildcards(
+            params.negative_prompt, params.seed, wildcards
+        )
+
+
+def pop_random(list: List[str]) -> str:
+    """
+    From https://stackoverflow.com/a/14088129
+    """
+    i = random.randrange(len(list))
+    list[i], list[-1] = list[-1], list[i]
+    return list.pop()
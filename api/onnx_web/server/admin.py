@@ -1,12 +1,12 @@
 from logging import getLogger
 
 from flask import Flask, jsonify, make_response, request
-from jsonschema import ValidationError, validate
+from jsonschema import ValidationError
 
-from ..utils import load_config, load_config_str
+from ..utils import load_config_str
 from ..worker.pool import DevicePoolExecutor
 from .context import ServerContext
-from .load import load_extras, load_models, load_wildcards
+from .load import get_schema_validator, load_extras, load_models, load_wildcards
 from .utils import wrap_route
 
 logger = getLogger(__name__)
@@ -55,13 +55,13 @@ def update_extra_models(server: ServerContext):
     if conversion_lock:
         return make_response(jsonify({})), 409
 
-    extra_schema = load_config("./schemas/extras.yaml")
+    extra_validator = get_schema_validator("extras")
     data_str = request.data.decode(encoding=(request.content_encoding or "utf-8"))
 
     try:
         data = load_config_str(data_str)
         try:
-            validate(data, extra_schema)
+            extra_validator.validate(data)
         except ValidationError:
             logger.exception("invalid data in extras file")
     except Exception:
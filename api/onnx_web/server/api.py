@@ -1,24 +1,31 @@
-from io import BytesIO
+from json import dumps
 from logging import getLogger
 from os import path
+from typing import List, Optional, Tuple
 
 from flask import Flask, jsonify, make_response, request, url_for
-from jsonschema import validate
 from PIL import Image
 
 from ..chain import CHAIN_STAGES, ChainPipeline
-from ..diffusers.load import get_available_pipelines, get_pipeline_schedulers
-from ..diffusers.run import (
-    run_blend_pipeline,
-    run_img2img_pipeline,
-    run_inpaint_pipeline,
-    run_txt2img_pipeline,
-    run_upscale_pipeline,
+from ..diffusers.names import get_available_pipelines, get_pipeline_schedulers
+from ..image.encoded import EncodedImage
+from ..output import (
+    add_cached_result,
+    find_cached_result,
+    get_output_size,
+    json_params,
+    make_output_name,
 )
-from ..diffusers.utils import replace_wildcards
-from ..output import json_params, make_output_name
-from ..params import Border, Size, StageParams, TileOrder, UpscaleParams
-from ..transformers.run import run_txt2txt_pipeline
+from ..params import (
+    Border,
+    HighresParams,
+    ImageParams,
+    Size,
+    StageParams,
+    TileOrder,
+    UpscaleParams,
+)
+from ..prompt.wildcards import replace_wildcards
 from ..utils import (
     base_join,
     get_and_clamp_float,
@@ -28,10 +35,10 @@ from ..utils import (
     get_from_map,
     get_not_empty,
     get_size,
-    load_config,
     load_config_str,
     sanitize_name,
 )
+from ..worker.command import PRIORITY_LOW, PRIORITY_NORMAL, JobFunction
 from ..worker.pool import DevicePoolExecutor
 from .context import ServerContext
 from .load import (
@@ -44,10 +51,12 @@ from .load import (
     get_mask_filters,
     get_network_models,
     get_noise_sources,
+    get_schema_validator,
     get_source_filters,
     get_upscaling_models,
     get_wildcard_data,
 )
+from .output_index import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_output_index
 from .params import (
     border_from_request,
     highres_from_request,
@@ -58,6 +67,14 @@ from .utils import wrap_route
 
 logger = getLogger(__name__)
 
+# the pipelines are imported by the worker running each job
+run_blend_pipeline = JobFunction("onnx_web.diffusers.run", "run_blend_pipeline")
+run_img2img_pipeline = JobFunction("onnx_web.diffusers.run", "run_img2img_pipeline")
+run_inpaint_pipeline = JobFunction("onnx_web.diffusers.run", "run_inpaint_pipeline")
+run_txt2img_pipeline = JobFunction("onnx_web.diffusers.run", "run_txt2img_pipeline")
+run_upscale_pipeline = JobFunction("onnx_web.diffusers.run", "run_upscale_pipeline")
+run_txt2txt_pipeline = JobFunction("onnx_web.transformers.run", "run_txt2txt_pipeline")
+
 
 def ready_reply(
     ready: bool = False,
@@ -151,20 +168,55 @@ def list_pipelines(server: ServerContext):
 
 
 def list_platforms(server: ServerContext):
-    return jsonify([p.device for p in get_available_platforms()])
+    # logical devices on the same platform are picked by the pool, so only list each platform once
+    platforms = [p.platform for p in get_available_platforms()]
+    return jsonify(list(dict.fromkeys(platforms)))
 
 
 def list_schedulers(server: ServerContext):
     return jsonify(get_pipeline_schedulers())
 
 
+def find_request_result(
+    server: ServerContext, mode: str, params: ImageParams, size: Size, **kwargs
+) -> Tuple[Optional[str], Optional[List[str]]]:
+    # requests without a seed use a random one and will not be repeated, so they are not worth caching or following
+    if request.args.get("seed", "-1") == "-1":
+        return (None, None)
+
+    return find_cached_result(server, mode, params, size, **kwargs)
+
+
+def get_request_priority(
+    server: ServerContext,
+    size: Size,
+    upscale: Optional[UpscaleParams] = None,
+    border: Optional[Border] = None,
+    highres: Optional[HighresParams] = None,
+) -> int:
+    """
+    Run large images and requests that ask for it with a low priority, so they can be preempted by smaller jobs.
+    """
+    if request.args.get("priority", None) == "low":
+        return PRIORITY_LOW
+
+    if server.low_priority_pixels > 0:
+        output_size = get_output_size(size, upscale, border, highres)
+        if output_size.width * output_size.height >= server.low_priority_pixels:
+            logger.debug("output size %s will run with a low priority", output_size)
+            return PRIORITY_LOW
+
+    return PRIORITY_NORMAL
+
+
 def img2img(server: ServerContext, pool: DevicePoolExecutor):
     source_file = request.files.get("source")
     if source_file is None:
         return error_reply("source image is required")
 
-    source = Image.open(BytesIO(source_file.read())).convert("RGB")
-    size = Size(source.width, source.height)
+    # the image is decoded by the worker
+    source = EncodedImage.from_file(source_file, "RGB")
+    size = Size(*source.size)
 
     device, params, _size = pipeline_from_request(server, "img2img")
     upscale = upscale_from_request()
@@ -190,12 +242,28 @@ def img2img(server: ServerContext, pool: DevicePoolExecutor):
         )
         output_count += 1
 
+    digest, cached = find_request_result(
+        server,
+        "img2img",
+        params,
+        size,
+        upscale=upscale,
+        highres=highres,
+        extras=[strength, source_filter],
+        sources=[source],
+    )
+    if cached is not None:
+        logger.info("img2img result found in cache: %s", cached[0])
+        return jsonify(
+            json_params(cached, params, size, upscale=upscale, highres=highres)
+        )
+
     output = make_output_name(
         server, "img2img", params, size, extras=[strength], count=output_count
     )
 
     job_name = output[0]
-    pool.submit(
+    output = pool.submit(
         job_name,
         run_img2img_pipeline,
         server,
@@ -206,8 +274,13 @@ def img2img(server: ServerContext, pool: DevicePoolExecutor):
         source,
         strength,
         needs_device=device,
+        digest=digest,
+        outputs=output,
+        priority=get_request_priority(server, size, upscale=upscale, highres=highres),
         source_filter=source_filter,
     )
+    job_name = output[0]
+    add_cached_result(server, digest, output)
 
     logger.info("img2img job queued for: %s", job_name)
 
@@ -221,10 +294,19 @@ def txt2img(server: ServerContext, pool: DevicePoolExecutor):
 
     replace_wildcards(params, get_wildcard_data())
 
+    digest, cached = find_request_result(
+        server, "txt2img", params, size, upscale=upscale, highres=highres
+    )
+    if cached is not None:
+        logger.info("txt2img result found in cache: %s", cached[0])
+        return jsonify(
+            json_params(cached, params, size, upscale=upscale, highres=highres)
+        )
+
     output = make_output_name(server, "txt2img", params, size)
 
     job_name = output[0]
-    pool.submit(
+    output = pool.submit(
         job_name,
         run_txt2img_pipeline,
         server,
@@ -234,7 +316,12 @@ def txt2img(server: ServerContext, pool: DevicePoolExecutor):
         upscale,
         highres,
         needs_device=device,
+        digest=digest,
+        outputs=output,
+        priority=get_request_priority(server, size, upscale=upscale, highres=highres),
     )
+    job_name = output[0]
+    add_cached_result(server, digest, output)
 
     logger.info("txt2img job queued for: %s", job_name)
 
@@ -250,13 +337,11 @@ def inpaint(server: ServerContext, pool: DevicePoolExecutor):
     if mask_file is None:
         return error_reply("mask image is required")
 
-    source = Image.open(BytesIO(source_file.read())).convert("RGB")
-    size = Size(source.width, source.height)
+    # the images are decoded by the worker, and the mask is drawn over black
+    source = EncodedImage.from_file(source_file, "RGB")
+    size = Size(*source.size)
 
-    mask_top_layer = Image.open(BytesIO(mask_file.read())).convert("RGBA")
-    mask = Image.new("RGBA", mask_top_layer.size, color=(0, 0, 0, 255))
-    mask.alpha_composite(mask_top_layer)
-    mask.convert(mode="L")
+    mask = EncodedImage.from_file(mask_file, "RGBA", background=(0, 0, 0, 255))
 
     full_res_inpaint = get_boolean(
         request.args, "fullresInpaint", get_config_value("fullresInpaint")
@@ -284,6 +369,32 @@ def inpaint(server: ServerContext, pool: DevicePoolExecutor):
 
     replace_wildcards(params, get_wildcard_data())
 
+    digest, cached = find_request_result(
+        server,
+        "inpaint",
+        params,
+        size,
+        upscale=upscale,
+        border=expand,
+        highres=highres,
+        extras=[
+            mask_filter.__name__,
+            noise_source.__name__,
+            fill_color,
+            tile_order,
+            full_res_inpaint,
+            full_res_inpaint_padding,
+        ],
+        sources=[source, mask],
+    )
+    if cached is not None:
+        logger.info("inpaint result found in cache: %s", cached[0])
+        return jsonify(
+            json_params(
+                cached, params, size, upscale=upscale, border=expand, highres=highres
+            )
+        )
+
     output = make_output_name(
         server,
         "inpaint",
@@ -302,7 +413,7 @@ def inpaint(server: ServerContext, pool: DevicePoolExecutor):
     )
 
     job_name = output[0]
-    pool.submit(
+    output = pool.submit(
         job_name,
         run_inpaint_pipeline,
         server,
@@ -321,7 +432,14 @@ def inpaint(server: ServerContext, pool: DevicePoolExecutor):
         full_res_inpaint,
         full_res_inpaint_padding,
         needs_device=device,
+        digest=digest,
+        outputs=output,
+        priority=get_request_priority(
+            server, size, upscale=upscale, border=expand, highres=highres
+        ),
     )
+    job_name = output[0]
+    add_cached_result(server, digest, output)
 
     logger.info("inpaint job queued for: %s", job_name)
 
@@ -337,7 +455,7 @@ def upscale(server: ServerContext, pool: DevicePoolExecutor):
     if source_file is None:
         return error_reply("source image is required")
 
-    source = Image.open(BytesIO(source_file.read())).convert("RGB")
+    source = EncodedImage.from_file(source_file, "RGB")
 
     device, params, size = pipeline_from_request(server)
     upscale = upscale_from_request()
@@ -345,10 +463,25 @@ def upscale(server: ServerContext, pool: DevicePoolExecutor):
 
     replace_wildcards(params, get_wildcard_data())
 
+    digest, cached = find_request_result(
+        server,
+        "upscale",
+        params,
+        size,
+        upscale=upscale,
+        highres=highres,
+        sources=[source],
+    )
+    if cached is not None:
+        logger.info("upscale result found in cache: %s", cached[0])
+        return jsonify(
+            json_params(cached, params, size, upscale=upscale, highres=highres)
+        )
+
     output = make_output_name(server, "upscale", params, size)
 
     job_name = output[0]
-    pool.submit(
+    output = pool.submit(
         job_name,
         run_upscale_pipeline,
         server,
@@ -359,7 +492,12 @@ def upscale(server: ServerContext, pool: DevicePoolExecutor):
         highres,
         source,
         needs_device=device,
+        digest=digest,
+        outputs=output,
+        priority=get_request_priority(server, size, upscale=upscale, highres=highres),
     )
+    job_name = output[0]
+    add_cached_result(server, digest, output)
 
     logger.info("upscale job queued for: %s", job_name)
 
@@ -375,10 +513,12 @@ def chain(server: ServerContext, pool: DevicePoolExecutor):
         return error_reply("chain pipeline must have a body")
 
     data = load_config_str(body)
-    schema = load_config("./schemas/chain.yaml")
 
-    logger.debug("validating chain request: %s against %s", data, schema)
-    validate(data, schema)
+    logger.debug("validating chain request: %s", data)
+    get_schema_validator("chain").validate(data)
+
+    # the stage params are replaced with objects while the pipeline is built, so keep the original for the cache
+    chain_data = dumps(data, sort_keys=True)
 
     # get defaults from the regular parameters
     device, params, size = pipeline_from_request(server)
@@ -389,12 +529,13 @@ def chain(server: ServerContext, pool: DevicePoolExecutor):
 
     pipeline = ChainPipeline()
     for stage_data in data.get("stages", []):
-        stage_class = CHAIN_STAGES[stage_data.get("type")]
+        stage_type = stage_data.get("type")
+        _stage_module, stage_class = CHAIN_STAGES[stage_type]
         kwargs = stage_data.get("params", {})
-        logger.info("request stage: %s, %s", stage_class.__name__, kwargs)
+        logger.info("request stage: %s, %s", stage_class, kwargs)
 
         stage = StageParams(
-            stage_data.get("name", stage_class.__name__),
+            stage_data.get("name", stage_class),
             tile_size=get_size(kwargs.get("tile_size")),
             outscale=get_and_clamp_int(kwargs, "outscale", 1, 4),
         )
@@ -418,8 +559,7 @@ def chain(server: ServerContext, pool: DevicePoolExecutor):
             )
             source_file = request.files.get(stage_source_name)
             if source_file is not None:
-                source = Image.open(BytesIO(source_file.read())).convert("RGB")
-                kwargs["stage_source"] = source
+                kwargs["stage_source"] = EncodedImage.from_file(source_file, "RGB")
 
         if stage_mask_name in request.files:
             logger.debug(
@@ -429,16 +569,32 @@ def chain(server: ServerContext, pool: DevicePoolExecutor):
             )
             mask_file = request.files.get(stage_mask_name)
             if mask_file is not None:
-                mask = Image.open(BytesIO(mask_file.read())).convert("RGB")
-                kwargs["stage_mask"] = mask
+                kwargs["stage_mask"] = EncodedImage.from_file(mask_file, "RGB")
 
-        pipeline.append((stage_class(), stage, kwargs))
+        # the stage will be imported by the worker
+        pipeline.append((stage_type, stage, kwargs))
 
     logger.info("running chain pipeline with %s stages", len(pipeline.stages))
 
+    digest, cached = find_request_result(
+        server,
+        "chain",
+        params,
+        size,
+        extras=[chain_data],
+        sources=[
+            kwargs.get(key)
+            for _type, _stage, kwargs in pipeline.stages
+            for key in ["stage_source", "stage_mask"]
+        ],
+    )
+    if cached is not None:
+        logger.info("chain result found in cache: %s", cached[0])
+        return jsonify(json_params(cached, params, size))
+
     # build and run chain pipeline
     empty_source = Image.new("RGB", (size.width, size.height))
-    pool.submit(
+    output = pool.submit(
         job_name,
         pipeline,
         server,
@@ -447,7 +603,11 @@ def chain(server: ServerContext, pool: DevicePoolExecutor):
         output=output[0],
         size=size,
         needs_device=device,
+        digest=digest,
+        outputs=output,
+        priority=get_request_priority(server, size),
     )
+    add_cached_result(server, digest, output)
 
     return jsonify(json_params(output, params, size))
 
@@ -457,7 +617,7 @@ def blend(server: ServerContext, pool: DevicePoolExecutor):
     if mask_file is None:
         return error_reply("mask image is required")
 
-    mask = Image.open(BytesIO(mask_file.read())).convert("RGBA")
+    mask = EncodedImage.from_file(mask_file, "RGBA")
 
     max_sources = 2
     sources = []
@@ -467,15 +627,21 @@ def blend(server: ServerContext, pool: DevicePoolExecutor):
         if source_file is None:
             logger.warning("missing source %s", i)
         else:
-            source = Image.open(BytesIO(source_file.read())).convert("RGBA")
-            sources.append(source)
+            sources.append(EncodedImage.from_file(source_file, "RGBA"))
 
     device, params, size = pipeline_from_request(server)
     upscale = upscale_from_request()
 
+    digest, cached = find_request_result(
+        server, "blend", params, size, upscale=upscale, sources=[*sources, mask]
+    )
+    if cached is not None:
+        logger.info("blend result found in cache: %s", cached[0])
+        return jsonify(json_params(cached, params, size, upscale=upscale))
+
     output = make_output_name(server, "upscale", params, size)
     job_name = output[0]
-    pool.submit(
+    output = pool.submit(
         job_name,
         run_blend_pipeline,
         server,
@@ -487,7 +653,12 @@ def blend(server: ServerContext, pool: DevicePoolExecutor):
         sources,
         mask,
         needs_device=device,
+        digest=digest,
+        outputs=output,
+        priority=get_request_priority(server, size, upscale=upscale),
     )
+    job_name = output[0]
+    add_cached_result(server, digest, output)
 
     logger.info("upscale job queued for: %s", job_name)
 
@@ -509,6 +680,7 @@ def txt2txt(server: ServerContext, pool: DevicePoolExecutor):
         size,
         output,
         needs_device=device,
+        priority=get_request_priority(server, size),
     )
 
     return jsonify(json_params(output, params, size))
@@ -554,6 +726,43 @@ def ready(server: ServerContext, pool: DevicePoolExecutor):
     )
 
 
+def list_outputs(server: ServerContext):
+    index = get_output_index(server)
+    if index is None:
+        return error_reply("output index is not enabled")
+
+    limit = get_and_clamp_int(request.args, "limit", DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+    before = request.args.get("before", None)
+    if before is not None:
+        try:
+            before = int(before)
+        except ValueError:
+            return error_reply("before must be an integer")
+
+    seed = request.args.get("seed", None)
+    if seed is not None:
+        try:
+            seed = int(seed)
+        except ValueError:
+            return error_reply("seed must be an integer")
+
+    outputs, next_page = index.list_outputs(
+        limit=limit,
+        before=before,
+        mode=request.args.get("mode", None),
+        model=request.args.get("model", None),
+        seed=seed,
+    )
+
+    return jsonify(
+        {
+            "next": next_page,
+            "outputs": outputs,
+        }
+    )
+
+
 def register_api_routes(app: Flask, server: ServerContext, pool: DevicePoolExecutor):
     return [
         app.route("/api")(wrap_route(introspect, server, app=app)),
@@ -587,4 +796,5 @@ def register_api_routes(app: Flask, server: ServerContext, pool: DevicePoolExecu
             wrap_route(cancel, server, pool=pool)
         ),
         app.route("/api/ready")(wrap_route(ready, server, pool=pool)),
+        app.route("/api/outputs")(wrap_route(list_outputs, server)),
     ]
@@ -3,16 +3,20 @@ from os import environ, path
 from secrets import token_urlsafe
 from typing import List, Optional
 
-import torch
-
 from ..utils import get_boolean
 from .model_cache import ModelCache
 
 logger = getLogger(__name__)
 
 DEFAULT_CACHE_LIMIT = 5
+DEFAULT_CPU_WORKERS = 1
 DEFAULT_JOB_LIMIT = 10
 DEFAULT_IMAGE_FORMAT = "png"
+DEFAULT_OUTPUT_WORKERS = 0
+DEFAULT_PNG_COMPRESSION = 6
+DEFAULT_PREVIEW_STEPS = 0
+DEFAULT_THUMBNAIL_FORMAT = "webp"
+DEFAULT_THUMBNAIL_SIZE = 256
 DEFAULT_SERVER_VERSION = "v0.10.0"
 
 
@@ -37,6 +41,27 @@ class ServerContext:
         memory_limit: Optional[int] = None,
         admin_token: Optional[str] = None,
         server_version: Optional[str] = DEFAULT_SERVER_VERSION,
+        output_workers: int = DEFAULT_OUTPUT_WORKERS,
+        png_compression: int = DEFAULT_PNG_COMPRESSION,
+        output_manifest: bool = False,
+        output_index: Optional[str] = None,
+        thumbnail_format: str = DEFAULT_THUMBNAIL_FORMAT,
+        thumbnail_size: int = DEFAULT_THUMBNAIL_SIZE,
+        preview_steps: int = DEFAULT_PREVIEW_STEPS,
+        prewarm: Optional[List[str]] = None,
+        cpu_workers: int = DEFAULT_CPU_WORKERS,
+        cpu_threads: int = 0,
+        cpu_inter_threads: int = 0,
+        cpu_aux_threads: int = 0,
+        cpu_affinity: Optional[str] = None,
+        result_cache: bool = False,
+        result_cache_limit: int = 0,
+        result_cache_ttl: int = 0,
+        low_priority_pixels: int = 0,
+        stage_cache_limit: int = 0,
+        scatter_tiles: int = 0,
+        large_image_pixels: int = 0,
+        job_broker: Optional[str] = None,
     ) -> None:
         self.bundle_path = bundle_path
         self.model_path = model_path
@@ -56,6 +81,31 @@ class ServerContext:
         self.memory_limit = memory_limit
         self.admin_token = admin_token or token_urlsafe()
         self.server_version = server_version
+        self.output_workers = output_workers
+        self.png_compression = png_compression
+        self.output_manifest = output_manifest
+        self.output_index = (
+            path.join(self.cache_path, "outputs.db")
+            if output_index is None
+            else output_index
+        )
+        self.thumbnail_format = thumbnail_format
+        self.thumbnail_size = thumbnail_size
+        self.preview_steps = preview_steps
+        self.prewarm = [entry for entry in (prewarm or []) if len(entry) > 0]
+        self.cpu_workers = cpu_workers
+        self.cpu_threads = cpu_threads
+        self.cpu_inter_threads = cpu_inter_threads
+        self.cpu_aux_threads = cpu_aux_threads
+        self.cpu_affinity = cpu_affinity
+        self.result_cache = result_cache
+        self.result_cache_limit = result_cache_limit
+        self.result_cache_ttl = result_cache_ttl
+        self.low_priority_pixels = low_priority_pixels
+        self.stage_cache_limit = stage_cache_limit
+        self.scatter_tiles = scatter_tiles
+        self.large_image_pixels = large_image_pixels
+        self.job_broker = job_broker
 
         self.cache = ModelCache(self.cache_limit)
 
@@ -88,9 +138,42 @@ class ServerContext:
             server_version=environ.get(
                 "ONNX_WEB_SERVER_VERSION", DEFAULT_SERVER_VERSION
             ),
+            output_workers=int(
+                environ.get("ONNX_WEB_OUTPUT_WORKERS", DEFAULT_OUTPUT_WORKERS)
+            ),
+            png_compression=int(
+                environ.get("ONNX_WEB_PNG_COMPRESSION", DEFAULT_PNG_COMPRESSION)
+            ),
+            output_manifest=get_boolean(environ, "ONNX_WEB_OUTPUT_MANIFEST", False),
+            output_index=environ.get("ONNX_WEB_OUTPUT_INDEX", None),
+            thumbnail_format=environ.get(
+                "ONNX_WEB_THUMBNAIL_FORMAT", DEFAULT_THUMBNAIL_FORMAT
+            ),
+            thumbnail_size=int(
+                environ.get("ONNX_WEB_THUMBNAIL_SIZE", DEFAULT_THUMBNAIL_SIZE)
+            ),
+            preview_steps=int(
+                environ.get("ONNX_WEB_PREVIEW_STEPS", DEFAULT_PREVIEW_STEPS)
+            ),
+            prewarm=environ.get("ONNX_WEB_PREWARM", "").split(","),
+            cpu_workers=int(environ.get("ONNX_WEB_CPU_WORKERS", DEFAULT_CPU_WORKERS)),
+            cpu_threads=int(environ.get("ONNX_WEB_CPU_THREADS", 0)),
+            cpu_inter_threads=int(environ.get("ONNX_WEB_CPU_INTER_THREADS", 0)),
+            cpu_aux_threads=int(environ.get("ONNX_WEB_CPU_AUX_THREADS", 0)),
+            cpu_affinity=environ.get("ONNX_WEB_CPU_AFFINITY", None),
+            result_cache=get_boolean(environ, "ONNX_WEB_RESULT_CACHE", False),
+            result_cache_limit=int(environ.get("ONNX_WEB_RESULT_CACHE_LIMIT", 0)),
+            result_cache_ttl=int(environ.get("ONNX_WEB_RESULT_CACHE_TTL", 0)),
+            low_priority_pixels=int(environ.get("ONNX_WEB_LOW_PRIORITY_PIXELS", 0)),
+            stage_cache_limit=int(environ.get("ONNX_WEB_STAGE_CACHE_LIMIT", 0)),
+            scatter_tiles=int(environ.get("ONNX_WEB_SCATTER_TILES", 0)),
+            large_image_pixels=int(environ.get("ONNX_WEB_LARGE_IMAGE_PIXELS", 0)),
+            job_broker=environ.get("ONNX_WEB_JOB_BROKER", None),
         )
 
     def torch_dtype(self):
+        import torch
+
         if "torch-fp16" in self.optimizations:
             return torch.float16
         else:
@@ -0,0 +1,63 @@
+from hashlib import sha256
+from logging import getLogger
+from os import listdir, path, stat
+from typing import Dict, Tuple
+
+logger = getLogger(__name__)
+
+HASH_BUFFER_SIZE = 2**22  # 4MB
+
+# file hashes, keyed by path, modification time, and size
+file_hashes: Dict[Tuple[str, float, int], str] = {}
+
+
+def hash_file(name: str):
+    sha = sha256()
+    with open(name, "rb") as f:
+        while True:
+            data = f.read(HASH_BUFFER_SIZE)
+            if not data:
+                break
+
+            sha.update(data)
+
+    return sha.hexdigest()
+
+
+def hash_file_cached(name: str) -> str:
+    """
+    Hash a file, reusing the previous hash if the file has not been modified since then.
+    """
+    stat_result = stat(name)
+    key = (path.abspath(name), stat_result.st_mtime, stat_result.st_size)
+    if key not in file_hashes:
+        logger.debug("hashing file: %s", name)
+        file_hashes[key] = hash_file(name)
+
+    return file_hashes[key]
+
+
+def get_model_files_key(model_path: str) -> str:
+    """
+    Get a key for a model and its external data files, like the `weights.pb` file next to a diffusion model, which
+    changes when any of them are replaced.
+
+    This uses the path, size, and modification time of each file rather than their contents, so it does not need to
+    read the weights again in every worker.
+    """
+    model_path = path.abspath(model_path)
+    model_dir = path.dirname(model_path)
+    files = [model_path] + [
+        path.join(model_dir, name)
+        for name in sorted(listdir(model_dir))
+        if not name.endswith(".onnx") and path.isfile(path.join(model_dir, name))
+    ]
+
+    sha = sha256()
+    for name in files:
+        stat_result = stat(name)
+        sha.update(
+            f"{name}:{stat_result.st_size}:{stat_result.st_mtime_ns}\n".encode("utf-8")
+        )
+
+    return sha.hexdigest()
@@ -2,11 +2,11 @@ from collections import defaultdict
 from functools import cmp_to_key
 from glob import glob
 from logging import getLogger
-from os import path
+from os import cpu_count, path
 from typing import Any, Dict, List, Optional, Union
 
-import torch
-from jsonschema import ValidationError, validate
+from jsonschema import ValidationError
+from jsonschema.validators import validator_for
 
 from ..image import (  # mask filters; noise sources
     mask_filter_gaussian_multiply,
@@ -33,9 +33,14 @@ from ..image import (  # mask filters; noise sources
 )
 from ..models.meta import NetworkModel
 from ..params import DeviceParams
-from ..torch_before_ort import get_available_providers
-from ..utils import load_config, merge
-from .context import ServerContext
+from ..utils import load_config, merge, parse_cores
+from .context import DEFAULT_CPU_WORKERS, ServerContext
+
+try:
+    from os import sched_getaffinity
+except ImportError:
+    # only available on some platforms, like Linux
+    sched_getaffinity = None
 
 logger = getLogger(__name__)
 
@@ -66,7 +71,7 @@ platform_providers = {
     "cuda": "CUDAExecutionProvider",
     "directml": "DmlExecutionProvider",
     "rocm": "ROCMExecutionProvider",
-    "tensorrt": "TensorRTExecutionProvider",
+    "tensorrt": "TensorrtExecutionProvider",
 }
 source_filters = {
     "canny": source_filter_canny,
@@ -85,11 +90,13 @@ source_filters = {
 
 # Available ORT providers
 available_platforms: List[DeviceParams] = []
+available_platform_index: Dict[str, DeviceParams] = {}
 
 # loaded from model_path
 correction_models: List[str] = []
 diffusion_models: List[str] = []
 network_models: List[NetworkModel] = []
+network_model_index: Dict[str, NetworkModel] = {}
 upscaling_models: List[str] = []
 wildcard_data: Dict[str, List[str]] = defaultdict(list)
 
@@ -97,6 +104,13 @@ wildcard_data: Dict[str, List[str]] = defaultdict(list)
 extra_hashes: Dict[str, str] = {}
 extra_strings: Dict[str, Any] = {}
 
+# request schemas, compiled into validators the first time they are used
+schema_files = {
+    "chain": "./schemas/chain.yaml",
+    "extras": "./schemas/extras.yaml",
+}
+schema_validators: Dict[str, Any] = {}
+
 
 def get_config_params():
     return config_params
@@ -106,6 +120,10 @@ def get_available_platforms():
     return available_platforms
 
 
+def get_available_platform(name: str) -> Optional[DeviceParams]:
+    return available_platform_index.get(name, None)
+
+
 def get_correction_models():
     return correction_models
 
@@ -118,6 +136,10 @@ def get_network_models():
     return network_models
 
 
+def get_network_model(name: str) -> Optional[NetworkModel]:
+    return network_model_index.get(name, None)
+
+
 def get_upscaling_models():
     return upscaling_models
 
@@ -154,6 +176,21 @@ def get_config_value(key: str, subkey: str = "default", default=None):
     return config_params.get(key, {}).get(subkey, default)
 
 
+def get_schema_validator(name: str):
+    """
+    Get the validator for one of the request schemas, loading and checking the schema if it has not been used yet.
+    """
+    if name not in schema_validators:
+        schema_file = schema_files[name]
+        logger.debug("compiling %s schema from %s", name, schema_file)
+        schema = load_config(schema_file)
+        validator_class = validator_for(schema)
+        validator_class.check_schema(schema)
+        schema_validators[name] = validator_class(schema)
+
+    return schema_validators[name]
+
+
 def load_extras(server: ServerContext):
     """
     Load the extras file(s) and collect the relevant parts for the server: labels and strings
@@ -164,7 +201,7 @@ def load_extras(server: ServerContext):
     labels = {}
     strings = {}
 
-    extra_schema = load_config("./schemas/extras.yaml")
+    extra_validator = get_schema_validator("extras")
 
     for file in server.extra_models:
         if file is not None and file != "":
@@ -173,7 +210,7 @@ def load_extras(server: ServerContext):
                 data = load_config(file)
                 logger.debug("validating extras file %s", data)
                 try:
-                    validate(data, extra_schema)
+                    extra_validator.validate(data)
                 except ValidationError:
                     logger.exception("invalid data in extras file")
                     continue
@@ -284,6 +321,7 @@ def load_models(server: ServerContext) -> None:
     global correction_models
     global diffusion_models
     global network_models
+    global network_model_index
     global upscaling_models
 
     # main categories
@@ -366,6 +404,9 @@ def load_models(server: ServerContext) -> None:
     logger.debug("loaded LoRA models from disk: %s", lora_models)
     network_models.extend([NetworkModel(model, "lora") for model in lora_models])
 
+    # when more than one type of network has the same name, the last one is used
+    network_model_index = {model.name: model for model in network_models}
+
 
 def load_params(server: ServerContext) -> None:
     global config_params
@@ -384,8 +425,87 @@ def load_params(server: ServerContext) -> None:
         config_platform["default"] = server.default_platform
 
 
+def get_cpu_cores() -> List[int]:
+    """
+    Get the CPU cores that this process is allowed to use.
+    """
+    if sched_getaffinity is not None:
+        return sorted(sched_getaffinity(0))
+
+    return list(range(cpu_count() or 1))
+
+
+def get_cpu_platforms(server: ServerContext, cores: List[int]) -> List[DeviceParams]:
+    """
+    Split the CPU into logical devices, one for each CPU worker.
+
+    With `ONNX_WEB_CPU_AFFINITY`, each device is pinned to its own set of cores, either from the config or split
+    evenly with `auto`. When there is more than one worker or the workers are pinned, each one gets a thread for
+    each of its cores, so workers on the same machine do not compete for them.
+    """
+    workers = max(1, server.cpu_workers)
+    affinity = (server.cpu_affinity or "").strip()
+    core_sets: List[Optional[List[int]]]
+
+    if affinity == "auto":
+        if len(cores) < workers:
+            logger.warning(
+                "not enough CPU cores for %s workers, using %s", workers, len(cores)
+            )
+            workers = len(cores)
+
+        size = len(cores) // workers
+        core_sets = [
+            cores[i * size : ((i + 1) * size if i < workers - 1 else len(cores))]
+            for i in range(workers)
+        ]
+    elif len(affinity) > 0:
+        core_sets = [
+            parse_cores(part) for part in affinity.split(";") if len(part.strip()) > 0
+        ]
+        if server.cpu_workers not in [DEFAULT_CPU_WORKERS, len(core_sets)]:
+            logger.warning(
+                "CPU affinity has %s core sets, starting one worker for each set rather than %s workers",
+                len(core_sets),
+                server.cpu_workers,
+            )
+        workers = len(core_sets)
+    else:
+        core_sets = [None] * workers
+
+    devices = []
+    for i, core_set in enumerate(core_sets):
+        threads = server.cpu_threads
+        if threads == 0 and (workers > 1 or core_set is not None):
+            share = len(core_set) if core_set is not None else len(cores) // workers
+            threads = max(1, share)
+
+        devices.append(
+            DeviceParams(
+                "cpu" if i == 0 else f"cpu-{i}",
+                platform_providers["cpu"],
+                None,
+                server.optimizations,
+                platform="cpu",
+                threads=threads,
+                inter_threads=server.cpu_inter_threads,
+                aux_threads=server.cpu_aux_threads,
+                affinity=core_set,
+            )
+        )
+
+    return devices
+
+
 def load_platforms(server: ServerContext) -> None:
     global available_platforms
+    global available_platform_index
+
+    # this is the only part of the server that needs Torch, to count the CUDA devices, and it must be imported
+    # before onnxruntime
+    import torch
+
+    from ..torch_before_ort import get_available_providers
 
     providers = list(get_available_providers())
     logger.debug("loading available platforms from providers: %s", providers)
@@ -413,6 +533,8 @@ def load_platforms(server: ServerContext) -> None:
                             server.optimizations,
                         )
                     )
+            elif potential == "cpu":
+                available_platforms.extend(get_cpu_platforms(server, get_cpu_cores()))
             else:
                 available_platforms.append(
                     DeviceParams(
@@ -436,15 +558,15 @@ def load_platforms(server: ServerContext) -> None:
 
     # make sure CPU is last on the list
     def any_first_cpu_last(a: DeviceParams, b: DeviceParams):
-        if a.device == b.device:
+        if a.platform == b.platform:
             return 0
 
         # any should be first, if it's available
-        if a.device == "any":
+        if a.platform == "any":
             return -1
 
         # cpu should be last, if it's available
-        if a.device == "cpu":
+        if a.platform == "cpu":
             return 1
 
         return -1
@@ -453,12 +575,22 @@ def load_platforms(server: ServerContext) -> None:
         available_platforms, key=cmp_to_key(any_first_cpu_last)
     )
 
+    # when more than one device has the same name, the last one is used
+    available_platform_index = {
+        platform.device: platform for platform in available_platforms
+    }
+
     logger.info(
         "available acceleration platforms: %s",
         ", ".join([str(p) for p in available_platforms]),
     )
 
 
+def load_schemas(server: ServerContext) -> None:
+    for name in schema_files:
+        get_schema_validator(name)
+
+
 def load_wildcards(server: ServerContext) -> None:
     global wildcard_data
 
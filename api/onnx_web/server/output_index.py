@@ -0,0 +1,355 @@
+from json import dumps, loads
+from logging import getLogger
+from os import makedirs, path, scandir
+from sqlite3 import Connection, Row, connect
+from threading import Thread, local
+from time import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .context import ServerContext
+
+logger = getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+OUTPUT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    mode TEXT,
+    seed INTEGER,
+    model TEXT,
+    width INTEGER,
+    height INTEGER,
+    thumbnail TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outputs_mode ON outputs (mode, id);
+CREATE INDEX IF NOT EXISTS outputs_model ON outputs (model, id);
+CREATE INDEX IF NOT EXISTS outputs_seed ON outputs (seed, id);
+CREATE TABLE IF NOT EXISTS results (
+    digest TEXT PRIMARY KEY,
+    outputs TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+OUTPUT_COLUMNS = [
+    "id",
+    "name",
+    "mode",
+    "seed",
+    "model",
+    "width",
+    "height",
+    "thumbnail",
+    "created",
+    "updated",
+]
+
+
+def get_output_mode(name: str) -> str:
+    """
+    Get the pipeline mode from an output name, which starts with the mode.
+    """
+    return name.split("_", 1)[0]
+
+
+class OutputIndex:
+    """
+    Index of the images in the output path, so they can be listed without scanning the directory.
+
+    This is backed by an SQLite database in WAL mode, which can be written by the workers and read by the server
+    at the same time. Each thread uses its own connection.
+    """
+
+    index_path: str
+
+    def __init__(self, index_path: str) -> None:
+        self.index_path = index_path
+        self.local = local()
+
+    def connect(self) -> Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            index_dir = path.dirname(self.index_path)
+            if index_dir != "" and not path.exists(index_dir):
+                makedirs(index_dir, exist_ok=True)
+
+            logger.debug("opening output index: %s", self.index_path)
+            conn = connect(self.index_path, timeout=30.0)
+            conn.row_factory = Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(OUTPUT_SCHEMA)
+            self.local.conn = conn
+
+        return conn
+
+    def add_output(
+        self,
+        name: str,
+        mode: Optional[str] = None,
+        seed: Optional[int] = None,
+        model: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        thumbnail: Optional[str] = None,
+        created: Optional[float] = None,
+    ) -> None:
+        now = time()
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO outputs "
+                "(name, mode, seed, model, width, height, thumbnail, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET "
+                "mode = excluded.mode, seed = excluded.seed, model = excluded.model, "
+                "width = excluded.width, height = excluded.height, "
+                "thumbnail = COALESCE(excluded.thumbnail, outputs.thumbnail), "
+                "updated = excluded.updated",
+                (
+                    name,
+                    mode or get_output_mode(name),
+                    seed,
+                    model,
+                    width,
+                    height,
+                    thumbnail,
+                    created or now,
+                    now,
+                ),
+            )
+
+    def add_json(self, name: str, json: Dict[str, Any], **kwargs) -> None:
+        """
+        Add an output using the same JSON params that are written to its sidecar file.
+        """
+        params = json.get("params", {})
+        size = json.get("size", {})
+        self.add_output(
+            name,
+            seed=params.get("seed", None),
+            model=params.get("model", None),
+            width=size.get("width", None),
+            height=size.get("height", None),
+            **kwargs,
+        )
+
+    def get_output(self, name: str) -> Optional[Dict[str, Any]]:
+        row = (
+            self.connect()
+            .execute(
+                f"SELECT {', '.join(OUTPUT_COLUMNS)} FROM outputs WHERE name = ?",
+                (name,),
+            )
+            .fetchone()
+        )
+
+        if row is None:
+            return None
+
+        return dict(row)
+
+    def list_outputs(
+        self,
+        limit: int = DEFAULT_PAGE_SIZE,
+        before: Optional[int] = None,
+        mode: Optional[str] = None,
+        model: Optional[str] = None,
+        seed: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        List outputs from newest to oldest, returning a page and the cursor for the next page, if there is one.
+
+        Pages use the output ID as a cursor, rather than an offset, so they stay fast deep into the history.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        clauses = []
+        args: List[Any] = []
+
+        if before is not None:
+            clauses.append("id < ?")
+            args.append(before)
+
+        if mode is not None:
+            clauses.append("mode = ?")
+            args.append(mode)
+
+        if model is not None:
+            clauses.append("model = ?")
+            args.append(model)
+
+        if seed is not None:
+            clauses.append("seed = ?")
+            args.append(seed)
+
+        query = f"SELECT {', '.join(OUTPUT_COLUMNS)} FROM outputs"
+        if len(clauses) > 0:
+            query += " WHERE " + " AND ".join(clauses)
+
+        query += " ORDER BY id DESC LIMIT ?"
+        args.append(limit + 1)
+
+        rows = [dict(row) for row in self.connect().execute(query, args)]
+        if len(rows) > limit:
+            return (rows[:limit], rows[limit - 1]["id"])
+
+        return (rows, None)
+
+    def remove_output(self, name: str) -> bool:
+        conn = self.connect()
+        with conn:
+            cursor = conn.execute("DELETE FROM outputs WHERE name = ?", (name,))
+
+        return cursor.rowcount > 0
+
+    def count_outputs(self) -> int:
+        return self.connect().execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+
+    def add_result(self, digest: str, outputs: List[str]) -> None:
+        """
+        Record the outputs for a request digest, replacing any earlier outputs for the same request.
+        """
+        now = time()
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (digest, outputs, created, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (digest, dumps(outputs), now, now),
+            )
+
+    def get_result(self, digest: str) -> Optional[List[str]]:
+        """
+        Get the outputs for a request digest and mark them as recently used.
+        """
+        conn = self.connect()
+        with conn:
+            row = conn.execute(
+                "SELECT outputs FROM results WHERE digest = ?", (digest,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            conn.execute(
+                "UPDATE results SET accessed = ? WHERE digest = ?", (time(), digest)
+            )
+
+        return loads(row["outputs"])
+
+    def remove_result(self, digest: str) -> bool:
+        conn = self.connect()
+        with conn:
+            cursor = conn.execute("DELETE FROM results WHERE digest = ?", (digest,))
+
+        return cursor.rowcount > 0
+
+    def expire_results(self, limit: int = 0, ttl: float = 0) -> List[str]:
+        """
+        Remove results that have not been used within the TTL, in seconds, and the least recently used results
+        beyond the limit, returning their outputs. Zero disables either check.
+        """
+        conn = self.connect()
+        with conn:
+            digests = []
+            if ttl > 0:
+                digests.extend(
+                    row["digest"]
+                    for row in conn.execute(
+                        "SELECT digest FROM results WHERE accessed < ?",
+                        (time() - ttl,),
+                    )
+                )
+
+            if limit > 0:
+                digests.extend(
+                    row["digest"]
+                    for row in conn.execute(
+                        "SELECT digest FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?",
+                        (limit,),
+                    )
+                )
+
+            outputs = []
+            for digest in set(digests):
+                row = conn.execute(
+                    "SELECT outputs FROM results WHERE digest = ?", (digest,)
+                ).fetchone()
+                if row is not None:
+                    outputs.extend(loads(row["outputs"]))
+                    conn.execute("DELETE FROM results WHERE digest = ?", (digest,))
+
+        return outputs
+
+    def count_results(self) -> int:
+        return self.connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def rebuild(self, output_path: str) -> int:
+        """
+        Add existing outputs to the index using their JSON sidecar files.
+
+        This scans the output path once, and should only be needed when the index is first created.
+        """
+        count = 0
+        with scandir(output_path) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(".json"):
+                    continue
+
+                name = entry.name[: -len(".json")]
+                if not path.exists(path.join(output_path, name)):
+                    continue
+
+                try:
+                    with open(entry.path, "r") as f:
+                        json = loads(f.read())
+
+                    self.add_json(name, json, created=entry.stat().st_mtime)
+                    count += 1
+                except Exception:
+                    logger.warning("error indexing output: %s", name, exc_info=True)
+
+        logger.info("added %s existing outputs to the index", count)
+        return count
+
+
+output_indices: Dict[str, OutputIndex] = {}
+
+
+def get_output_index(server: ServerContext) -> Optional[OutputIndex]:
+    if server.output_index is None or server.output_index == "":
+        return None
+
+    if server.output_index not in output_indices:
+        output_indices[server.output_index] = OutputIndex(server.output_index)
+
+    return output_indices[server.output_index]
+
+
+def load_output_index(server: ServerContext) -> None:
+    """
+    Create the output index and, if it is empty, add any existing outputs in the background.
+    """
+    index = get_output_index(server)
+    if index is None:
+        logger.debug("output index is disabled")
+        return
+
+    if index.count_outputs() > 0:
+        return
+
+    logger.info("indexing existing outputs in the background")
+    thread = Thread(
+        target=index.rebuild,
+        args=(server.output_path,),
+        daemon=True,
+        name="onnx-web output index",
+    )
+    thread.start()
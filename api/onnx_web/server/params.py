@@ -4,7 +4,7 @@ from typing import Tuple
 import numpy as np
 from flask import request
 
-from ..diffusers.load import get_available_pipelines, get_pipeline_schedulers
+from ..diffusers.names import get_available_pipelines, get_pipeline_schedulers
 from ..params import (
     Border,
     DeviceParams,
@@ -22,11 +22,11 @@ from ..utils import (
 )
 from .context import ServerContext
 from .load import (
-    get_available_platforms,
+    get_available_platform,
     get_config_value,
     get_correction_models,
     get_highres_methods,
-    get_network_models,
+    get_network_model,
     get_upscaling_models,
 )
 from .utils import get_model_path
@@ -45,9 +45,7 @@ def pipeline_from_request(
     device_name = request.args.get("platform")
 
     if device_name is not None and device_name != "any":
-        for platform in get_available_platforms():
-            if platform.device == device_name:
-                device = platform
+        device = get_available_platform(device_name)
 
     # diffusion model
     model = get_not_empty(request.args, "model", get_config_value("model"))
@@ -55,9 +53,8 @@ def pipeline_from_request(
 
     control = None
     control_name = request.args.get("control")
-    for network in get_network_models():
-        if network.name == control_name:
-            control = network
+    if control_name is not None:
+        control = get_network_model(control_name)
 
     # pipeline stuff
     pipeline = get_from_list(
@@ -0,0 +1,263 @@
+from hashlib import sha256
+from logging import getLogger
+from os import getpid, makedirs, path, replace, stat
+from shutil import rmtree
+from typing import Any, Dict, Literal, Optional, Tuple
+
+import numpy as np
+
+from ..constants import ONNX_MODEL, ONNX_WEIGHTS
+from ..params import DeviceParams
+from .context import ServerContext
+from .file_hash import get_model_files_key
+
+logger = getLogger(__name__)
+
+Precision = Literal["fp16", "fp32"]
+
+# model metadata key for the precision of the weights, written during conversion
+PRECISION_KEY = "onnx-web:precision"
+
+# path within the cache path
+PRECISION_PATH = "precision"
+
+# attention ops that are kept in fp32, since they can overflow in fp16 with the v2 models
+FP16_OP_BLOCK_LIST = ["Attention", "MultiHeadAttention"]
+
+# precision for each component, by policy. components that are not listed keep their native precision.
+PRECISION_POLICIES: Dict[str, Dict[str, Precision]] = {
+    "fp16": {
+        "controlnet": "fp16",
+        "text-encoder": "fp16",
+        "unet": "fp16",
+        "vae": "fp16",
+    },
+    "fp32": {
+        "controlnet": "fp32",
+        "text-encoder": "fp32",
+        "unet": "fp32",
+        "vae": "fp32",
+    },
+    "mixed": {
+        "controlnet": "fp16",
+        "text-encoder": "fp32",
+        "unet": "fp16",
+        "vae": "fp32",
+    },
+}
+
+# model path, mtime, and size to precision
+model_precisions: Dict[Tuple[str, float, int], Precision] = {}
+
+
+def get_precision_policy(optimizations: list) -> Optional[str]:
+    """
+    Get the precision policy from the `onnx-precision-*` optimizations, or None to run each model in the precision
+    it was converted with.
+    """
+    for policy in PRECISION_POLICIES.keys():
+        if f"onnx-precision-{policy}" in optimizations:
+            return policy
+
+    return None
+
+
+def set_model_precision(model: Any, precision: Precision) -> None:
+    """
+    Record the precision of an ONNX model's weights in its metadata.
+    """
+    for prop in model.metadata_props:
+        if prop.key == PRECISION_KEY:
+            prop.value = precision
+            return
+
+    prop = model.metadata_props.add()
+    prop.key = PRECISION_KEY
+    prop.value = precision
+
+
+def save_model_precision(model_path: str, precision: Precision) -> None:
+    """
+    Record the precision of a saved model, without loading or rewriting its external weights.
+    """
+    from onnx import load_model, save_model
+
+    model = load_model(model_path, load_external_data=False)
+    set_model_precision(model, precision)
+    save_model(model, model_path)
+
+
+def get_model_precision(model_path: str) -> Precision:
+    """
+    Get the precision of a model's weights, from the metadata written during conversion.
+
+    Models that were converted before the metadata existed are checked for 16-bit weights instead. The result is
+    kept until the model file changes.
+    """
+    from onnx import TensorProto, load_model
+
+    stat_result = stat(model_path)
+    key = (path.abspath(model_path), stat_result.st_mtime, stat_result.st_size)
+    if key in model_precisions:
+        return model_precisions[key]
+
+    model = load_model(model_path, load_external_data=False)
+    precision = next(
+        (prop.value for prop in model.metadata_props if prop.key == PRECISION_KEY),
+        None,
+    )
+
+    if precision is None:
+        logger.debug(
+            "model has no precision metadata, checking weights: %s", model_path
+        )
+        half = any(
+            tensor.data_type == TensorProto.FLOAT16
+            for tensor in model.graph.initializer
+        )
+        precision = "fp16" if half else "fp32"
+
+    model_precisions[key] = precision
+    return precision
+
+
+def get_component_precision(
+    device: DeviceParams, model_type: Optional[str], native: Precision
+) -> Precision:
+    """
+    Choose the precision for a model component on a device, using the policy from the device optimizations.
+
+    Components that run on the CPU always use fp32, since most CPUs run fp16 more slowly, and fp16 weights cannot
+    be restored to fp32 without reconverting the model.
+    """
+    policy = get_precision_policy(device.optimizations)
+    if policy is None or model_type is None:
+        return native
+
+    precision = PRECISION_POLICIES[policy].get(model_type, native)
+
+    if (
+        precision == "fp16"
+        and device.ort_provider(model_type) == "CPUExecutionProvider"
+    ):
+        logger.debug("running %s model on CPU, not converting to fp16", model_type)
+        return native
+
+    if precision == "fp32" and native == "fp16":
+        logger.warning(
+            "%s model was converted to fp16 and cannot be run in fp32, reconvert it without --half",
+            model_type,
+        )
+        return native
+
+    return precision
+
+
+def convert_model_fp16(model_path: str, v2: bool = False) -> Any:
+    """
+    Load a model and convert its nodes to fp16, keeping 32-bit inputs and outputs.
+
+    Shapes are inferred before the conversion, from the graph without its external weights, so large models do not
+    need to fit within the protobuf limit.
+    """
+    from onnx import load_model
+    from onnx.external_data_helper import load_external_data_for_model
+    from onnx.shape_inference import infer_shapes
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+
+    model = infer_shapes(load_model(model_path, load_external_data=False))
+    load_external_data_for_model(model, path.dirname(path.abspath(model_path)))
+
+    model = convert_float_to_float16(
+        model,
+        disable_shape_infer=True,
+        force_fp16_initializers=True,
+        keep_io_types=True,
+        op_block_list=FP16_OP_BLOCK_LIST if v2 else None,
+    )
+    set_model_precision(model, "fp16")
+    return model
+
+
+def get_precision_model(
+    server: ServerContext,
+    device: DeviceParams,
+    model_path: str,
+    model_type: Optional[str] = None,
+) -> str:
+    """
+    Get the path to a copy of the model in the precision chosen by the policy, converting it the first time.
+
+    The converted models keep 32-bit inputs and outputs, like models converted with `--half`, so the pipeline does
+    not need to cast anything between steps.
+    """
+    # reading the precision may load the whole model, so only do that when the policy could change it
+    policy = get_precision_policy(device.optimizations)
+    if (
+        policy is None
+        or model_type is None
+        or model_type not in PRECISION_POLICIES[policy]
+    ):
+        return model_path
+
+    native = get_model_precision(model_path)
+    precision = get_component_precision(device, model_type, native)
+    if precision == native:
+        return model_path
+
+    sha = sha256()
+    sha.update(get_model_files_key(model_path).encode("utf-8"))
+    sha.update(precision.encode("utf-8"))
+    key = sha.hexdigest()
+
+    converted_path = path.join(server.cache_path, PRECISION_PATH, key)
+    converted_model = path.join(converted_path, ONNX_MODEL)
+    if path.exists(converted_model):
+        logger.debug(
+            "using %s copy of %s model: %s", precision, model_type, converted_model
+        )
+        return converted_model
+
+    logger.info("converting %s model to %s: %s", model_type, precision, model_path)
+    from onnx import save_model
+
+    # write to a temporary folder and move it into place once it is complete, so other workers never see a
+    # partial model
+    temp_path = f"{converted_path}.{getpid()}"
+    makedirs(temp_path, exist_ok=True)
+
+    try:
+        # the runtime cannot tell the v1 and v2 UNets apart, so the attention ops are always kept in fp32. exported
+        # graphs only contain them after they have been fused by the optimizer.
+        model = convert_model_fp16(model_path, v2=True)
+        save_model(
+            model,
+            path.join(temp_path, ONNX_MODEL),
+            save_as_external_data=True,
+            all_tensors_to_one_file=True,
+            location=ONNX_WEIGHTS,
+        )
+    except Exception:
+        rmtree(temp_path, ignore_errors=True)
+        raise
+
+    try:
+        replace(temp_path, converted_path)
+    except OSError:
+        logger.debug("converted model already exists, discarding this copy")
+        rmtree(temp_path, ignore_errors=True)
+
+    return converted_model
+
+
+def get_input_types(session: Any) -> Dict[str, np.dtype]:
+    """
+    Get the NumPy dtype for each input of an ONNX session, so callers can match them once rather than on every call.
+    """
+    from diffusers.pipelines.onnx_utils import ORT_TO_NP_TYPE
+
+    return {
+        input.name: np.dtype(ORT_TO_NP_TYPE[input.type])
+        for input in session.get_inputs()
+        if input.type in ORT_TO_NP_TYPE
+    }
@@ -0,0 +1,173 @@
+from hashlib import sha256
+from json import dumps
+from logging import getLogger
+from os import getpid, makedirs, path, replace
+from shutil import rmtree
+from typing import Any, Dict, List, Optional, Union
+
+from ..constants import ONNX_MODEL
+from ..params import DeviceParams
+from .context import ServerContext
+from .file_hash import get_model_files_key
+from .precision import get_precision_model
+
+logger = getLogger(__name__)
+
+# paths within the cache path
+OPTIMIZED_PATH = "optimized"
+TENSORRT_PATH = "tensorrt"
+
+# weights larger than this are written to an external data file next to the optimized model, which keeps large
+# models under the 2GB protobuf limit
+OPTIMIZED_DATA = "weights.pb"
+OPTIMIZED_DATA_MIN_SIZE = 1024
+
+TENSORRT_PROVIDER = "TensorrtExecutionProvider"
+
+
+def get_session_key(
+    model_path: str,
+    provider: str,
+    provider_options: Optional[Dict[str, Any]],
+    optimization_level: int,
+) -> str:
+    """
+    Get the cache key for an optimized session, which changes when the model or its external weights, provider,
+    provider options, optimization level, or ONNX runtime version change.
+    """
+    from ..torch_before_ort import get_version_string
+
+    sha = sha256()
+    sha.update(get_model_files_key(model_path).encode("utf-8"))
+    sha.update(get_version_string().encode("utf-8"))
+    sha.update(provider.encode("utf-8"))
+    sha.update(dumps(provider_options or {}, sort_keys=True).encode("utf-8"))
+    sha.update(str(int(optimization_level)).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def get_provider_options(
+    server: ServerContext, provider: str, key: str
+) -> Optional[Dict[str, Any]]:
+    """
+    Get the provider options that persist engine caches, if the provider has any.
+
+    TensorRT engines are kept in a folder for each model, while the timing cache is shared between models.
+    """
+    if provider != TENSORRT_PROVIDER:
+        return None
+
+    tensorrt_path = path.join(server.cache_path, TENSORRT_PATH)
+    engine_path = path.join(tensorrt_path, key)
+    makedirs(engine_path, exist_ok=True)
+
+    return {
+        "trt_engine_cache_enable": True,
+        "trt_engine_cache_path": engine_path,
+        "trt_timing_cache_enable": True,
+        "trt_timing_cache_path": tensorrt_path,
+    }
+
+
+def get_providers(
+    provider: str, provider_options: Optional[Dict[str, Any]]
+) -> List[Union[str, tuple]]:
+    if provider_options is None:
+        return [provider]
+
+    return [(provider, provider_options)]
+
+
+def load_session(
+    server: ServerContext,
+    device: DeviceParams,
+    model_path: str,
+    model_type: Optional[str] = None,
+):
+    """
+    Create an ONNX session for a model file, loading the optimized graph from a previous worker when one exists.
+
+    When the `onnx-cache-optimized` optimization is enabled, the optimized graph is saved the first time a model
+    is loaded and reused after that, until the model or session settings change. TensorRT engines cannot be saved
+    as an ONNX graph, so they use the provider's own engine and timing caches instead.
+
+    If the `onnx-precision-*` optimizations choose a different precision for this type of model, a converted copy
+    of the model is loaded instead.
+    """
+    from ..torch_before_ort import GraphOptimizationLevel, InferenceSession
+
+    model_path = get_precision_model(server, device, model_path, model_type)
+    provider = device.ort_provider(model_type)
+    sess_options = device.sess_options(cache=False, model_type=model_type)
+
+    if "onnx-cache-optimized" not in server.optimizations:
+        return InferenceSession(
+            model_path, providers=[provider], sess_options=sess_options
+        )
+
+    key = get_session_key(
+        model_path, provider, device.options, sess_options.graph_optimization_level
+    )
+    provider_options = get_provider_options(server, provider, key)
+    providers = get_providers(provider, provider_options)
+
+    if provider == TENSORRT_PROVIDER:
+        logger.debug("using TensorRT engine cache for %s", model_path)
+        return InferenceSession(
+            model_path, providers=providers, sess_options=sess_options
+        )
+
+    optimized_path = path.join(server.cache_path, OPTIMIZED_PATH, key)
+    optimized_model = path.join(optimized_path, ONNX_MODEL)
+
+    if path.exists(optimized_model):
+        logger.debug(
+            "loading optimized model for %s from %s", model_path, optimized_model
+        )
+        try:
+            # the graph has already been optimized, do not spend time on it again
+            sess_options.graph_optimization_level = (
+                GraphOptimizationLevel.ORT_DISABLE_ALL
+            )
+            return InferenceSession(
+                optimized_model, providers=providers, sess_options=sess_options
+            )
+        except Exception:
+            logger.warning(
+                "error loading optimized model from %s, regenerating it",
+                optimized_model,
+                exc_info=True,
+            )
+            rmtree(optimized_path, ignore_errors=True)
+            sess_options = device.sess_options(cache=False, model_type=model_type)
+
+    # write to a temporary folder and move it into place once the session has been created, so other workers
+    # never see a partial model
+    temp_path = f"{optimized_path}.{getpid()}"
+    makedirs(temp_path, exist_ok=True)
+
+    logger.debug("saving optimized model for %s to %s", model_path, optimized_path)
+    sess_options.optimized_model_filepath = path.join(temp_path, ONNX_MODEL)
+    sess_options.add_session_config_entry(
+        "session.optimized_model_external_initializers_file_name", OPTIMIZED_DATA
+    )
+    sess_options.add_session_config_entry(
+        "session.optimized_model_external_initializers_min_size_in_bytes",
+        str(OPTIMIZED_DATA_MIN_SIZE),
+    )
+
+    try:
+        session = InferenceSession(
+            model_path, providers=providers, sess_options=sess_options
+        )
+    except Exception:
+        rmtree(temp_path, ignore_errors=True)
+        raise
+
+    try:
+        replace(temp_path, optimized_path)
+    except OSError:
+        logger.debug("optimized model already exists, discarding this copy")
+        rmtree(temp_path, ignore_errors=True)
+
+    return session
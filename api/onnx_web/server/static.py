@@ -2,10 +2,14 @@ from os import path
 
 from flask import Flask, send_from_directory
 
+from ..output import THUMBNAIL_PATH
 from ..worker.pool import DevicePoolExecutor
 from .context import ServerContext
 from .utils import wrap_route
 
+# thumbnail names include the output name, which is unique, so they can be cached for a long time
+THUMBNAIL_MAX_AGE = 60 * 60 * 24 * 365
+
 
 def serve_bundle_file(server: ServerContext, filename="index.html"):
     return send_from_directory(path.join("..", server.bundle_path), filename)
@@ -26,11 +30,23 @@ def output(server: ServerContext, filename: str):
     )
 
 
+def thumbnail(server: ServerContext, filename: str):
+    return send_from_directory(
+        path.join("..", server.output_path, THUMBNAIL_PATH),
+        filename,
+        as_attachment=False,
+        max_age=THUMBNAIL_MAX_AGE,
+    )
+
+
 def register_static_routes(
     app: Flask, server: ServerContext, _pool: DevicePoolExecutor
 ):
     return [
         app.route("/")(wrap_route(index, server)),
         app.route("/<path:filename>")(wrap_route(index_path, server)),
+        app.route(f"/output/{THUMBNAIL_PATH}/<path:filename>")(
+            wrap_route(thumbnail, server)
+        ),
         app.route("/output/<path:filename>")(wrap_route(output, server)),
     ]
@@ -8,7 +8,6 @@ from os import environ, path
 from platform import system
 from typing import Any, Dict, List, Optional, Sequence, TypeVar, Union
 
-import torch
 from yaml import safe_load
 
 from .params import DeviceParams, SizeChart
@@ -96,14 +95,43 @@ def get_size(val: Union[int, str, None]) -> Union[int, SizeChart]:
     raise ValueError("invalid size")
 
 
+def parse_cores(value: str) -> List[int]:
+    """
+    Parse a list of CPU cores and ranges, like `0-3,8`.
+    """
+    cores = []
+    for part in value.split(","):
+        part = part.strip()
+        if len(part) == 0:
+            continue
+
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cores.extend(range(int(start), int(end) + 1))
+        else:
+            cores.append(int(part))
+
+    return sorted(set(cores))
+
+
 def run_gc(devices: Optional[List[DeviceParams]] = None):
     logger.debug(
         "running garbage collection with %s active threads", threading.active_count()
     )
     gc.collect()
 
-    if torch.cuda.is_available() and devices is not None:
-        for device in [d for d in devices if d.device.startswith("cuda")]:
+    if devices is None:
+        return
+
+    cuda_devices = [d for d in devices if d.device.startswith("cuda")]
+    if len(cuda_devices) == 0:
+        return
+
+    # only import Torch when there is VRAM to collect, since the server process does not need it
+    import torch
+
+    if torch.cuda.is_available():
+        for device in cuda_devices:
             logger.debug("running Torch garbage collection for device: %s", device)
             with torch.cuda.device(device.torch_str()):
                 torch.cuda.empty_cache()
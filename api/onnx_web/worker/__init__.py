@@ -1,2 +1,4 @@
 from .context import WorkerContext, ProgressCallback
 from .pool import DevicePoolExecutor
+from .broker import JobBroker, SqliteJobBroker, get_job_broker
+from .remote import RemotePoolExecutor
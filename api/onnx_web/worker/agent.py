@@ -0,0 +1,151 @@
+from logging import getLogger
+from multiprocessing import set_start_method
+from os import getpid
+from socket import gethostname
+from time import sleep
+from typing import Dict, List, Optional
+
+from setproctitle import setproctitle
+
+from ..server.context import ServerContext
+from .broker import JobBroker, get_job_broker
+from .command import ProgressCommand
+from .pool import DevicePoolExecutor
+
+logger = getLogger(__name__)
+
+
+class WorkerAgent:
+    """
+    Claim jobs from a broker for the devices on this machine, run them in a local worker pool, and report their
+    progress back to the broker.
+
+    Each device claims one job at a time, so jobs stay in the broker, where another machine can claim them, until a
+    device is ready for them.
+    """
+
+    server: ServerContext
+    broker: JobBroker
+    pool: DevicePoolExecutor
+    name: str
+
+    claimed: Dict[str, int]  # Job -> last progress
+    cancelled: List[str]
+
+    def __init__(
+        self,
+        server: ServerContext,
+        broker: JobBroker,
+        pool: DevicePoolExecutor,
+        name: Optional[str] = None,
+    ) -> None:
+        self.server = server
+        self.broker = broker
+        self.pool = pool
+        self.name = name or f"{gethostname()}:{getpid()}"
+
+        self.claimed = {}
+        self.cancelled = []
+
+    def update(self) -> None:
+        self.report_jobs()
+        self.claim_jobs()
+
+        # keep the lease on jobs that are running without reporting any progress, like long model loads
+        if len(self.claimed) > 0:
+            self.broker.heartbeat(self.name, list(self.claimed.keys()))
+
+    def report_jobs(self) -> None:
+        """
+        Send progress for the claimed jobs to the broker, and pass on any cancellations from the servers.
+        """
+        for key, last_progress in list(self.claimed.items()):
+            if key not in self.cancelled and self.broker.is_cancelled(key):
+                logger.info("job %s was cancelled by the server", key)
+                self.pool.cancel(key)
+                self.cancelled.append(key)
+
+            pending, progress = self.pool.done(key)
+            if pending:
+                continue
+
+            if progress is None:
+                # the job was cancelled before it started or lost with its worker
+                logger.warning("claimed job is no longer in the pool: %s", key)
+                progress = ProgressCommand(
+                    key,
+                    "",
+                    True,
+                    max(last_progress, 0),
+                    cancelled=key in self.cancelled,
+                    failed=True,
+                )
+
+            if progress.finished or progress.progress != last_progress:
+                self.broker.report(progress)
+                self.claimed[key] = progress.progress
+
+            if progress.finished:
+                logger.debug("reported finished job: %s", key)
+                del self.claimed[key]
+                if key in self.cancelled:
+                    self.cancelled.remove(key)
+
+    def claim_jobs(self) -> None:
+        for device in self.pool.devices:
+            if self.pool.get_device_load(device.device) > 0:
+                continue
+
+            job = self.broker.claim(self.name, device.platform)
+            if job is None:
+                continue
+
+            # the job should use the paths and settings for this machine, rather than the server
+            args = [
+                self.server if isinstance(arg, ServerContext) else arg
+                for arg in job.args
+            ]
+
+            logger.info("claimed job %s for device %s", job.name, device.device)
+            self.pool.submit(
+                job.name,
+                job.fn,
+                *args,
+                needs_device=device,
+                priority=job.priority,
+                **job.kwargs,
+            )
+            self.claimed[job.name] = -1
+
+
+def main() -> None:
+    from ..server.load import get_available_platforms, load_platforms
+    from ..server.utils import check_paths
+
+    setproctitle("onnx-web agent")
+    set_start_method("spawn", force=True)
+
+    server = ServerContext.from_environ()
+    broker = get_job_broker(server)
+    if broker is None:
+        raise ValueError("worker agents need a job broker, set ONNX_WEB_JOB_BROKER")
+
+    check_paths(server)
+    load_platforms(server)
+
+    pool = DevicePoolExecutor(
+        server, [p for p in get_available_platforms() if p.device != "any"]
+    )
+    agent = WorkerAgent(server, broker, pool)
+
+    logger.info("starting worker agent %s", agent.name)
+    pool.start()
+
+    try:
+        while True:
+            agent.update()
+            sleep(pool.progress_interval)
+    except KeyboardInterrupt:
+        logger.info("stopping worker agent")
+    finally:
+        pool.join()
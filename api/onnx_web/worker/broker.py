@@ -0,0 +1,454 @@
+from json import dumps, loads
+from logging import getLogger
+from os import makedirs, path
+from pickle import dumps as pickle_dumps
+from pickle import loads as pickle_loads
+from sqlite3 import Connection, Row, connect
+from threading import local
+from time import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..image.encoded import EncodedImage, find_images
+from ..server.context import ServerContext
+from .command import JobCommand, ProgressCommand
+
+logger = getLogger(__name__)
+
+# finished jobs are kept for this long, in seconds, so their status can still be checked
+DEFAULT_JOB_TTL = 24 * 60 * 60
+
+# running jobs that have not been updated for this long, in seconds, are assumed lost with their agent
+DEFAULT_JOB_LEASE = 5 * 60
+
+JOB_FINISHED = "finished"
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+
+BROKER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    platform TEXT,
+    payload BLOB NOT NULL,
+    digest TEXT,
+    outputs TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 1,
+    followers INTEGER NOT NULL DEFAULT 1,
+    state TEXT NOT NULL,
+    worker TEXT,
+    device TEXT,
+    progress INTEGER NOT NULL DEFAULT 0,
+    cancelled INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority, created);
+CREATE INDEX IF NOT EXISTS jobs_digest ON jobs (digest, state);
+CREATE TABLE IF NOT EXISTS images (
+    job TEXT NOT NULL,
+    ref INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job, ref)
+);
+"""
+
+
+def get_job_images(job: JobCommand) -> List[EncodedImage]:
+    return find_images([job.args, job.kwargs, getattr(job.fn, "stages", [])])
+
+
+class JobBroker:
+    """
+    Pass jobs from the servers to the worker agents, and their progress back again, so the servers and workers can
+    run on different machines.
+
+    Each job is claimed by one worker, which reports progress until the job has finished. Duplicate jobs with the
+    same digest follow the first one, like the local worker pool. If a worker stops sending heartbeats for a job,
+    the job is returned to the queue for another worker to claim.
+    """
+
+    def publish(
+        self,
+        job: JobCommand,
+        platform: Optional[str] = None,
+        digest: Optional[str] = None,
+        outputs: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        Queue a job for any worker with the given platform and return its outputs, or the outputs of an earlier job
+        with the same digest.
+        """
+        raise NotImplementedError()
+
+    def claim(self, worker: str, platform: str) -> Optional[JobCommand]:
+        """
+        Take the oldest pending job with the highest priority for a platform, if there is one.
+        """
+        raise NotImplementedError()
+
+    def report(self, progress: ProgressCommand) -> None:
+        raise NotImplementedError()
+
+    def heartbeat(self, worker: str, keys: List[str]) -> None:
+        """
+        Renew the lease on jobs that a worker is still running, so they are not claimed again by another worker.
+        """
+        raise NotImplementedError()
+
+    def status(self, key: str) -> Tuple[bool, Optional[ProgressCommand]]:
+        """
+        Check if a job is still pending and get its last progress update, like `DevicePoolExecutor.done`.
+        """
+        raise NotImplementedError()
+
+    def cancel(self, key: str) -> bool:
+        raise NotImplementedError()
+
+    def is_cancelled(self, key: str) -> bool:
+        raise NotImplementedError()
+
+    def list_jobs(self) -> Dict[str, List[ProgressCommand]]:
+        """
+        List the jobs by state, with the pending jobs first.
+        """
+        raise NotImplementedError()
+
+
+class SqliteJobBroker(JobBroker):
+    """
+    A job broker in an SQLite database, which can be shared by servers and workers on the same machine or on a
+    network filesystem that supports locking.
+
+    The jobs are pickled, so the database must only be writable by trusted servers. The encoded images are stored
+    in their own table and only referenced by the pickled job.
+    """
+
+    broker_path: str
+    job_lease: float
+    job_ttl: float
+
+    def __init__(
+        self,
+        broker_path: str,
+        job_ttl: float = DEFAULT_JOB_TTL,
+        job_lease: float = DEFAULT_JOB_LEASE,
+    ) -> None:
+        self.broker_path = broker_path
+        self.job_lease = job_lease
+        self.job_ttl = job_ttl
+        self.local = local()
+
+    def connect(self) -> Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            broker_dir = path.dirname(self.broker_path)
+            if broker_dir != "" and not path.exists(broker_dir):
+                makedirs(broker_dir, exist_ok=True)
+
+            logger.debug("opening job broker: %s", self.broker_path)
+            conn = connect(self.broker_path, timeout=30.0, isolation_level=None)
+            conn.row_factory = Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(BROKER_SCHEMA)
+            self.local.conn = conn
+
+        return conn
+
+    def transaction(self, fn: Callable[[Connection], Any]) -> Any:
+        """
+        Run a function in a write transaction, so claims and duplicate checks from other processes cannot interleave.
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def publish(
+        self,
+        job: JobCommand,
+        platform: Optional[str] = None,
+        digest: Optional[str] = None,
+        outputs: Optional[List[str]] = None,
+    ) -> List[str]:
+        outputs = outputs or [job.name]
+
+        def publish_job(conn: Connection) -> List[str]:
+            now = time()
+            conn.execute(
+                "DELETE FROM jobs WHERE state = ? AND updated < ?",
+                (JOB_FINISHED, now - self.job_ttl),
+            )
+
+            if digest is not None:
+                row = conn.execute(
+                    "SELECT name, outputs FROM jobs WHERE digest = ? AND state != ? AND cancelled = 0",
+                    (digest, JOB_FINISHED),
+                ).fetchone()
+                if row is not None:
+                    logger.info(
+                        "job %s is a duplicate of %s, following it",
+                        job.name,
+                        row["name"],
+                    )
+                    conn.execute(
+                        "UPDATE jobs SET followers = followers + 1 WHERE name = ?",
+                        (row["name"],),
+                    )
+                    return loads(row["outputs"])
+
+            # keep the image data out of the pickled job
+            images = get_job_images(job)
+            for ref, image in enumerate(images):
+                conn.execute(
+                    "INSERT OR REPLACE INTO images (job, ref, data) VALUES (?, ?, ?)",
+                    (job.name, ref, image.get_data()),
+                )
+                image.data = None
+                image.ref = ref
+
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs "
+                "(name, platform, payload, digest, outputs, priority, state, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.name,
+                    platform,
+                    pickle_dumps(job),
+                    digest,
+                    dumps(outputs),
+                    job.priority,
+                    JOB_PENDING,
+                    now,
+                    now,
+                ),
+            )
+
+            logger.debug(
+                "published job %s for platform %s with %s images",
+                job.name,
+                platform,
+                len(images),
+            )
+            return outputs
+
+        return self.transaction(publish_job)
+
+    def claim(self, worker: str, platform: str) -> Optional[JobCommand]:
+        def claim_job(conn: Connection) -> Optional[Tuple[Row, List[Row]]]:
+            self.expire_jobs(conn)
+
+            row = conn.execute(
+                "SELECT name, payload FROM jobs WHERE state = ? AND (platform IS NULL OR platform = ?) "
+                "ORDER BY priority DESC, created LIMIT 1",
+                (JOB_PENDING, platform),
+            ).fetchone()
+            if row is None:
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET state = ?, worker = ?, updated = ? WHERE name = ?",
+                (JOB_RUNNING, worker, time(), row["name"]),
+            )
+            images = conn.execute(
+                "SELECT ref, data FROM images WHERE job = ?", (row["name"],)
+            ).fetchall()
+            return (row, images)
+
+        claimed = self.transaction(claim_job)
+        if claimed is None:
+            return None
+
+        row, image_rows = claimed
+        job: JobCommand = pickle_loads(row["payload"])
+        data = {image["ref"]: image["data"] for image in image_rows}
+        for image in get_job_images(job):
+            image.data = data[image.ref]
+
+        logger.debug("worker %s claimed job %s", worker, job.name)
+        return job
+
+    def report(self, progress: ProgressCommand) -> None:
+        state = JOB_FINISHED if progress.finished else JOB_RUNNING
+        conn = self.connect()
+        conn.execute(
+            "UPDATE jobs SET state = ?, device = ?, progress = ?, cancelled = MAX(cancelled, ?), failed = ?, "
+            "updated = ? WHERE name = ?",
+            (
+                state,
+                progress.device,
+                progress.progress,
+                progress.cancelled,
+                progress.failed,
+                time(),
+                progress.job,
+            ),
+        )
+
+        if progress.finished:
+            conn.execute("DELETE FROM images WHERE job = ?", (progress.job,))
+
+    def heartbeat(self, worker: str, keys: List[str]) -> None:
+        conn = self.connect()
+        now = time()
+        for key in keys:
+            conn.execute(
+                "UPDATE jobs SET updated = ? WHERE name = ? AND state = ? AND worker = ?",
+                (now, key, JOB_RUNNING, worker),
+            )
+
+    def expire_jobs(self, conn: Connection) -> None:
+        """
+        Return running jobs whose worker has stopped sending heartbeats to the queue, or finish them if they were
+        cancelled, since no worker will report on them again.
+        """
+        now = time()
+        expired = conn.execute(
+            "SELECT name, worker, cancelled FROM jobs WHERE state = ? AND updated < ?",
+            (JOB_RUNNING, now - self.job_lease),
+        ).fetchall()
+
+        for row in expired:
+            if row["cancelled"] > 0:
+                logger.warning(
+                    "lease expired for cancelled job %s on worker %s, finishing it",
+                    row["name"],
+                    row["worker"],
+                )
+                conn.execute(
+                    "UPDATE jobs SET state = ?, updated = ? WHERE name = ?",
+                    (JOB_FINISHED, now, row["name"]),
+                )
+                conn.execute("DELETE FROM images WHERE job = ?", (row["name"],))
+            else:
+                logger.warning(
+                    "lease expired for job %s on worker %s, returning it to the queue",
+                    row["name"],
+                    row["worker"],
+                )
+                conn.execute(
+                    "UPDATE jobs SET state = ?, worker = NULL, device = NULL, progress = 0, updated = ? "
+                    "WHERE name = ?",
+                    (JOB_PENDING, now, row["name"]),
+                )
+
+    def status(self, key: str) -> Tuple[bool, Optional[ProgressCommand]]:
+        row = (
+            self.connect()
+            .execute(
+                "SELECT name, state, device, progress, cancelled, failed FROM jobs WHERE name = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+
+        if row is None:
+            return (False, None)
+
+        if row["state"] == JOB_PENDING:
+            return (True, None)
+
+        return (False, self.get_progress(row))
+
+    def cancel(self, key: str) -> bool:
+        def cancel_job(conn: Connection) -> bool:
+            row = conn.execute(
+                "SELECT state, followers FROM jobs WHERE name = ?", (key,)
+            ).fetchone()
+            if row is None or row["state"] == JOB_FINISHED:
+                logger.debug("cannot cancel unknown or finished job: %s", key)
+                return False
+
+            if row["followers"] > 1:
+                conn.execute(
+                    "UPDATE jobs SET followers = followers - 1 WHERE name = ?", (key,)
+                )
+                logger.info(
+                    "not cancelling job %s, %s submissions are still waiting for it",
+                    key,
+                    row["followers"] - 1,
+                )
+                return True
+
+            if row["state"] == JOB_PENDING:
+                # no worker will report on this job, so it is finished here
+                conn.execute(
+                    "UPDATE jobs SET state = ?, cancelled = 1, updated = ? WHERE name = ?",
+                    (JOB_FINISHED, time(), key),
+                )
+                conn.execute("DELETE FROM images WHERE job = ?", (key,))
+                logger.info("cancelled pending job: %s", key)
+            else:
+                # the worker will stop the job the next time it checks
+                conn.execute(
+                    "UPDATE jobs SET cancelled = 1, updated = ? WHERE name = ?",
+                    (time(), key),
+                )
+                logger.info("cancelling running job: %s", key)
+
+            return True
+
+        return self.transaction(cancel_job)
+
+    def is_cancelled(self, key: str) -> bool:
+        row = (
+            self.connect()
+            .execute("SELECT cancelled FROM jobs WHERE name = ?", (key,))
+            .fetchone()
+        )
+        return row is not None and row["cancelled"] > 0
+
+    def list_jobs(self) -> Dict[str, List[ProgressCommand]]:
+        jobs: Dict[str, List[ProgressCommand]] = {
+            JOB_PENDING: [],
+            JOB_RUNNING: [],
+            JOB_FINISHED: [],
+        }
+
+        for row in self.connect().execute(
+            "SELECT name, state, device, progress, cancelled, failed FROM jobs ORDER BY created"
+        ):
+            jobs[row["state"]].append(self.get_progress(row))
+
+        return jobs
+
+    def get_progress(self, row: Row) -> ProgressCommand:
+        return ProgressCommand(
+            row["name"],
+            row["device"],
+            row["state"] == JOB_FINISHED,
+            row["progress"],
+            cancelled=row["cancelled"] > 0,
+            failed=row["failed"] > 0,
+        )
+
+
+# broker types by URL scheme, like `sqlite:///path/to/jobs.db`
+JOB_BROKERS: Dict[str, Callable[[str], JobBroker]] = {
+    "sqlite": SqliteJobBroker,
+}
+
+job_brokers: Dict[str, JobBroker] = {}
+
+
+def get_job_broker(server: ServerContext) -> Optional[JobBroker]:
+    if server.job_broker is None or server.job_broker == "":
+        return None
+
+    if server.job_broker not in job_brokers:
+        scheme, _sep, location = server.job_broker.partition(":")
+        if scheme not in JOB_BROKERS:
+            raise ValueError(f"unknown job broker: {scheme}")
+
+        # sqlite:///var/lib/jobs.db is an absolute path and sqlite:jobs.db is relative to the server
+        if location.startswith("//"):
+            location = location[2:]
+
+        job_brokers[server.job_broker] = JOB_BROKERS[scheme](location)
+
+    return job_brokers[server.job_broker]
@@ -0,0 +1,87 @@
+from logging import getLogger
+from os import makedirs, path, remove
+from pickle import dump, load
+from typing import List, Optional
+
+from PIL import Image
+
+from ..server.context import ServerContext
+from ..utils import base_join
+
+logger = getLogger(__name__)
+
+# path within the cache path
+CHECKPOINT_PATH = "checkpoints"
+
+
+class JobCheckpoint:
+    """
+    The state of a chain pipeline between two stages, which is enough to resume the job from the next stage.
+    """
+
+    stage: int
+    progress: int
+    images: List[Optional[Image.Image]]
+
+    def __init__(
+        self, stage: int, progress: int, images: List[Optional[Image.Image]]
+    ) -> None:
+        self.stage = stage
+        self.progress = progress
+        self.images = images
+
+
+def get_checkpoint_path(server: ServerContext, job: str) -> str:
+    return base_join(path.join(server.cache_path, CHECKPOINT_PATH), f"{job}.pkl")
+
+
+def save_checkpoint(server: ServerContext, job: str, checkpoint: JobCheckpoint) -> str:
+    from ..output import write_atomic
+
+    dest = get_checkpoint_path(server, job)
+    makedirs(path.dirname(dest), exist_ok=True)
+
+    def write(temp_path: str):
+        with open(temp_path, "wb") as f:
+            dump(checkpoint, f)
+
+    write_atomic(dest, write)
+    logger.debug("saved checkpoint for job %s at stage %s", job, checkpoint.stage)
+    return dest
+
+
+def load_checkpoint(server: ServerContext, job: str) -> Optional[JobCheckpoint]:
+    """
+    Load and remove the checkpoint for a job, if it has one. The job will save a new checkpoint if it is preempted
+    again.
+    """
+    checkpoint_path = get_checkpoint_path(server, job)
+    if not path.exists(checkpoint_path):
+        return None
+
+    try:
+        with open(checkpoint_path, "rb") as f:
+            checkpoint = load(f)
+    finally:
+        remove(checkpoint_path)
+
+    logger.info("resuming job %s from stage %s", job, checkpoint.stage)
+    return checkpoint
+
+
+def remove_checkpoint(server: ServerContext, job: str) -> bool:
+    """
+    Remove the checkpoint for a job that will not be resumed, if it has one.
+    """
+    checkpoint_path = get_checkpoint_path(server, job)
+    if not path.exists(checkpoint_path):
+        return False
+
+    try:
+        remove(checkpoint_path)
+    except FileNotFoundError:
+        # the worker may have just resumed the job
+        return False
+
+    logger.debug("removed checkpoint for job %s", job)
+    return True
@@ -1,5 +1,11 @@
+from importlib import import_module
 from typing import Any, Callable, Dict
 
+# priority classes for jobs, where higher priority jobs can preempt lower priority ones
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HIGH = 2
+
 
 class ProgressCommand:
     device: str
@@ -8,6 +14,7 @@ class ProgressCommand:
     progress: int
     cancelled: bool
     failed: bool
+    preempted: bool
 
     def __init__(
         self,
@@ -17,6 +24,7 @@ class ProgressCommand:
         progress: int,
         cancelled: bool = False,
         failed: bool = False,
+        preempted: bool = False,
     ):
         self.job = job
         self.device = device
@@ -24,6 +32,7 @@ class ProgressCommand:
         self.progress = progress
         self.cancelled = cancelled
         self.failed = failed
+        self.preempted = preempted
 
 
 class JobCommand:
@@ -32,6 +41,8 @@ class JobCommand:
     fn: Callable[..., None]
     args: Any
     kwargs: Dict[str, Any]
+    priority: int
+    helper: bool  # runs part of another job, and is not reported to clients
 
     def __init__(
         self,
@@ -40,9 +51,34 @@ class JobCommand:
         fn: Callable[..., None],
         args: Any,
         kwargs: Dict[str, Any],
+        priority: int = PRIORITY_NORMAL,
+        helper: bool = False,
     ):
         self.device = device
         self.name = name
         self.fn = fn
         self.args = args
         self.kwargs = kwargs
+        self.priority = priority
+        self.helper = helper
+
+
+class JobFunction:
+    """
+    Refer to a job function by module and name, which will be imported by the worker that runs it, so the server
+    can queue jobs without loading the pipelines.
+    """
+
+    module: str
+    name: str
+
+    def __init__(self, module: str, name: str):
+        self.module = module
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        fn = getattr(import_module(self.module), self.name)
+        return fn(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"{self.module}.{self.name}"
@@ -1,11 +1,12 @@
 from logging import getLogger
+from multiprocessing import Queue, Value
 from os import getpid
-from typing import Any, Callable, Optional
-
-from torch.multiprocessing import Queue, Value
+from queue import Full
+from typing import Any, Callable, Optional, Tuple
 
 from ..errors import CancelledException
 from ..params import DeviceParams
+from ..server.context import ServerContext
 from .command import JobCommand, ProgressCommand
 
 logger = getLogger(__name__)
@@ -16,6 +17,7 @@ ProgressCallback = Callable[[int, int, Any], None]
 
 class WorkerContext:
     cancel: "Value[bool]"
+    checkpoint_owner: Optional[Any]
     job: Optional[str]
     name: str
     pending: "Queue[JobCommand]"
@@ -23,6 +25,8 @@ class WorkerContext:
     progress: "Queue[ProgressCommand]"
     last_progress: Optional[ProgressCommand]
     idle: "Value[bool]"
+    preempt: "Value[bool]"
+    tile_requests: Optional["Queue[Tuple[str, str, str]]"]
     timeout: float
     retries: int
 
@@ -36,8 +40,11 @@ class WorkerContext:
         progress: "Queue[ProgressCommand]",
         active_pid: "Value[int]",
         idle: "Value[bool]",
+        preempt: Optional["Value[bool]"] = None,
+        tile_requests: Optional["Queue[Tuple[str, str, str]]"] = None,
     ):
         self.job = None
+        self.checkpoint_owner = None
         self.name = name
         self.device = device
         self.cancel = cancel
@@ -47,14 +54,18 @@ class WorkerContext:
         self.active_pid = active_pid
         self.last_progress = None
         self.idle = idle
+        self.preempt = preempt or Value("B", False)
+        self.tile_requests = tile_requests
         self.timeout = 1.0
         self.retries = 3  # TODO: get from env
 
     def start(self, job: str) -> None:
         self.job = job
+        self.checkpoint_owner = None
         self.retries = 3
         self.set_cancel(cancel=False)
         self.set_idle(idle=False)
+        self.set_preempt(preempt=False)
 
     def is_active(self) -> bool:
         return self.get_active() == getpid()
@@ -65,6 +76,13 @@ class WorkerContext:
     def is_idle(self) -> bool:
         return self.idle.value
 
+    def is_preempted(self) -> bool:
+        """
+        Check if a higher priority job is waiting for this device. Jobs that can save a checkpoint should do so and
+        raise a `PreemptedException`, others can ignore this.
+        """
+        return self.preempt.value
+
     def get_active(self) -> int:
         with self.active_pid.get_lock():
             return self.active_pid.value
@@ -81,15 +99,40 @@ class WorkerContext:
 
         return 0
 
-    def get_progress_callback(self) -> ProgressCallback:
+    def get_progress_callback(
+        self, server: Optional[ServerContext] = None
+    ) -> ProgressCallback:
+        """
+        Get a callback that reports progress for the current job.
+
+        If a server is provided and latent previews are enabled, the callback will also write a preview of the
+        latents every few steps.
+        """
         from ..chain.base import ChainProgress
 
         def on_progress(step: int, timestep: int, latents: Any):
             on_progress.step = step
             self.set_progress(step)
 
+            if (
+                server is not None
+                and server.preview_steps > 0
+                and latents is not None
+                and step % server.preview_steps == 0
+            ):
+                self.set_preview(server, latents)
+
         return ChainProgress.from_progress(on_progress)
 
+    def set_preview(self, server: ServerContext, latents: Any) -> None:
+        from ..output import save_preview
+
+        try:
+            save_preview(server, self.job, latents)
+        except Exception:
+            # previews are optional and should not stop the job
+            logger.debug("error saving latent preview", exc_info=True)
+
     def set_cancel(self, cancel: bool = True) -> None:
         with self.cancel.get_lock():
             self.cancel.value = cancel
@@ -98,6 +141,25 @@ class WorkerContext:
         with self.idle.get_lock():
             self.idle.value = idle
 
+    def set_preempt(self, preempt: bool = True) -> None:
+        with self.preempt.get_lock():
+            self.preempt.value = preempt
+
+    def request_tiles(self, tile_path: str) -> None:
+        """
+        Ask the pool to start helper jobs for the tiles in a folder on any idle devices with the same platform.
+        """
+        if self.tile_requests is None:
+            logger.debug("worker cannot request help with tiles")
+            return
+
+        try:
+            self.tile_requests.put(
+                (self.job, self.device.device, tile_path), block=False
+            )
+        except Full:
+            logger.warning("tile request queue is full, running tiles on this device")
+
     def set_progress(self, progress: int) -> None:
         if self.job is None:
             raise RuntimeError("no job on which to set progress")
@@ -120,44 +182,95 @@ class WorkerContext:
             block=False,
         )
 
-    def finish(self) -> None:
-        if self.job is None:
+    def finish(
+        self,
+        job: Optional[str] = None,
+        progress: Optional[int] = None,
+        cancelled: Optional[bool] = None,
+    ) -> None:
+        """
+        Report that a job has finished.
+
+        The job, progress, and cancelled flag default to the current job, but can be provided when finishing a job
+        from another thread after the worker has moved on, such as once its output files have been written.
+        """
+        job = job or self.job
+        if job is None:
             logger.warning("setting finished without an active job")
         else:
-            logger.debug("setting finished for job %s", self.job)
-            self.last_progress = ProgressCommand(
-                self.job,
+            logger.debug("setting finished for job %s", job)
+            finished = ProgressCommand(
+                job,
                 self.device.device,
                 True,
-                self.get_progress(),
-                self.is_cancelled(),
+                self.get_progress() if progress is None else progress,
+                self.is_cancelled() if cancelled is None else cancelled,
                 False,
             )
+
+            # a job that finishes after the worker has moved on should not replace the progress of the current job
+            if job == self.job:
+                self.last_progress = finished
+
             self.progress.put(
-                self.last_progress,
+                finished,
                 block=False,
             )
 
-    def fail(self) -> None:
+    def preempted(self) -> None:
+        """
+        Report that the current job has saved a checkpoint and stopped, so the pool can queue it again.
+        """
         if self.job is None:
+            logger.warning("setting preempted without an active job")
+            return
+
+        logger.info("setting preempted for job %s", self.job)
+        self.last_progress = ProgressCommand(
+            self.job,
+            self.device.device,
+            False,
+            self.get_progress(),
+            self.is_cancelled(),
+            False,
+            preempted=True,
+        )
+        self.progress.put(
+            self.last_progress,
+            block=False,
+        )
+
+    def fail(
+        self,
+        job: Optional[str] = None,
+        progress: Optional[int] = None,
+        cancelled: Optional[bool] = None,
+    ) -> None:
+        job = job or self.job
+        if job is None:
             logger.warning("setting failure without an active job")
         else:
-            logger.warning("setting failure for job %s", self.job)
+            logger.warning("setting failure for job %s", job)
             try:
-                self.last_progress = ProgressCommand(
-                    self.job,
+                failed = ProgressCommand(
+                    job,
                     self.device.device,
                     True,
-                    self.get_progress(),
-                    self.is_cancelled(),
+                    self.get_progress() if progress is None else progress,
+                    self.is_cancelled() if cancelled is None else cancelled,
                     True,
                 )
+
+                # like finish, a failed write for an earlier job should not replace the progress of the current job
+                if job == self.job:
+                    self.last_progress = failed
+
                 self.progress.put(
-                    self.last_progress,
+                    failed,
                     block=False,
                 )
             except Exception:
-                logger.exception("error setting failure on job %s", self.job)
+                logger.exception("error setting failure on job %s", job)
 
 
 class JobStatus:
@@ -1,15 +1,17 @@
-from collections import Counter
 from logging import getLogger
+from multiprocessing import Process, Queue, Value
+from os import path
 from queue import Empty
-from threading import Lock, Thread
+from threading import RLock, Thread
 from typing import Callable, Dict, List, Optional, Tuple
 
-from torch.multiprocessing import Process, Queue, Value
-
+from ..output import remove_preview
 from ..params import DeviceParams
 from ..server import ServerContext
-from .command import JobCommand, ProgressCommand
+from .checkpoint import remove_checkpoint
+from .command import PRIORITY_NORMAL, JobCommand, ProgressCommand
 from .context import WorkerContext
+from .shared import SharedBuffer, release_buffers, share_images
 from .utils import Interval
 from .worker import worker_main
 
@@ -27,6 +29,8 @@ class DevicePoolExecutor:
     recycle_interval: float
 
     leaking: List[Tuple[str, Process, WorkerContext]]
+    retiring: List[Tuple[str, Process, WorkerContext]]
+    warming: Dict[str, Tuple[Process, WorkerContext]]
 
     worker_cancel: Dict[str, "Value[bool]"]
     worker_idle: Dict[str, "Value[bool]"]
@@ -43,12 +47,18 @@ class DevicePoolExecutor:
 
     cancelled_jobs: List[str]
     finished_jobs: List[ProgressCommand]
+    job_digests: Dict[str, str]  # Digest -> job
+    job_followers: Dict[str, int]  # Job -> submission count
+    job_outputs: Dict[str, List[str]]  # Job -> outputs
     pending_jobs: List[JobCommand]
+    running_commands: Dict[str, JobCommand]  # Job -> command
     running_jobs: Dict[str, ProgressCommand]  # Device -> job progress
+    shared_buffers: Dict[str, List[SharedBuffer]]  # Job -> buffers
     total_jobs: Dict[str, int]  # Device -> job count
 
     logs: "Queue[str]"
-    rlock: Lock
+    tile_requests: "Queue[Tuple[str, str, str]]"  # (job, device, tile path)
+    rlock: "RLock"
 
     def __init__(
         self,
@@ -69,6 +79,8 @@ class DevicePoolExecutor:
         self.recycle_interval = recycle_interval
 
         self.leaking = []
+        self.retiring = []
+        self.warming = {}
         self.context = {}
         self.current = {}
         self.pending = {}
@@ -77,14 +89,20 @@ class DevicePoolExecutor:
 
         self.cancelled_jobs = []
         self.finished_jobs = []
+        self.job_digests = {}
+        self.job_followers = {}
+        self.job_outputs = {}
         self.pending_jobs = []
+        self.running_commands = {}
         self.running_jobs = {}
+        self.shared_buffers = {}
         self.total_jobs = {}
         self.worker_cancel = {}
         self.worker_idle = {}
 
         self.logs = Queue(self.max_pending_per_worker)
-        self.rlock = Lock()
+        self.tile_requests = Queue(self.max_pending_per_worker)
+        self.rlock = RLock()
 
     def start(self) -> None:
         self.create_health_worker()
@@ -94,13 +112,18 @@ class DevicePoolExecutor:
         for device in self.devices:
             self.create_device_worker(device)
 
-    def create_device_worker(self, device: DeviceParams) -> None:
+    def create_device_worker(self, device: DeviceParams, replace=False) -> None:
+        """
+        Start a worker for a device.
+
+        When replacing a worker that is still running, the new worker will warm up while the old one keeps taking
+        jobs, then take over the device once it reports that it is idle.
+        """
         name = device.device
 
         # always recreate queues
-        self.progress[name] = Queue(self.max_pending_per_worker)
-        self.pending[name] = Queue(self.max_pending_per_worker)
-        self.total_jobs[device.device] = 0
+        progress = Queue(self.max_pending_per_worker)
+        pending = Queue(self.max_pending_per_worker)
 
         # reuse pid sentinel
         if name in self.current:
@@ -111,21 +134,19 @@ class DevicePoolExecutor:
             current = Value("L", 0)
             self.current[name] = current
 
-        self.worker_cancel[name] = Value("B", False)
-        self.worker_idle[name] = Value("B", False)
-
         # create a new context and worker
         context = WorkerContext(
             name,
             device,
-            cancel=self.worker_cancel[name],
-            progress=self.progress[name],
+            cancel=Value("B", False),
+            progress=progress,
             logs=self.logs,
-            pending=self.pending[name],
+            pending=pending,
             active_pid=current,
-            idle=self.worker_idle[name],
+            idle=Value("B", False),
+            preempt=Value("B", False),
+            tile_requests=self.tile_requests,
         )
-        self.context[name] = context
 
         worker = Process(
             name=f"onnx-web worker: {name}",
@@ -133,11 +154,60 @@ class DevicePoolExecutor:
             args=(context, self.server),
         )
         worker.daemon = True
-        self.workers[name] = worker
 
         logger.debug("starting worker for device %s", device)
         worker.start()
-        current.value = worker.pid
+
+        if replace:
+            logger.info(
+                "warming up replacement worker %s for device %s", worker.pid, name
+            )
+            self.warming[name] = (worker, context)
+        else:
+            self.set_device_worker(name, worker, context)
+
+    def set_device_worker(
+        self, device: str, worker: Process, context: WorkerContext
+    ) -> None:
+        """
+        Make a worker active for its device, which will send it new jobs and make any previous worker exit once it
+        has finished its current job.
+        """
+        previous = self.workers.get(device, None)
+        if previous is not None and previous.is_alive():
+            logger.debug("retiring worker %s for device %s", previous.pid, device)
+            self.retiring.append((device, previous, self.context[device]))
+
+        self.context[device] = context
+        self.pending[device] = context.pending
+        self.progress[device] = context.progress
+        self.worker_cancel[device] = context.cancel
+        self.worker_idle[device] = context.idle
+        self.workers[device] = worker
+        self.total_jobs[device] = 0
+
+        with context.active_pid.get_lock():
+            context.active_pid.value = worker.pid
+
+    def promote_workers(self) -> None:
+        """
+        Hand each device over to its replacement worker, once the replacement has warmed up.
+        """
+        with self.rlock:
+            for device, (worker, context) in list(self.warming.items()):
+                if not worker.is_alive():
+                    logger.warning(
+                        "replacement worker for device %s died while warming up", device
+                    )
+                    del self.warming[device]
+                elif context.is_idle():
+                    logger.info(
+                        "replacement worker %s for device %s is warm, taking over",
+                        worker.pid,
+                        device,
+                    )
+                    del self.warming[device]
+                    self.set_device_worker(device, worker, context)
 
     def create_health_worker(self) -> None:
         self.health_worker = Interval(self.recycle_interval, health_main, args=(self,))
@@ -173,51 +243,82 @@ class DevicePoolExecutor:
         device, _progress = self.running_jobs[key]
         return self.context[device]
 
+    def get_device_load(self, device: str) -> int:
+        """
+        Count the jobs that are waiting for or running on a device.
+        """
+        pending = sum(1 for job in self.pending_jobs if job.device == device)
+        running = sum(1 for job in self.running_jobs.values() if job.device == device)
+        return pending + running
+
     def get_next_device(self, needs_device: Optional[DeviceParams] = None) -> int:
+        """
+        Pick the device with the fewest jobs. When the job needs a particular platform, only the devices on that
+        platform are used, so jobs are spread between logical devices like the CPU workers.
+        """
+        candidates = list(range(len(self.devices)))
+
         # respect overrides if possible
         if needs_device is not None:
-            for i in range(len(self.devices)):
-                if self.devices[i].device == needs_device.device:
-                    return i
+            matching = [
+                i
+                for i in candidates
+                if self.devices[i].platform == needs_device.platform
+            ]
+            if len(matching) > 0:
+                candidates = matching
 
-        jobs = Counter(range(len(self.devices)))
-        jobs.update([self.pending[d.device].qsize() for d in self.devices])
+        jobs = {i: self.get_device_load(self.devices[i].device) for i in candidates}
+        logger.trace("jobs queued by device: %s", jobs)
 
-        queued = jobs.most_common()
-        logger.trace("jobs queued by device: %s", queued)
-
-        lowest_count = queued[-1][1]
-        lowest_devices = [d[0] for d in queued if d[1] == lowest_count]
-        lowest_devices.sort()
-
-        return lowest_devices[0]
+        # the first device wins ties
+        return min(candidates, key=lambda i: jobs[i])
 
     def cancel(self, key: str) -> bool:
         """
         Cancel a job. If the job has not been started, this will cancel
         the future and never execute it. If the job has been started, it
         should be cancelled on the next progress callback.
+
+        Jobs with followers keep running until every submission has been
+        cancelled.
         """
+        with self.rlock:
+            for job in self.finished_jobs:
+                if job.job == key:
+                    logger.debug("cannot cancel finished job: %s", key)
+                    return False
+
+            followers = self.job_followers.get(key, 1)
+            if followers > 1:
+                self.job_followers[key] = followers - 1
+                logger.info(
+                    "not cancelling job %s, %s submissions are still waiting for it",
+                    key,
+                    followers - 1,
+                )
+                return True
 
-        for job in self.finished_jobs:
-            if job.job == key:
-                logger.debug("cannot cancel finished job: %s", key)
-                return False
+            self.forget_job(key)
 
-        for job in self.pending_jobs:
-            if job.name == key:
-                self.pending_jobs.remove(job)
-                logger.info("cancelled pending job: %s", key)
-                return True
+            for job in self.pending_jobs:
+                if job.name == key:
+                    self.pending_jobs.remove(job)
+                    self.release_job(key)
+                    # preempted jobs wait here with a checkpoint that will never be resumed
+                    remove_checkpoint(self.server, key)
+                    remove_preview(self.server, key)
+                    logger.info("cancelled pending job: %s", key)
+                    return True
 
-        if key not in self.running_jobs:
-            logger.debug("cancelled job is not active: %s", key)
-        else:
-            job = self.running_jobs[key]
-            logger.info("cancelling job %s, active on device %s", key, job.device)
+            if key not in self.running_jobs:
+                logger.debug("cancelled job is not active: %s", key)
+            else:
+                job = self.running_jobs[key]
+                logger.info("cancelling job %s, active on device %s", key, job.device)
 
-        self.cancelled_jobs.append(key)
-        return True
+            self.cancelled_jobs.append(key)
+            return True
 
     def done(self, key: str) -> Tuple[bool, Optional[ProgressCommand]]:
         """
@@ -287,6 +388,19 @@ class DevicePoolExecutor:
             logger.debug("stopping leaking workers")
             self.join_leaking()
 
+            logger.debug("stopping replacement and retired workers")
+            for device in list(self.warming.keys()):
+                self.stop_warming(device)
+
+            for _device, worker, _context in self.retiring:
+                worker.join(self.join_timeout)
+
+            self.join_retiring()
+
+            logger.debug("releasing shared buffers")
+            for key in list(self.shared_buffers.keys()):
+                self.release_job(key)
+
             logger.debug("worker pool stopped")
 
     def join_leaking(self):
@@ -319,12 +433,37 @@ class DevicePoolExecutor:
 
             self.leaking[:] = [dw for dw in self.leaking if dw[1].is_alive()]
 
+    def join_retiring(self):
+        """
+        Forget about replaced workers once they have finished their last job and exited.
+
+        Their progress is collected by the progress worker until then.
+        """
+        for device, worker, context in self.retiring:
+            if not worker.is_alive():
+                logger.debug(
+                    "replaced worker %s for device %s has exited", worker.pid, device
+                )
+                drain_progress(self, device, context)
+
+        self.retiring[:] = [dw for dw in self.retiring if dw[1].is_alive()]
+
+    def stop_warming(self, device: str):
+        if device in self.warming:
+            worker, _context = self.warming.pop(device)
+            logger.debug(
+                "stopping replacement worker %s for device %s", worker.pid, device
+            )
+            worker.terminate()
+
     def recycle(self, recycle_all=False):
         logger.debug("recycling worker pool")
 
         with self.rlock:
             self.join_leaking()
+            self.join_retiring()
 
+            needs_replace = []
             needs_restart = []
 
             for device, worker in self.workers.items():
@@ -332,7 +471,8 @@ class DevicePoolExecutor:
                 if not worker.is_alive():
                     logger.warning("worker for device %s has died", device)
                     needs_restart.append(device)
-                elif recycle_all or jobs > self.max_jobs_per_worker:
+                elif recycle_all:
+                    self.stop_warming(device)
                     logger.info(
                         "shutting down worker for device %s after %s jobs", device, jobs
                     )
@@ -349,6 +489,12 @@ class DevicePoolExecutor:
 
                     self.workers[device] = None
                     needs_restart.append(device)
+                elif jobs > self.max_jobs_per_worker:
+                    if device not in self.warming:
+                        logger.info(
+                            "replacing worker for device %s after %s jobs", device, jobs
+                        )
+                        needs_replace.append(device)
                 else:
                     logger.debug(
                         "worker %s for device %s has run %s jobs and is still alive",
@@ -362,7 +508,18 @@ class DevicePoolExecutor:
 
             for device in self.devices:
                 if device.device in needs_restart:
-                    self.create_device_worker(device)
+                    if device.device in self.warming:
+                        # there is nothing left to serve the device, so the replacement should take over now
+                        logger.info(
+                            "replacement worker for device %s is still warming up",
+                            device.device,
+                        )
+                        worker, context = self.warming.pop(device.device)
+                        self.set_device_worker(device.device, worker, context)
+                    else:
+                        self.create_device_worker(device)
+                elif device.device in needs_replace:
+                    self.create_device_worker(device, replace=True)
 
             if self.logger_worker.is_alive():
                 logger.debug("logger worker is running")
@@ -385,20 +542,58 @@ class DevicePoolExecutor:
         /,
         *args,
         needs_device: Optional[DeviceParams] = None,
+        digest: Optional[str] = None,
+        outputs: Optional[List[str]] = None,
+        priority: int = PRIORITY_NORMAL,
         **kwargs,
-    ) -> None:
-        device_idx = self.get_next_device(needs_device=needs_device)
-        device = self.devices[device_idx].device
-        logger.info(
-            "assigning job %s to device %s: %s",
-            key,
-            device_idx,
-            device,
-        )
+    ) -> List[str]:
+        """
+        Queue a job and return its outputs, which default to the job key.
+
+        When a job with the same digest is already pending or running, this will follow that job rather than
+        queueing another one, and return the outputs of the earlier job instead.
+
+        Jobs with a higher priority run first, and will preempt a lower priority job that is running on the same
+        device, if that job can be checkpointed.
+        """
+        with self.rlock:
+            if digest is not None and digest in self.job_digests:
+                leader = self.job_digests[digest]
+                self.job_followers[leader] += 1
+                logger.info(
+                    "job %s is a duplicate of %s, following it with %s submissions",
+                    key,
+                    leader,
+                    self.job_followers[leader],
+                )
+                return self.job_outputs[leader]
+
+            device_idx = self.get_next_device(needs_device=needs_device)
+            device = self.devices[device_idx].device
+            logger.info(
+                "assigning job %s to device %s: %s",
+                key,
+                device_idx,
+                device,
+            )
+
+            # move the images into shared memory, so they are not pickled into the queue
+            buffers = share_images([args, kwargs, getattr(fn, "stages", [])])
+            if len(buffers) > 0:
+                logger.debug("sharing %s images with job %s", len(buffers), key)
+                self.shared_buffers[key] = buffers
 
-        # build and queue job
-        job = JobCommand(key, device, fn, args, kwargs)
-        self.pending_jobs.append(job)
+            # build and queue job
+            job = JobCommand(key, device, fn, args, kwargs, priority=priority)
+            self.pending_jobs.append(job)
+
+            outputs = outputs or [key]
+            if digest is not None:
+                self.job_digests[digest] = key
+                self.job_followers[key] = 1
+                self.job_outputs[key] = outputs
+
+            return outputs
 
     def status(self) -> Dict[str, List[Tuple[str, int, bool, bool, bool, bool]]]:
         """
@@ -453,41 +648,163 @@ class DevicePoolExecutor:
         }
 
     def next_job(self, device: str):
-        for job in self.pending_jobs:
-            if job.device == device:
-                logger.debug("enqueuing job %s on device %s", job.name, device)
-                self.pending[device].put(job, block=False)
-                # job will be removed from pending queue when progress is updated
-                return
+        jobs = [job for job in self.pending_jobs if job.device == device]
+        if len(jobs) > 0:
+            # the first job wins ties, so jobs with the same priority run in order
+            job = max(jobs, key=lambda job: job.priority)
+            logger.debug("enqueuing job %s on device %s", job.name, device)
+            self.pending[device].put(job, block=False)
+            # job will be removed from pending queue when progress is updated
+            return
 
         logger.trace("no pending jobs for device %s", device)
 
+    def preempt_jobs(self):
+        """
+        Ask the jobs running on each device to stop at their next checkpoint if a higher priority job is waiting
+        for that device.
+        """
+        for name, progress in self.running_jobs.items():
+            command = self.running_commands.get(name, None)
+            context = self.context.get(progress.device, None)
+            if command is None or context is None or context.is_preempted():
+                continue
+
+            waiting = [
+                job.priority
+                for job in self.pending_jobs
+                if job.device == progress.device and job.priority > command.priority
+            ]
+            if len(waiting) > 0:
+                logger.info(
+                    "preempting job %s on device %s for a higher priority job",
+                    name,
+                    progress.device,
+                )
+                context.set_preempt()
+
+    def scatter_tiles(self, job: str, device: str, tile_path: str) -> List[str]:
+        """
+        Start helper jobs for the tiles from a job on any idle devices with the same platform as the device that is
+        running the job, and return their names.
+
+        The helpers claim tiles from the folder until there are none left, so they can start late, or not at all.
+        """
+        from ..chain.scatter import run_tile_job
+
+        source = next((d for d in self.devices if d.device == device), None)
+        if source is None:
+            logger.warning("tiles requested by unknown device: %s", device)
+            return []
+
+        command = self.running_commands.get(job, None)
+        priority = PRIORITY_NORMAL if command is None else command.priority
+
+        helpers = []
+        for helper in self.devices:
+            if helper.device == device or helper.platform != source.platform:
+                continue
+
+            if self.get_device_load(helper.device) > 0:
+                continue
+
+            name = f"{path.basename(tile_path)}-{helper.device}"
+            logger.debug("starting helper job %s on device %s", name, helper.device)
+            self.pending_jobs.append(
+                JobCommand(
+                    name,
+                    helper.device,
+                    run_tile_job,
+                    [self.server, tile_path],
+                    {},
+                    priority=priority,
+                    helper=True,
+                )
+            )
+            helpers.append(name)
+
+        logger.info("scattering tiles from job %s to %s devices", job, len(helpers))
+        return helpers
+
+    def requeue_job(self, progress: ProgressCommand):
+        """
+        Put a preempted job back at the front of the queue, so it resumes from its checkpoint before any other jobs
+        with the same priority.
+        """
+        if progress.job in self.running_jobs:
+            del self.running_jobs[progress.job]
+
+        command = self.running_commands.pop(progress.job, None)
+        if command is None or progress.job in self.cancelled_jobs:
+            logger.info("preempted job will not be resumed: %s", progress.job)
+            remove_checkpoint(self.server, progress.job)
+            progress.finished = True
+            progress.cancelled = True
+            return self.finish_job(progress)
+
+        logger.info("queueing preempted job again: %s", progress.job)
+        self.pending_jobs.insert(0, command)
+
     def finish_job(self, progress: ProgressCommand):
         # move from running to finished
         logger.info("job has finished: %s", progress.job)
-        self.finished_jobs.append(progress)
+        command = self.running_commands.pop(progress.job, None)
+        if command is not None and command.helper:
+            # no client will check on helper jobs, so they do not need to be kept
+            logger.debug("helper job has finished: %s", progress.job)
+        else:
+            self.finished_jobs.append(progress)
+
         if progress.job in self.running_jobs:
             del self.running_jobs[progress.job]
 
+        self.release_job(progress.job)
+        self.forget_job(progress.job)
+        remove_preview(self.server, progress.job)
+
         self.join_leaking()
         if progress.job in self.cancelled_jobs:
             self.cancelled_jobs.remove(progress.job)
 
-    def update_job(self, progress: ProgressCommand):
+    def update_job(
+        self, progress: ProgressCommand, context: Optional[WorkerContext] = None
+    ):
+        """
+        Record a progress update for a job.
+
+        The context defaults to the current worker for the job's device, but should be provided for updates from
+        workers that have been replaced.
+        """
         if progress.finished:
             return self.finish_job(progress)
 
+        if progress.preempted:
+            return self.requeue_job(progress)
+
+        context = context or self.context[progress.device]
+
         # move from pending to running
         logger.debug(
             "progress update for job: %s to %s", progress.job, progress.progress
         )
         self.running_jobs[progress.job] = progress
+        for job in self.pending_jobs:
+            if job.name == progress.job:
+                self.running_commands[job.name] = job
+
         self.pending_jobs[:] = [
             job for job in self.pending_jobs if job.name != progress.job
         ]
 
-        # increment job counter if this is the start of a new job
-        if progress.progress == 0:
+        # increment job counter if this is the start of a new job on the current worker, not counting helper jobs,
+        # which only run part of another job
+        command = self.running_commands.get(progress.job, None)
+        is_helper = command is not None and command.helper
+        if (
+            progress.progress == 0
+            and context is self.context[progress.device]
+            and not is_helper
+        ):
             if progress.device in self.total_jobs:
                 self.total_jobs[progress.device] += 1
             else:
@@ -506,7 +823,26 @@ class DevicePoolExecutor:
                 progress.job,
                 progress.device,
             )
-            self.context[progress.device].set_cancel()
+            context.set_cancel()
+
+    def forget_job(self, key: str):
+        """
+        Stop sending duplicate submissions to a job, once it has finished or been cancelled.
+        """
+        with self.rlock:
+            self.job_followers.pop(key, None)
+            self.job_outputs.pop(key, None)
+            for digest in [d for d, job in self.job_digests.items() if job == key]:
+                del self.job_digests[digest]
+
+    def release_job(self, key: str):
+        """
+        Release the shared memory for a job, once the worker is done with it.
+        """
+        buffers = self.shared_buffers.pop(key, [])
+        if len(buffers) > 0:
+            logger.debug("releasing %s shared buffers for job %s", len(buffers), key)
+            release_buffers(buffers)
 
     def leak_worker(self, device: str):
         context = self.context[device]
@@ -545,8 +881,26 @@ def logger_main(pool: DevicePoolExecutor, logs: "Queue[str]"):
             logger.exception("error in log worker")
 
 
+def drain_progress(pool: DevicePoolExecutor, device: str, context: WorkerContext):
+    try:
+        progress = context.progress.get_nowait()
+        while progress is not None:
+            pool.update_job(progress, context=context)
+            progress = context.progress.get_nowait()
+    except Empty:
+        logger.trace("empty queue in replaced worker for device %s", device)
+    except ValueError as e:
+        logger.debug("value error in replaced worker for device %s: %s", device, e)
+    except Exception:
+        logger.exception("error in replaced worker for device %s", device)
+
+
 def progress_main(pool: DevicePoolExecutor):
     logger.trace("checking in from progress worker thread")
+    pool.promote_workers()
+
+    for device, _worker, context in pool.retiring:
+        drain_progress(pool, device, context)
 
     for device, _worker, context in pool.leaking:
         # whether the worker is alive or not, try to clear its queues
@@ -577,6 +931,20 @@ def progress_main(pool: DevicePoolExecutor):
         except Exception:
             logger.exception("error in progress worker for device %s", device)
 
+    try:
+        job, device, tile_path = pool.tile_requests.get_nowait()
+        while job is not None:
+            pool.scatter_tiles(job, device, tile_path)
+            job, device, tile_path = pool.tile_requests.get_nowait()
+    except Empty:
+        logger.trace("no tile requests from workers")
+    except ValueError as e:
+        logger.debug("value error in tile requests: %s", e)
+    except Exception:
+        logger.exception("error scattering tiles")
+
+    pool.preempt_jobs()
+
     for device, context in pool.context.items():
         if context.is_idle():
             logger.trace("enqueueing next job for idle worker")
@@ -0,0 +1,150 @@
+from logging import getLogger
+from time import monotonic
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from ..models.meta import NetworkModel
+from ..params import DeviceParams, ImageParams
+from ..server.context import ServerContext
+from ..utils import base_join
+from .context import WorkerContext
+
+logger = getLogger(__name__)
+
+WARMUP_PROMPT = "warm up"
+WARMUP_SIZE = 64
+WARMUP_STEPS = 4
+
+# pipelines that take a source image and use its size
+IMAGE_PIPELINES = ["img2img", "img2img-sdxl", "pix2pix", "upscale"]
+
+
+class PrewarmModel:
+    """
+    A combination of model, pipeline, scheduler, and optional ControlNet that should be loaded before the worker
+    starts taking jobs.
+    """
+
+    model: str
+    pipeline: str
+    scheduler: str
+    control: Optional[str]
+
+    def __init__(
+        self,
+        model: str,
+        pipeline: str,
+        scheduler: str,
+        control: Optional[str] = None,
+    ) -> None:
+        self.model = model
+        self.pipeline = pipeline
+        self.scheduler = scheduler
+        self.control = control
+
+    def __repr__(self) -> str:
+        parts = [self.model, self.pipeline, self.scheduler]
+        if self.control is not None:
+            parts.append(self.control)
+
+        return ":".join(parts)
+
+    def get_params(self, server: ServerContext) -> ImageParams:
+        control = None
+        if self.control is not None:
+            control = NetworkModel(self.control, "control")
+
+        return ImageParams(
+            base_join(server.model_path, self.model),
+            self.pipeline,
+            self.scheduler,
+            WARMUP_PROMPT,
+            cfg=1.0,
+            steps=WARMUP_STEPS,
+            seed=0,
+            control=control,
+        )
+
+    @classmethod
+    def parse(cls, entry: str) -> "PrewarmModel":
+        """
+        Parse an entry in the form of `model:pipeline:scheduler` or `model:pipeline:scheduler:control`.
+        """
+        parts = [part.strip() for part in entry.split(":")]
+        if len(parts) not in [3, 4] or any(len(part) == 0 for part in parts):
+            raise ValueError(
+                f"prewarm entry must be model:pipeline:scheduler[:control]: {entry}"
+            )
+
+        return PrewarmModel(*parts)
+
+
+def get_warmup_args(pipeline: str) -> Dict[str, Any]:
+    """
+    Get the arguments for a tiny inference, which initializes the ONNX sessions without spending much time on
+    the images themselves.
+    """
+    image = Image.new("RGB", (WARMUP_SIZE, WARMUP_SIZE))
+    args = {
+        "num_inference_steps": WARMUP_STEPS,
+    }
+
+    if pipeline in IMAGE_PIPELINES:
+        args["image"] = image
+        return args
+
+    args["height"] = WARMUP_SIZE
+    args["width"] = WARMUP_SIZE
+
+    if pipeline == "controlnet":
+        args["image"] = image
+    elif pipeline == "inpaint":
+        args["image"] = image
+        args["mask_image"] = Image.new("RGB", (WARMUP_SIZE, WARMUP_SIZE), "white")
+
+    return args
+
+
+def warmup_pipeline(
+    server: ServerContext, device: DeviceParams, model: PrewarmModel
+) -> None:
+    from ..diffusers.load import load_pipeline
+
+    params = model.get_params(server)
+    pipe = load_pipeline(server, params, model.pipeline, device)
+    pipe(WARMUP_PROMPT, **get_warmup_args(model.pipeline))
+
+
+def prewarm_worker(worker: WorkerContext, server: ServerContext) -> None:
+    """
+    Load the hot set of pipelines into the worker's model cache and run each of them once.
+
+    Errors are logged and skipped, since a missing model should not keep the worker from starting.
+    """
+    device = worker.get_device()
+
+    if len(server.prewarm) > server.cache_limit:
+        logger.warning(
+            "prewarming %s pipelines, but only %s models can be cached",
+            len(server.prewarm),
+            server.cache_limit,
+        )
+
+    for entry in server.prewarm:
+        try:
+            model = PrewarmModel.parse(entry)
+        except ValueError as e:
+            logger.warning("skipping invalid prewarm entry: %s", e)
+            continue
+
+        logger.info("prewarming pipeline %s on device %s", model, device.device)
+        start = monotonic()
+
+        try:
+            warmup_pipeline(server, device, model)
+            logger.info(
+                "prewarmed pipeline %s in %.2f seconds", model, monotonic() - start
+            )
+        except Exception:
+            logger.exception("error prewarming pipeline %s", model)
@@ -0,0 +1,91 @@
+from logging import getLogger
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..params import DeviceParams
+from ..server import ServerContext
+from .broker import JOB_FINISHED, JOB_PENDING, JOB_RUNNING, JobBroker
+from .command import PRIORITY_NORMAL, JobCommand, ProgressCommand
+
+logger = getLogger(__name__)
+
+
+class RemotePoolExecutor:
+    """
+    Queue jobs on a broker for the worker agents, rather than running them in local worker processes.
+
+    This has the same methods as the DevicePoolExecutor, so the API can use either one. The progress of each job is
+    kept in the broker, so any server using the same broker can report on it.
+    """
+
+    server: ServerContext
+    devices: List[DeviceParams]
+    broker: JobBroker
+
+    def __init__(
+        self,
+        server: ServerContext,
+        devices: List[DeviceParams],
+        broker: JobBroker,
+    ):
+        self.server = server
+        self.devices = devices
+        self.broker = broker
+
+    def start(self) -> None:
+        logger.info(
+            "queueing jobs on broker, start workers with: python -m onnx_web.worker"
+        )
+
+    def join(self) -> None:
+        logger.debug("jobs are run by the remote workers, nothing to stop")
+
+    def recycle(self, recycle_all=False) -> None:
+        logger.info("remote workers are recycled by their agents")
+
+    def submit(
+        self,
+        key: str,
+        fn: Callable[..., None],
+        /,
+        *args,
+        needs_device: Optional[DeviceParams] = None,
+        digest: Optional[str] = None,
+        outputs: Optional[List[str]] = None,
+        priority: int = PRIORITY_NORMAL,
+        **kwargs,
+    ) -> List[str]:
+        # the device is chosen by the worker that claims the job
+        platform = None if needs_device is None else needs_device.platform
+        job = JobCommand(key, platform or "any", fn, args, kwargs, priority=priority)
+
+        logger.info("publishing job %s for platform %s", key, platform)
+        return self.broker.publish(
+            job, platform=platform, digest=digest, outputs=outputs
+        )
+
+    def cancel(self, key: str) -> bool:
+        return self.broker.cancel(key)
+
+    def done(self, key: str) -> Tuple[bool, Optional[ProgressCommand]]:
+        return self.broker.status(key)
+
+    def status(self) -> Dict[str, List[Tuple[str, int, bool, bool, bool, bool]]]:
+        """
+        Returns a tuple of: job/device, progress, progress, finished, cancelled, failed
+        """
+        jobs = self.broker.list_jobs()
+        return {
+            "cancelled": [],
+            "finished": [
+                (job.job, job.progress, False, True, job.cancelled, job.failed)
+                for job in jobs[JOB_FINISHED]
+            ],
+            "pending": [
+                (job.job, 0, True, False, False, False) for job in jobs[JOB_PENDING]
+            ],
+            "running": [
+                (job.job, job.progress, False, False, job.cancelled, job.failed)
+                for job in jobs[JOB_RUNNING]
+            ],
+            "total": [],
+        }
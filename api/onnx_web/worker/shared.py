@@ -0,0 +1,120 @@
+from logging import getLogger
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..image.encoded import find_images
+
+logger = getLogger(__name__)
+
+# payloads smaller than this are cheaper to pickle than to share
+MIN_SHARED_SIZE = 2**16  # 64kB
+
+
+class SharedBuffer:
+    """
+    A NumPy array in shared memory, which is passed to other processes by name, rather than pickling the contents.
+
+    The process that creates the buffer owns it and must release it once the other processes are done with it. Other
+    processes can map the buffer as often as they need, but should not keep the array after closing it.
+    """
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+    memory: Optional[SharedMemory]
+
+    def __init__(self, name: str, shape: Tuple[int, ...], dtype: str) -> None:
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.memory = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the handle belongs to the process that opened it
+        return {
+            "name": self.name,
+            "shape": self.shape,
+            "dtype": self.dtype,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["name"], state["shape"], state["dtype"])
+
+    def __repr__(self) -> str:
+        return f"SharedBuffer({self.name}, {self.shape}, {self.dtype})"
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape, dtype=np.int64)) * np.dtype(self.dtype).itemsize
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> "SharedBuffer":
+        """
+        Copy an array into a new shared buffer, which is owned by the calling process.
+        """
+        memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+        buffer = SharedBuffer(memory.name, array.shape, array.dtype.str)
+        buffer.memory = memory
+
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+        view[...] = array
+        del view
+
+        logger.trace("created shared buffer %s", buffer)
+        return buffer
+
+    def map(self) -> np.ndarray:
+        """
+        Map the buffer as an array, without copying it. The array is only valid until the buffer is closed.
+        """
+        if self.memory is None:
+            self.memory = SharedMemory(name=self.name)
+
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+
+    def read(self) -> np.ndarray:
+        """
+        Copy the contents of the buffer into a new array and close it.
+        """
+        try:
+            return self.map().copy()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.memory is not None:
+            self.memory.close()
+            self.memory = None
+
+    def release(self) -> None:
+        """
+        Close and remove the buffer. This should only be called by the process that created it.
+        """
+        try:
+            memory = self.memory or SharedMemory(name=self.name)
+        except FileNotFoundError:
+            logger.debug("shared buffer has already been removed: %s", self.name)
+            return
+
+        self.memory = None
+        memory.close()
+        memory.unlink()
+
+
+def share_images(value: Any) -> List[SharedBuffer]:
+    """
+    Move the contents of any encoded images in a job argument into shared memory, including lists, tuples, and dicts
+    of them. The images are changed in place, and the new buffers are returned so they can be released later.
+    """
+    buffers = [image.share(min_size=MIN_SHARED_SIZE) for image in find_images(value)]
+    return [buffer for buffer in buffers if buffer is not None]
+
+
+def release_buffers(buffers: List[SharedBuffer]) -> None:
+    for buffer in buffers:
+        try:
+            buffer.release()
+        except Exception:
+            logger.exception("error releasing shared buffer %s", buffer)
@@ -1,15 +1,26 @@
+from concurrent.futures import Future
 from logging import getLogger
 from os import getpid
 from queue import Empty
 from sys import exit
+from time import sleep
+from typing import List
 
 from setproctitle import setproctitle
 
-from ..errors import RetryException
+from ..errors import PreemptedException, RetryException
+from ..image.encoded import decode_images
+from ..output import drain_output_writes, when_written
+from ..params import DeviceParams
 from ..server import ServerContext, apply_patches
-from ..torch_before_ort import get_available_providers
 from .context import WorkerContext
 
+try:
+    from os import sched_setaffinity
+except ImportError:
+    # only available on some platforms, like Linux
+    sched_setaffinity = None
+
 logger = getLogger(__name__)
 
 EXIT_ERROR = 1
@@ -27,9 +38,63 @@ MEMORY_ERRORS = [
 ]
 
 
+def finish_job(worker: WorkerContext, job: str, writes: List[Future]) -> None:
+    if len(writes) == 0:
+        logger.info("job succeeded: %s", job)
+        worker.finish()
+        return
+
+    logger.debug("waiting for %s output files from job %s", len(writes), job)
+    progress = worker.get_progress()
+    cancelled = worker.is_cancelled()
+
+    def on_written(failed: bool):
+        if failed:
+            logger.error("error writing outputs for job: %s", job)
+            worker.fail(job=job, progress=progress, cancelled=cancelled)
+        else:
+            logger.info("job succeeded: %s", job)
+            worker.finish(job=job, progress=progress, cancelled=cancelled)
+
+    when_written(writes, on_written)
+
+
+def pin_worker(device: DeviceParams) -> None:
+    """
+    Pin the worker process to the cores for its device and limit the Torch threads to match.
+
+    The ONNX sessions get their thread counts from the session options, but Torch and the thread pools that ONNX
+    starts will use any core the process is allowed to use.
+    """
+    if device.affinity is not None:
+        if sched_setaffinity is not None:
+            logger.debug("pinning worker %s to cores %s", getpid(), device.affinity)
+            sched_setaffinity(0, device.affinity)
+        else:
+            logger.warning("CPU affinity is not supported on this platform")
+
+    if device.threads > 0:
+        import torch
+
+        torch.set_num_threads(device.threads)
+
+
 def worker_main(worker: WorkerContext, server: ServerContext):
-    apply_patches(server)
     setproctitle("onnx-web worker: %s" % (worker.device.device))
+    pin_worker(worker.device)
+
+    # the server does not load the pipelines, so the patches and progress settings only apply to the workers,
+    # and the job modules are imported by the first job that needs them
+    from ..torch_before_ort import get_available_providers
+
+    apply_patches(server)
+
+    if not server.show_progress:
+        from diffusers.utils.logging import disable_progress_bar
+        from huggingface_hub.utils.tqdm import disable_progress_bars
+
+        disable_progress_bar()
+        disable_progress_bars()
 
     logger.trace(
         "checking in from worker with providers: %s", get_available_providers()
@@ -38,6 +103,19 @@ def worker_main(worker: WorkerContext, server: ServerContext):
     # make leaking workers easier to recycle
     worker.progress.cancel_join_thread()
 
+    if len(server.prewarm) > 0:
+        from .prewarm import prewarm_worker
+
+        prewarm_worker(worker, server)
+
+    # report that the worker is warm, then wait for the pool to retire the previous worker for this device
+    worker.set_idle()
+    while not worker.is_active():
+        logger.trace(
+            "worker %s is waiting to replace %s", getpid(), worker.get_active()
+        )
+        sleep(worker.timeout)
+
     while True:
         try:
             if not worker.is_active():
@@ -58,14 +136,22 @@ def worker_main(worker: WorkerContext, server: ServerContext):
 
             # reset progress, which does a final check for cancellation
             worker.set_progress(0)
-            job.fn(worker, *job.args, **job.kwargs)
 
-            # confirm completion of the job
-            logger.info("job succeeded: %s", job.name)
-            worker.finish()
+            # outputs left over from a failed job should not hold up this one
+            drain_output_writes()
+            # uploaded images are decoded here, rather than in the server
+            args = [decode_images(arg) for arg in job.args]
+            job.fn(worker, *args, **decode_images(job.kwargs))
+
+            # confirm completion of the job once its outputs have been written
+            finish_job(worker, job.name, drain_output_writes())
         except Empty:
             logger.trace("worker reached end of queue, setting idle flag")
             worker.set_idle()
+        except PreemptedException:
+            # the job has saved a checkpoint and will be queued again
+            logger.info("job was preempted: %s", worker.job)
+            worker.preempted()
         except KeyboardInterrupt:
             logger.debug("worker got keyboard interrupt")
             worker.fail()
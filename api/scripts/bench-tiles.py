@@ -0,0 +1,81 @@
+from argparse import ArgumentParser
+from time import monotonic, sleep
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+from onnx_web.chain.tile import process_tile_grid, process_tile_spiral
+
+
+def make_source(width: int, height: int, seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    return Image.fromarray(pixels)
+
+
+def fill_noise(source, dims, origin, fill=None):
+    # the default noise source is random, which would make the outputs different between runs
+    return Image.new(source.mode, dims, "black")
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(
+        description="Compare the time taken to tile an image with and without the tile pipeline."
+    )
+    parser.add_argument("--height", type=int, default=2048)
+    parser.add_argument("--width", type=int, default=2048)
+    parser.add_argument("--tile", type=int, default=512)
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--overlap", type=float, default=0.25)
+    parser.add_argument("--order", choices=["grid", "spiral"], default="spiral")
+    parser.add_argument(
+        "--inference",
+        type=float,
+        default=0.5,
+        help="seconds to wait in each tile, in place of running a model",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(args)
+
+    source = make_source(args.width, args.height, args.seed)
+    tile_size = args.tile * args.scale
+
+    def tile_filter(tile_image, tile_mask, dims):
+        # sessions release the GIL while they run, like sleep does
+        sleep(args.inference)
+        return tile_image.resize((tile_size, tile_size), Image.Resampling.NEAREST)
+
+    process = process_tile_grid if args.order == "grid" else process_tile_spiral
+
+    results = {}
+    for pipeline in [False, True]:
+        times = []
+        for _ in range(args.repeat):
+            start = monotonic()
+            output = process(
+                source,
+                args.tile,
+                args.scale,
+                [tile_filter],
+                overlap=args.overlap,
+                noise_source=fill_noise,
+                tile_pipeline=pipeline,
+            )
+            times.append(monotonic() - start)
+
+        results[pipeline] = (min(times), np.array(output))
+
+    sequential, sequential_output = results[False]
+    pipelined, pipelined_output = results[True]
+
+    print("mode\ttime (s)")
+    print("sequential\t%.3f" % sequential)
+    print("pipelined\t%.3f" % pipelined)
+    print("speedup\t%.3f" % (sequential / pipelined))
+    print("same output\t%s" % np.array_equal(sequential_output, pipelined_output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from argparse import ArgumentParser
+from statistics import median
+from subprocess import run
+from sys import executable, exit
+from time import monotonic
+from typing import List, Tuple
+
+# modules that the server process should not need, since only the workers run pipelines
+HEAVY_MODULES = [
+    "basicsr",
+    "controlnet_aux",
+    "cv2",
+    "diffusers",
+    "mediapipe",
+    "onnx",
+    "optimum",
+    "torch",
+    "transformers",
+]
+
+CHECK_MODULES = "import sys; print(','.join(m for m in {modules} if m in sys.modules))"
+
+
+def time_import(module: str) -> Tuple[float, List[str]]:
+    """
+    Import a module in a new interpreter and return the time taken, along with the heavy modules it loaded.
+    """
+    code = f"import {module}; " + CHECK_MODULES.format(modules=HEAVY_MODULES)
+
+    start = monotonic()
+    result = run([executable, "-c", code], capture_output=True, check=True, text=True)
+    duration = monotonic() - start
+
+    loaded = [name for name in result.stdout.strip().split(",") if len(name) > 0]
+    return (duration, loaded)
+
+
+def profile_import(module: str, limit: int) -> List[Tuple[int, str]]:
+    """
+    Get the slowest imports, by cumulative time, using the interpreter's import timing.
+    """
+    result = run(
+        [executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _self, cumulative, name = line[len("import time:") :].split("|")
+        times.append((int(cumulative), name.strip()))
+
+    return sorted(times, reverse=True)[:limit]
+
+
+def main() -> int:
+    parser = ArgumentParser(description="check how long the server takes to import")
+    parser.add_argument("--module", default="onnx_web.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-time", type=float, default=None)
+    parser.add_argument("--profile", type=int, default=0)
+    args = parser.parse_args()
+
+    durations = []
+    loaded = set()
+    for _ in range(args.runs):
+        duration, modules = time_import(args.module)
+        durations.append(duration)
+        loaded.update(modules)
+
+    startup = median(durations)
+    print(f"importing {args.module} took {startup:.3f}s (median of {args.runs} runs)")
+
+    for cumulative, name in profile_import(args.module, args.profile):
+        print(f"  {cumulative / 1e6:.3f}s {name}")
+
+    failed = False
+    if len(loaded) > 0:
+        print(
+            f"server loaded modules that should be left to the workers: {sorted(loaded)}"
+        )
+        failed = True
+
+    if args.max_time is not None and startup > args.max_time:
+        print(f"startup time is over the limit of {args.max_time:.3f}s")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
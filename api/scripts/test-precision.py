@@ -0,0 +1,125 @@
+from argparse import ArgumentParser
+from os import path
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from onnx_web.constants import ONNX_MODEL
+from onnx_web.params import DeviceParams
+from onnx_web.server.context import ServerContext
+from onnx_web.server.precision import PRECISION_POLICIES, get_input_types
+from onnx_web.server.session_cache import load_session
+
+LATENT_CHANNELS = 4
+LATENT_FACTOR = 8
+VAE_SCALE = 0.18215
+
+
+def run_policy(
+    server: ServerContext,
+    device: DeviceParams,
+    model: str,
+    steps: int,
+    size: int,
+    seed: int,
+) -> Dict[str, Any]:
+    """
+    Run the UNet and VAE decoder with fixed inputs and return the time taken and decoded image.
+
+    The latents are stepped with a simple fixed scale rather than a scheduler, since only the difference between
+    policies matters here.
+    """
+    unet = load_session(server, device, path.join(model, "unet", ONNX_MODEL), "unet")
+    vae = load_session(
+        server, device, path.join(model, "vae_decoder", ONNX_MODEL), "vae"
+    )
+
+    unet_types = get_input_types(unet)
+    vae_types = get_input_types(vae)
+    hidden_size = next(
+        input.shape[2]
+        for input in unet.get_inputs()
+        if input.name == "encoder_hidden_states"
+    )
+    if not isinstance(hidden_size, int):
+        hidden_size = 768
+
+    rng = np.random.default_rng(seed)
+    latent_size = size // LATENT_FACTOR
+    sample = rng.standard_normal((1, LATENT_CHANNELS, latent_size, latent_size))
+    sample = sample.astype(unet_types["sample"])
+    hidden_states = rng.standard_normal((1, 77, hidden_size))
+    hidden_states = hidden_states.astype(unet_types["encoder_hidden_states"])
+
+    start = monotonic()
+    for step in range(steps):
+        timestep = np.array(
+            [1000 - (step * 1000 // steps)], dtype=unet_types["timestep"]
+        )
+        noise = unet.run(
+            None,
+            {
+                "sample": sample,
+                "timestep": timestep,
+                "encoder_hidden_states": hidden_states,
+            },
+        )[0]
+        sample = sample - (noise.astype(sample.dtype) / steps)
+
+    unet_time = monotonic() - start
+
+    start = monotonic()
+    latents = (sample / VAE_SCALE).astype(vae_types["latent_sample"])
+    image = vae.run(None, {"latent_sample": latents})[0]
+    vae_time = monotonic() - start
+
+    return {
+        "image": np.clip(image.astype(np.float32) / 2 + 0.5, 0, 1),
+        "unet": unet_time,
+        "vae": vae_time,
+    }
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(
+        description="Compare the speed and output of each precision policy for a diffusion model."
+    )
+    parser.add_argument("model", help="path to a converted diffusion model")
+    parser.add_argument("--cache", default="../models/.cache")
+    parser.add_argument("--device", default="0")
+    parser.add_argument("--provider", default="CUDAExecutionProvider")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--steps", type=int, default=10)
+    args = parser.parse_args(args)
+
+    results = {}
+    for policy in ["fp32", *[p for p in PRECISION_POLICIES.keys() if p != "fp32"]]:
+        optimizations = [f"onnx-precision-{policy}"]
+        server = ServerContext(cache_path=args.cache, optimizations=optimizations)
+        device = DeviceParams(
+            args.device,
+            args.provider,
+            {"device_id": int(args.device)} if args.device.isnumeric() else None,
+            optimizations=optimizations,
+        )
+
+        # run once to convert the models and warm up the sessions
+        run_policy(server, device, args.model, 1, args.size, args.seed)
+        results[policy] = run_policy(
+            server, device, args.model, args.steps, args.size, args.seed
+        )
+
+    reference = results["fp32"]["image"]
+    print("policy\tunet (s/step)\tvae (s)\tmse vs fp32")
+    for policy, result in results.items():
+        mse = float(np.mean((result["image"] - reference) ** 2))
+        print(
+            "%s\t%.4f\t%.4f\t%.8f"
+            % (policy, result["unet"] / args.steps, result["vae"], mse)
+        )
+
+
+if __name__ == "__main__":
+    main()
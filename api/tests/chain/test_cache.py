@@ -0,0 +1,157 @@
+import unittest
+from os import listdir, path
+from tempfile import TemporaryDirectory
+
+from PIL import Image
+
+from onnx_web.chain.base import ChainPipeline
+from onnx_web.chain.cache import (
+    STAGE_CACHE_PATH,
+    evict_stage_results,
+    get_cache_value,
+    make_stage_digests,
+    save_stage_result,
+)
+from onnx_web.chain.persist_disk import PersistDiskStage
+from onnx_web.chain.result import StageResult
+from onnx_web.chain.stage import BaseStage
+from onnx_web.params import DeviceParams, ImageParams, StageParams
+from onnx_web.server.context import ServerContext
+
+
+class TestWorker:
+    job = "test"
+    retries = 3
+
+    def __init__(self) -> None:
+        self.checkpoint_owner = None
+
+    def get_device(self):
+        return DeviceParams("cpu", "CPUExecutionProvider")
+
+    def is_preempted(self):
+        return False
+
+
+class CountStage(BaseStage):
+    def __init__(self) -> None:
+        self.runs = 0
+
+    def run(self, _worker, _server, _stage, _params, sources, **kwargs):
+        self.runs += 1
+        return sources
+
+
+def make_params(seed: int = 1) -> ImageParams:
+    return ImageParams("test", "txt2img", "ddim", "test", 1.0, 1, seed)
+
+
+class TestCacheValue(unittest.TestCase):
+    def test_image_contents(self):
+        red = get_cache_value(Image.new("RGB", (8, 8), (255, 0, 0)))
+        blue = get_cache_value(Image.new("RGB", (8, 8), (0, 0, 255)))
+        self.assertNotEqual(red, blue)
+        self.assertEqual(red, get_cache_value(Image.new("RGB", (8, 8), (255, 0, 0))))
+
+    def test_functions(self):
+        self.assertEqual(get_cache_value(make_params), f"{__name__}.make_params")
+
+
+class TestStageDigests(unittest.TestCase):
+    def test_upstream_changes(self):
+        server = ServerContext()
+        sources = StageResult.from_images([None])
+        stages = [
+            (CountStage(), StageParams(), {"strength": 0.5}),
+            (CountStage(), StageParams(), {}),
+        ]
+
+        first = make_stage_digests(server, make_params(), sources, stages, {})
+        self.assertEqual(len(first), 2)
+        self.assertNotEqual(first[0], first[1])
+
+        # changing an earlier stage changes every stage after it
+        stages[0] = (CountStage(), StageParams(), {"strength": 0.6})
+        second = make_stage_digests(server, make_params(), sources, stages, {})
+        self.assertNotEqual(first[0], second[0])
+        self.assertNotEqual(first[1], second[1])
+
+        # the output name does not change the images
+        third = make_stage_digests(
+            server, make_params(seed=2), sources, stages, {"output": "test.png"}
+        )
+        fourth = make_stage_digests(
+            server, make_params(seed=2), sources, stages, {"output": "other.png"}
+        )
+        self.assertNotEqual(second, third)
+        self.assertEqual(third, fourth)
+
+    def test_uncacheable_stage(self):
+        stages = [
+            (CountStage(), StageParams(), {}),
+            (PersistDiskStage(), StageParams(), {}),
+            (CountStage(), StageParams(), {}),
+        ]
+        digests = make_stage_digests(
+            ServerContext(), make_params(), StageResult.from_images([None]), stages, {}
+        )
+        self.assertEqual(len(digests), 1)
+
+
+class TestStageCache(unittest.TestCase):
+    def test_resume_chain(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(cache_path=temp, stage_cache_limit=10)
+            first = CountStage()
+            second = CountStage()
+            pipeline = ChainPipeline(
+                [
+                    (first, StageParams(tile_size=64), None),
+                    (second, StageParams(tile_size=64), {"strength": 0.5}),
+                ]
+            )
+
+            source = Image.new("RGB", (16, 16), (255, 0, 0))
+            pipeline(TestWorker(), server, make_params(), [source])
+            self.assertEqual((first.runs, second.runs), (1, 1))
+
+            # repeating the chain uses the last stage
+            outputs = pipeline(TestWorker(), server, make_params(), [source])
+            self.assertEqual((first.runs, second.runs), (1, 1))
+            self.assertEqual(outputs[0].getpixel((0, 0)), (255, 0, 0))
+
+            # changing the last stage uses the first stage
+            pipeline.stages[1] = (second, StageParams(tile_size=64), {"strength": 0.6})
+            pipeline(TestWorker(), server, make_params(), [source])
+            self.assertEqual((first.runs, second.runs), (1, 2))
+
+    def test_cache_error(self):
+        with TemporaryDirectory() as temp:
+            # a file where the cache folder should be makes every write fail
+            with open(path.join(temp, STAGE_CACHE_PATH), "w") as f:
+                f.write("not a folder")
+
+            server = ServerContext(cache_path=temp, stage_cache_limit=10)
+            stage = CountStage()
+            pipeline = ChainPipeline([(stage, StageParams(tile_size=64), None)])
+
+            source = Image.new("RGB", (16, 16), (255, 0, 0))
+            outputs = pipeline(TestWorker(), server, make_params(), [source])
+            self.assertEqual(stage.runs, 1)
+            self.assertEqual(outputs[0].getpixel((0, 0)), (255, 0, 0))
+
+    def test_evict_oldest(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(cache_path=temp, stage_cache_limit=1)
+            image = Image.new("RGB", (256, 256))
+            for i in range(8):
+                save_stage_result(server, f"digest-{i}", [image])
+
+            cached = listdir(path.join(temp, STAGE_CACHE_PATH))
+            self.assertLess(len(cached), 8)
+            self.assertIn("digest-7.pkl", cached)
+            self.assertNotIn("digest-0.pkl", cached)
+
+            server.stage_cache_limit = 0
+            evict_stage_results(server)
+            self.assertEqual(listdir(path.join(temp, STAGE_CACHE_PATH)), [])
@@ -0,0 +1,55 @@
+import unittest
+
+from onnx_web.chain.blend_linear import BlendLinearStage
+from onnx_web.chain.plan import plan_chain
+from onnx_web.chain.upscale_simple import UpscaleSimpleStage
+from onnx_web.params import ImageParams, Size, StageParams, UpscaleParams
+
+
+def make_params() -> ImageParams:
+    return ImageParams("test", "txt2img", "ddim", "test", 1.0, 1, 1)
+
+
+def make_resize(scale: int, method: str = "bilinear"):
+    return (
+        UpscaleSimpleStage(),
+        StageParams(),
+        {"method": method, "upscale": UpscaleParams("test", scale=scale)},
+    )
+
+
+class TestPlanChain(unittest.TestCase):
+    def test_drop_noop(self):
+        plan = plan_chain([make_resize(1), make_resize(2)], make_params())
+        self.assertEqual(len(plan.stages), 1)
+        self.assertEqual(plan.stages[0][2]["upscale"].scale, 2)
+
+    def test_drop_repeated(self):
+        blend = (BlendLinearStage(), StageParams(), {"alpha": 0.5})
+        plan = plan_chain([blend, blend, make_resize(2), blend], make_params())
+        self.assertEqual(len(plan.stages), 3)
+
+    def test_merge_resize(self):
+        plan = plan_chain([make_resize(2), make_resize(2)], make_params())
+        self.assertEqual(len(plan.stages), 1)
+        self.assertEqual(plan.stages[0][2]["upscale"].scale, 4)
+
+        # different methods do not give the same images
+        plan = plan_chain(
+            [make_resize(2), make_resize(2, method="lanczos")], make_params()
+        )
+        self.assertEqual(len(plan.stages), 2)
+
+    def test_stage_types(self):
+        plan = plan_chain([("blend-linear", StageParams(), {})], make_params())
+        self.assertIsInstance(plan.stages[0][0], BlendLinearStage)
+
+    def test_explain(self):
+        plan = plan_chain(
+            [make_resize(1), make_resize(2), make_resize(2)], make_params()
+        )
+        explain = plan.explain(Size(256, 256)).splitlines()
+        self.assertEqual(
+            explain[0], "0: UpscaleSimpleStage, 256x256 -> 1024x1024, not tiled"
+        )
+        self.assertEqual(len(explain), 3)
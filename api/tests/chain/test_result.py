@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from onnx_web.chain.base import ChainPipeline
+from onnx_web.chain.result import (
+    FORMAT_HWC_RGB,
+    FORMAT_NCHW_BGR,
+    StageResult,
+    convert_array,
+)
+from onnx_web.chain.stage import BaseStage
+from onnx_web.params import DeviceParams, ImageParams, StageParams
+from onnx_web.server.context import ServerContext
+
+
+class TestWorker:
+    checkpoint_owner = None
+    job = "test"
+    retries = 3
+
+    def get_device(self):
+        return DeviceParams("cpu", "CPUExecutionProvider")
+
+    def is_preempted(self):
+        return False
+
+
+class InvertStage(BaseStage):
+    input_format = FORMAT_NCHW_BGR
+    output_format = FORMAT_NCHW_BGR
+
+    def __init__(self) -> None:
+        self.inputs = []
+
+    def run(self, _worker, _server, _stage, _params, sources, **kwargs):
+        self.inputs.extend(sources)
+        return [1.0 - source for source in sources]
+
+
+class TestConvertArray(unittest.TestCase):
+    def test_round_trip(self):
+        array = np.random.default_rng(0).integers(0, 255, (4, 6, 3), dtype=np.uint8)
+
+        converted = convert_array(array, FORMAT_HWC_RGB, FORMAT_NCHW_BGR)
+        self.assertEqual(converted.shape, (1, 3, 4, 6))
+        self.assertEqual(converted.dtype, np.float32)
+        self.assertAlmostEqual(converted[0, 0, 1, 2], array[1, 2, 2] / 255.0, places=6)
+
+        restored = convert_array(converted, FORMAT_NCHW_BGR, FORMAT_HWC_RGB)
+        self.assertTrue(np.array_equal(restored, array))
+
+    def test_clip(self):
+        array = np.full((1, 3, 2, 2), 1.5, dtype=np.float32)
+        converted = convert_array(array, FORMAT_NCHW_BGR, FORMAT_HWC_RGB)
+        self.assertTrue(np.all(converted == 255))
+
+
+class TestStageResult(unittest.TestCase):
+    def test_lazy_conversion(self):
+        image = Image.new("RGB", (8, 4), (255, 0, 0))
+        result = StageResult.from_images([image, None])
+
+        arrays = result.as_arrays(FORMAT_NCHW_BGR)
+        self.assertEqual(arrays[0].shape, (1, 3, 4, 8))
+        self.assertIsNone(arrays[1])
+        self.assertIs(result.as_arrays(FORMAT_NCHW_BGR), arrays)
+        self.assertIs(result.as_images()[0], image)
+        self.assertEqual(result.count(None), 1)
+
+    def test_sizes(self):
+        array = np.zeros((1, 3, 4, 8), dtype=np.float32)
+        result = StageResult.from_arrays([array], FORMAT_NCHW_BGR)
+
+        size = result.sizes()[0]
+        self.assertEqual((size.width, size.height), (8, 4))
+        self.assertEqual(result.as_images()[0].size, (8, 4))
+
+
+class TestChainResults(unittest.TestCase):
+    def test_array_stages(self):
+        first = InvertStage()
+        second = InvertStage()
+        pipeline = ChainPipeline(
+            [
+                (first, StageParams(tile_size=64), None),
+                (second, StageParams(tile_size=64), None),
+            ]
+        )
+
+        source = Image.new("RGB", (16, 16), (255, 0, 0))
+        params = ImageParams("test", "txt2img", "ddim", "test", 1.0, 1, 1)
+        outputs = pipeline(TestWorker(), ServerContext(), params, [source])
+
+        # the second stage gets the arrays from the first stage, without going through PIL
+        self.assertTrue(np.allclose(second.inputs[0], 1.0 - first.inputs[0]))
+        self.assertEqual(outputs[0].getpixel((0, 0)), (255, 0, 0))
@@ -0,0 +1,131 @@
+import unittest
+from os import listdir, makedirs, path
+from tempfile import TemporaryDirectory
+
+from PIL import Image, ImageOps
+
+from onnx_web.chain.scatter import (
+    ScatterTileRunner,
+    claim_band,
+    get_tile_bands,
+    release_band,
+    run_tile_job,
+)
+from onnx_web.chain.stage import BaseStage
+from onnx_web.params import DeviceParams, ImageParams, StageParams
+from onnx_web.server.context import ServerContext
+
+
+class InvertStage(BaseStage):
+    tile_locality = "tile"
+
+    def run(self, _worker, _server, _stage, _params, sources, **kwargs):
+        return [ImageOps.invert(image) for image in sources]
+
+
+class TestWorker:
+    job = "test"
+    tile_requests = []
+
+    def __init__(self, server: ServerContext, helper: bool = True) -> None:
+        self.device = DeviceParams("cpu", "CPUExecutionProvider")
+        self.server = server
+        self.helper = helper
+        self.progress = 0
+
+    def is_cancelled(self):
+        return False
+
+    def set_progress(self, progress: int):
+        self.progress = progress
+
+    def request_tiles(self, tile_path: str):
+        # run the helper job before this device claims any tiles, so it finishes all of them
+        if self.helper:
+            run_tile_job(self, self.server, tile_path)
+
+
+def make_params() -> ImageParams:
+    return ImageParams("test", "txt2img", "ddim", "test", 1.0, 1, 1)
+
+
+def invert_filter(tile_image, tile_mask, dims):
+    return ImageOps.invert(tile_image)
+
+
+def make_tiles(count: int):
+    return [
+        (i * 8, 0, Image.new("RGB", (8, 8), (i * 10, 0, 0)), None) for i in range(count)
+    ]
+
+
+class TestTileBands(unittest.TestCase):
+    def test_band_size(self):
+        self.assertEqual(get_tile_bands(3, "tile"), [[0], [1], [2]])
+        self.assertEqual(get_tile_bands(5, "band"), [[0, 1, 2], [3, 4]])
+
+    def test_claim(self):
+        with TemporaryDirectory() as temp:
+            self.assertTrue(claim_band(temp, 0))
+            self.assertFalse(claim_band(temp, 0))
+            release_band(temp, 0)
+            self.assertTrue(claim_band(temp, 0))
+
+
+class TestScatterTileRunner(unittest.TestCase):
+    def test_helper_tiles(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(cache_path=temp, scatter_tiles=2)
+            worker = TestWorker(server)
+            runner = ScatterTileRunner(
+                worker, server, InvertStage(), StageParams(), make_params(), {}
+            )
+
+            tiles = make_tiles(4)
+            outputs = runner(tiles, [invert_filter], 8)
+            self.assertEqual(
+                [output.getpixel((0, 0)) for output in outputs],
+                [(255 - i * 10, 255, 255) for i in range(4)],
+            )
+            self.assertEqual(worker.progress, 4)
+
+            # the tiles are removed after they have been gathered
+            self.assertEqual(listdir(path.join(temp, "tiles")), [])
+
+    def test_local_tiles(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(cache_path=temp, scatter_tiles=2)
+            worker = TestWorker(server, helper=False)
+            runner = ScatterTileRunner(
+                worker, server, InvertStage(), StageParams(), make_params(), {}
+            )
+
+            outputs = runner(make_tiles(4), [invert_filter], 8)
+            self.assertEqual(len(outputs), 4)
+            self.assertEqual(worker.progress, 0)
+
+    def test_disabled(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(cache_path=temp)
+            runner = ScatterTileRunner(
+                TestWorker(server),
+                server,
+                InvertStage(),
+                StageParams(),
+                make_params(),
+                {},
+            )
+
+            self.assertFalse(runner.can_scatter(4))
+            runner(make_tiles(4), [invert_filter], 8)
+            self.assertFalse(path.exists(path.join(temp, "tiles")))
+
+    def test_finished_tiles(self):
+        with TemporaryDirectory() as temp:
+            tile_path = path.join(temp, "tiles", "missing")
+            makedirs(tile_path)
+
+            server = ServerContext(cache_path=temp)
+            worker = TestWorker(server)
+            run_tile_job(worker, server, tile_path)
+            self.assertEqual(worker.progress, 0)
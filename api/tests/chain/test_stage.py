@@ -0,0 +1,17 @@
+import unittest
+
+from onnx_web.chain import CHAIN_STAGES, BaseStage, get_stage_class
+
+
+class TestStageClasses(unittest.TestCase):
+    def test_stage_types(self):
+        for stage_type, (_module_name, class_name) in CHAIN_STAGES.items():
+            with self.subTest(stage_type=stage_type):
+                stage_class = get_stage_class(stage_type)
+                self.assertTrue(issubclass(stage_class, BaseStage))
+                self.assertEqual(stage_class.__name__, class_name)
+
+    def test_lazy_exports(self):
+        import onnx_web.chain
+
+        self.assertIs(onnx_web.chain.BlendLinearStage, get_stage_class("blend-linear"))
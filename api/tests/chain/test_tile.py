@@ -0,0 +1,233 @@
+import unittest
+from os import listdir
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from onnx_web.chain.tile import (
+    MaskPlan,
+    TileAccumulator,
+    get_mask_crop,
+    process_tile_grid,
+    process_tile_spiral,
+)
+
+
+def make_mask(size, box=None) -> Image.Image:
+    mask = Image.new("L", size, 0)
+    if box is not None:
+        mask.paste(255, box)
+
+    return mask
+
+
+class CountingFilter:
+    def __init__(self) -> None:
+        self.calls = []
+
+    def __call__(self, tile_image, tile_mask, dims):
+        self.calls.append(dims)
+        return Image.new("RGB", tile_image.size, "red")
+
+
+class TestMaskPlan(unittest.TestCase):
+    def test_covers(self):
+        plan = MaskPlan(make_mask((256, 256), (100, 100, 110, 110)), dilation=0)
+
+        self.assertTrue(plan.covers(0, 0, 128, 128))
+        self.assertTrue(plan.covers(105, 105, 106, 106))
+        self.assertFalse(plan.covers(128, 128, 256, 256))
+        self.assertFalse(plan.covers(0, 0, 100, 100))
+
+    def test_dilation(self):
+        plan = MaskPlan(make_mask((256, 256), (100, 100, 110, 110)), dilation=8)
+
+        self.assertTrue(plan.covers(0, 0, 95, 95))
+        self.assertFalse(plan.covers(0, 0, 90, 90))
+
+    def test_outside_image(self):
+        plan = MaskPlan(make_mask((64, 64), (0, 0, 64, 64)), dilation=0)
+
+        self.assertTrue(plan.covers(-32, -32, 32, 32))
+        self.assertFalse(plan.covers(64, 64, 128, 128))
+
+    def test_bbox(self):
+        plan = MaskPlan(make_mask((256, 256), (100, 50, 110, 60)), dilation=4)
+        self.assertEqual(plan.bbox(), (96, 46, 114, 64))
+
+        empty = MaskPlan(make_mask((256, 256)))
+        self.assertIsNone(empty.bbox())
+
+
+class TestMaskCrop(unittest.TestCase):
+    def test_small_mask(self):
+        crop = get_mask_crop(make_mask((2048, 2048), (1000, 1000, 1010, 1010)), 512)
+        left, top, right, bottom = crop
+
+        self.assertEqual((right - left, bottom - top), (512, 512))
+        self.assertTrue(left <= 1000 and right >= 1010)
+        self.assertEqual(left % 8, 0)
+        self.assertEqual(top % 8, 0)
+
+    def test_edge_mask(self):
+        crop = get_mask_crop(make_mask((2048, 1024), (2040, 0, 2048, 8)), 512)
+        self.assertEqual(crop, (1536, 0, 2048, 512))
+
+    def test_full_mask(self):
+        self.assertIsNone(get_mask_crop(make_mask((512, 512), (0, 0, 512, 512)), 512))
+        self.assertIsNone(get_mask_crop(make_mask((1024, 1024)), 512))
+
+
+class TestTileSkipping(unittest.TestCase):
+    def test_spiral_skips_unmasked(self):
+        source = Image.new("RGB", (1024, 1024), "blue")
+        mask = make_mask(source.size, (0, 0, 32, 32))
+        tile_filter = CountingFilter()
+
+        output = process_tile_spiral(
+            source, 512, 1, [tile_filter], overlap=0.0, mask=mask
+        )
+
+        self.assertEqual(len(tile_filter.calls), 1)
+        self.assertEqual(output.getpixel((0, 0)), (255, 0, 0))
+        self.assertEqual(output.getpixel((1000, 1000)), (0, 0, 255))
+
+    def test_spiral_scaled(self):
+        source = Image.new("RGB", (256, 256), "blue")
+        mask = make_mask(source.size, (0, 0, 32, 32))
+        tile_filter = CountingFilter()
+
+        def upscale_filter(tile_image, tile_mask, dims):
+            tile_filter(tile_image, tile_mask, dims)
+            return tile_image.resize((256, 256))
+
+        process_tile_spiral(source, 128, 2, [upscale_filter], overlap=0.0, mask=mask)
+        self.assertEqual(len(tile_filter.calls), 4)
+
+    def test_grid_skips_unmasked(self):
+        source = Image.new("RGB", (1024, 1024), "blue")
+        mask = make_mask(source.size, (600, 600, 700, 700))
+        tile_filter = CountingFilter()
+
+        output = process_tile_grid(source, 512, 1, [tile_filter], mask=mask)
+
+        self.assertEqual(tile_filter.calls, [(512, 512, 512)])
+        self.assertEqual(output.getpixel((0, 0)), (0, 0, 255))
+        self.assertEqual(output.getpixel((700, 700)), (255, 0, 0))
+
+
+def make_gradient(size) -> Image.Image:
+    width, height = size
+    x, y = np.meshgrid(
+        np.linspace(0, 255, width, dtype=np.uint8),
+        np.linspace(0, 255, height, dtype=np.uint8),
+    )
+    return Image.fromarray(np.stack([x, y, np.full_like(x, 128)], axis=2))
+
+
+def fill_noise(source, dims, origin, fill=None):
+    return Image.new(source.mode, dims, "green")
+
+
+class TestTilePipeline(unittest.TestCase):
+    def assertSameImage(self, first: Image.Image, second: Image.Image):
+        self.assertEqual(first.size, second.size)
+        self.assertTrue(np.array_equal(np.array(first), np.array(second)))
+
+    def test_grid_matches_sequential(self):
+        source = make_gradient((1000, 600))
+        mask = make_mask(source.size, (100, 100, 900, 300))
+
+        def invert_filter(tile_image, tile_mask, dims):
+            return ImageOps.invert(tile_image).resize((256, 256))
+
+        outputs = [
+            process_tile_grid(
+                source,
+                128,
+                2,
+                [invert_filter],
+                overlap=0.25,
+                mask=mask,
+                tile_pipeline=pipeline,
+            )
+            for pipeline in [False, True]
+        ]
+        self.assertSameImage(*outputs)
+
+    def test_spiral_matches_sequential(self):
+        source = make_gradient((640, 384))
+        tile_filter = CountingFilter()
+
+        def invert_filter(tile_image, tile_mask, dims):
+            tile_filter(tile_image, tile_mask, dims)
+            return ImageOps.invert(tile_image)
+
+        outputs = [
+            process_tile_spiral(
+                source,
+                128,
+                1,
+                [invert_filter],
+                overlap=0.5,
+                noise_source=fill_noise,
+                tile_pipeline=pipeline,
+            )
+            for pipeline in [False, True]
+        ]
+        self.assertSameImage(*outputs)
+        self.assertGreater(len(tile_filter.calls), 2)
+
+    def test_filter_error(self):
+        source = make_gradient((512, 512))
+
+        def error_filter(tile_image, tile_mask, dims):
+            if dims[0] > 0:
+                raise ValueError("tile error")
+
+            return tile_image
+
+        with self.assertRaises(ValueError):
+            process_tile_grid(source, 128, 1, [error_filter], tile_pipeline=True)
+
+
+class TestTileAccumulator(unittest.TestCase):
+    def add_grid(self, accumulator: TileAccumulator, size: int, tile: int):
+        open_bands = []
+        tops = [
+            y for y in range(0, size, tile // 2) for _x in range(0, size, tile // 2)
+        ]
+        lefts = [
+            x for _y in range(0, size, tile // 2) for x in range(0, size, tile // 2)
+        ]
+        for index, (left, top) in enumerate(zip(lefts, tops)):
+            tile_image = make_gradient(
+                (tile * accumulator.scale, tile * accumulator.scale)
+            )
+            accumulator.add(left, top, tile_image)
+            if index + 1 < len(tops):
+                accumulator.complete(min(tops[index + 1 :]))
+
+            open_bands.append(len(accumulator.bands))
+
+        return accumulator.finish(), max(open_bands)
+
+    def test_grid_bands(self):
+        output, open_bands = self.add_grid(
+            TileAccumulator(2, 512, 512, 64, 0.5), 512, 64
+        )
+        self.assertEqual(output.size, (1024, 1024))
+        self.assertLessEqual(open_bands, 2)
+
+    def test_canvas_path(self):
+        expected, _open_bands = self.add_grid(
+            TileAccumulator(2, 256, 256, 64, 0.5), 256, 64
+        )
+        with TemporaryDirectory() as temp:
+            output, _open_bands = self.add_grid(
+                TileAccumulator(2, 256, 256, 64, 0.5, canvas_path=temp), 256, 64
+            )
+            self.assertEqual(listdir(temp), [])
+
+        self.assertTrue(np.array_equal(np.array(expected), np.array(output)))
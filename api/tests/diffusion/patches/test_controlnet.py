@@ -0,0 +1,151 @@
+import unittest
+
+import numpy as np
+from onnx import TensorProto, helper
+
+from onnx_web.diffusers.patches.controlnet import (
+    CONTROLNET_RESIDUALS,
+    UNET_RESIDUALS,
+    ControlNetBinding,
+    make_scale_model,
+)
+from onnx_web.torch_before_ort import InferenceSession
+
+SHAPE = [1, 4, 8, 8]
+
+
+def make_session(model) -> InferenceSession:
+    model.ir_version = 8
+    return InferenceSession(
+        model.SerializeToString(), providers=["CPUExecutionProvider"]
+    )
+
+
+def make_controlnet() -> InferenceSession:
+    """
+    Each residual is the sample plus the conditioning image, times the residual index.
+    """
+    inputs = [
+        helper.make_tensor_value_info("sample", TensorProto.FLOAT, SHAPE),
+        helper.make_tensor_value_info("timestep", TensorProto.FLOAT, [1]),
+        helper.make_tensor_value_info(
+            "encoder_hidden_states", TensorProto.FLOAT, SHAPE
+        ),
+        helper.make_tensor_value_info("controlnet_cond", TensorProto.FLOAT, SHAPE),
+    ]
+    outputs = [
+        helper.make_tensor_value_info(f"residual_{i}", TensorProto.FLOAT, SHAPE)
+        for i in range(CONTROLNET_RESIDUALS)
+    ]
+    initializers = [
+        helper.make_tensor(f"index_{i}", TensorProto.FLOAT, [], [float(i)])
+        for i in range(CONTROLNET_RESIDUALS)
+    ]
+    nodes = [helper.make_node("Add", ["sample", "controlnet_cond"], ["sum"])] + [
+        helper.make_node("Mul", ["sum", f"index_{i}"], [f"residual_{i}"])
+        for i in range(CONTROLNET_RESIDUALS)
+    ]
+    graph = helper.make_graph(nodes, "controlnet", inputs, outputs, initializers)
+    return make_session(helper.make_model(graph))
+
+
+def make_unet() -> InferenceSession:
+    """
+    The output is the sample plus the hidden states plus all of the residuals.
+    """
+    inputs = [
+        helper.make_tensor_value_info("sample", TensorProto.FLOAT, SHAPE),
+        helper.make_tensor_value_info("timestep", TensorProto.FLOAT, [1]),
+        helper.make_tensor_value_info(
+            "encoder_hidden_states", TensorProto.FLOAT, SHAPE
+        ),
+    ] + [
+        helper.make_tensor_value_info(name, TensorProto.FLOAT, SHAPE)
+        for name in UNET_RESIDUALS
+    ]
+    outputs = [helper.make_tensor_value_info("out_sample", TensorProto.FLOAT, SHAPE)]
+    nodes = [
+        helper.make_node(
+            "Sum",
+            ["sample", "encoder_hidden_states", *UNET_RESIDUALS],
+            ["out_sample"],
+        )
+    ]
+    graph = helper.make_graph(nodes, "unet", inputs, outputs)
+    return make_session(helper.make_model(graph))
+
+
+def run_host(controlnet, unet, sample, timestep, hidden, cond, scale):
+    residuals = controlnet.run(
+        None,
+        {
+            "sample": sample,
+            "timestep": timestep,
+            "encoder_hidden_states": hidden,
+            "controlnet_cond": cond,
+        },
+    )
+    residuals = [residual * scale for residual in residuals]
+    return unet.run(
+        None,
+        {
+            "sample": sample,
+            "timestep": timestep,
+            "encoder_hidden_states": hidden,
+            **dict(zip(UNET_RESIDUALS, residuals)),
+        },
+    )[0]
+
+
+class TestMakeScaleModel(unittest.TestCase):
+    def test_scale_inputs(self):
+        session = InferenceSession(
+            make_scale_model(2, np.float32), providers=["CPUExecutionProvider"]
+        )
+        outputs = session.run(
+            None,
+            {
+                "input_0": np.ones((2, 2), dtype=np.float32),
+                "input_1": np.full((3,), 2.0, dtype=np.float32),
+                "scale": np.array(0.5, dtype=np.float32),
+            },
+        )
+
+        self.assertTrue(np.allclose(outputs[0], 0.5))
+        self.assertTrue(np.allclose(outputs[1], 1.0))
+
+
+class TestControlNetBinding(unittest.TestCase):
+    def test_cpu_sessions_not_bound(self):
+        self.assertIsNone(
+            ControlNetBinding.from_sessions(make_controlnet(), make_unet())
+        )
+
+    def test_matches_host_path(self):
+        controlnet = make_controlnet()
+        unet = make_unet()
+        binding = ControlNetBinding(controlnet, unet, "cpu")
+
+        rng = np.random.default_rng(42)
+        cond = rng.standard_normal(SHAPE, dtype=np.float32)
+        hidden = rng.standard_normal(SHAPE, dtype=np.float32)
+        timestep = np.array([1.0], dtype=np.float32)
+
+        for scale in [1.0, 0.5]:
+            for _step in range(2):
+                sample = rng.standard_normal(SHAPE, dtype=np.float32)
+                expected = run_host(
+                    controlnet, unet, sample, timestep, hidden, cond, scale
+                )
+                result = binding(sample, timestep, hidden, cond, scale)
+                self.assertTrue(np.allclose(result, expected, atol=1e-5))
+
+    def test_constants_follow_new_values(self):
+        binding = ControlNetBinding(make_controlnet(), make_unet(), "cpu")
+        first = np.zeros(SHAPE, dtype=np.float32)
+        second = np.ones(SHAPE, dtype=np.float32)
+
+        self.assertIs(
+            binding.get_constant("test", first), binding.get_constant("test", first)
+        )
+        self.assertTrue(np.allclose(binding.get_constant("test", second).numpy(), 1.0))
@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+import torch
+from diffusers import DDIMScheduler
+
+from onnx_web.diffusers.schedulers.base import (
+    NumpySchedulerMixin,
+    SampleHistory,
+    combine,
+    get_scalar,
+    get_scheduler_input,
+    like_input,
+    to_numpy,
+)
+from onnx_web.diffusers.schedulers.ddim import NumpyDDIMScheduler
+
+
+class TestCombine(unittest.TestCase):
+    def test_weighted_sum(self):
+        a = np.ones((2, 2), dtype=np.float32)
+        b = np.full((2, 2), 2.0, dtype=np.float32)
+        out = np.empty_like(a)
+
+        combine([(2.0, a), (-0.5, b)], out, np.empty_like(a))
+        self.assertTrue(np.allclose(out, 1.0))
+
+    def test_keeps_dtype(self):
+        a = np.ones((2, 2), dtype=np.float16)
+        out = combine([(0.5, a), (0.25, a)], np.empty_like(a), np.empty_like(a))
+        self.assertEqual(out.dtype, np.float16)
+        self.assertTrue(np.allclose(out, 0.75))
+
+
+class TestConversions(unittest.TestCase):
+    def test_tensor_round_trip(self):
+        tensor = torch.ones((2, 2))
+        array = to_numpy(tensor)
+        self.assertIsInstance(array, np.ndarray)
+        self.assertIsInstance(like_input(array, tensor), torch.Tensor)
+        self.assertIsInstance(like_input(array, array), np.ndarray)
+
+    def test_scheduler_input(self):
+        array = np.ones((2, 2), dtype=np.float32)
+        self.assertIs(get_scheduler_input(NumpyDDIMScheduler(), array), array)
+        self.assertIsInstance(get_scheduler_input(DDIMScheduler(), array), torch.Tensor)
+
+        # configs without a NumPy step fall back to the diffusers step, which needs tensors
+        fallback = NumpyDDIMScheduler(thresholding=True)
+        self.assertIsInstance(get_scheduler_input(fallback, array), torch.Tensor)
+
+    def test_scalar_timestep(self):
+        self.assertEqual(get_scalar(torch.tensor(981)), 981)
+        self.assertEqual(get_scalar(np.array([981.5])), 981.5)
+
+
+class TestSampleHistory(unittest.TestCase):
+    def test_reuses_slots(self):
+        history = SampleHistory(2)
+        like = np.zeros((1, 4, 8, 8), dtype=np.float32)
+
+        slots = []
+        for i in range(5):
+            slot = history.next_slot(like)
+            slot.fill(i)
+            history.push(slot, i)
+            slots.append(id(slot))
+
+        self.assertEqual(len(set(slots)), 3)
+        self.assertEqual(history.timesteps, [3, 4])
+        self.assertEqual([output[0, 0, 0, 0] for output in history.outputs], [3, 4])
+
+    def test_reallocate_on_shape(self):
+        history = SampleHistory(2)
+        slot = history.next_slot(np.zeros((1, 4, 8, 8), dtype=np.float32))
+        history.push(slot, 1)
+
+        slot = history.next_slot(np.zeros((1, 4, 16, 16), dtype=np.float32))
+        self.assertEqual(slot.shape, (1, 4, 16, 16))
+        self.assertEqual(history.outputs, [None, None])
+
+
+class TestSampleBuffers(unittest.TestCase):
+    def test_alternate_samples(self):
+        scheduler = NumpySchedulerMixin()
+        scheduler.buffers = {}
+
+        sample = np.zeros((1, 4, 8, 8), dtype=np.float32)
+        first = scheduler.get_sample_buffer(sample)
+        second = scheduler.get_sample_buffer(first)
+        self.assertFalse(np.may_share_memory(first, second))
+        self.assertIs(scheduler.get_sample_buffer(second), first)
+        self.assertIs(
+            scheduler.get_buffer("scratch", sample),
+            scheduler.get_buffer("scratch", first),
+        )
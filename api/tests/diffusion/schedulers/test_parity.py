@@ -0,0 +1,145 @@
+import unittest
+from inspect import signature
+
+import numpy as np
+import torch
+from diffusers import (
+    DDIMScheduler,
+    DPMSolverMultistepScheduler,
+    EulerAncestralDiscreteScheduler,
+    EulerDiscreteScheduler,
+    UniPCMultistepScheduler,
+)
+
+from onnx_web.diffusers.schedulers.ddim import NumpyDDIMScheduler
+from onnx_web.diffusers.schedulers.dpm import NumpyDPMSolverMultistepScheduler
+from onnx_web.diffusers.schedulers.euler import (
+    NumpyEulerAncestralDiscreteScheduler,
+    NumpyEulerDiscreteScheduler,
+)
+from onnx_web.diffusers.schedulers.unipc import NumpyUniPCMultistepScheduler
+
+# from the Stable Diffusion v1.5 scheduler config
+SD_CONFIG = {
+    "beta_end": 0.012,
+    "beta_schedule": "scaled_linear",
+    "beta_start": 0.00085,
+    "num_train_timesteps": 1000,
+    "steps_offset": 1,
+}
+
+SHAPE = (2, 4, 8, 8)
+
+
+def run_scheduler(scheduler, steps: int, as_numpy: bool = False) -> np.ndarray:
+    """
+    Run a scheduler with fake model outputs, which are the same for each scheduler.
+    """
+    rng = np.random.RandomState(42)
+    generator = torch.Generator().manual_seed(42)
+    step_args = {}
+    if "generator" in signature(scheduler.step).parameters:
+        step_args["generator"] = generator
+
+    scheduler.set_timesteps(steps)
+    latents = rng.randn(*SHAPE).astype(np.float32) * float(scheduler.init_noise_sigma)
+
+    for t in scheduler.timesteps:
+        model_input = scheduler.scale_model_input(torch.from_numpy(latents), t)
+        model_output = rng.randn(*SHAPE).astype(np.float32) - model_input.numpy()
+
+        if as_numpy:
+            latents = scheduler.step(model_output, t, latents, **step_args).prev_sample
+        else:
+            latents = scheduler.step(
+                torch.from_numpy(model_output),
+                t,
+                torch.from_numpy(latents),
+                **step_args,
+            ).prev_sample.numpy()
+
+    return latents
+
+
+class SchedulerParityMixin:
+    reference = None
+    scheduler = None
+    configs = [{}]
+
+    def assert_parity(self, config, steps: int, as_numpy: bool = False):
+        expected = run_scheduler(self.reference(**SD_CONFIG, **config), steps)
+        actual = run_scheduler(
+            self.scheduler(**SD_CONFIG, **config), steps, as_numpy=as_numpy
+        )
+
+        # the coefficients are computed in float64, rather than float32, so allow for rounding relative to the
+        # size of the latents
+        tolerance = 1e-5 * max(1.0, np.abs(expected).max())
+
+        self.assertEqual(actual.dtype, expected.dtype)
+        self.assertTrue(
+            np.allclose(actual, expected, rtol=1e-4, atol=tolerance),
+            f"max difference: {np.abs(actual - expected).max()}",
+        )
+
+    def test_parity(self):
+        for config in self.configs:
+            for steps in [10, 25]:
+                with self.subTest(config=config, steps=steps):
+                    self.assert_parity(config, steps)
+
+    def test_numpy_inputs(self):
+        self.assert_parity(self.configs[0], 10, as_numpy=True)
+
+    def test_same_timesteps(self):
+        reference = self.reference(**SD_CONFIG)
+        scheduler = self.scheduler(**SD_CONFIG)
+        reference.set_timesteps(20)
+        scheduler.set_timesteps(20)
+
+        self.assertTrue(torch.equal(reference.timesteps, scheduler.timesteps))
+
+
+class TestDDIMParity(SchedulerParityMixin, unittest.TestCase):
+    reference = DDIMScheduler
+    scheduler = NumpyDDIMScheduler
+    configs = [
+        {"clip_sample": False, "set_alpha_to_one": False},
+        {"clip_sample": True, "prediction_type": "v_prediction"},
+    ]
+
+
+class TestEulerParity(SchedulerParityMixin, unittest.TestCase):
+    reference = EulerDiscreteScheduler
+    scheduler = NumpyEulerDiscreteScheduler
+    configs = [{}, {"prediction_type": "v_prediction"}]
+
+
+class TestEulerAncestralParity(SchedulerParityMixin, unittest.TestCase):
+    reference = EulerAncestralDiscreteScheduler
+    scheduler = NumpyEulerAncestralDiscreteScheduler
+
+
+class TestDPMMultistepParity(SchedulerParityMixin, unittest.TestCase):
+    reference = DPMSolverMultistepScheduler
+    scheduler = NumpyDPMSolverMultistepScheduler
+    configs = [
+        {},
+        {"solver_order": 3},
+        {"algorithm_type": "dpmsolver", "solver_type": "heun", "solver_order": 3},
+        {"prediction_type": "v_prediction", "lower_order_final": False},
+    ]
+
+    def test_fallback(self):
+        self.assert_parity({"thresholding": True}, 10)
+
+
+class TestUniPCMultistepParity(SchedulerParityMixin, unittest.TestCase):
+    reference = UniPCMultistepScheduler
+    scheduler = NumpyUniPCMultistepScheduler
+    configs = [
+        {},
+        {"solver_order": 3, "solver_type": "bh1"},
+        {"predict_x0": False, "prediction_type": "v_prediction"},
+        {"disable_corrector": [0, 1]},
+    ]
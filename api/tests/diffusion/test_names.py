@@ -0,0 +1,12 @@
+import unittest
+
+from onnx_web.diffusers.load import available_pipelines, pipeline_schedulers
+from onnx_web.diffusers.names import get_available_pipelines, get_pipeline_schedulers
+
+
+class TestNames(unittest.TestCase):
+    def test_pipeline_names(self):
+        self.assertEqual(get_available_pipelines(), list(available_pipelines.keys()))
+
+    def test_scheduler_names(self):
+        self.assertEqual(get_pipeline_schedulers(), list(pipeline_schedulers.keys()))
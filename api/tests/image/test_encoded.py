@@ -0,0 +1,51 @@
+import unittest
+from io import BytesIO
+from pickle import dumps, loads
+
+from PIL import Image
+
+from onnx_web.image.encoded import EncodedImage, decode_images
+
+
+def encode_image(image: Image.Image) -> bytes:
+    data = BytesIO()
+    image.save(data, format="PNG")
+    return data.getvalue()
+
+
+class TestEncodedImage(unittest.TestCase):
+    def test_size(self):
+        image = EncodedImage(encode_image(Image.new("RGB", (64, 32))))
+        self.assertEqual(image.size, (64, 32))
+
+    def test_decode_mode(self):
+        image = EncodedImage(encode_image(Image.new("L", (8, 8), 255)), mode="RGB")
+        decoded = image.decode()
+
+        self.assertEqual(decoded.mode, "RGB")
+        self.assertEqual(decoded.getpixel((0, 0)), (255, 255, 255))
+
+    def test_decode_background(self):
+        image = EncodedImage(
+            encode_image(Image.new("RGBA", (8, 8), (255, 255, 255, 0))),
+            mode="RGBA",
+            background=(0, 0, 0, 255),
+        )
+        self.assertEqual(image.decode().getpixel((0, 0)), (0, 0, 0, 255))
+
+    def test_pickle(self):
+        image = EncodedImage(encode_image(Image.new("RGB", (8, 8), "red")))
+        copy = loads(dumps(image))
+
+        self.assertEqual(copy.decode().getpixel((0, 0)), (255, 0, 0))
+
+
+class TestDecodeImages(unittest.TestCase):
+    def test_nested(self):
+        image = EncodedImage(encode_image(Image.new("RGB", (8, 8))))
+        decoded = decode_images({"sources": [image, "foo"], "mask": image, "steps": 5})
+
+        self.assertIsInstance(decoded["sources"][0], Image.Image)
+        self.assertEqual(decoded["sources"][1], "foo")
+        self.assertIsInstance(decoded["mask"], Image.Image)
+        self.assertEqual(decoded["steps"], 5)
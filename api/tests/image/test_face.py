@@ -0,0 +1,148 @@
+import unittest
+
+import numpy as np
+import torch
+
+from onnx_web.image.face import (
+    correct_faces,
+    detect_faces,
+    get_face_region,
+    paste_faces,
+)
+
+
+class FakeFaceHelper:
+    def __init__(self, affine_matrices):
+        self.affine_matrices = affine_matrices
+        self.face_size = (64, 64)
+        self.use_parse = False
+
+
+class FakeDetectHelper:
+    """
+    Detects one face with its landmarks at fixed fractions of the detection image, like a real detector would
+    report for the same face at any resolution.
+    """
+
+    def __init__(self):
+        self.device = torch.device("cpu")
+        self.face_size = (64, 64)
+        self.pad_blur = False
+        self.use_parse = False
+        self.detect_shapes = []
+        self.restored_faces = []
+
+    def clean_all(self):
+        self.all_landmarks_5 = []
+        self.det_faces = []
+        self.affine_matrices = []
+        self.cropped_faces = []
+
+    def read_image(self, image):
+        self.input_img = image
+
+    def get_face_landmarks_5(self, only_center_face=False, eye_dist_threshold=None):
+        height, width = self.input_img.shape[0:2]
+        self.detect_shapes.append((height, width))
+
+        fractions = np.array(
+            [[0.4, 0.4], [0.6, 0.4], [0.5, 0.5], [0.4, 0.6], [0.6, 0.6]]
+        )
+        self.all_landmarks_5.append(fractions * [width, height])
+        self.det_faces.append(
+            np.array([0.3 * width, 0.3 * height, 0.7 * width, 0.7 * height, 0.99])
+        )
+        return 1
+
+    def align_warp_face(self):
+        for landmarks in self.all_landmarks_5:
+            # translate the first eye to the origin of the face crop
+            affine = np.array(
+                [[1.0, 0.0, -landmarks[0, 0]], [0.0, 1.0, -landmarks[0, 1]]]
+            )
+            self.affine_matrices.append(affine)
+            self.cropped_faces.append(np.zeros((64, 64, 3), dtype=np.uint8))
+
+    def add_restored_face(self, face):
+        self.restored_faces.append(face)
+
+
+class DetectFacesTests(unittest.TestCase):
+    def test_full_resolution_landmarks(self):
+        image = np.zeros((2048, 3072, 3), dtype=np.uint8)
+        helper = FakeDetectHelper()
+
+        self.assertEqual(detect_faces(helper, image, detect_size=512), 1)
+        self.assertEqual(helper.detect_shapes, [(512, 768)])
+        self.assertIs(helper.input_img, image)
+
+        self.assertTrue(
+            np.allclose(helper.all_landmarks_5[0][0], [0.4 * 3072, 0.4 * 2048])
+        )
+        self.assertTrue(
+            np.allclose(
+                helper.det_faces[0],
+                [0.3 * 3072, 0.3 * 2048, 0.7 * 3072, 0.7 * 2048, 0.99],
+            )
+        )
+
+    def test_small_image(self):
+        image = np.zeros((256, 256, 3), dtype=np.uint8)
+        helper = FakeDetectHelper()
+
+        detect_faces(helper, image, detect_size=512)
+        self.assertEqual(helper.detect_shapes, [(256, 256)])
+        self.assertTrue(np.allclose(helper.all_landmarks_5[0][0], [102.4, 102.4]))
+
+
+class CorrectFacesTests(unittest.TestCase):
+    def test_restore_batch(self):
+        image = np.zeros((1024, 1024, 3), dtype=np.uint8)
+        helper = FakeDetectHelper()
+        batches = []
+
+        def restore(batch):
+            batches.append(batch.shape)
+            return torch.ones_like(batch)
+
+        result = correct_faces(helper, image, restore, detect_size=256)
+
+        self.assertIs(result, image)
+        self.assertEqual(batches, [(1, 3, 64, 64)])
+        self.assertEqual(len(helper.restored_faces), 1)
+
+        # the white face is pasted at the full-resolution landmark, not the detection one
+        self.assertGreater(image[442, 442].min(), 200)
+        self.assertEqual(image[0:300, 0:300].max(), 0)
+
+
+class FaceRegionTests(unittest.TestCase):
+    def test_translated_face(self):
+        inverse_affine = np.array([[1.0, 0.0, 100.0], [0.0, 1.0, 50.0]])
+        region = get_face_region(inverse_affine, (64, 64), 512, 512, pad=0)
+        self.assertEqual(region, (100, 50, 164, 114))
+
+    def test_clipped_face(self):
+        inverse_affine = np.array([[1.0, 0.0, 480.0], [0.0, 1.0, -10.0]])
+        region = get_face_region(inverse_affine, (64, 64), 512, 512, pad=0)
+        self.assertEqual(region, (480, 0, 512, 54))
+
+
+class PasteFacesTests(unittest.TestCase):
+    def test_paste_in_place(self):
+        image = np.zeros((256, 256, 3), dtype=np.uint8)
+        affine = np.array([[1.0, 0.0, -96.0], [0.0, 1.0, -96.0]])
+        helper = FakeFaceHelper([affine])
+        face = np.full((64, 64, 3), 255, dtype=np.uint8)
+
+        result = paste_faces(helper, image, [face])
+
+        self.assertIs(result, image)
+        self.assertGreater(image[128, 128, 0], 200)
+        self.assertEqual(image[0:80, :].max(), 0)
+        self.assertEqual(image[180:, :].max(), 0)
+
+    def test_no_faces(self):
+        image = np.zeros((64, 64, 3), dtype=np.uint8)
+        paste_faces(FakeFaceHelper([]), image, [])
+        self.assertEqual(image.max(), 0)
@@ -0,0 +1,57 @@
+import unittest
+
+from jsonschema import ValidationError
+
+from onnx_web.server.context import ServerContext
+from onnx_web.server.load import (
+    get_cpu_platforms,
+    get_schema_validator,
+    schema_validators,
+)
+
+
+class TestSchemaValidator(unittest.TestCase):
+    def test_compiled_once(self):
+        validator = get_schema_validator("chain")
+
+        self.assertIn("chain", schema_validators)
+        self.assertIs(get_schema_validator("chain"), validator)
+
+    def test_validate_chain(self):
+        validator = get_schema_validator("chain")
+        validator.validate({"stages": []})
+
+        with self.assertRaises(ValidationError):
+            validator.validate({"stages": "none"})
+
+
+class TestCpuPlatforms(unittest.TestCase):
+    def test_default(self):
+        devices = get_cpu_platforms(ServerContext(), list(range(8)))
+
+        self.assertEqual(len(devices), 1)
+        self.assertEqual(devices[0].device, "cpu")
+        self.assertEqual(devices[0].threads, 0)
+        self.assertIsNone(devices[0].affinity)
+
+    def test_workers(self):
+        devices = get_cpu_platforms(ServerContext(cpu_workers=3), list(range(8)))
+
+        self.assertEqual([d.device for d in devices], ["cpu", "cpu-1", "cpu-2"])
+        self.assertEqual([d.platform for d in devices], ["cpu", "cpu", "cpu"])
+        self.assertEqual([d.threads for d in devices], [2, 2, 2])
+
+    def test_auto_affinity(self):
+        server = ServerContext(cpu_workers=3, cpu_affinity="auto", cpu_aux_threads=1)
+        devices = get_cpu_platforms(server, list(range(8)))
+
+        self.assertEqual([d.affinity for d in devices], [[0, 1], [2, 3], [4, 5, 6, 7]])
+        self.assertEqual([d.threads for d in devices], [2, 2, 4])
+        self.assertEqual([d.aux_threads for d in devices], [1, 1, 1])
+
+    def test_explicit_affinity(self):
+        server = ServerContext(cpu_affinity="0-3,8; 4-7", cpu_threads=2)
+        devices = get_cpu_platforms(server, list(range(16)))
+
+        self.assertEqual([d.affinity for d in devices], [[0, 1, 2, 3, 8], [4, 5, 6, 7]])
+        self.assertEqual([d.threads for d in devices], [2, 2])
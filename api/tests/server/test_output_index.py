@@ -0,0 +1,126 @@
+import unittest
+from json import dumps
+from os import path
+from tempfile import TemporaryDirectory
+from time import sleep
+
+from onnx_web.server.output_index import OutputIndex, get_output_mode
+
+
+class TestGetOutputMode(unittest.TestCase):
+    def test_mode_prefix(self):
+        self.assertEqual(get_output_mode("txt2img_42_abcd_1234_0.png"), "txt2img")
+
+
+class TestOutputIndex(unittest.TestCase):
+    def test_add_and_get(self):
+        with TemporaryDirectory() as temp:
+            index = OutputIndex(path.join(temp, "outputs.db"))
+            index.add_output("txt2img_1_a_0_0.png", seed=1, model="test", width=512)
+
+            output = index.get_output("txt2img_1_a_0_0.png")
+            self.assertEqual(output["mode"], "txt2img")
+            self.assertEqual(output["seed"], 1)
+            self.assertEqual(output["width"], 512)
+            self.assertIsNone(index.get_output("missing.png"))
+
+    def test_update_existing(self):
+        with TemporaryDirectory() as temp:
+            index = OutputIndex(path.join(temp, "outputs.db"))
+            index.add_output("txt2img_1_a_0_0.png", seed=1, thumbnail="thumb.webp")
+            index.add_output("txt2img_1_a_0_0.png", seed=2)
+
+            output = index.get_output("txt2img_1_a_0_0.png")
+            self.assertEqual(index.count_outputs(), 1)
+            self.assertEqual(output["seed"], 2)
+            self.assertEqual(output["thumbnail"], "thumb.webp")
+
+    def test_pages(self):
+        with TemporaryDirectory() as temp:
+            index = OutputIndex(path.join(temp, "outputs.db"))
+            for i in range(5):
+                index.add_output(f"txt2img_{i}_a_0_0.png", seed=i)
+
+            page, next_page = index.list_outputs(limit=2)
+            self.assertEqual([output["seed"] for output in page], [4, 3])
+
+            page, next_page = index.list_outputs(limit=2, before=next_page)
+            self.assertEqual([output["seed"] for output in page], [2, 1])
+
+            page, next_page = index.list_outputs(limit=2, before=next_page)
+            self.assertEqual([output["seed"] for output in page], [0])
+            self.assertIsNone(next_page)
+
+    def test_filters(self):
+        with TemporaryDirectory() as temp:
+            index = OutputIndex(path.join(temp, "outputs.db"))
+            index.add_output("txt2img_1_a_0_0.png", seed=1, model="one")
+            index.add_output("img2img_1_a_0_0.png", seed=1, model="two")
+            index.add_output("txt2img_2_a_0_0.png", seed=2, model="two")
+
+            page, _next = index.list_outputs(mode="txt2img")
+            self.assertEqual(len(page), 2)
+
+            page, _next = index.list_outputs(model="two", seed=1)
+            self.assertEqual(
+                [output["name"] for output in page], ["img2img_1_a_0_0.png"]
+            )
+
+    def test_rebuild(self):
+        with TemporaryDirectory() as temp:
+            for name in ["txt2img_1_a_0_0.png", "orphan.png"]:
+                with open(path.join(temp, f"{name}.json"), "w") as f:
+                    f.write(
+                        dumps(
+                            {
+                                "params": {"model": "test", "seed": 1},
+                                "size": {"width": 64, "height": 32},
+                            }
+                        )
+                    )
+
+            # only the first output has an image
+            with open(path.join(temp, "txt2img_1_a_0_0.png"), "wb") as f:
+                f.write(b"")
+
+            index = OutputIndex(path.join(temp, "index", "outputs.db"))
+            self.assertEqual(index.rebuild(temp), 1)
+
+            output = index.get_output("txt2img_1_a_0_0.png")
+            self.assertEqual(output["model"], "test")
+            self.assertEqual(output["height"], 32)
+
+
+class TestResults(unittest.TestCase):
+    def test_add_and_get(self):
+        with TemporaryDirectory() as temp:
+            index = OutputIndex(path.join(temp, "outputs.db"))
+            index.add_result("abc", ["a.png", "b.png"])
+
+            self.assertEqual(index.get_result("abc"), ["a.png", "b.png"])
+            self.assertIsNone(index.get_result("def"))
+
+            self.assertTrue(index.remove_result("abc"))
+            self.assertEqual(index.count_results(), 0)
+
+    def test_expire_limit(self):
+        with TemporaryDirectory() as temp:
+            index = OutputIndex(path.join(temp, "outputs.db"))
+            for i in range(3):
+                index.add_result(str(i), [f"{i}.png"])
+
+            # using the oldest result keeps it
+            index.get_result("0")
+
+            self.assertEqual(index.expire_results(limit=2), ["1.png"])
+            self.assertEqual(index.count_results(), 2)
+
+    def test_expire_ttl(self):
+        with TemporaryDirectory() as temp:
+            index = OutputIndex(path.join(temp, "outputs.db"))
+            index.add_result("abc", ["a.png"])
+
+            self.assertEqual(index.expire_results(ttl=60), [])
+
+            sleep(0.01)
+            self.assertEqual(index.expire_results(ttl=0.001), ["a.png"])
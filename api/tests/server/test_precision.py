@@ -0,0 +1,230 @@
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from onnx import TensorProto, helper, load_model, save_model
+
+from onnx_web.params import DeviceParams
+from onnx_web.server.context import ServerContext
+from onnx_web.server.precision import (
+    PRECISION_KEY,
+    convert_model_fp16,
+    get_component_precision,
+    get_input_types,
+    get_model_precision,
+    get_precision_model,
+    get_precision_policy,
+    save_model_precision,
+)
+from onnx_web.server.session_cache import load_session
+
+
+def save_test_model(
+    model_path: str,
+    data_type=TensorProto.FLOAT,
+    scale_value: float = 2.0,
+    external=False,
+) -> None:
+    scale = helper.make_tensor("scale", data_type, [1], [scale_value])
+    nodes = [helper.make_node("Cast", ["scale"], ["scale_float"], to=TensorProto.FLOAT)]
+    nodes.append(helper.make_node("Mul", ["input", "scale_float"], ["output"]))
+    graph = helper.make_graph(
+        nodes,
+        "test",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 4])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 4])],
+        [scale],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    save_model(
+        model,
+        model_path,
+        save_as_external_data=external,
+        all_tensors_to_one_file=True,
+        location="weights.pb",
+        size_threshold=0,
+    )
+
+
+def make_attention_model():
+    graph = helper.make_graph(
+        [
+            helper.make_node("Relu", ["input"], ["hidden"]),
+            helper.make_node(
+                "MultiHeadAttention",
+                ["hidden", "hidden", "hidden"],
+                ["output"],
+                domain="com.microsoft",
+                num_heads=1,
+            ),
+        ],
+        "test",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 2, 4])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 2, 4])],
+    )
+    model = helper.make_model(
+        graph,
+        opset_imports=[
+            helper.make_opsetid("", 17),
+            helper.make_opsetid("com.microsoft", 1),
+        ],
+    )
+    model.ir_version = 8
+    return model
+
+
+class TestPrecisionPolicy(unittest.TestCase):
+    def test_policy(self):
+        self.assertIsNone(get_precision_policy([]))
+        self.assertEqual(get_precision_policy(["onnx-precision-mixed"]), "mixed")
+
+    def test_mixed(self):
+        device = DeviceParams(
+            "cuda", "CUDAExecutionProvider", optimizations=["onnx-precision-mixed"]
+        )
+        self.assertEqual(get_component_precision(device, "unet", "fp32"), "fp16")
+        self.assertEqual(get_component_precision(device, "vae", "fp32"), "fp32")
+        self.assertEqual(get_component_precision(device, None, "fp32"), "fp32")
+
+    def test_cpu(self):
+        device = DeviceParams(
+            "cpu", "CPUExecutionProvider", optimizations=["onnx-precision-fp16"]
+        )
+        self.assertEqual(get_component_precision(device, "unet", "fp32"), "fp32")
+
+        pinned = DeviceParams(
+            "cuda",
+            "CUDAExecutionProvider",
+            optimizations=["onnx-precision-fp16", "onnx-cpu-vae"],
+        )
+        self.assertEqual(get_component_precision(pinned, "unet", "fp32"), "fp16")
+        self.assertEqual(get_component_precision(pinned, "vae", "fp32"), "fp32")
+
+    def test_half_model(self):
+        device = DeviceParams(
+            "cuda", "CUDAExecutionProvider", optimizations=["onnx-precision-fp32"]
+        )
+        self.assertEqual(get_component_precision(device, "unet", "fp16"), "fp16")
+
+
+class TestModelPrecision(unittest.TestCase):
+    def test_metadata(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path)
+            self.assertEqual(get_model_precision(model_path), "fp32")
+
+            save_model_precision(model_path, "fp16")
+            self.assertEqual(get_model_precision(model_path), "fp16")
+
+            props = load_model(model_path).metadata_props
+            self.assertEqual([p.key for p in props], [PRECISION_KEY])
+
+    def test_weights(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path, TensorProto.FLOAT16)
+            self.assertEqual(get_model_precision(model_path), "fp16")
+
+
+class TestPrecisionModel(unittest.TestCase):
+    def test_convert(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path)
+
+            server = ServerContext(cache_path=temp)
+            device = DeviceParams(
+                "cuda", "CUDAExecutionProvider", optimizations=["onnx-precision-fp16"]
+            )
+
+            converted = get_precision_model(server, device, model_path, "unet")
+            self.assertNotEqual(converted, model_path)
+            self.assertEqual(get_model_precision(converted), "fp16")
+            self.assertEqual(
+                get_precision_model(server, device, model_path, "unet"), converted
+            )
+
+            # the converted model keeps fp32 inputs
+            cpu = DeviceParams("cpu", "CPUExecutionProvider")
+            session = load_session(server, cpu, converted)
+            self.assertEqual(get_input_types(session), {"input": np.float32})
+
+            data = np.ones((1, 4), dtype=np.float32)
+            self.assertTrue(np.allclose(session.run(None, {"input": data})[0], 2.0))
+
+    def test_external_weights(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path, external=True)
+
+            server = ServerContext(cache_path=temp)
+            device = DeviceParams(
+                "cuda", "CUDAExecutionProvider", optimizations=["onnx-precision-fp16"]
+            )
+
+            converted = get_precision_model(server, device, model_path, "unet")
+            cpu = DeviceParams("cpu", "CPUExecutionProvider")
+            session = load_session(server, cpu, converted)
+            data = np.ones((1, 4), dtype=np.float32)
+            self.assertTrue(np.allclose(session.run(None, {"input": data})[0], 2.0))
+
+            # a different checkpoint with the same graph is converted again
+            save_test_model(model_path, scale_value=3.0, external=True)
+            reconverted = get_precision_model(server, device, model_path, "unet")
+            self.assertNotEqual(converted, reconverted)
+
+            session = load_session(server, cpu, reconverted)
+            self.assertTrue(np.allclose(session.run(None, {"input": data})[0], 3.0))
+
+    def test_block_attention(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_model(make_attention_model(), model_path)
+
+            for v2 in [False, True]:
+                model = convert_model_fp16(model_path, v2=v2)
+                attention = next(
+                    node
+                    for node in model.graph.node
+                    if node.op_type == "MultiHeadAttention"
+                )
+                inputs = [
+                    node
+                    for node in model.graph.node
+                    if node.output[0] in attention.input and node.op_type == "Cast"
+                ]
+
+                # blocked nodes get their inputs cast back to fp32
+                self.assertEqual(len(inputs) > 0, v2)
+
+    def test_native(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path)
+
+            server = ServerContext(cache_path=temp)
+            device = DeviceParams("cuda", "CUDAExecutionProvider")
+            self.assertEqual(
+                get_precision_model(server, device, model_path, "unet"), model_path
+            )
+
+    def test_no_policy(self):
+        with TemporaryDirectory() as temp:
+            # the model is not loaded without a policy, so it does not need to exist
+            model_path = path.join(temp, "missing.onnx")
+
+            server = ServerContext(cache_path=temp)
+            device = DeviceParams("cuda", "CUDAExecutionProvider")
+            self.assertEqual(
+                get_precision_model(server, device, model_path, "unet"), model_path
+            )
+
+            fp16 = DeviceParams(
+                "cuda", "CUDAExecutionProvider", optimizations=["onnx-precision-fp16"]
+            )
+            self.assertEqual(
+                get_precision_model(server, fp16, model_path, None), model_path
+            )
@@ -0,0 +1,145 @@
+import unittest
+from os import listdir, path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from onnx import TensorProto, helper, save_model
+
+from onnx_web.params import DeviceParams
+from onnx_web.server.context import ServerContext
+from onnx_web.server.session_cache import (
+    OPTIMIZED_PATH,
+    get_provider_options,
+    get_session_key,
+    load_session,
+)
+
+
+def save_test_model(model_path: str, scale: float = 2.0) -> None:
+    """
+    Save a model that multiplies the input by a constant, which the graph optimizer can fold.
+    """
+    scale_tensor = helper.make_tensor("scale", TensorProto.FLOAT, [1], [scale])
+    graph = helper.make_graph(
+        [
+            helper.make_node("Identity", ["scale"], ["scale_copy"]),
+            helper.make_node("Mul", ["input", "scale_copy"], ["output"]),
+        ],
+        "test",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 4])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 4])],
+        [scale_tensor],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    save_model(model, model_path)
+
+
+class TestSessionKey(unittest.TestCase):
+    def test_key_changes(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path)
+
+            key = get_session_key(model_path, "CPUExecutionProvider", None, 99)
+            self.assertEqual(
+                key, get_session_key(model_path, "CPUExecutionProvider", None, 99)
+            )
+            self.assertNotEqual(
+                key, get_session_key(model_path, "CUDAExecutionProvider", None, 99)
+            )
+            self.assertNotEqual(
+                key,
+                get_session_key(
+                    model_path, "CPUExecutionProvider", {"device_id": 1}, 99
+                ),
+            )
+            self.assertNotEqual(
+                key, get_session_key(model_path, "CPUExecutionProvider", None, 1)
+            )
+
+            save_test_model(model_path, scale=3.0)
+            self.assertNotEqual(
+                key, get_session_key(model_path, "CPUExecutionProvider", None, 99)
+            )
+
+    def test_external_weights(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path)
+            with open(path.join(temp, "weights.pb"), "wb") as f:
+                f.write(b"first")
+
+            key = get_session_key(model_path, "CPUExecutionProvider", None, 99)
+
+            # a different checkpoint with the same graph only changes the weights
+            with open(path.join(temp, "weights.pb"), "wb") as f:
+                f.write(b"second checkpoint")
+
+            self.assertNotEqual(
+                key, get_session_key(model_path, "CPUExecutionProvider", None, 99)
+            )
+
+    def test_tensorrt_options(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(cache_path=temp)
+            self.assertIsNone(
+                get_provider_options(server, "CPUExecutionProvider", "key")
+            )
+
+            options = get_provider_options(server, "TensorrtExecutionProvider", "key")
+            self.assertTrue(options["trt_engine_cache_enable"])
+            self.assertTrue(options["trt_engine_cache_path"].startswith(temp))
+            self.assertTrue(path.isdir(options["trt_engine_cache_path"]))
+
+
+class TestLoadSession(unittest.TestCase):
+    def test_save_and_reuse(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path)
+
+            server = ServerContext(
+                cache_path=temp, optimizations=["onnx-cache-optimized"]
+            )
+            device = DeviceParams("cpu", "CPUExecutionProvider")
+            data = np.ones((1, 4), dtype=np.float32)
+
+            session = load_session(server, device, model_path)
+            self.assertTrue(np.allclose(session.run(None, {"input": data})[0], 2.0))
+
+            optimized = listdir(path.join(temp, OPTIMIZED_PATH))
+            self.assertEqual(len(optimized), 1)
+
+            session = load_session(server, device, model_path)
+            self.assertTrue(np.allclose(session.run(None, {"input": data})[0], 2.0))
+            self.assertEqual(listdir(path.join(temp, OPTIMIZED_PATH)), optimized)
+
+    def test_regenerate_stale(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path)
+
+            server = ServerContext(
+                cache_path=temp, optimizations=["onnx-cache-optimized"]
+            )
+            device = DeviceParams("cpu", "CPUExecutionProvider")
+            data = np.ones((1, 4), dtype=np.float32)
+
+            load_session(server, device, model_path)
+            save_test_model(model_path, scale=3.0)
+
+            session = load_session(server, device, model_path)
+            self.assertTrue(np.allclose(session.run(None, {"input": data})[0], 3.0))
+            self.assertEqual(len(listdir(path.join(temp, OPTIMIZED_PATH))), 2)
+
+    def test_disabled(self):
+        with TemporaryDirectory() as temp:
+            model_path = path.join(temp, "model.onnx")
+            save_test_model(model_path)
+
+            server = ServerContext(cache_path=temp)
+            device = DeviceParams("cpu", "CPUExecutionProvider")
+
+            load_session(server, device, model_path)
+            self.assertFalse(path.exists(path.join(temp, OPTIMIZED_PATH)))
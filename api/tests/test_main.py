@@ -0,0 +1,47 @@
+import unittest
+from subprocess import run
+from sys import executable
+
+# the server process should import these lazily, if at all
+HEAVY_MODULES = [
+    "basicsr",
+    "controlnet_aux",
+    "cv2",
+    "diffusers",
+    "onnx",
+    "optimum",
+    "torch",
+    "transformers",
+]
+
+
+def get_loaded_modules(code: str):
+    """
+    Run some code in a new interpreter and list the heavy modules it loaded.
+    """
+    check = "; import sys; print(','.join(m for m in %s if m in sys.modules))" % (
+        HEAVY_MODULES
+    )
+    result = run(
+        [executable, "-c", code + check], capture_output=True, check=True, text=True
+    )
+    return [name for name in result.stdout.strip().split(",") if len(name) > 0]
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_server_imports(self):
+        self.assertEqual(get_loaded_modules("import onnx_web.main"), [])
+
+    def test_package_imports(self):
+        self.assertEqual(
+            get_loaded_modules("from onnx_web import ServerContext, Size"), []
+        )
+
+    def test_lazy_exports(self):
+        import onnx_web
+        from onnx_web.params import Size
+
+        self.assertIs(onnx_web.Size, Size)
+
+        with self.assertRaises(AttributeError):
+            onnx_web.not_a_real_export
@@ -1,4 +1,34 @@
 import unittest
+from json import loads
+from os import listdir, makedirs, path, stat, utime
+from tempfile import TemporaryDirectory
+from threading import Event
+
+import numpy as np
+from PIL import Image
+
+from onnx_web.image.encoded import EncodedImage
+from onnx_web.output import (
+    THUMBNAIL_PATH,
+    OutputMetadata,
+    add_cached_result,
+    drain_output_writes,
+    find_cached_result,
+    get_model_hash,
+    make_request_digest,
+    remove_preview,
+    save_image,
+    save_manifest,
+    save_preview,
+    when_written,
+)
+from onnx_web.params import ImageParams, Size
+from onnx_web.server.context import ServerContext
+
+
+def make_metadata(server: ServerContext, model: str = "test-model") -> OutputMetadata:
+    params = ImageParams(model, "txt2img", "ddim", "a prompt", 5.0, 20, 1)
+    return OutputMetadata.from_params(server, params, Size(64, 64))
 
 
 class TestHashValue(unittest.TestCase):
@@ -16,8 +46,304 @@ class TestMakeOutputName(unittest.TestCase):
 
 
 class TestSaveImage(unittest.TestCase):
-    pass
+    def test_save_sync(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(output_index="", output_path=output_path)
+            dest = save_image(server, "test.png", Image.new("RGB", (8, 8)))
+
+            self.assertTrue(path.exists(dest))
+            self.assertEqual(listdir(output_path), ["test.png"])
+
+    def test_save_background(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(
+                output_index="", output_path=output_path, output_workers=2
+            )
+            dests = [
+                save_image(server, f"test_{i}.png", Image.new("RGB", (8, 8)))
+                for i in range(4)
+            ]
+
+            writes = drain_output_writes()
+            self.assertEqual(len(writes), 4)
+
+            results = []
+            written = Event()
+
+            def on_written(failed: bool):
+                results.append(failed)
+                written.set()
+
+            when_written(writes, on_written)
+            self.assertTrue(written.wait(timeout=10))
+            self.assertEqual(results, [False])
+            for dest in dests:
+                self.assertTrue(path.exists(dest))
+
+            # no temporary files should be left behind
+            self.assertEqual(len(listdir(output_path)), 4)
+
+    def test_unsupported_format(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(
+                output_index="", output_path=output_path, image_format="nope"
+            )
+            dest = save_image(server, "test.nope", Image.new("RGB", (8, 8)))
+
+            with Image.open(dest) as image:
+                self.assertEqual(image.format, "PNG")
+
+
+class TestWhenWritten(unittest.TestCase):
+    def test_no_writes(self):
+        results = []
+        when_written([], results.append)
+        self.assertEqual(results, [False])
 
 
 class TestSaveParams(unittest.TestCase):
-    pass
+    def test_sidecar_per_output(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(output_index="", output_path=output_path)
+            metadata = make_metadata(server)
+            for i in range(2):
+                save_image(
+                    server, f"test_{i}.png", Image.new("RGB", (8, 8)), metadata=metadata
+                )
+
+            self.assertIn("test_0.png.json", listdir(output_path))
+            self.assertIn("test_1.png.json", listdir(output_path))
+
+    def test_manifest_per_job(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(
+                output_index="",
+                output_path=output_path,
+                output_manifest=True,
+                thumbnail_size=0,
+            )
+            metadata = make_metadata(server)
+            outputs = ["test_0.png", "test_1.png"]
+            for output in outputs:
+                save_image(server, output, Image.new("RGB", (8, 8)), metadata=metadata)
+
+            dest = save_manifest(server, outputs, metadata)
+            self.assertEqual(
+                sorted(listdir(output_path)),
+                ["test_0.jsonl", "test_0.png", "test_1.png"],
+            )
+
+            with open(dest, "r") as f:
+                lines = [loads(line) for line in f.readlines()]
+
+            self.assertEqual([line["outputs"] for line in lines], outputs)
+
+    def test_manifest_disabled(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(output_index="", output_path=output_path)
+            self.assertIsNone(
+                save_manifest(server, ["test.png"], make_metadata(server))
+            )
+
+
+class TestWriteThumbnail(unittest.TestCase):
+    def test_thumbnail_with_metadata(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(
+                output_index="", output_path=output_path, thumbnail_size=16
+            )
+            save_image(
+                server,
+                "test.png",
+                Image.new("RGB", (64, 32)),
+                metadata=make_metadata(server),
+            )
+
+            thumbnails = listdir(path.join(output_path, THUMBNAIL_PATH))
+            self.assertEqual(len(thumbnails), 1)
+
+            with Image.open(path.join(output_path, THUMBNAIL_PATH, thumbnails[0])) as t:
+                self.assertEqual(t.size, (16, 8))
+
+    def test_no_thumbnail_when_disabled(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(
+                output_index="", output_path=output_path, thumbnail_size=0
+            )
+            save_image(
+                server,
+                "test.png",
+                Image.new("RGB", (64, 32)),
+                metadata=make_metadata(server),
+            )
+
+            self.assertFalse(path.exists(path.join(output_path, THUMBNAIL_PATH)))
+
+
+class TestSavePreview(unittest.TestCase):
+    def test_preview_size(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(output_index="", output_path=output_path)
+            name = save_preview(server, "test.png", np.zeros((1, 4, 8, 16)))
+
+            with Image.open(path.join(output_path, name)) as preview:
+                self.assertEqual(preview.size, (16, 8))
+
+    def test_remove_preview(self):
+        with TemporaryDirectory() as output_path:
+            server = ServerContext(output_index="", output_path=output_path)
+            name = save_preview(server, "test", np.zeros((1, 4, 8, 8)))
+
+            self.assertTrue(remove_preview(server, "test"))
+            self.assertFalse(path.exists(path.join(output_path, name)))
+            self.assertFalse(remove_preview(server, "test"))
+
+
+class TestOutputMetadata(unittest.TestCase):
+    def test_outputs_only_change(self):
+        metadata = make_metadata(ServerContext())
+        first = metadata.tojson(["first.png"])
+        second = metadata.tojson(["second.png"])
+
+        self.assertEqual(first["outputs"], ["first.png"])
+        self.assertEqual(second["outputs"], ["second.png"])
+
+        first.pop("outputs")
+        second.pop("outputs")
+        self.assertEqual(first, second)
+
+
+class TestGetModelHash(unittest.TestCase):
+    def test_missing_hash(self):
+        with TemporaryDirectory() as model:
+            self.assertEqual(get_model_hash(model), "unknown")
+
+    def test_hash_file_changes(self):
+        with TemporaryDirectory() as model:
+            hash_path = path.join(model, "hash.txt")
+            with open(hash_path, "w") as f:
+                f.write("abc123\n")
+
+            self.assertEqual(get_model_hash(model), "abc123")
+
+            with open(hash_path, "w") as f:
+                f.write("def456\n")
+
+            # make sure the modification time changes
+            stat_result = stat(hash_path)
+            utime(hash_path, (stat_result.st_atime, stat_result.st_mtime + 10))
+
+            self.assertEqual(get_model_hash(model), "def456")
+
+
+class TestMakeRequestDigest(unittest.TestCase):
+    def test_same_request(self):
+        with TemporaryDirectory() as model_path:
+            server = ServerContext(model_path=model_path)
+            params = ImageParams(
+                "test-model", "txt2img", "ddim", "a prompt", 5.0, 20, 1
+            )
+
+            self.assertEqual(
+                make_request_digest(server, "txt2img", params, Size(64, 64)),
+                make_request_digest(server, "txt2img", params, Size(64, 64)),
+            )
+            self.assertNotEqual(
+                make_request_digest(server, "txt2img", params, Size(64, 64)),
+                make_request_digest(server, "txt2img", params, Size(64, 128)),
+            )
+
+    def test_source_images(self):
+        with TemporaryDirectory() as model_path:
+            server = ServerContext(model_path=model_path)
+            params = ImageParams(
+                "test-model", "img2img", "ddim", "a prompt", 5.0, 20, 1
+            )
+
+            first = make_request_digest(
+                server, "img2img", params, Size(64, 64), sources=[EncodedImage(b"a")]
+            )
+            second = make_request_digest(
+                server, "img2img", params, Size(64, 64), sources=[EncodedImage(b"b")]
+            )
+            self.assertNotEqual(first, second)
+
+    def test_network_files(self):
+        with TemporaryDirectory() as model_path:
+            server = ServerContext(model_path=model_path)
+            params = ImageParams(
+                "test-model", "txt2img", "ddim", "a <lora:test:1.0> prompt", 5.0, 20, 1
+            )
+
+            missing = make_request_digest(server, "txt2img", params, Size(64, 64))
+
+            makedirs(path.join(model_path, "lora"))
+            lora_path = path.join(model_path, "lora", "test.safetensors")
+            with open(lora_path, "wb") as f:
+                f.write(b"first")
+
+            first = make_request_digest(server, "txt2img", params, Size(64, 64))
+
+            with open(lora_path, "wb") as f:
+                f.write(b"second!")
+
+            second = make_request_digest(server, "txt2img", params, Size(64, 64))
+            self.assertEqual(len({missing, first, second}), 3)
+
+
+class TestResultCache(unittest.TestCase):
+    def test_cache_disabled(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(model_path=temp, output_path=temp)
+            params = ImageParams(
+                "test-model", "txt2img", "ddim", "a prompt", 5.0, 20, 1
+            )
+
+            digest, cached = find_cached_result(server, "txt2img", params, Size(64, 64))
+            self.assertIsNotNone(digest)
+            self.assertIsNone(cached)
+
+    def test_hit_after_write(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(
+                model_path=temp,
+                output_path=temp,
+                output_index=path.join(temp, "outputs.db"),
+                result_cache=True,
+            )
+            params = ImageParams(
+                "test-model", "txt2img", "ddim", "a prompt", 5.0, 20, 1
+            )
+
+            digest, cached = find_cached_result(server, "txt2img", params, Size(64, 64))
+            self.assertIsNone(cached)
+            add_cached_result(server, digest, ["test.png"])
+
+            # the job has not written the output yet
+            _digest, cached = find_cached_result(
+                server, "txt2img", params, Size(64, 64)
+            )
+            self.assertIsNone(cached)
+
+            Image.new("RGB", (8, 8)).save(path.join(temp, "test.png"))
+            _digest, cached = find_cached_result(
+                server, "txt2img", params, Size(64, 64)
+            )
+            self.assertEqual(cached, ["test.png"])
+
+    def test_evict_outputs(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(
+                model_path=temp,
+                output_path=temp,
+                output_index=path.join(temp, "outputs.db"),
+                result_cache=True,
+                result_cache_limit=1,
+            )
+
+            for name in ["first", "second"]:
+                Image.new("RGB", (8, 8)).save(path.join(temp, f"{name}.png"))
+                add_cached_result(server, name, [f"{name}.png"])
+
+            self.assertFalse(path.exists(path.join(temp, "first.png")))
+            self.assertTrue(path.exists(path.join(temp, "second.png")))
@@ -1,6 +1,6 @@
 import unittest
 
-from onnx_web.params import Border, Size
+from onnx_web.params import Border, DeviceParams, Size
 
 class BorderTests(unittest.TestCase):
     def test_json(self):
@@ -65,6 +65,17 @@ class DeviceParamsTests(unittest.TestCase):
     def test_torch_rocm(self):
         pass
 
+    def test_threads(self):
+        device = DeviceParams(
+            "cpu", "CPUExecutionProvider", threads=8, inter_threads=2, aux_threads=2
+        )
+
+        self.assertEqual(device.sess_options().intra_op_num_threads, 8)
+        self.assertEqual(device.sess_options().inter_op_num_threads, 2)
+        self.assertEqual(device.sess_options(model_type="unet").intra_op_num_threads, 8)
+        self.assertEqual(device.sess_options(model_type="vae").intra_op_num_threads, 2)
+        self.assertIs(device.sess_options(), device.sess_options())
+
 
 class ImageParamsTests(unittest.TestCase):
     def test_json(self):
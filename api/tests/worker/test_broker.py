@@ -0,0 +1,113 @@
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+from onnx_web.image.encoded import EncodedImage
+from onnx_web.server.context import ServerContext
+from onnx_web.worker.broker import SqliteJobBroker, get_job_broker
+from onnx_web.worker.command import JobCommand, ProgressCommand
+
+
+def make_job(name: str, *args) -> JobCommand:
+    return JobCommand(name, "any", print, list(args), {})
+
+
+class TestSqliteJobBroker(unittest.TestCase):
+    def test_claim_by_platform(self):
+        with TemporaryDirectory() as temp:
+            broker = SqliteJobBroker(path.join(temp, "jobs.db"))
+            broker.publish(make_job("a"), platform="cuda")
+            broker.publish(make_job("b"))
+
+            self.assertEqual(broker.claim("worker", "cpu").name, "b")
+            self.assertIsNone(broker.claim("worker", "cpu"))
+            self.assertEqual(broker.claim("worker", "cuda").name, "a")
+
+    def test_images_by_reference(self):
+        with TemporaryDirectory() as temp:
+            broker = SqliteJobBroker(path.join(temp, "jobs.db"))
+            image = EncodedImage(b"image data")
+            broker.publish(make_job("a", {"source": image}))
+
+            self.assertIsNone(image.data)
+            self.assertEqual(image.ref, 0)
+
+            job = broker.claim("worker", "cpu")
+            self.assertEqual(job.args[0]["source"].get_data(), b"image data")
+
+    def test_progress(self):
+        with TemporaryDirectory() as temp:
+            broker = SqliteJobBroker(path.join(temp, "jobs.db"))
+            broker.publish(make_job("a"))
+            self.assertEqual(broker.status("a"), (True, None))
+            self.assertEqual(broker.status("b"), (False, None))
+
+            broker.claim("worker", "cpu")
+            broker.report(ProgressCommand("a", "cpu", False, 5))
+            _pending, progress = broker.status("a")
+            self.assertEqual(progress.progress, 5)
+            self.assertFalse(progress.finished)
+
+            broker.report(ProgressCommand("a", "cpu", True, 10))
+            _pending, progress = broker.status("a")
+            self.assertTrue(progress.finished)
+            self.assertFalse(broker.cancel("a"))
+
+    def test_duplicate_jobs(self):
+        with TemporaryDirectory() as temp:
+            broker = SqliteJobBroker(path.join(temp, "jobs.db"))
+            broker.publish(make_job("a"), digest="abc", outputs=["a_0"])
+            self.assertEqual(
+                broker.publish(make_job("b"), digest="abc", outputs=["b_0"]), ["a_0"]
+            )
+
+            # the job is only cancelled once both submissions have cancelled it
+            self.assertTrue(broker.cancel("a"))
+            self.assertFalse(broker.is_cancelled("a"))
+            self.assertTrue(broker.cancel("a"))
+            self.assertTrue(broker.is_cancelled("a"))
+            self.assertIsNone(broker.claim("worker", "cpu"))
+
+    def test_expired_lease(self):
+        with TemporaryDirectory() as temp:
+            broker = SqliteJobBroker(path.join(temp, "jobs.db"))
+            broker.publish(make_job("a"))
+            broker.publish(make_job("b"))
+            self.assertEqual(broker.claim("first", "cpu").name, "a")
+            self.assertEqual(broker.claim("first", "cpu").name, "b")
+
+            # the first worker stops responding after renewing the lease on one job
+            broker.connect().execute("UPDATE jobs SET updated = 0")
+            broker.heartbeat("first", ["b"])
+
+            self.assertEqual(broker.claim("second", "cpu").name, "a")
+            self.assertIsNone(broker.claim("second", "cpu"))
+
+    def test_expired_cancelled(self):
+        with TemporaryDirectory() as temp:
+            broker = SqliteJobBroker(path.join(temp, "jobs.db"))
+            broker.publish(make_job("a"))
+            broker.claim("first", "cpu")
+            self.assertTrue(broker.cancel("a"))
+
+            broker.connect().execute("UPDATE jobs SET updated = 0")
+            self.assertIsNone(broker.claim("second", "cpu"))
+
+            _pending, progress = broker.status("a")
+            self.assertTrue(progress.finished)
+            self.assertTrue(progress.cancelled)
+
+
+class TestGetJobBroker(unittest.TestCase):
+    def test_disabled(self):
+        self.assertIsNone(get_job_broker(ServerContext()))
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            get_job_broker(ServerContext(job_broker="redis://localhost"))
+
+    def test_sqlite_path(self):
+        with TemporaryDirectory() as temp:
+            broker_path = path.join(temp, "jobs.db")
+            broker = get_job_broker(ServerContext(job_broker=f"sqlite://{broker_path}"))
+            self.assertEqual(broker.broker_path, broker_path)
@@ -0,0 +1,95 @@
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+from PIL import Image
+
+from onnx_web.chain.base import ChainPipeline
+from onnx_web.chain.stage import BaseStage
+from onnx_web.errors import PreemptedException
+from onnx_web.params import DeviceParams, ImageParams, StageParams
+from onnx_web.server.context import ServerContext
+from onnx_web.worker.checkpoint import (
+    JobCheckpoint,
+    get_checkpoint_path,
+    load_checkpoint,
+    remove_checkpoint,
+    save_checkpoint,
+)
+
+
+class TestWorker:
+    job = "test"
+    retries = 3
+
+    def __init__(self, preempt: bool = False) -> None:
+        self.checkpoint_owner = None
+        self.preempt = preempt
+
+    def get_device(self):
+        return DeviceParams("cpu", "CPUExecutionProvider")
+
+    def get_progress(self):
+        return 0
+
+    def is_preempted(self):
+        return self.preempt
+
+
+class CountStage(BaseStage):
+    def __init__(self) -> None:
+        self.runs = 0
+
+    def run(self, _worker, _server, _stage, _params, sources, **kwargs):
+        self.runs += 1
+        return sources
+
+
+class TestCheckpoint(unittest.TestCase):
+    def test_round_trip(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(cache_path=temp)
+            image = Image.new("RGB", (8, 8), (255, 0, 0))
+            save_checkpoint(server, "job", JobCheckpoint(2, 10, [image]))
+
+            checkpoint = load_checkpoint(server, "job")
+            self.assertEqual(checkpoint.stage, 2)
+            self.assertEqual(checkpoint.progress, 10)
+            self.assertEqual(checkpoint.images[0].getpixel((0, 0)), (255, 0, 0))
+
+            # checkpoints are only used once
+            self.assertFalse(path.exists(get_checkpoint_path(server, "job")))
+            self.assertIsNone(load_checkpoint(server, "job"))
+
+    def test_remove(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(cache_path=temp)
+            save_checkpoint(server, "job", JobCheckpoint(1, 5, []))
+
+            self.assertTrue(remove_checkpoint(server, "job"))
+            self.assertFalse(remove_checkpoint(server, "job"))
+            self.assertIsNone(load_checkpoint(server, "job"))
+
+    def test_resume_chain(self):
+        with TemporaryDirectory() as temp:
+            server = ServerContext(cache_path=temp)
+            first = CountStage()
+            second = CountStage()
+            pipeline = ChainPipeline(
+                [
+                    (first, StageParams(tile_size=64), None),
+                    (second, StageParams(tile_size=64), None),
+                ]
+            )
+
+            source = Image.new("RGB", (16, 16), (255, 0, 0))
+            params = ImageParams("test", "txt2img", "ddim", "test", 1.0, 1, 1)
+
+            with self.assertRaises(PreemptedException):
+                pipeline(TestWorker(preempt=True), server, params, [source])
+
+            self.assertEqual((first.runs, second.runs), (1, 0))
+
+            outputs = pipeline(TestWorker(), server, params, [source])
+            self.assertEqual((first.runs, second.runs), (1, 1))
+            self.assertEqual(outputs[0].getpixel((0, 0)), (255, 0, 0))
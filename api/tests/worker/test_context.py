@@ -0,0 +1,67 @@
+import unittest
+from multiprocessing import Value
+from queue import Queue
+
+from onnx_web.params import DeviceParams
+from onnx_web.worker.context import WorkerContext
+
+
+def make_context() -> WorkerContext:
+    return WorkerContext(
+        "test",
+        DeviceParams("cpu", "CPUExecutionProvider"),
+        Value("B", False),
+        Queue(),
+        Queue(),
+        Queue(),
+        Value("L", 0),
+        Value("B", False),
+    )
+
+
+class TestWorkerFinish(unittest.TestCase):
+    def test_finish_previous_job(self):
+        context = make_context()
+        context.start("a")
+        context.set_progress(5)
+        context.start("b")
+        context.set_progress(2)
+
+        # the outputs for the first job are written after the second job has started
+        context.finish(job="a", progress=5, cancelled=False)
+        self.assertEqual(context.get_progress(), 2)
+        self.assertEqual(context.last_progress.job, "b")
+
+        updates = [context.progress.get_nowait() for _ in range(3)]
+        self.assertEqual(updates[-1].job, "a")
+        self.assertTrue(updates[-1].finished)
+
+    def test_finish_current_job(self):
+        context = make_context()
+        context.start("a")
+        context.set_progress(5)
+        context.finish()
+        self.assertTrue(context.last_progress.finished)
+        self.assertEqual(context.get_progress(), 5)
+
+
+class TestWorkerFail(unittest.TestCase):
+    def test_fail_previous_job(self):
+        context = make_context()
+        context.start("old")
+        context.start("new")
+        context.set_progress(3)
+        current = context.last_progress
+
+        context.fail(job="old", progress=7, cancelled=False)
+        self.assertIs(context.last_progress, current)
+        self.assertEqual(context.get_progress(), 3)
+        self.assertFalse(context.last_progress.finished)
+        self.assertFalse(context.last_progress.failed)
+
+    def test_fail_current_job(self):
+        context = make_context()
+        context.start("a")
+        context.fail()
+        self.assertTrue(context.last_progress.finished)
+        self.assertTrue(context.last_progress.failed)
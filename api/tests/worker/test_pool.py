@@ -0,0 +1,247 @@
+import unittest
+from os import path
+from queue import Queue
+from tempfile import TemporaryDirectory
+from threading import Barrier, Thread
+
+import numpy as np
+
+from onnx_web.output import save_preview
+from onnx_web.params import DeviceParams
+from onnx_web.server.context import ServerContext
+from onnx_web.worker.checkpoint import (
+    JobCheckpoint,
+    get_checkpoint_path,
+    save_checkpoint,
+)
+from onnx_web.worker.command import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    JobCommand,
+    ProgressCommand,
+)
+from onnx_web.worker.pool import DevicePoolExecutor
+
+
+def make_pool() -> DevicePoolExecutor:
+    return DevicePoolExecutor(
+        ServerContext(),
+        [
+            DeviceParams("cuda", "CUDAExecutionProvider"),
+            DeviceParams("cpu", "CPUExecutionProvider", platform="cpu"),
+            DeviceParams("cpu-1", "CPUExecutionProvider", platform="cpu"),
+        ],
+    )
+
+
+class TestNextDevice(unittest.TestCase):
+    def test_least_jobs(self):
+        pool = make_pool()
+        self.assertEqual(pool.get_next_device(), 0)
+
+        pool.pending_jobs.append(JobCommand("a", "cuda", None, [], {}))
+        self.assertEqual(pool.get_next_device(), 1)
+
+    def test_platform(self):
+        pool = make_pool()
+        cpu = DeviceParams("cpu", "CPUExecutionProvider", platform="cpu")
+        self.assertEqual(pool.get_next_device(needs_device=cpu), 1)
+
+        pool.pending_jobs.append(JobCommand("a", "cpu", None, [], {}))
+        self.assertEqual(pool.get_next_device(needs_device=cpu), 2)
+
+        pool.pending_jobs.append(JobCommand("b", "cpu-1", None, [], {}))
+        pool.pending_jobs.append(JobCommand("c", "cpu-1", None, [], {}))
+        self.assertEqual(pool.get_next_device(needs_device=cpu), 1)
+
+
+class TestDuplicateJobs(unittest.TestCase):
+    def test_follow_pending(self):
+        pool = make_pool()
+        first = pool.submit("a", None, digest="abc", outputs=["a_0", "a_1"])
+        second = pool.submit("b", None, digest="abc", outputs=["b_0", "b_1"])
+
+        self.assertEqual(first, ["a_0", "a_1"])
+        self.assertEqual(second, ["a_0", "a_1"])
+        self.assertEqual([job.name for job in pool.pending_jobs], ["a"])
+
+    def test_different_digest(self):
+        pool = make_pool()
+        pool.submit("a", None, digest="abc")
+        self.assertEqual(pool.submit("b", None, digest="def"), ["b"])
+        self.assertEqual(pool.submit("c", None), ["c"])
+        self.assertEqual(len(pool.pending_jobs), 3)
+
+    def test_cancel_all_followers(self):
+        pool = make_pool()
+        pool.submit("a", None, digest="abc")
+        pool.submit("b", None, digest="abc")
+
+        self.assertTrue(pool.cancel("a"))
+        self.assertEqual(len(pool.pending_jobs), 1)
+
+        self.assertTrue(pool.cancel("a"))
+        self.assertEqual(len(pool.pending_jobs), 0)
+
+        # later submissions start a new job
+        self.assertEqual(pool.submit("c", None, digest="abc"), ["c"])
+
+    def test_concurrent_duplicates(self):
+        pool = make_pool()
+        barrier = Barrier(8)
+        results = []
+
+        def submit(index: int):
+            barrier.wait()
+            results.append(pool.submit(f"job-{index}", None, digest="abc"))
+
+        threads = [Thread(target=submit, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(pool.pending_jobs), 1)
+        self.assertEqual(len(set(tuple(outputs) for outputs in results)), 1)
+        self.assertEqual(pool.job_followers[pool.pending_jobs[0].name], 8)
+
+    def test_finished_job(self):
+        pool = make_pool()
+        pool.submit("a", None, digest="abc")
+        pool.finish_job(ProgressCommand("a", "cuda", True, 10))
+
+        self.assertEqual(pool.submit("b", None, digest="abc"), ["b"])
+
+
+class TestPreemptContext:
+    def __init__(self) -> None:
+        self.preempt = False
+
+    def is_preempted(self) -> bool:
+        return self.preempt
+
+    def set_preempt(self) -> None:
+        self.preempt = True
+
+
+class TestJobPriority(unittest.TestCase):
+    def test_next_job_priority(self):
+        pool = make_pool()
+        pool.pending = {"cuda": Queue()}
+        pool.pending_jobs.extend(
+            [
+                JobCommand("a", "cuda", None, [], {}, priority=PRIORITY_LOW),
+                JobCommand("b", "cuda", None, [], {}),
+                JobCommand("c", "cuda", None, [], {}),
+            ]
+        )
+
+        pool.next_job("cuda")
+        self.assertEqual(pool.pending["cuda"].get().name, "b")
+
+    def test_preempt_lower_priority(self):
+        pool = make_pool()
+        context = TestPreemptContext()
+        pool.context = {"cuda": context}
+
+        pool.submit("a", None, priority=PRIORITY_LOW)
+        pool.update_job(ProgressCommand("a", "cuda", False, 1), context=context)
+        pool.preempt_jobs()
+        self.assertFalse(context.preempt)
+
+        pool.pending_jobs.append(
+            JobCommand("b", "cuda", None, [], {}, priority=PRIORITY_HIGH)
+        )
+        pool.preempt_jobs()
+        self.assertTrue(context.preempt)
+
+    def test_requeue_preempted(self):
+        pool = make_pool()
+        context = TestPreemptContext()
+        pool.submit("a", None, priority=PRIORITY_LOW)
+        pool.update_job(ProgressCommand("a", "cuda", False, 1), context=context)
+        pool.submit("b", None)
+
+        pool.update_job(ProgressCommand("a", "cuda", False, 1, preempted=True))
+        self.assertEqual([job.name for job in pool.pending_jobs], ["a", "b"])
+        self.assertNotIn("a", pool.running_jobs)
+        self.assertEqual(len(pool.finished_jobs), 0)
+
+    def test_cancel_preempted(self):
+        pool = make_pool()
+        context = TestPreemptContext()
+        pool.submit("a", None)
+        pool.update_job(ProgressCommand("a", "cuda", False, 1), context=context)
+        pool.cancelled_jobs.append("a")
+
+        pool.update_job(ProgressCommand("a", "cuda", False, 1, preempted=True))
+        self.assertEqual(len(pool.pending_jobs), 0)
+        self.assertTrue(pool.finished_jobs[0].cancelled)
+
+    def test_cancel_pending_preempted(self):
+        with TemporaryDirectory() as temp:
+            pool = DevicePoolExecutor(
+                ServerContext(cache_path=temp),
+                [DeviceParams("cuda", "CUDAExecutionProvider")],
+            )
+            context = TestPreemptContext()
+            pool.submit("a", None)
+            pool.update_job(ProgressCommand("a", "cuda", False, 1), context=context)
+
+            save_checkpoint(pool.server, "a", JobCheckpoint(1, 1, []))
+            pool.update_job(ProgressCommand("a", "cuda", False, 1, preempted=True))
+            self.assertEqual([job.name for job in pool.pending_jobs], ["a"])
+
+            self.assertTrue(pool.cancel("a"))
+            self.assertFalse(path.exists(get_checkpoint_path(pool.server, "a")))
+
+
+class TestJobPreviews(unittest.TestCase):
+    def test_finished_preview(self):
+        with TemporaryDirectory() as temp:
+            pool = DevicePoolExecutor(
+                ServerContext(output_path=temp),
+                [DeviceParams("cuda", "CUDAExecutionProvider")],
+            )
+            pool.submit("a", None)
+            name = save_preview(pool.server, "a", np.zeros((1, 4, 8, 8)))
+
+            pool.update_job(ProgressCommand("a", "cuda", True, 1))
+            self.assertFalse(path.exists(path.join(temp, name)))
+
+
+class TestScatterTiles(unittest.TestCase):
+    def test_idle_devices(self):
+        pool = make_pool()
+        pool.submit("a", None, needs_device=pool.devices[1])
+        self.assertEqual(pool.scatter_tiles("a", "cpu", "tiles/a-1"), ["a-1-cpu-1"])
+
+        helper = pool.pending_jobs[-1]
+        self.assertEqual(helper.device, "cpu-1")
+        self.assertEqual(helper.args[1], "tiles/a-1")
+
+    def test_busy_devices(self):
+        pool = make_pool()
+        pool.submit("a", None, needs_device=pool.devices[1])
+        pool.pending_jobs.append(JobCommand("b", "cpu-1", None, [], {}))
+        self.assertEqual(pool.scatter_tiles("a", "cpu", "tiles/a-1"), [])
+
+        # other platforms are not used, even when they are idle
+        self.assertEqual(pool.scatter_tiles("c", "cuda", "tiles/c-1"), [])
+
+    def test_helper_jobs(self):
+        pool = make_pool()
+        pool.context = {"cpu": TestPreemptContext(), "cpu-1": TestPreemptContext()}
+        pool.submit("a", None, needs_device=pool.devices[1])
+        pool.update_job(ProgressCommand("a", "cpu", False, 0))
+        [helper] = pool.scatter_tiles("a", "cpu", "tiles/a-1")
+        self.assertTrue(pool.pending_jobs[-1].helper)
+
+        # helper jobs do not count towards recycling the worker, and are not kept once they finish
+        pool.update_job(ProgressCommand(helper, "cpu-1", False, 0))
+        self.assertEqual(pool.total_jobs, {"cpu": 1})
+
+        pool.update_job(ProgressCommand(helper, "cpu-1", True, 1))
+        pool.update_job(ProgressCommand("a", "cpu", True, 1))
+        self.assertEqual([job.job for job in pool.finished_jobs], ["a"])
@@ -0,0 +1,53 @@
+import unittest
+
+from onnx_web.server.context import ServerContext
+from onnx_web.worker.prewarm import PrewarmModel, get_warmup_args
+
+
+class TestPrewarmModel(unittest.TestCase):
+    def test_parse(self):
+        model = PrewarmModel.parse("stable-diffusion-onnx-v1-5:txt2img:ddim")
+        self.assertEqual(model.model, "stable-diffusion-onnx-v1-5")
+        self.assertEqual(model.pipeline, "txt2img")
+        self.assertEqual(model.scheduler, "ddim")
+        self.assertIsNone(model.control)
+
+    def test_parse_control(self):
+        model = PrewarmModel.parse("stable-diffusion-onnx-v1-5:controlnet:ddim:canny")
+        self.assertEqual(model.control, "canny")
+        self.assertEqual(str(model), "stable-diffusion-onnx-v1-5:controlnet:ddim:canny")
+
+    def test_parse_invalid(self):
+        for entry in ["model", "model:txt2img", "model::ddim", "a:b:c:d:e"]:
+            with self.subTest(entry=entry):
+                with self.assertRaises(ValueError):
+                    PrewarmModel.parse(entry)
+
+    def test_params(self):
+        server = ServerContext(model_path="models")
+        params = PrewarmModel.parse("sd:controlnet:ddim:canny").get_params(server)
+        self.assertEqual(params.pipeline, "controlnet")
+        self.assertEqual(params.scheduler, "ddim")
+        self.assertEqual(params.control.name, "canny")
+        self.assertTrue(params.model.endswith("sd"))
+
+
+class TestWarmupArgs(unittest.TestCase):
+    def test_image_pipelines(self):
+        args = get_warmup_args("img2img")
+        self.assertIn("image", args)
+        self.assertNotIn("height", args)
+
+    def test_inpaint(self):
+        args = get_warmup_args("inpaint")
+        self.assertEqual(args["image"].size, args["mask_image"].size)
+
+    def test_txt2img(self):
+        args = get_warmup_args("txt2img")
+        self.assertNotIn("image", args)
+        self.assertEqual(args["height"], args["width"])
+
+
+class TestServerContext(unittest.TestCase):
+    def test_empty_prewarm(self):
+        self.assertEqual(ServerContext(prewarm=[""]).prewarm, [])
@@ -0,0 +1,74 @@
+import unittest
+from io import BytesIO
+from multiprocessing import get_context
+from pickle import dumps, loads
+
+import numpy as np
+from PIL import Image
+
+from onnx_web.image.encoded import EncodedImage, decode_images
+from onnx_web.worker.shared import SharedBuffer, release_buffers, share_images
+
+
+def sum_buffer(buffer: SharedBuffer, results) -> None:
+    results.put(int(buffer.read().sum()))
+
+
+def encode_noise(size: int) -> bytes:
+    # noise does not compress, so the PNG will be larger than the minimum shared size
+    pixels = np.random.RandomState(42).randint(0, 255, (size, size, 3), dtype=np.uint8)
+    data = BytesIO()
+    Image.fromarray(pixels).save(data, format="PNG")
+    return data.getvalue()
+
+
+class TestSharedBuffer(unittest.TestCase):
+    def test_round_trip(self):
+        array = np.arange(24, dtype=np.float32).reshape((2, 3, 4))
+        buffer = SharedBuffer.from_array(array)
+
+        try:
+            copy = loads(dumps(buffer))
+            self.assertIsNone(copy.memory)
+            self.assertTrue(np.array_equal(copy.read(), array))
+        finally:
+            buffer.release()
+
+    def test_other_process(self):
+        array = np.ones((64, 64), dtype=np.uint8)
+        buffer = SharedBuffer.from_array(array)
+
+        try:
+            context = get_context("spawn")
+            results = context.Queue()
+            process = context.Process(target=sum_buffer, args=(buffer, results))
+            process.start()
+            self.assertEqual(results.get(timeout=30), 64 * 64)
+            process.join()
+        finally:
+            buffer.release()
+
+    def test_release_twice(self):
+        buffer = SharedBuffer.from_array(np.zeros(4))
+        buffer.release()
+        buffer.release()
+
+
+class TestShareImages(unittest.TestCase):
+    def test_share_and_decode(self):
+        large = EncodedImage(encode_noise(256))
+        small = EncodedImage(encode_noise(8))
+        args = [[large], {"mask": small}]
+
+        buffers = share_images(args)
+        try:
+            self.assertEqual(len(buffers), 1)
+            self.assertIsNone(large.data)
+            self.assertIsNotNone(small.data)
+
+            args = loads(dumps(args))
+            decoded = decode_images(args)
+            self.assertEqual(decoded[0][0].size, (256, 256))
+            self.assertEqual(decoded[1]["mask"].size, (8, 8))
+        finally:
+            release_buffers(buffers)